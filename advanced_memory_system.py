@@ -5,9 +5,10 @@ Gerencia memória de curto e longo prazo com insights contextuais
 import json
 import logging
 import re
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 from datetime import datetime, timedelta
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass
+from memory_store import MemoryStore
 
 @dataclass
 class MemoryFact:
@@ -20,133 +21,129 @@ class MemoryFact:
     user_phone: str
 
 class AdvancedMemorySystem:
-    def __init__(self):
+    def __init__(self, store: Optional[MemoryStore] = None, history: Optional[Any] = None):
         self.short_term_memory = {}  # Sessão atual (RAM)
-        self.long_term_memory = {}   # Persistente (Banco de Dados)
-        self.contextual_insights = {}  # Padrões aprendidos
-        self.conversation_summaries = {}  # Resumos por usuário
+        # Memória de longo prazo, resumos e insights: LRU limitado + write-behind no banco
+        self.store = store or MemoryStore()
+        # Histórico de conversas (app.core.conversation_store): a conversa recente sai
+        # do ring buffer, gravado na hora, e não do resumo, que segue a fila de ingestão
+        self.history = history
         self.fact_extractor = FactExtractor()
+    
+    @property
+    def long_term_memory(self):
+        """Visão por telefone: categoria -> fatos (compatível com o antigo dict)"""
+        return self.store.long_term_view
+    
+    @property
+    def conversation_summaries(self):
+        return self.store.summaries_view
+    
+    @property
+    def contextual_insights(self):
+        return self.store.insights_view
         
     def process_conversation(self, user_phone: str, user_message: str, ai_response: str):
         """Processa conversa completa e atualiza memórias"""
-        # 1. Extrai fatos relevantes
-        facts = self.fact_extractor.extract_facts(user_message, ai_response, user_phone)
-        
-        # 2. Atualiza memórias
-        for fact in facts:
-            self.update_memory(fact)
-        
-        # 3. Atualiza resumo contextual
-        self.update_contextual_summary(user_phone, user_message, ai_response)
-        
-        # 4. Gera insights comportamentais
-        self.generate_behavioral_insights(user_phone, user_message)
+        self.process_conversations(user_phone, [(user_message, ai_response)])
+    
+    def process_conversations(self, user_phone: str, exchanges: List[Tuple[str, str]]):
+        """Processa em lote as trocas (mensagem, resposta) de um mesmo usuário"""
+        # Um único carregamento do usuário para todo o lote
+        self.store.get(user_phone)
+        total_facts = 0
+        
+        for user_message, ai_response in exchanges:
+            # 1. Extrai fatos, tópicos e sinais em uma única passada
+            analysis = self.fact_extractor.analyze(user_message)
+            facts = self.fact_extractor.extract_facts(user_message, ai_response, user_phone, analysis)
+            
+            # 2. Atualiza memórias
+            for fact in facts:
+                self.update_memory(fact)
+            
+            # 3. Atualiza resumo contextual
+            self.update_contextual_summary(user_phone, user_message, ai_response, analysis)
+            
+            # 4. Gera insights comportamentais
+            self.generate_behavioral_insights(user_phone, user_message, analysis)
+            total_facts += len(facts)
         
-        logging.info(f"Processada conversa para {user_phone}: {len(facts)} fatos extraídos")
+        logging.info(f"Processada conversa para {user_phone}: {len(exchanges)} trocas, {total_facts} fatos extraídos")
     
     def update_memory(self, fact: MemoryFact):
         """Atualiza sistema de memória com novo fato"""
-        user_phone = fact.user_phone
-        
-        # Inicializa estruturas se necessário
-        if user_phone not in self.long_term_memory:
-            self.long_term_memory[user_phone] = {
-                'preferences': [],
-                'business_context': [],
-                'personal_info': [],
-                'insights': []
-            }
-        
-        # Categoriza e armazena fato
-        memory_category = self.long_term_memory[user_phone]
-        fact_dict = asdict(fact)
-        fact_dict['timestamp'] = fact.timestamp.isoformat()
+        # `type` e `user_phone` já são a categoria e a chave do store: não
+        # são repetidos em cada fato residente/persistido
+        fact_dict = {
+            'content': fact.content,
+            'timestamp': fact.timestamp.isoformat(),
+            'importance': fact.importance,
+            'context': fact.context
+        }
         
-        if fact.type in memory_category:
-            # Evita duplicatas
-            existing_contents = [f['content'] for f in memory_category[fact.type]]
-            if fact.content not in existing_contents:
-                memory_category[fact.type].append(fact_dict)
-                
-                # Mantém apenas os 50 fatos mais importantes por categoria
-                memory_category[fact.type].sort(key=lambda x: x['importance'], reverse=True)
-                memory_category[fact.type] = memory_category[fact.type][:50]
+        # Dedup por hash e top-50 por importância ficam a cargo do store
+        self.store.add_fact(fact.user_phone, fact.type, fact_dict)
     
-    def update_contextual_summary(self, user_phone: str, user_msg: str, ai_response: str):
+    def update_contextual_summary(self, user_phone: str, user_msg: str, ai_response: str,
+                                  analysis: Optional['MessageAnalysis'] = None):
         """Atualiza resumo contextual da conversa"""
-        if user_phone not in self.conversation_summaries:
-            self.conversation_summaries[user_phone] = {
-                'last_topics': [],
-                'interaction_style': 'formal',
-                'current_session': [],
-                'key_themes': {}
-            }
-        
-        summary = self.conversation_summaries[user_phone]
-        
-        # Adiciona à sessão atual
-        summary['current_session'].append({
+        # Tópicos extraídos fora do lock do store
+        topics = self.extract_topics(user_msg, analysis)
+        interaction = {
             'user': user_msg[:200],  # Primeiros 200 chars
             'ai': ai_response[:200],
             'timestamp': datetime.now().isoformat()
-        })
-        
-        # Mantém apenas últimas 10 interações na sessão
-        summary['current_session'] = summary['current_session'][-10:]
+        }
         
-        # Extrai tópicos principais
-        topics = self.extract_topics(user_msg)
-        for topic in topics:
-            if topic not in summary['last_topics']:
-                summary['last_topics'].append(topic)
-        summary['last_topics'] = summary['last_topics'][-15:]  # Últimos 15 tópicos
+        def update(summary):
+            # Adiciona à sessão atual, mantendo apenas as últimas 10 interações
+            summary['current_session'].append(interaction)
+            summary['current_session'] = summary['current_session'][-10:]
+            
+            for topic in topics:
+                if topic not in summary['last_topics']:
+                    summary['last_topics'].append(topic)
+            summary['last_topics'] = summary['last_topics'][-15:]  # Últimos 15 tópicos
+        
+        self.store.update_section(user_phone, 'summary', lambda: {
+            'last_topics': [],
+            'interaction_style': 'formal',
+            'current_session': [],
+            'key_themes': {}
+        }, update)
     
-    def extract_topics(self, text: str) -> List[str]:
-        """Extrai tópicos principais do texto"""
-        # Palavras-chave relevantes para negócios/IA
-        business_keywords = [
-            'marketing', 'publicidade', 'vendas', 'cliente', 'empresa', 'negócio',
-            'ia', 'inteligência artificial', 'automação', 'bot', 'whatsapp',
-            'estratégia', 'campanha', 'roi', 'conversão', 'lead', 'funil'
-        ]
-        
-        text_lower = text.lower()
-        found_topics = []
-        
-        for keyword in business_keywords:
-            if keyword in text_lower:
-                found_topics.append(keyword)
-        
-        return found_topics[:5]  # Máximo 5 tópicos por mensagem
+    def extract_topics(self, text: str, analysis: Optional['MessageAnalysis'] = None) -> List[str]:
+        """Extrai tópicos principais do texto (máximo 5 por mensagem)"""
+        return (analysis or self.fact_extractor.analyze(text)).topics
     
-    def generate_behavioral_insights(self, user_phone: str, message: str):
+    def generate_behavioral_insights(self, user_phone: str, message: str,
+                                     analysis: Optional['MessageAnalysis'] = None):
         """Gera insights comportamentais baseado na mensagem"""
-        if user_phone not in self.contextual_insights:
-            self.contextual_insights[user_phone] = {
-                'communication_style': 'discovering',
-                'technical_level': 'unknown',
-                'business_maturity': 'unknown',
-                'preferred_topics': {},
-                'interaction_patterns': []
-            }
-        
-        insights = self.contextual_insights[user_phone]
-        
-        # Detecta estilo de comunicação
-        if len(message) > 100:
-            insights['communication_style'] = 'detailed'
-        elif len(message) < 20:
-            insights['communication_style'] = 'concise'
-        
-        # Detecta nível técnico
-        tech_terms = ['api', 'webhook', 'integração', 'sql', 'python', 'javascript']
-        if any(term in message.lower() for term in tech_terms):
-            insights['technical_level'] = 'high'
-        
-        # Detecta maturidade empresarial
-        business_terms = ['estratégia', 'roi', 'kpi', 'métricas', 'funil', 'conversão']
-        if any(term in message.lower() for term in business_terms):
-            insights['business_maturity'] = 'advanced'
+        analysis = analysis or self.fact_extractor.analyze(message)
+        
+        def update(insights):
+            # Detecta estilo de comunicação
+            if len(message) > 100:
+                insights['communication_style'] = 'detailed'
+            elif len(message) < 20:
+                insights['communication_style'] = 'concise'
+            
+            # Detecta nível técnico
+            if analysis.technical:
+                insights['technical_level'] = 'high'
+            
+            # Detecta maturidade empresarial
+            if analysis.business_mature:
+                insights['business_maturity'] = 'advanced'
+        
+        self.store.update_section(user_phone, 'insights', lambda: {
+            'communication_style': 'discovering',
+            'technical_level': 'unknown',
+            'business_maturity': 'unknown',
+            'preferred_topics': {},
+            'interaction_patterns': []
+        }, update)
     
     def get_context_for_prompt(self, user_phone: str) -> Dict[str, Any]:
         """Retorna contexto completo para geração de prompt"""
@@ -159,18 +156,23 @@ class AdvancedMemorySystem:
             'behavioral_patterns': {}
         }
         
+        # Um único acesso ao banco (se o usuário não estiver residente);
+        # as leituras abaixo passam a ser em RAM
+        self.store.get(user_phone)
+        
         # Conversa recente
+        recent_session = []
+        if self.history is not None:
+            recent_session = [{'user': user, 'ai': ai} for user, ai in self.history.recent_exchanges(user_phone, 3)]
         if user_phone in self.conversation_summaries:
             summary = self.conversation_summaries[user_phone]
-            recent_session = summary.get('current_session', [])[-3:]  # Últimas 3 interações
-            
-            context['recent_conversation'] = '\n'.join([
-                f"Usuário: {interaction['user'][:100]}..."
-                f"Endrigo: {interaction['ai'][:100]}..."
-                for interaction in recent_session
-            ])
-            
+            recent_session = recent_session or summary.get('current_session', [])[-3:]  # Últimas 3 interações
             context['conversation_summary'] = f"Tópicos recentes: {', '.join(summary.get('last_topics', []))}"
+        context['recent_conversation'] = '\n'.join([
+            f"Usuário: {interaction['user'][:100]}..."
+            f"Endrigo: {interaction['ai'][:100]}..."
+            for interaction in recent_session
+        ])
         
         # Memória de longo prazo
         if user_phone in self.long_term_memory:
@@ -201,6 +203,8 @@ class AdvancedMemorySystem:
             'memory_categories': {}
         }
         
+        self.store.get(user_phone)
+        
         if user_phone in self.long_term_memory:
             memory = self.long_term_memory[user_phone]
             for category, facts in memory.items():
@@ -219,114 +223,157 @@ class AdvancedMemorySystem:
         
         return stats
 
+# Padrões de fatos na ordem original: (categoria, gatilho literal, cauda, tamanho mínimo)
+_FACT_PATTERNS = [
+    ('preferences', 'eu gosto de ', r'(.+?)(?:\.|,|$)', 3),
+    ('preferences', 'eu prefiro ', r'(.+?)(?:\.|,|$)', 3),
+    ('preferences', 'minha preferência é ', r'(.+?)(?:\.|,|$)', 3),
+    ('preferences', 'eu sempre ', r'(.+?)(?:\.|,|$)', 3),
+    ('preferences', 'não gosto de ', r'(.+?)(?:\.|,|$)', 3),
+    ('business_context', 'minha empresa ', r'(.+?)(?:\.|,|$)', 5),
+    ('business_context', 'meu negócio ', r'(.+?)(?:\.|,|$)', 5),
+    ('business_context', 'trabalho com ', r'(.+?)(?:\.|,|$)', 5),
+    ('business_context', 'nosso cliente ', r'(.+?)(?:\.|,|$)', 5),
+    ('business_context', 'estou desenvolvendo ', r'(.+?)(?:\.|,|$)', 5),
+    ('personal_info', 'meu nome é ', r'(.+?)(?:\.|,|$)', 2),
+    ('personal_info', 'me chamo ', r'(.+?)(?:\.|,|$)', 2),
+    ('personal_info', 'sou de ', r'(.+?)(?:\.|,|$)', 2),
+    ('personal_info', 'moro em ', r'(.+?)(?:\.|,|$)', 2),
+    ('personal_info', 'tenho ', r'(.+?) anos', 2),
+]
+
+_FACT_LABELS = {
+    'preferences': 'Preferência: ',
+    'business_context': 'Contexto empresarial: ',
+    'personal_info': 'Info pessoal: ',
+}
+
+# Palavras-chave relevantes para negócios/IA (tópicos) e sinais comportamentais
+TOPIC_KEYWORDS = (
+    'marketing', 'publicidade', 'vendas', 'cliente', 'empresa', 'negócio',
+    'ia', 'inteligência artificial', 'automação', 'bot', 'whatsapp',
+    'estratégia', 'campanha', 'roi', 'conversão', 'lead', 'funil'
+)
+TECH_TERMS = frozenset(['api', 'webhook', 'integração', 'sql', 'python', 'javascript'])
+BUSINESS_TERMS = frozenset(['estratégia', 'roi', 'kpi', 'métricas', 'funil', 'conversão'])
+
+
+def _trie_pattern(words: List[str]) -> str:
+    """Regex em forma de trie: prefixos comuns são testados uma única vez"""
+    trie: Dict[str, Any] = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[''] = {}
+
+    def build(node: Dict[str, Any]) -> str:
+        alts = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not alts:
+            return ''
+        body = alts[0] if len(alts) == 1 else '(?:' + '|'.join(alts) + ')'
+        return f'(?:{body})?' if '' in node else body
+
+    return build(trie)
+
+
+@dataclass
+class MessageAnalysis:
+    """Resultado de uma única passada do FactExtractor sobre a mensagem"""
+    preferences: List[str]
+    business_context: List[str]
+    personal_info: List[str]
+    topics: List[str]
+    technical: bool
+    business_mature: bool
+
+
 class FactExtractor:
-    """Extrator inteligente de fatos relevantes"""
+    """
+    Extrator inteligente de fatos relevantes.
+
+    Os 15 padrões viram uma única regex de gatilhos (trie) percorrida uma vez;
+    só nos gatilhos encontrados a cauda pré-compilada é aplicada. As
+    palavras-chave de tópicos e insights são deduplicadas e testadas uma vez
+    sobre o mesmo texto em minúsculas.
+    """
+
+    _TRIGGERS = re.compile(_trie_pattern([trigger for _, trigger, _, _ in _FACT_PATTERNS]))
+    _BY_TRIGGER = {
+        trigger: (index, _FACT_LABELS[category], re.compile(tail), min_len)
+        for index, (category, trigger, tail, min_len) in enumerate(_FACT_PATTERNS)
+    }
+    _KEYWORDS = tuple(dict.fromkeys(TOPIC_KEYWORDS + tuple(sorted(TECH_TERMS | BUSINESS_TERMS))))
+
+    def analyze(self, text: str) -> MessageAnalysis:
+        """Extrai fatos, tópicos e sinais comportamentais em uma passada"""
+        text_lower = text.lower()
+
+        # Mesma semântica do re.findall por padrão: ocorrências do mesmo padrão
+        # não se sobrepõem, mas padrões diferentes podem se sobrepor
+        found = [[] for _ in _FACT_PATTERNS]
+        last_end = [0] * len(_FACT_PATTERNS)
+        search = self._TRIGGERS.search
+        match = search(text_lower)
+        while match:
+            index, label, tail, min_len = self._BY_TRIGGER[match.group()]
+            if match.start() >= last_end[index]:
+                captured = tail.match(text_lower, match.end())
+                if captured:
+                    last_end[index] = captured.end()
+                    value = captured.group(1).strip()
+                    if len(value) > min_len:  # Evita matches muito curtos
+                        found[index].append(label + value)
+            match = search(text_lower, match.start() + 1)
+
+        by_category = {category: [] for category in _FACT_LABELS}
+        for (category, _, _, _), values in zip(_FACT_PATTERNS, found):
+            by_category[category].extend(values)
+
+        keywords = {kw for kw in self._KEYWORDS if kw in text_lower}
+
+        return MessageAnalysis(
+            preferences=by_category['preferences'],
+            business_context=by_category['business_context'],
+            personal_info=by_category['personal_info'],
+            topics=[kw for kw in TOPIC_KEYWORDS if kw in keywords][:5],  # Máximo 5 tópicos
+            technical=not TECH_TERMS.isdisjoint(keywords),
+            business_mature=not BUSINESS_TERMS.isdisjoint(keywords),
+        )
     
-    def extract_facts(self, user_msg: str, ai_response: str, user_phone: str) -> List[MemoryFact]:
+    def extract_facts(self, user_msg: str, ai_response: str, user_phone: str,
+                      analysis: Optional[MessageAnalysis] = None) -> List[MemoryFact]:
         """Extrai fatos relevantes da conversa"""
+        analysis = analysis or self.analyze(user_msg)
         facts = []
         timestamp = datetime.now()
-        
-        # Extrai preferências
-        preferences = self.extract_preferences(user_msg)
-        for pref in preferences:
-            facts.append(MemoryFact(
-                type='preferences',
-                content=pref,
-                timestamp=timestamp,
-                importance=7,
-                context=user_msg[:100],
-                user_phone=user_phone
-            ))
-        
-        # Extrai contexto de negócios
-        business_context = self.extract_business_context(user_msg)
-        for context in business_context:
-            facts.append(MemoryFact(
-                type='business_context',
-                content=context,
-                timestamp=timestamp,
-                importance=8,
-                context=user_msg[:100],
-                user_phone=user_phone
-            ))
-        
-        # Extrai informações pessoais
-        personal_info = self.extract_personal_info(user_msg)
-        for info in personal_info:
-            facts.append(MemoryFact(
-                type='personal_info',
-                content=info,
-                timestamp=timestamp,
-                importance=6,
-                context=user_msg[:100],
-                user_phone=user_phone
-            ))
+        context = user_msg[:100]
+        
+        for category, contents, importance in (
+            ('preferences', analysis.preferences, 7),
+            ('business_context', analysis.business_context, 8),
+            ('personal_info', analysis.personal_info, 6),
+        ):
+            for content in contents:
+                facts.append(MemoryFact(
+                    type=category,
+                    content=content,
+                    timestamp=timestamp,
+                    importance=importance,
+                    context=context,
+                    user_phone=user_phone
+                ))
         
         return facts
     
     def extract_preferences(self, text: str) -> List[str]:
         """Extrai preferências explícitas"""
-        preferences = []
-        text_lower = text.lower()
-        
-        # Padrões de preferência
-        preference_patterns = [
-            r'eu gosto de (.+?)(?:\.|,|$)',
-            r'eu prefiro (.+?)(?:\.|,|$)', 
-            r'minha preferência é (.+?)(?:\.|,|$)',
-            r'eu sempre (.+?)(?:\.|,|$)',
-            r'não gosto de (.+?)(?:\.|,|$)'
-        ]
-        
-        for pattern in preference_patterns:
-            matches = re.findall(pattern, text_lower)
-            for match in matches:
-                if len(match.strip()) > 3:  # Evita matches muito curtos
-                    preferences.append(f"Preferência: {match.strip()}")
-        
-        return preferences
+        return self.analyze(text).preferences
     
     def extract_business_context(self, text: str) -> List[str]:
         """Extrai contexto empresarial"""
-        business_contexts = []
-        text_lower = text.lower()
-        
-        # Padrões de negócio
-        business_patterns = [
-            r'minha empresa (.+?)(?:\.|,|$)',
-            r'meu negócio (.+?)(?:\.|,|$)',
-            r'trabalho com (.+?)(?:\.|,|$)',
-            r'nosso cliente (.+?)(?:\.|,|$)',
-            r'estou desenvolvendo (.+?)(?:\.|,|$)'
-        ]
-        
-        for pattern in business_patterns:
-            matches = re.findall(pattern, text_lower)
-            for match in matches:
-                if len(match.strip()) > 5:
-                    business_contexts.append(f"Contexto empresarial: {match.strip()}")
-        
-        return business_contexts
+        return self.analyze(text).business_context
     
     def extract_personal_info(self, text: str) -> List[str]:
         """Extrai informações pessoais relevantes"""
-        personal_info = []
-        text_lower = text.lower()
-        
-        # Padrões de informação pessoal
-        personal_patterns = [
-            r'meu nome é (.+?)(?:\.|,|$)',
-            r'me chamo (.+?)(?:\.|,|$)',
-            r'sou de (.+?)(?:\.|,|$)',
-            r'moro em (.+?)(?:\.|,|$)',
-            r'tenho (.+?) anos'
-        ]
-        
-        for pattern in personal_patterns:
-            matches = re.findall(pattern, text_lower)
-            for match in matches:
-                if len(match.strip()) > 2:
-                    personal_info.append(f"Info pessoal: {match.strip()}")
-        
-        return personal_info
\ No newline at end of file
+        return self.analyze(text).personal_info
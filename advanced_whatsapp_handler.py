@@ -14,8 +14,12 @@ import requests
 from advanced_realtime_client import RealtimeVoiceClone
 from personality_manager import PersonalityManager
 from advanced_memory_system import AdvancedMemorySystem
+from memory_ingest import MemoryIngestPipeline
 from optimized_pipeline import OptimizedPipeline
 from knowledge_base_manager import KnowledgeBaseManager
+from app.clients import openai_client
+from app.core.context_budget import ContextAssembler, Snippet
+from app.core.conversation_store import get_conversation_store
 from elevenlabs_service import generate_voice_response
 
 class AdvancedWhatsAppHandler:
@@ -23,9 +27,16 @@ class AdvancedWhatsAppHandler:
         # Componentes principais
         self.realtime_client = RealtimeVoiceClone()
         self.personality_manager = PersonalityManager()
-        self.memory_system = AdvancedMemorySystem()
+        self.history = get_conversation_store()
+        self.memory_system = AdvancedMemorySystem(history=self.history)
+        # Atualizações de memória/perfil fora do caminho da resposta
+        self.memory_pipeline = MemoryIngestPipeline(self.memory_system, self.personality_manager)
         self.pipeline = OptimizedPipeline()
+        # Teto do pipeline de voz: passou disso, cai no fallback de texto
+        self.voice_pipeline_timeout = float(os.environ.get('VOICE_PIPELINE_TIMEOUT_S', '45'))
         self.knowledge_base = KnowledgeBaseManager()
+        # Prompt do assistente limitado a CONTEXT_TOKEN_BUDGET tokens
+        self.context_assembler = ContextAssembler()
         
         # Serviços externos
         self.twilio_client = Client(
@@ -44,7 +55,7 @@ class AdvancedWhatsAppHandler:
         
         try:
             # 1. Recupera contexto da memória avançada
-            memory_context = self.memory_system.get_context_for_prompt(from_number)
+            memory_context = await asyncio.to_thread(self.memory_system.get_context_for_prompt, from_number)
             
             # 2. Gera prompt contextual com personalidade
             contextual_prompt = self.personality_manager.generate_contextual_prompt(
@@ -61,18 +72,16 @@ class AdvancedWhatsAppHandler:
                     message_body, from_number, memory_context, contextual_prompt
                 )
             
-            # 4. Atualiza memória com a conversa
-            self.memory_system.process_conversation(
-                from_number, message_body or "[Mensagem de áudio]", response['text']
+            # 4-5. Histórico (ring buffer + insert em lote), memória e perfil do usuário em
+            # background (write-behind); timeout=0: nunca bloqueia o event loop quando a fila está cheia
+            message_type = 'audio' if media_url else 'text'
+            self.history.append_exchange(from_number, message_body or "[Mensagem de áudio]", [response['text']],
+                                         message_type=message_type)
+            self.memory_pipeline.submit(
+                from_number, message_body or "[Mensagem de áudio]", response['text'],
+                message_type=message_type, timeout=0
             )
             
-            # 5. Atualiza perfil do usuário
-            self.personality_manager.update_user_profile(from_number, {
-                'message_text': message_body,
-                'message_type': 'audio' if media_url else 'text',
-                'response_generated': response['text']
-            })
-            
             # 6. Gera resposta TwiML
             twiml_response = self._create_twiml_response(response)
             
@@ -91,25 +100,32 @@ class AdvancedWhatsAppHandler:
         """Processa mensagem de áudio com Realtime API"""
         try:
             # 1. Download do áudio
-            audio_data = self._download_audio(media_url)
+            audio_data = await asyncio.to_thread(self._download_audio, media_url)
             
             # 2. Conecta ao Realtime API se necessário
             if not self.realtime_client.is_connected:
                 await self.realtime_client.connect()
             
             # 3. Injeta contexto da base de conhecimento
-            kb_context = self.knowledge_base.inject_context_for_realtime("[Mensagem de áudio]")
+            kb_context = await asyncio.to_thread(self.knowledge_base.inject_context_for_realtime, "[Mensagem de áudio]")
             await self.realtime_client.inject_context(kb_context)
             
             # 4. Processa áudio via pipeline otimizado
-            realtime_response = await self.pipeline.process_with_streaming(
-                audio_data, context
-            )
+            try:
+                realtime_response = await asyncio.wait_for(
+                    self.pipeline.process_with_streaming(audio_data, context),
+                    timeout=self.voice_pipeline_timeout
+                )
+            except asyncio.TimeoutError:
+                logging.warning(f"Pipeline de voz excedeu {self.voice_pipeline_timeout:.0f}s; usando fallback")
+                realtime_response = {'success': False, 'error': 'timeout'}
             
             if realtime_response.get('success'):
-                # Usa resposta do Realtime API
-                response_text = realtime_response.get('text', 'Resposta processada via Realtime API')
-                audio_response = realtime_response.get('audio')
+                # Resposta do pipeline; o áudio já veio sintetizado frase a frase
+                response_text = realtime_response['text']
+                audio_response = await asyncio.to_thread(
+                    self._publish_audio_segments, realtime_response.get('audio_segments', [])
+                )
             else:
                 # Fallback para sistema atual
                 response_text = await self._fallback_text_response(
@@ -120,7 +136,7 @@ class AdvancedWhatsAppHandler:
             # 4. Gera áudio se não veio do Realtime API
             if not audio_response and len(response_text) < 800:
                 try:
-                    audio_response = self._generate_audio_response_sync(response_text)
+                    audio_response = await asyncio.to_thread(self._generate_audio_response_sync, response_text)
                 except Exception as e:
                     logging.warning(f"Falha na geração de áudio: {e}")
                     audio_response = None
@@ -138,76 +154,75 @@ class AdvancedWhatsAppHandler:
                 from_number, context, ""
             )
     
-    async def _handle_text_message(self, message_text: str, from_number: str,
-                                 context: Dict[str, Any], contextual_prompt: str) -> Dict[str, Any]:
-        """Processa mensagem de texto com personalidade avançada"""
-        try:
-            # Usa OpenAI Client atual para compatibilidade
-            from openai import OpenAI
-            import os
-            
-            client = OpenAI(api_key=os.environ.get('OPENAI_API_KEY'))
-            assistant_id = os.environ.get('ASSISTANT_ID')
-            
-            # Obtém contexto relevante da base de conhecimento
-            kb_context = self.knowledge_base.retrieve_relevant_context(message_text)
-            
-            # Injeta contexto da memória e base de conhecimento no prompt
-            enhanced_prompt = f"""
-{contextual_prompt}
+    def _assemble_prompt(self, message_text: str, from_number: str,
+                         context: Dict[str, Any], contextual_prompt: str) -> str:
+        """Pontua memória, preferências, contexto empresarial e trechos da base e monta o prompt no orçamento"""
+        snippets = [Snippet('personality', contextual_prompt, required=True)]
 
-CONTEXTO DA MEMÓRIA:
-{context.get('recent_conversation', 'Primeira interação')}
+        # Itens mais recentes valem mais (listas da memória vêm em ordem cronológica)
+        lines = [line for line in context.get('recent_conversation', '').split('\n') if line.strip()]
+        for section, items in (('memory', lines),
+                               ('preferences', context.get('user_preferences', [])),
+                               ('business', context.get('business_context', []))):
+            for position, item in enumerate(items, 1):
+                snippets.append(Snippet(section, str(item), score=position / len(items)))
 
-PREFERÊNCIAS CONHECIDAS:
-{'; '.join(context.get('user_preferences', []))}
+        hits = self.knowledge_base.retrieve_scored(message_text, top_k=6)
+        best = max((score for score, _ in hits), default=0.0)
+        for score, chunk in hits:
+            snippets.append(Snippet('knowledge', chunk.text, score=score / best if best > 0 else 0.0))
 
-CONTEXTO EMPRESARIAL:
-{'; '.join(context.get('business_context', []))}
+        snippets.append(Snippet('instructions', (
+            "IMPORTANTE: Baseie suas respostas na base de conhecimento fornecida.\n"
+            "Responda de forma natural mantendo continuidade total da conversa."
+        ), required=True))
 
-BASE DE CONHECIMENTO RELEVANTE:
-{kb_context}
+        assembled = self.context_assembler.assemble(message_text, snippets)
+        usage = assembled.usage()
+        logging.info(f"📐 Contexto {from_number}: {usage['used']}/{usage['budget']} tokens, "
+                     f"{usage['included']} trechos, {usage['dropped']} descartados {usage['by_section']}")
+        return assembled.text
 
-IMPORTANTE: Baseie suas respostas na base de conhecimento fornecida.
-Responda de forma natural mantendo continuidade total da conversa.
-            """
-            
-            # Cria thread com mensagem do usuário apenas (Assistant API não aceita system role)
-            thread = client.beta.threads.create(
-                messages=[
-                    {"role": "user", "content": f"{enhanced_prompt}\n\nUsuário: {message_text}"}
-                ]
-            )
+    @staticmethod
+    def _session_id(from_number: str) -> str:
+        """Mesma chave de sessão do webhook principal (wa:<WaId>)"""
+        return f"wa:{from_number.replace('whatsapp:', '').lstrip('+')}"
+
+    async def _handle_text_message(self, message_text: str, from_number: str,
+                                 context: Dict[str, Any], contextual_prompt: str) -> Dict[str, Any]:
+        """Processa mensagem de texto com personalidade avançada"""
+        try:
+            assistant_id = os.environ.get('ASSISTANT_ID')
             
-            # Executa Assistant (verifica se assistant_id existe)
             if not assistant_id:
                 response_text = "Assistant ID não configurado. Usando sistema de fallback."
             else:
-                run = client.beta.threads.runs.create(
-                    thread_id=thread.id,
-                    assistant_id=assistant_id
+                # Contexto da memória e base de conhecimento, dentro do orçamento de tokens
+                # (busca na base e contagem de tokens fora do event loop)
+                enhanced_prompt = await asyncio.to_thread(
+                    self._assemble_prompt, message_text, from_number, context, contextual_prompt
                 )
-            
-                # Aguarda resposta
-                import time
-                timeout = 15
-                start_time = time.time()
                 
-                while run.status not in ["completed", "failed", "cancelled"]:
-                    if time.time() - start_time > timeout:
-                        break
-                    time.sleep(1)
-                    run = client.beta.threads.runs.retrieve(thread_id=thread.id, run_id=run.id)
+                # Mesma thread por usuário e mesmo motor de run do orquestrador principal
+                # (sessão "wa:<número>"); o contexto vai como instrução do run, fora do
+                # histórico da thread. Chamadas bloqueantes rodam no pool de runs.
+                outcome = await openai_client.ask_assistant_async(
+                    self._session_id(from_number), message_text,
+                    from_user=f"whatsapp:{from_number}", assistant_id=assistant_id,
+                    additional_instructions=enhanced_prompt, timeout=15, fetch_reply=True,
+                )
                 
-                if run.status == "completed":
-                    messages = client.beta.threads.messages.list(thread_id=thread.id)
-                    message_content = messages.data[0].content[0]
-                    
-                    # Verifica tipo de conteúdo de forma segura
-                    if hasattr(message_content, 'text'):
-                        response_text = message_content.text.value
-                    else:
-                        response_text = "Resposta processada com sistema avançado"
+                if outcome and (outcome['texts'] or outcome['media']):
+                    # O assistente já entregou a resposta pelas ferramentas de envio: o TwiML
+                    # volta vazio (senão o usuário recebe a resposta duas vezes)
+                    return {
+                        'text': "\n\n".join(outcome['texts']) or "[Mídia enviada]",
+                        'audio': None,
+                        'source': 'assistant_tools',
+                        'delivered': True
+                    }
+                if outcome and outcome['status'] == 'completed' and outcome.get('reply'):
+                    response_text = outcome['reply']
                 else:
                     response_text = "Sistema temporariamente sobrecarregado. Tente novamente."
             
@@ -264,6 +279,22 @@ Responda de forma natural mantendo continuidade total da conversa.
         
         return None
     
+    def _publish_audio_segments(self, segment_paths: list) -> Optional[str]:
+        """Junta os mp3 dos segmentos do pipeline em um arquivo servido via HTTP"""
+        if not segment_paths:
+            return None
+        try:
+            with tempfile.NamedTemporaryFile(delete=False, suffix='.mp3') as merged:
+                for path in segment_paths:
+                    with open(path, 'rb') as segment:
+                        merged.write(segment.read())
+                    os.unlink(path)
+            static_path = self._move_to_static(merged.name)
+            return f"{self.webhook_url}/static/audio/{static_path}"
+        except Exception as e:
+            logging.error(f"Erro ao juntar áudio do pipeline: {e}")
+            return None
+    
     def _download_audio(self, media_url: str) -> bytes:
         """Download de áudio do Twilio"""
         try:
@@ -295,6 +326,8 @@ Responda de forma natural mantendo continuidade total da conversa.
     def _create_twiml_response(self, response_data: Dict[str, Any]) -> MessagingResponse:
         """Cria resposta TwiML para WhatsApp"""
         twiml_response = MessagingResponse()
+        if response_data.get('delivered'):
+            return twiml_response
         message = Message()
         
         # Adiciona texto
@@ -331,11 +364,9 @@ Responda de forma natural mantendo continuidade total da conversa.
                     for memory in self.memory_system.long_term_memory.values()
                 )
             },
-            'pipeline': {
-                'streaming_enabled': self.pipeline.streaming_enabled,
-                'target_latency': self.pipeline.max_latency_target,
-                'performance_score': self.pipeline._calculate_performance_score()
-            },
+            'memory_pipeline': self.memory_pipeline.get_stats(),
+            'context_budget': self.context_assembler.get_stats(),
+            'pipeline': self.pipeline.get_stats(),
             'elevenlabs': {
                 'configured': bool(os.environ.get('ELEVENLABS_API_KEY')),
                 'voice_id': os.environ.get('ELEVENLABS_VOICE_ID', 'not_set')
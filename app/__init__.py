@@ -30,8 +30,10 @@ def create_app():
     app = Flask(__name__)
     
     # Import blueprint after app creation to avoid circular imports
-    from .routes import whatsapp_bp
+    from .routes import whatsapp_bp, kb_admin_bp, admin_bp
     app.register_blueprint(whatsapp_bp)
+    app.register_blueprint(kb_admin_bp)
+    app.register_blueprint(admin_bp)
     
     @app.get("/health")
     def health():
@@ -1,13 +1,73 @@
 # app/clients/openai_client.py
-import os, time, json, logging, re
+import os, time, logging, re, threading, asyncio, functools
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
 from openai import OpenAI
-from app.functions import AVAILABLE_FUNCTIONS
+from app.functions import AVAILABLE_FUNCTIONS, get_delivery, send_voice_reply, send_whatsapp_message
+from app.core.answer_cache import get_answer_cache
+from app.core.transcript_cache import get_transcript_cache
+from app.core.user_stats import get_user_stats
+from app.core.conversation_store import get_conversation_store
+from app.core import chunked_asr, vad
+from app.core.metrics import LatencyStats
+from app.core.rag import get_rag_service
+from app.utils import jsoncodec
 
 logger = logging.getLogger(__name__)
 
 client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
 ASSISTANT_ID = os.environ.get("OPENAI_ASSISTANT_ID")
 user_thread_map = {} # Em produção, mova para um DB (Redis)
+# Polling do run: verificações rápidas no início, espaçando até POLL_MAX_S
+POLL_MIN_S = 0.3
+POLL_MAX_S = 1.5
+_session_locks = {}
+_session_locks_guard = threading.Lock()
+# Runs passam a maior parte do tempo esperando a API: pool próprio, maior que o padrão do asyncio
+RUN_EXECUTOR = ThreadPoolExecutor(max_workers=int(os.environ.get("ASSISTANT_RUN_WORKERS", "32")),
+                                  thread_name_prefix="assistant-run")
+# Latência das ferramentas ("tool.<nome>"), dos runs do assistente ("run", "tool_round"),
+# do fast path ("fast_path", "fast_path.first_token") e de cada modo de resposta ("mode.<modo>")
+ORCHESTRATOR_METRICS = LatencyStats()
+
+# Fast path: chat completions com streaming, sem thread nem polling
+FAST_PATH_MODEL = os.environ.get("FAST_PATH_MODEL", "gpt-4o-mini")
+FAST_PATH_TIMEOUT_S = float(os.environ.get("FAST_PATH_TIMEOUT_S", "8"))
+FAST_PATH_MAX_TOKENS = int(os.environ.get("FAST_PATH_MAX_TOKENS", "400"))
+FAST_PATH_HISTORY_TURNS = int(os.environ.get("FAST_PATH_HISTORY_TURNS", "10"))
+FAST_PATH_MAX_ROUNDS = 3
+FAST_PATH_SYSTEM_PROMPT = os.environ.get("FAST_PATH_SYSTEM_PROMPT", (
+    "Você é Endrigo Almada, especialista em marketing digital com 22 anos de experiência. "
+    "Responda de forma natural, amigável e profissional em português brasileiro, em mensagens "
+    "curtas de WhatsApp (parágrafos separados por linha em branco viram mensagens separadas). "
+    "Para responder em áudio, gere o áudio com tts_generate_and_store e envie o que ela devolver "
+    "(URL ou handle tts-pendente:<n>) com send_whatsapp_media. Se a pergunta exigir dados da base de conhecimento (preços, cases, "
+    "materiais, detalhes de serviços) ou um arquivo, chame usar_assistente_completo em vez de responder."
+))
+ESCALATE_TOOL = "usar_assistente_completo"
+FAST_PATH_TOOLS = [
+    {"type": "function", "function": {
+        "name": "tts_generate_and_store",
+        "description": ("Gera um áudio com a voz do Endrigo para o texto. Devolve a URL pública do mp3 ou, "
+                        "com a entrega especulativa, um handle (tts-pendente:<n>) que vale como URL nos envios."),
+        "parameters": {"type": "object", "properties": {"text": {"type": "string"}}, "required": ["text"]},
+    }},
+    {"type": "function", "function": {
+        "name": "send_whatsapp_media",
+        "description": "Envia ao usuário uma mídia pela URL (ou pelo handle devolvido por tts_generate_and_store).",
+        "parameters": {"type": "object", "properties": {"media_url": {"type": "string"}}, "required": ["media_url"]},
+    }},
+    {"type": "function", "function": {
+        "name": "send_whatsapp_message",
+        "description": "Envia uma mensagem de texto adicional ao usuário.",
+        "parameters": {"type": "object", "properties": {"body": {"type": "string"}}, "required": ["body"]},
+    }},
+    {"type": "function", "function": {
+        "name": ESCALATE_TOOL,
+        "description": "Passa a mensagem para o assistente completo, com busca na base de conhecimento e arquivos.",
+        "parameters": {"type": "object", "properties": {"motivo": {"type": "string"}}, "required": ["motivo"]},
+    }},
+]
 
 def _sanitize(text: str) -> str:
     if not text: return ""
@@ -20,13 +80,251 @@ def _get_or_create_thread(session_id: str):
     try:
         thread = client.beta.threads.create(metadata={"session_id": session_id})
         user_thread_map[session_id] = thread.id
+        # Thread nova não tem os trechos do RAG enviados antes
+        get_rag_service().forget_session(session_id)
         logger.info(f"[THREAD] Criada thread id={thread.id} para sessão={session_id}")
         return thread.id
     except Exception as e:
         logger.error(f"Erro ao criar thread: {e}", exc_info=True)
         return None
 
+def _session_lock(session_id: str) -> threading.Lock:
+    """Um run por thread: mensagens de uma sessão são processadas em série"""
+    with _session_locks_guard:
+        lock = _session_locks.get(session_id)
+        if lock is None:
+            lock = _session_locks[session_id] = threading.Lock()
+        return lock
+
+def _dispatch_tool_calls(calls, session_id: str, from_user: str, sent_texts: list, sent_media: list) -> list:
+    """Executa as funções pedidas pelo assistente e devolve os tool_outputs"""
+    tool_outputs = []
+    for tool_call in calls:
+        func_name = tool_call.function.name
+        arguments = jsoncodec.loads(tool_call.function.arguments)
+        
+        # Passa o 'to' (número do usuário) para as funções de envio
+        if 'send_whatsapp' in func_name:
+            arguments['to'] = from_user
+        
+        # Passa o 'session_id' para as funções que precisam dele
+        if func_name in ['rag_query']:
+            arguments['session_id'] = session_id
+        
+        function_to_call = AVAILABLE_FUNCTIONS.get(func_name)
+        if function_to_call:
+            logger.info(f"[FUNCTION CALL] Executando '{func_name}' com args: {arguments}")
+            t0 = time.perf_counter()
+            try:
+                output = function_to_call(**arguments)
+                elapsed_ms = (time.perf_counter() - t0) * 1000
+                ORCHESTRATOR_METRICS.record(f"tool.{func_name}", elapsed_ms)
+                tool_outputs.append({"tool_call_id": tool_call.id, "output": str(output)})
+                if func_name in ('send_whatsapp_message', 'send_whatsapp_media') and '"sucesso"' in str(output):
+                    if func_name == 'send_whatsapp_message':
+                        sent_texts.append(arguments.get('body'))
+                    else:
+                        sent_media.append(arguments.get('media_url'))
+                logger.info(f"[FUNCTION SUCCESS] '{func_name}' executada em {elapsed_ms:.0f}ms")
+            except Exception as e:
+                ORCHESTRATOR_METRICS.record(f"tool.{func_name}", (time.perf_counter() - t0) * 1000, ok=False)
+                error_msg = f"Erro na função {func_name}: {e}"
+                logger.error(f"[FUNCTION ERROR] {error_msg}", exc_info=True)
+                tool_outputs.append({"tool_call_id": tool_call.id, "output": error_msg})
+        else:
+            error_msg = f"Função '{func_name}' não encontrada"
+            logger.error(f"[FUNCTION NOT FOUND] {error_msg}")
+            tool_outputs.append({"tool_call_id": tool_call.id, "output": error_msg})
+    return tool_outputs
+
+def _run_until_done(thread_id: str, session_id: str, from_user: str, assistant_id: str,
+                    additional_instructions: str = None, timeout: float = 90.0) -> dict:
+    """
+    Cria o run na thread e acompanha até terminar, executando as ferramentas pedidas.
+    Retorna {"status", "run_id", "texts", "media", "elapsed_ms", "last_error"};
+    status: completed | failed | cancelled | expired | timeout.
+    """
+    params = {"thread_id": thread_id, "assistant_id": assistant_id}
+    if additional_instructions:
+        params["additional_instructions"] = additional_instructions
+    run = client.beta.threads.runs.create(**params)
+    logger.info(f"[RUN CREATE] ID={run.id} para sessão={session_id}")
+
+    start = time.time()
+    run_started = time.perf_counter()
+    sent_texts, sent_media = [], []
+    status = "timeout"
+    poll = POLL_MIN_S
+    while time.time() - start < timeout:
+        run = client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run.id)
+        logger.info(f"[RUN STATUS] ID={run.id}, Status={run.status}")
+
+        if run.status == "requires_action":
+            calls = run.required_action.submit_tool_outputs.tool_calls if run.required_action and run.required_action.submit_tool_outputs else []
+            logger.info(f"[RUN ACTION] Assistente solicitou {len(calls)} função(ões)")
+            round_started = time.perf_counter()
+            tool_outputs = _dispatch_tool_calls(calls, session_id, from_user, sent_texts, sent_media)
+            ORCHESTRATOR_METRICS.record("tool_round", (time.perf_counter() - round_started) * 1000)
+            client.beta.threads.runs.submit_tool_outputs(thread_id=thread_id, run_id=run.id, tool_outputs=tool_outputs)
+            poll = POLL_MIN_S  # o run retoma logo após receber as saídas
+
+        elif run.status in ("completed", "failed", "cancelled", "expired"):
+            status = run.status
+            break
+
+        time.sleep(poll)
+        poll = min(poll * 1.5, POLL_MAX_S)
+
+    if status == "timeout":
+        # Run ativo bloqueia novas mensagens na thread, que é reaproveitada
+        try:
+            client.beta.threads.runs.cancel(thread_id=thread_id, run_id=run.id)
+        except Exception as e:
+            logger.warning(f"[RUN CANCEL] Falha ao cancelar run {run.id}: {e}")
+
+    elapsed_ms = (time.perf_counter() - run_started) * 1000
+    ORCHESTRATOR_METRICS.record("run", elapsed_ms, ok=status == "completed")
+    return {"status": status, "run_id": run.id, "texts": sent_texts, "media": sent_media,
+            "elapsed_ms": elapsed_ms, "last_error": getattr(run, "last_error", None)}
+
+def ask_assistant(session_id: str, content: str, from_user: str = None, assistant_id: str = None,
+                  additional_instructions: str = None, timeout: float = 90.0, fetch_reply: bool = False):
+    """
+    Adiciona a mensagem na thread da sessão (reaproveitada entre mensagens) e
+    executa o run. Com fetch_reply, inclui em "reply" o texto final do assistente.
+    Retorna None se a thread não pôde ser criada.
+    """
+    with _session_lock(session_id):
+        thread_id = _get_or_create_thread(session_id)
+        if not thread_id:
+            return None
+
+        # Adiciona mensagem do usuário
+        logger.info(f"[MESSAGE ADD] Adicionando mensagem do usuário na thread {thread_id}")
+        client.beta.threads.messages.create(thread_id=thread_id, role="user", content=content)
+        outcome = _run_until_done(thread_id, session_id, from_user, assistant_id or ASSISTANT_ID,
+                                  additional_instructions, timeout)
+
+    if fetch_reply and outcome["status"] == "completed":
+        messages = client.beta.threads.messages.list(thread_id=thread_id, run_id=outcome["run_id"], order="desc", limit=1)
+        reply = ""
+        if messages.data:
+            message_content = messages.data[0].content[0]
+            if hasattr(message_content, 'text'):
+                reply = _sanitize(message_content.text.value)
+        outcome["reply"] = reply
+    return outcome
+
+async def ask_assistant_async(session_id: str, content: str, **kwargs):
+    """ask_assistant fora do event loop (no RUN_EXECUTOR), para handlers async"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(RUN_EXECUTOR, functools.partial(ask_assistant, session_id, content, **kwargs))
+
+def _stream_completion(messages: list, on_text) -> tuple:
+    """
+    Uma chamada de chat completions com streaming. `on_text` recebe cada
+    parágrafo completo assim que ele termina de chegar.
+    Retorna (conteúdo, tool_calls montadas, ms até o primeiro token).
+    """
+    started = time.perf_counter()
+    first_token_ms = None
+    content, pending, calls = [], "", {}
+    stream = client.chat.completions.create(
+        model=FAST_PATH_MODEL, messages=messages, tools=FAST_PATH_TOOLS, stream=True,
+        max_tokens=FAST_PATH_MAX_TOKENS, temperature=0.7, timeout=FAST_PATH_TIMEOUT_S,
+    )
+    for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta
+        if first_token_ms is None and (delta.content or delta.tool_calls):
+            first_token_ms = (time.perf_counter() - started) * 1000
+        if delta.content:
+            content.append(delta.content)
+            pending += delta.content
+            while "\n\n" in pending:
+                paragraph, pending = pending.split("\n\n", 1)
+                if paragraph.strip():
+                    on_text(paragraph)
+        # Argumentos das funções chegam em pedaços, indexados pela posição da chamada
+        for part in delta.tool_calls or []:
+            call = calls.setdefault(part.index, {"id": "", "name": "", "arguments": ""})
+            if part.id:
+                call["id"] = part.id
+            if part.function:
+                call["name"] += part.function.name or ""
+                call["arguments"] += part.function.arguments or ""
+    if pending.strip():
+        on_text(pending)
+    tool_calls = [
+        SimpleNamespace(id=call["id"], function=SimpleNamespace(name=call["name"], arguments=call["arguments"] or "{}"))
+        for _, call in sorted(calls.items())
+    ]
+    return "".join(content), tool_calls, first_token_ms
+
+def fast_path_response(session_id: str, user_input: str, from_user: str, voice_reply: bool = False) -> dict:
+    """
+    Responde pelo chat completions com streaming, usando o histórico recente da
+    sessão. Cada parágrafo é enviado ao usuário assim que termina de chegar; com
+    voice_reply, uma nota de voz da resposta segue na fila logo depois do texto.
+    Retorna {"status", "texts", "media", "elapsed_ms", "first_token_ms", "reason"};
+    status: completed | escalate (o modelo pediu o assistente completo) | error.
+    """
+    history = get_conversation_store().last(session_id, FAST_PATH_HISTORY_TURNS)
+    messages = [{"role": "system", "content": FAST_PATH_SYSTEM_PROMPT}, *history,
+                {"role": "user", "content": user_input}]
+    sent_texts, sent_media = [], []
+
+    def send_paragraph(text: str):
+        text = _sanitize(text)
+        if text and '"sucesso"' in send_whatsapp_message(to=from_user, body=text):
+            sent_texts.append(text)
+
+    started = time.perf_counter()
+    first_token_ms, status, reason = None, "completed", None
+    with _session_lock(session_id):
+        try:
+            for _ in range(FAST_PATH_MAX_ROUNDS):
+                content, tool_calls, ttft = _stream_completion(messages, send_paragraph)
+                if first_token_ms is None and ttft is not None:
+                    first_token_ms = ttft
+                    ORCHESTRATOR_METRICS.record("fast_path.first_token", ttft)
+                escalation = next((c for c in tool_calls if c.function.name == ESCALATE_TOOL), None)
+                if escalation:
+                    status = "escalate"
+                    reason = jsoncodec.loads(escalation.function.arguments).get("motivo")
+                    break
+                if not tool_calls:
+                    break
+                messages.append({"role": "assistant", "content": content or None, "tool_calls": [
+                    {"id": c.id, "type": "function", "function": {"name": c.function.name, "arguments": c.function.arguments}}
+                    for c in tool_calls
+                ]})
+                round_started = time.perf_counter()
+                outputs = _dispatch_tool_calls(tool_calls, session_id, from_user, sent_texts, sent_media)
+                ORCHESTRATOR_METRICS.record("tool_round", (time.perf_counter() - round_started) * 1000)
+                messages.extend({"role": "tool", "tool_call_id": o["tool_call_id"], "content": o["output"]} for o in outputs)
+        except Exception as e:
+            logger.error(f"[FAST PATH] Falha na sessão={session_id}: {e}", exc_info=True)
+            status, reason = "error", str(e)
+        if voice_reply and status == "completed" and sent_texts and not sent_media:
+            # Ainda dentro do lock da sessão: nenhuma resposta seguinte entra entre o texto e o áudio
+            sent_media.append(send_voice_reply(from_user, "\n\n".join(sent_texts)))
+
+    if status == "completed" and not (sent_texts or sent_media):
+        status, reason = "error", "resposta vazia"
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    ORCHESTRATOR_METRICS.record("fast_path", elapsed_ms, ok=status != "error")
+    logger.info(f"[FAST PATH] Sessão={session_id} status={status} em {elapsed_ms:.0f}ms "
+                f"(1º token {first_token_ms or 0:.0f}ms)")
+    return {"status": status, "texts": sent_texts, "media": sent_media, "elapsed_ms": elapsed_ms,
+            "first_token_ms": first_token_ms, "reason": reason}
+
 def orchestrate_assistant_response(session_id: str, user_input: str, from_user: str, to_bot: str):
+    """
+    Executa o run do assistente para a mensagem. Retorna o que foi enviado ao
+    usuário ({"texts", "media", "elapsed_ms"}) quando o run completa, senão None.
+    """
     if not ASSISTANT_ID:
         logger.error("[ORQUESTRADOR] OPENAI_ASSISTANT_ID ausente.")
         return
@@ -34,78 +332,54 @@ def orchestrate_assistant_response(session_id: str, user_input: str, from_user:
     try:
         logger.info(f"[ORQUESTRADOR INICIADO] Sessão={session_id}, Input={user_input[:50]}...")
         
-        thread_id = _get_or_create_thread(session_id)
-        if not thread_id:
+        outcome = ask_assistant(session_id, user_input, from_user)
+        if outcome is None:
             from app.functions import send_whatsapp_message
             send_whatsapp_message(to=from_user, body="Desculpe, tive um problema técnico. Pode tentar novamente?")
             return
 
-        # Adiciona mensagem do usuário
-        logger.info(f"[MESSAGE ADD] Adicionando mensagem do usuário na thread {thread_id}")
-        client.beta.threads.messages.create(thread_id=thread_id, role="user", content=user_input)
-
-        # Cria execução
-        run = client.beta.threads.runs.create(thread_id=thread_id, assistant_id=ASSISTANT_ID)
-        logger.info(f"[RUN CREATE] ID={run.id} para sessão={session_id}")
-
-        start = time.time()
-        while time.time() - start < 90: # Timeout de 90s
-            run = client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run.id)
-            logger.info(f"[RUN STATUS] ID={run.id}, Status={run.status}")
-
-            if run.status == "requires_action":
-                tool_outputs = []
-                calls = run.required_action.submit_tool_outputs.tool_calls if run.required_action and run.required_action.submit_tool_outputs else []
-                logger.info(f"[RUN ACTION] Assistente solicitou {len(calls)} função(ões)")
-                
-                for tool_call in calls:
-                    func_name = tool_call.function.name
-                    arguments = json.loads(tool_call.function.arguments)
-                    
-                    # Passa o 'to' (número do usuário) para as funções de envio
-                    if 'send_whatsapp' in func_name:
-                        arguments['to'] = from_user
-                    
-                    # Passa o 'session_id' para as funções que precisam dele
-                    if func_name in ['rag_query']:
-                        arguments['session_id'] = session_id
-                    
-                    function_to_call = AVAILABLE_FUNCTIONS.get(func_name)
-                    if function_to_call:
-                        logger.info(f"[FUNCTION CALL] Executando '{func_name}' com args: {arguments}")
-                        try:
-                            output = function_to_call(**arguments)
-                            tool_outputs.append({"tool_call_id": tool_call.id, "output": str(output)})
-                            logger.info(f"[FUNCTION SUCCESS] '{func_name}' executada com sucesso")
-                        except Exception as e:
-                            error_msg = f"Erro na função {func_name}: {e}"
-                            logger.error(f"[FUNCTION ERROR] {error_msg}", exc_info=True)
-                            tool_outputs.append({"tool_call_id": tool_call.id, "output": error_msg})
-                    else:
-                        error_msg = f"Função '{func_name}' não encontrada"
-                        logger.error(f"[FUNCTION NOT FOUND] {error_msg}")
-                        tool_outputs.append({"tool_call_id": tool_call.id, "output": error_msg})
-                
-                client.beta.threads.runs.submit_tool_outputs(thread_id=thread_id, run_id=run.id, tool_outputs=tool_outputs)
-
-            elif run.status == "completed":
-                logger.info(f"[RUN COMPLETED] ID={run.id}. Orquestração finalizada.")
-                return  # O trabalho acabou, as functions já enviaram as mensagens
-
-            elif run.status in ("failed","cancelled","expired"):
-                logger.error(f"[RUN FAILED] ID={run.id}, Status={run.status}, Erro: {run.last_error}")
-                from app.functions import send_whatsapp_message
-                send_whatsapp_message(to=from_user, body="Desculpe, minha linha de raciocínio foi interrompida. Pode tentar de novo?")
-                return
-            
-            time.sleep(1.5) # Aumenta um pouco a pausa entre as verificações
-
-        logger.error(f"[RUN TIMEOUT] A execução do Run {run.id} excedeu 90 segundos.")
+        if outcome["status"] == "completed":
+            logger.info(f"[RUN COMPLETED] ID={outcome['run_id']}. Orquestração finalizada.")
+            # O trabalho acabou, as functions já enviaram as mensagens
+            return {"texts": outcome["texts"], "media": outcome["media"], "elapsed_ms": outcome["elapsed_ms"]}
+
         from app.functions import send_whatsapp_message
-        send_whatsapp_message(to=from_user, body="Desculpe, demorei muito para processar. Pode tentar uma pergunta mais simples?")
+        if outcome["status"] == "timeout":
+            logger.error(f"[RUN TIMEOUT] A execução do Run {outcome['run_id']} excedeu 90 segundos.")
+            send_whatsapp_message(to=from_user, body="Desculpe, demorei muito para processar. Pode tentar uma pergunta mais simples?")
+        else:
+            logger.error(f"[RUN FAILED] ID={outcome['run_id']}, Status={outcome['status']}, Erro: {outcome['last_error']}")
+            send_whatsapp_message(to=from_user, body="Desculpe, minha linha de raciocínio foi interrompida. Pode tentar de novo?")
 
     except Exception as e:
         logger.error(f"[ORQUESTRADOR CRASH] Erro inesperado: {e}", exc_info=True)
         from app.functions import send_whatsapp_message
         send_whatsapp_message(to=from_user, body="Erro interno. Tente novamente.")
-        _send_fallback_message(from_user, "Ops, tive um problema interno. Pode tentar novamente?")
\ No newline at end of file
+        _send_fallback_message(from_user, "Ops, tive um problema interno. Pode tentar novamente?")
+
+def record_exchange(session_id: str, user_input: str, texts: list):
+    """Registra na thread a pergunta e a resposta servidas fora do run (cache, fast path), para o próximo run ter o histórico"""
+    thread_id = user_thread_map.get(session_id)
+    if not thread_id:
+        return
+    try:
+        with _session_lock(session_id):
+            client.beta.threads.messages.create(thread_id=thread_id, role="user", content=user_input)
+            client.beta.threads.messages.create(thread_id=thread_id, role="assistant", content="\n\n".join(texts))
+    except Exception as e:
+        logger.warning(f"[THREAD] Falha ao registrar a troca na thread {thread_id}: {e}")
+
+def get_orchestrator_metrics() -> dict:
+    """Latências do orquestrador (por ferramenta e por run) + cache do RAG"""
+    return {
+        "latency": ORCHESTRATOR_METRICS.snapshot(),
+        "rag": get_rag_service().get_stats(),
+        "answer_cache": get_answer_cache().get_stats(),
+        "threads": len(user_thread_map),
+        "conversations": get_conversation_store().get_stats(),
+        "delivery": get_delivery().get_stats(),
+        "vad": vad.get_stats(),
+        "asr_chunks": chunked_asr.get_stats(),
+        "transcripts": get_transcript_cache().get_stats(),
+        "users": {**get_user_stats().snapshot(), **get_user_stats().get_stats()},
+    }
@@ -1,11 +1,13 @@
 # app/clients/twilio_client.py
 import os
+import hashlib
 import logging
 import requests
 import uuid
 import subprocess
 import tempfile
 from twilio.rest import Client
+from app.core import chunked_asr, vad
 # Removed circular import - OpenAI client is handled elsewhere
 
 logger = logging.getLogger(__name__)
@@ -14,6 +16,10 @@ TWILIO_ACCOUNT_SID = os.environ.get("TWILIO_ACCOUNT_SID")
 TWILIO_AUTH_TOKEN = os.environ.get("TWILIO_AUTH_TOKEN")
 twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
 
+# Respostas de erro da transcrição (não entram no cache de transcrições)
+AUDIO_NOT_FOUND_MESSAGE = "Erro: Arquivo de áudio não encontrado."
+TRANSCRIPTION_FAILED_MESSAGE = "Desculpe, tive um problema para entender seu áudio."
+
 def _transcode_to_wav(src_path: str):
     dst_path = src_path.rsplit(".", 1)[0] + ".wav"
     command = ["ffmpeg", "-y", "-i", src_path, "-ac", "1", "-ar", "16000", "-acodec", "pcm_s16le", dst_path]
@@ -24,34 +30,70 @@ def _transcode_to_wav(src_path: str):
         logger.error(f"Erro no FFMPEG: {e.stderr}")
         raise
 
-def download_and_prepare_audio(media_url: str):
+def download_audio(media_url: str):
+    """Baixa a mídia sem transcodificar; devolve (caminho, sha256 dos bytes) ou None"""
     try:
         tmpdir = tempfile.mkdtemp(prefix="wa_audio_")
+        digest = hashlib.sha256()
         with requests.get(media_url, auth=(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN), timeout=20, stream=True) as r:
             r.raise_for_status()
             ext = ".ogg"
             raw_path = os.path.join(tmpdir, f"{uuid.uuid4()}{ext}")
             with open(raw_path, "wb") as f:
                 for chunk in r.iter_content(chunk_size=8192):
+                    digest.update(chunk)
                     f.write(chunk)
+        return raw_path, digest.hexdigest()
+    except Exception as e:
+        logger.error(f"❌ Falha ao baixar áudio: {e}", exc_info=True)
+        return None
 
+def prepare_audio(raw_path: str):
+    """Transcodifica para WAV 16kHz mono e remove o original; None em caso de erro"""
+    try:
         wav_path = _transcode_to_wav(raw_path)
         os.remove(raw_path)
         return wav_path
     except Exception as e:
-        logger.error(f"❌ Falha ao baixar/transcodificar áudio: {e}", exc_info=True)
+        logger.error(f"❌ Falha ao transcodificar áudio: {e}", exc_info=True)
+        return None
+
+def download_and_prepare_audio(media_url: str):
+    downloaded = download_audio(media_url)
+    return prepare_audio(downloaded[0]) if downloaded else None
+
+def _long_audio_pcm(path: str):
+    """PCM de áudios acima de ASR_LONG_AUDIO_S (transcritos em blocos paralelos); None para os curtos"""
+    try:
+        pcm, sample_rate = vad.read_wav(path)
+    except Exception:
         return None
+    return (pcm, sample_rate) if len(pcm) / sample_rate > chunked_asr.LONG_AUDIO_S else None
 
 def transcrever_audio_com_whisper(caminho_do_audio: str):
     """Transcreve áudio usando OpenAI Whisper - versão sem circular import"""
     from openai import OpenAI
     
     if not caminho_do_audio or not os.path.exists(caminho_do_audio):
-        return "Erro: Arquivo de áudio não encontrado."
+        return AUDIO_NOT_FOUND_MESSAGE
     try:
         # Initialize OpenAI client locally to avoid circular import
-        openai_client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
-        
+        # WHISPER_BASE_URL aponta para um servidor compatível (ex.: stand-in local nos benchmarks)
+        openai_client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"), base_url=os.environ.get("WHISPER_BASE_URL") or None)
+
+        long_audio = _long_audio_pcm(caminho_do_audio)
+        if long_audio:
+            # Notas de voz longas: blocos cortados nas pausas, transcritos em paralelo
+            transcribe = lambda data: str(openai_client.audio.transcriptions.create(
+                model="whisper-1", file=("bloco.wav", data), response_format="text"))
+            text, info = chunked_asr.transcribe_long(*long_audio, transcribe)
+            if info['partial']:
+                # Os trechos perdidos ficam marcados no texto (MISSING_CHUNK): nada é devolvido como completo
+                logger.warning(f"⚠️ Transcrição parcial: {info['failed']}/{info['chunks']} blocos sem texto")
+            return text.strip()
+
+        # Silêncio das pontas e pausas longas não vão para o upload
+        vad.compact_wav_file(caminho_do_audio)
         with open(caminho_do_audio, "rb") as audio_file:
             transcription = openai_client.audio.transcriptions.create(
                 model="whisper-1", file=audio_file, response_format="text"
@@ -59,7 +101,7 @@ def transcrever_audio_com_whisper(caminho_do_audio: str):
         return str(transcription).strip()
     except Exception as e:
         logger.error(f"❌ Erro na transcrição com Whisper: {e}", exc_info=True)
-        return "Desculpe, tive um problema para entender seu áudio."
+        return TRANSCRIPTION_FAILED_MESSAGE
     finally:
         if caminho_do_audio and os.path.exists(caminho_do_audio):
             try:
@@ -0,0 +1,250 @@
+# app/core/answer_cache.py
+"""
+Cache de respostas para perguntas repetidas ("quem é você", "o que você faz").
+
+Fica na frente do orquestrador: a pergunta é normalizada (minúsculas, sem
+acentos/pontuação, abreviações de WhatsApp expandidas) e procurada primeiro
+pelo hash exato e, opcionalmente, por quase-duplicata (cosseno entre os
+embeddings locais de hashing, os mesmos da busca semântica). Um acerto
+devolve o texto e a URL do áudio (TTS) da resposta original, sem novo run
+do assistente.
+
+A tabela é global (compartilhada entre usuários), então só entram e só saem
+respostas sem estado: geradas sem histórico da conversa nem contexto do
+usuário (a primeira mensagem da sessão). "Sim", "ok" ou "quanto custa?" no
+meio de uma conversa dependem do que veio antes e nunca passam pelo cache.
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.core.bm25 import fold_accents
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r'\w+')
+_DIGITS_RE = re.compile(r'\d+')
+_NEGATIONS = frozenset(('nao', 'nunca', 'nem', 'sem', 'ninguem', 'nada'))
+# Abreviações comuns no WhatsApp (já sem acento)
+_WA_ABBREVIATIONS = {
+    'vc': 'voce', 'vcs': 'voces', 'voc': 'voce', 'tb': 'tambem', 'tbm': 'tambem',
+    'pq': 'porque', 'q': 'que', 'oq': 'o que', 'td': 'tudo', 'blz': 'beleza',
+    'msg': 'mensagem', 'cmg': 'comigo', 'hj': 'hoje', 'qdo': 'quando', 'qnd': 'quando',
+    'vlw': 'valeu', 'obg': 'obrigado', 'pfv': 'por favor', 'pf': 'por favor',
+}
+
+
+def normalize_question(text: str) -> str:
+    """'Quem é vc??' -> 'quem e voce'"""
+    words = _WORD_RE.findall(fold_accents((text or '').lower()))
+    return " ".join(_WA_ABBREVIATIONS.get(word, word) for word in words)
+
+
+def fingerprint(normalized: str) -> str:
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:16]
+
+
+class CachedAnswer:
+    __slots__ = ('question', 'normalized', 'texts', 'media', 'llm_ms', 'created_at', 'hits', 'slot')
+
+    def __init__(self, question: str, normalized: str, texts: List[str], media: List[str], llm_ms: float):
+        self.question = question
+        self.normalized = normalized
+        self.texts = texts
+        self.media = media
+        self.llm_ms = llm_ms
+        self.created_at = time.time()
+        self.hits = 0
+        self.slot = -1  # linha na matriz de embeddings do cache
+
+
+class AnswerCache:
+    """
+    Respostas em cache por pergunta normalizada, válidas por `ttl` segundos.
+
+    Só perguntas curtas (até `max_words` palavras) e sem estado (`stateless`:
+    a sessão não tem histórico nem contexto) entram ou são servidas. Sessões
+    podem ser marcadas para ignorar o cache (`set_bypass`). `similarity` <= 0
+    desliga a busca por quase-duplicata.
+    """
+
+    def __init__(self, max_entries: int = 512, ttl: Optional[float] = None,
+                 similarity: Optional[float] = None, max_words: int = 12, embedder=None):
+        self.enabled = os.environ.get('ANSWER_CACHE_ENABLED', '1') != '0'
+        self.max_entries = max_entries
+        self.ttl = ttl if ttl is not None else float(os.environ.get('ANSWER_CACHE_TTL', '10800'))
+        self.similarity = (similarity if similarity is not None
+                           else float(os.environ.get('ANSWER_CACHE_SIMILARITY', '0.9')))
+        self.max_words = max_words
+        self._embedder = embedder
+        self._entries: 'OrderedDict[str, CachedAnswer]' = OrderedDict()
+        self._bypass: set = set()
+        self._lock = threading.Lock()
+        # Uma linha de embedding por entrada (linhas livres zeradas): a busca por
+        # quase-duplicata é um único produto matriz-vetor
+        self._matrix: Optional[np.ndarray] = None
+        self._slot_keys: List[Optional[str]] = [None] * max_entries
+        self._free_slots = list(range(max_entries - 1, -1, -1))
+        self.stats_counters = {
+            'lookups': 0, 'exact_hits': 0, 'near_hits': 0, 'misses': 0, 'bypassed': 0,
+            'stateful': 0, 'stored': 0, 'expired': 0, 'saved_llm_ms': 0.0,
+        }
+
+    @property
+    def embedder(self):
+        if self._embedder is None:
+            from app.core.embeddings import HashingEmbedder
+            # Perguntas curtas são quase só stopwords ("quem é você"): usa todas as palavras
+            self._embedder = HashingEmbedder(tokenizer=str.split)
+        return self._embedder
+
+    # --- Sessões ------------------------------------------------------------------
+
+    def set_bypass(self, session_id: str, bypass: bool = True):
+        """Faz a sessão ignorar o cache (sempre run completo do assistente)"""
+        with self._lock:
+            if bypass:
+                self._bypass.add(session_id)
+            else:
+                self._bypass.discard(session_id)
+
+    def is_bypassed(self, session_id: str) -> bool:
+        return not self.enabled or session_id in self._bypass
+
+    def _cacheable(self, normalized: str) -> bool:
+        return bool(normalized) and len(normalized.split()) <= self.max_words
+
+    # --- Consulta -----------------------------------------------------------------
+
+    def lookup(self, session_id: str, question: str, stateless: bool = False) -> Optional[CachedAnswer]:
+        if self.is_bypassed(session_id):
+            self.stats_counters['bypassed'] += 1
+            return None
+        if not stateless:
+            # Com histórico a mesma pergunta curta pode pedir outra resposta
+            self.stats_counters['stateful'] += 1
+            return None
+        normalized = normalize_question(question)
+        if not self._cacheable(normalized):
+            return None
+
+        self.stats_counters['lookups'] += 1
+        key = fingerprint(normalized)
+        with self._lock:
+            entry = self._fresh(key)
+            kind = 'exact_hits'
+            if entry is None and self.similarity > 0 and self._entries:
+                entry = self._nearest(normalized)
+                kind = 'near_hits'
+            if entry is None:
+                self.stats_counters['misses'] += 1
+                return None
+            entry.hits += 1
+            self.stats_counters[kind] += 1
+            self.stats_counters['saved_llm_ms'] += entry.llm_ms
+        logger.info(f"[ANSWER CACHE] {kind.split('_')[0]} para sessão={session_id}: "
+                    f"'{question[:40]}' ~ '{entry.question[:40]}' (economia de {entry.llm_ms:.0f}ms)")
+        return entry
+
+    def _fresh(self, key: str) -> Optional[CachedAnswer]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry.created_at > self.ttl:
+            self._remove(key)
+            self.stats_counters['expired'] += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _nearest(self, normalized: str) -> Optional[CachedAnswer]:
+        if self._matrix is None:
+            return None
+        scores = self._matrix @ self.embedder.embed([normalized])[0]
+        best = int(np.argmax(scores))
+        key = self._slot_keys[best]
+        if key is None or scores[best] < self.similarity:
+            return None
+        candidate = self._entries[key]
+        # Números ou negações diferentes ("plano 1" x "plano 2", "faz" x "não faz") mudam a pergunta
+        if _DIGITS_RE.findall(candidate.normalized) != _DIGITS_RE.findall(normalized):
+            return None
+        if _NEGATIONS.intersection(candidate.normalized.split()) != _NEGATIONS.intersection(normalized.split()):
+            return None
+        return self._fresh(key)
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        if entry.slot >= 0:
+            self._matrix[entry.slot] = 0.0
+            self._slot_keys[entry.slot] = None
+            self._free_slots.append(entry.slot)
+
+    def store(self, session_id: str, question: str, texts: List[str], media: Optional[List[str]] = None,
+              llm_ms: float = 0.0, stateless: bool = False) -> bool:
+        """
+        Guarda a resposta enviada para a pergunta; retorna True se entrou no cache.
+        Respostas geradas com histórico ou contexto do usuário (`stateless` falso) não entram.
+        """
+        if self.is_bypassed(session_id) or not stateless or not texts:
+            return False
+        normalized = normalize_question(question)
+        if not self._cacheable(normalized):
+            return False
+        key = fingerprint(normalized)
+        entry = CachedAnswer(question, normalized, list(texts), list(media or []), llm_ms)
+        vector = self.embedder.embed([normalized])[0] if self.similarity > 0 else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            while len(self._entries) >= self.max_entries:
+                self._remove(next(iter(self._entries)))
+            self._entries[key] = entry
+            if vector is not None:
+                if self._matrix is None:
+                    self._matrix = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+                entry.slot = self._free_slots.pop()
+                self._matrix[entry.slot] = vector
+                self._slot_keys[entry.slot] = key
+            self.stats_counters['stored'] += 1
+        return True
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._remove(key)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self.stats_counters)
+            top = sorted(self._entries.values(), key=lambda e: -e.hits)[:10]
+        hits = counters['exact_hits'] + counters['near_hits']
+        return {
+            **counters,
+            'enabled': self.enabled,
+            'entries': len(self._entries),
+            'bypassed_sessions': len(self._bypass),
+            'hit_rate': round(hits / counters['lookups'], 3) if counters['lookups'] else 0.0,
+            'saved_llm_ms': round(counters['saved_llm_ms'], 1),
+            'top': [{'pergunta': e.question, 'hits': e.hits} for e in top],
+        }
+
+
+_cache: Optional[AnswerCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> AnswerCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = AnswerCache()
+    return _cache
@@ -0,0 +1,188 @@
+# app/core/bm25.py
+"""
+Índice invertido com ranking BM25 para a base de conhecimento (RAG).
+
+O texto é normalizado uma única vez na indexação (minúsculas, sem acentos,
+sem stopwords). Cada consulta percorre apenas as listas de postings dos seus
+próprios termos, e o top-k sai de um heap.
+"""
+import heapq
+import math
+import re
+import unicodedata
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+_TOKEN_RE = re.compile(r'\w+')
+_COMBINING_RE = re.compile(r'[\u0300-\u036f]')
+
+# Stopwords do português já sem acento (o filtro roda depois da normalização)
+STOPWORDS_PT = frozenset("""
+a ao aos as ate com como da das de dela dele deles do dos e ela elas ele eles em
+entre era eram essa esse esta estao este eu foi foram ha isso isto ja la lhe mais
+mas me mesmo meu minha muito na nas nem no nos nossa nosso num numa o os ou para
+pela pelas pelo pelos por qual quando que quem se sem ser seu seus so sua suas tambem
+te tem ter teu tu tua um uma uns umas voce voces vos sao sera pra pro
+""".split())
+
+
+def fold_accents(text: str) -> str:
+    """Remove acentos e cedilha ('ação' -> 'acao')"""
+    return _COMBINING_RE.sub('', unicodedata.normalize('NFD', text))
+
+
+def tokenize(text: str) -> List[str]:
+    """Minúsculas, sem acentos, sem stopwords e sem tokens de 1 caractere"""
+    return [
+        token for token in _TOKEN_RE.findall(fold_accents(text.lower()))
+        if len(token) > 1 and token not in STOPWORDS_PT
+    ]
+
+
+class BM25Index:
+    """
+    Índice invertido BM25 (Okapi) sobre uma lista de documentos.
+
+    postings[termo] = (ids dos documentos, frequências) em arrays compactos;
+    a normalização por tamanho de documento é pré-calculada e só é refeita
+    quando documentos novos entram no índice.
+    """
+
+    def __init__(self, documents: Optional[Iterable[str]] = None, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Tuple[array, array]] = {}
+        self.doc_lengths = array('I')
+        self._total_length = 0
+        self._norms: Optional[List[float]] = None
+        for document in documents or ():
+            self.add(document)
+
+    @classmethod
+    def from_postings(cls, postings: Dict[str, Tuple[Sequence[int], Sequence[int]]],
+                      doc_lengths: Sequence[int], k1: float = 1.5, b: float = 0.75) -> 'BM25Index':
+        """
+        Reconstrói o índice a partir de postings já prontos (ex.: memoryviews
+        de um arquivo mapeado em memória), sem copiá-los.
+        """
+        index = cls(k1=k1, b=b)
+        index.postings = postings
+        index.doc_lengths = array('I', doc_lengths)
+        index._total_length = sum(index.doc_lengths)
+        return index
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def add(self, document: str) -> int:
+        """Indexa um documento e retorna seu id (posição na lista)"""
+        doc_id = len(self.doc_lengths)
+        tokens = tokenize(document)
+        for term, tf in Counter(tokens).items():
+            entry = self.postings.get(term)
+            if entry is None:
+                entry = self.postings[term] = (array('I'), array('I'))
+            elif not isinstance(entry[0], array):
+                # Postings mapeadas do disco são somente leitura: copia ao alterar
+                entry = self.postings[term] = (array('I', entry[0]), array('I', entry[1]))
+            entry[0].append(doc_id)
+            entry[1].append(tf)
+        self.doc_lengths.append(len(tokens))
+        self._total_length += len(tokens)
+        self._norms = None
+        return doc_id
+
+    def idf(self, term: str) -> float:
+        entry = self.postings.get(term)
+        if entry is None:
+            return 0.0
+        n, df = len(self.doc_lengths), len(entry[0])
+        # Variante do Lucene: sempre positiva, mesmo para termos muito comuns
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def _doc_norms(self) -> List[float]:
+        if self._norms is None:
+            avgdl = self._total_length / len(self.doc_lengths) if self.doc_lengths else 1.0
+            k1, b = self.k1, self.b
+            self._norms = [k1 * (1 - b + b * dl / (avgdl or 1.0)) for dl in self.doc_lengths]
+        return self._norms
+
+    def search(self, query: str, top_k: int = 3) -> List[Tuple[float, int]]:
+        """Retorna [(score, doc_id)] dos top_k documentos, do mais relevante ao menos"""
+        if not self.doc_lengths or top_k <= 0:
+            return []
+
+        norms = self._doc_norms()
+        k1_plus_1 = self.k1 + 1
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            entry = self.postings.get(term)
+            if entry is None:
+                continue
+            idf = self.idf(term)
+            get = scores.get
+            for doc_id, tf in zip(*entry):
+                scores[doc_id] = get(doc_id, 0.0) + idf * tf * k1_plus_1 / (tf + norms[doc_id])
+
+        # Empates ficam com o documento que aparece primeiro no corpus
+        best = heapq.nsmallest(top_k, scores.items(), key=lambda item: (-item[1], item[0]))
+        return [(score, doc_id) for doc_id, score in best]
+
+
+class SegmentedBM25:
+    """
+    BM25 sobre vários índices imutáveis (um por arquivo-fonte).
+
+    N, df e tamanho médio são globais, então o ranking é o mesmo de um índice
+    único com todos os documentos; trocar um arquivo troca só o seu segmento,
+    sem mesclar postings. O doc_id retornado é global (base do segmento + id local).
+    """
+
+    def __init__(self, segments: List[BM25Index], k1: float = 1.5, b: float = 0.75):
+        self.segments = segments
+        self.k1 = k1
+        self.b = b
+        self.bases = []
+        total_docs, total_length = 0, 0
+        for segment in segments:
+            self.bases.append(total_docs)
+            total_docs += len(segment)
+            total_length += segment._total_length
+        self.n_docs = total_docs
+        avgdl = (total_length / total_docs if total_docs else 1.0) or 1.0
+        self._norms = [
+            [k1 * (1 - b + b * dl / avgdl) for dl in segment.doc_lengths] for segment in segments
+        ]
+
+    def __len__(self):
+        return self.n_docs
+
+    def idf(self, term: str) -> float:
+        df = sum(len(entry[0]) for entry in (s.postings.get(term) for s in self.segments) if entry)
+        if not df:
+            return 0.0
+        return math.log(1 + (self.n_docs - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, top_k: int = 3) -> List[Tuple[float, int]]:
+        """Retorna [(score, doc_id global)] dos top_k documentos"""
+        if not self.n_docs or top_k <= 0:
+            return []
+
+        k1_plus_1 = self.k1 + 1
+        scores: Dict[int, float] = {}
+        get = scores.get
+        for term in set(tokenize(query)):
+            idf = self.idf(term)
+            if not idf:
+                continue
+            for segment, base, norms in zip(self.segments, self.bases, self._norms):
+                entry = segment.postings.get(term)
+                if entry is None:
+                    continue
+                for doc_id, tf in zip(*entry):
+                    key = base + doc_id
+                    scores[key] = get(key, 0.0) + idf * tf * k1_plus_1 / (tf + norms[doc_id])
+
+        best = heapq.nsmallest(top_k, scores.items(), key=lambda item: (-item[1], item[0]))
+        return [(score, doc_id) for doc_id, score in best]
@@ -0,0 +1,177 @@
+# app/core/chunked_asr.py
+"""
+Transcrição em blocos para notas de voz longas.
+
+Um áudio longo enviado inteiro ao Whisper é transcrito em série, então o tempo
+cresce com a duração. Aqui o PCM é cortado nas pausas que o VAD encontra
+(nunca no meio de uma palavra) em blocos de ~`target_s`, cada bloco é
+compactado como no VAD normal e os blocos são transcritos em paralelo, no
+máximo `parallelism` de cada vez por áudio (e `ASR_WORKERS` no processo todo).
+Os textos voltam na ordem dos blocos.
+
+`transcribe` é qualquer função (bytes WAV) -> texto; o cliente do Whisper fica
+em app/clients/twilio_client.py.
+"""
+import io
+import logging
+import os
+import threading
+import time
+import wave
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core import vad
+
+logger = logging.getLogger(__name__)
+
+LONG_AUDIO_S = float(os.environ.get('ASR_LONG_AUDIO_S', '45'))
+CHUNK_TARGET_S = float(os.environ.get('ASR_CHUNK_TARGET_S', '20'))
+CHUNK_MAX_S = float(os.environ.get('ASR_CHUNK_MAX_S', '40'))
+PARALLELISM = int(os.environ.get('ASR_PARALLELISM', '4'))
+# Marca, no lugar do bloco, o trecho que não foi transcrito (texto parcial não vai para o cache)
+MISSING_CHUNK = "[trecho inaudível]"
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+_stats_lock = threading.Lock()
+stats_counters = {'long_clips': 0, 'chunks': 0, 'chunk_retries': 0, 'chunk_errors': 0,
+                  'audio_s': 0.0, 'wall_s': 0.0}
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=int(os.environ.get('ASR_WORKERS', '8')),
+                                               thread_name_prefix="asr-chunk")
+    return _executor
+
+
+def encode_wav(pcm: np.ndarray, sample_rate: int) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm.astype('<i2').tobytes())
+    return buffer.getvalue()
+
+
+def _hard_cut(pcm: np.ndarray, sample_rate: int, start: int, end: int) -> int:
+    """Fala contínua sem pausa: corta no quadro de menor energia dos últimos 2s da janela"""
+    frame = sample_rate // 50
+    lo = max(start + frame, end - 2 * sample_rate)
+    window = pcm[lo:end - (end - lo) % frame].astype(np.float32)
+    if len(window) < frame:
+        return end
+    energy = np.mean(window.reshape(-1, frame) ** 2, axis=1)
+    return lo + int(np.argmin(energy)) * frame + frame // 2
+
+
+def plan_chunks(pcm: np.ndarray, sample_rate: int, target_s: Optional[float] = None,
+                max_s: Optional[float] = None, config: Optional[vad.VadConfig] = None) -> List[List[Tuple[int, int]]]:
+    """
+    Agrupa os trechos de fala do VAD em blocos: cada bloco fecha na pausa mais
+    longa entre `target_s` e `max_s`. Trechos maiores que `max_s` são cortados
+    no ponto de menor energia. Devolve, por bloco, os trechos (início, fim).
+    """
+    target = int((target_s or CHUNK_TARGET_S) * sample_rate)
+    limit = int((max_s or CHUNK_MAX_S) * sample_rate)
+    segments = []
+    for start, end in vad.speech_segments(pcm, sample_rate, config):
+        while end - start > limit:
+            cut = _hard_cut(pcm, sample_rate, start, start + limit)
+            segments.append((start, cut))
+            start = cut
+        segments.append((start, end))
+
+    chunks, current = [], []
+    for segment in segments:
+        current.append(segment)
+        while len(current) > 1 and current[-1][1] - current[0][0] > limit:
+            # Fecha na maior pausa entre o alvo e o limite; sem nenhuma, no último trecho que cabe
+            span = lambda i: current[i][1] - current[0][0]
+            gaps = [(current[i + 1][0] - current[i][1], i + 1) for i in range(len(current) - 1)
+                    if target <= span(i) <= limit]
+            split = max(gaps)[1] if gaps else max(1, sum(span(i) <= limit for i in range(len(current) - 1)))
+            chunks.append(current[:split])
+            current = current[split:]
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def transcribe_long(pcm: np.ndarray, sample_rate: int, transcribe: Callable[[bytes], str],
+                    parallelism: Optional[int] = None, config: Optional[vad.VadConfig] = None,
+                    retries: int = 1) -> Tuple[str, Dict[str, Any]]:
+    """
+    Transcreve em blocos paralelos e junta o texto na ordem. Um bloco que falha
+    é repetido `retries` vezes; se ainda falhar, entra no texto como
+    MISSING_CHUNK e o resultado sai com 'partial' = True.
+    Devolve (texto, {'chunks', 'failed', 'partial', 'audio_s', 'sent_s', 'wall_s'}).
+    """
+    config = config or vad.VadConfig.from_env()
+    parallelism = parallelism or PARALLELISM
+    started = time.perf_counter()
+    groups = plan_chunks(pcm, sample_rate, config=config)
+    if not groups:
+        groups = [[(0, len(pcm))]]
+    audio = [vad.join_segments(pcm, group, sample_rate, config.keep_pause_ms) for group in groups]
+    sent = sum(len(chunk) for chunk in audio)
+    vad.record(vad.VadResult(sample_rate, len(pcm), sent, [s for group in groups for s in group]))
+
+    def run(index: int) -> str:
+        data = encode_wav(audio[index], sample_rate)
+        for attempt in range(retries + 1):
+            try:
+                return transcribe(data).strip()
+            except Exception as e:
+                if attempt == retries:
+                    raise
+                with _stats_lock:
+                    stats_counters['chunk_retries'] += 1
+                logger.warning(f"[ASR] Bloco {index + 1}/{len(audio)} falhou ({e}); repetindo")
+
+    # Janela deslizante: no máximo `parallelism` blocos deste áudio em andamento
+    executor = _get_executor()
+    texts: List[Optional[str]] = [None] * len(audio)
+    pending, next_index, failed = {}, 0, 0
+    while next_index < len(audio) or pending:
+        while next_index < len(audio) and len(pending) < parallelism:
+            pending[executor.submit(run, next_index)] = next_index
+            next_index += 1
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            index = pending.pop(future)
+            try:
+                texts[index] = future.result()
+            except Exception as e:
+                failed += 1
+                logger.error(f"[ASR] Bloco {index + 1}/{len(audio)} sem transcrição: {e}")
+
+    wall = time.perf_counter() - started
+    info = {'chunks': len(audio), 'failed': failed, 'partial': failed > 0, 'audio_s': round(len(pcm) / sample_rate, 1),
+            'sent_s': round(sent / sample_rate, 1), 'wall_s': round(wall, 2)}
+    with _stats_lock:
+        stats_counters['long_clips'] += 1
+        stats_counters['chunks'] += len(audio)
+        stats_counters['chunk_errors'] += failed
+        stats_counters['audio_s'] += len(pcm) / sample_rate
+        stats_counters['wall_s'] += wall
+    logger.info(f"[ASR] {info['audio_s']}s em {len(audio)} blocos, {wall:.1f}s ({failed} falhas)")
+    if failed == len(audio):
+        raise RuntimeError("nenhum bloco foi transcrito")
+    return " ".join(MISSING_CHUNK if text is None else text for text in texts if text != ""), info
+
+
+def get_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        counters = dict(stats_counters)
+    counters['audio_s'] = round(counters['audio_s'], 1)
+    counters['wall_s'] = round(counters['wall_s'], 1)
+    counters['speedup'] = round(counters['audio_s'] / counters['wall_s'], 1) if counters['wall_s'] else 0.0
+    return counters
@@ -0,0 +1,221 @@
+# app/core/chunking.py
+"""
+Divisão dos documentos da base de conhecimento em chunks para o RAG.
+
+O SentenceChunker respeita parágrafos, itens de lista e frases: junta frases
+inteiras até o orçamento de tokens e repete as últimas frases no início do
+chunk seguinte (sobreposição configurável). Cada chunk leva metadados da
+origem (arquivo, página e offsets de caractere no texto extraído).
+
+Os "tokens" são uma aproximação estável e sem dependências: palavras e sinais
+de pontuação. Para o orçamento do prompt, conte com ~1.5 token BPE por token.
+"""
+import bisect
+import logging
+import os
+import re
+from dataclasses import dataclass
+from typing import List, Sequence
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r'\w+|[^\w\s]')
+_PARAGRAPH_RE = re.compile(r'\n[ \t]*\n\s*')
+_LINE_RE = re.compile(r'[^\n]+')
+# Linha que começa um item de lista: "- ", "• ", "1. ", "a) "
+_BULLET_RE = re.compile(r'\s*(?:[-•*▪–—]|\d{1,3}[.)]|[a-zA-Z][.)])\s')
+# Fim de frase: pontuação final (+ aspas/parênteses) seguida de espaço
+_SENTENCE_END_RE = re.compile(r'[.!?…]+["\'”’)\]]*(?=\s)')
+_HARD_LINE_END = ('.', '!', '?', '…', ':', ';')
+# Abreviações comuns que não encerram a frase
+_ABBREVIATIONS = frozenset("""
+sr sra srs dr dra drs prof profa eng av r ex etc pág pag p nº n no tel obs cia ltda
+""".split())
+
+
+def count_tokens(text: str) -> int:
+    """Aproximação de tokens: palavras + sinais de pontuação"""
+    return len(_TOKEN_RE.findall(text))
+
+
+@dataclass(frozen=True)
+class Chunk:
+    """Trecho de um documento com a sua origem"""
+    text: str
+    source: str = ""
+    page: int = 1          # página (1-based) onde o chunk começa
+    start: int = 0         # offsets de caractere no texto extraído do arquivo
+    end: int = 0
+
+
+def page_of(page_starts: Sequence[int], offset: int) -> int:
+    """Página (1-based) que contém o offset, dado o offset inicial de cada página"""
+    return max(bisect.bisect_right(page_starts, offset), 1)
+
+
+class FixedChunker:
+    """Janelas de `size` caracteres a cada `step` (chunker original, mantido para comparação)"""
+
+    name = "fixed"
+
+    def __init__(self, size: int = 400, step: int = 300):
+        self.size = size
+        self.step = step
+
+    @property
+    def signature(self) -> str:
+        return f"fixed/{self.size}/{self.step}"
+
+    def split(self, text: str, source: str = "", page_starts: Sequence[int] = (0,)) -> List[Chunk]:
+        return [
+            Chunk(text[i:i + self.size], source, page_of(page_starts, i), i, min(i + self.size, len(text)))
+            for i in range(0, len(text), self.step)
+        ]
+
+
+class SentenceChunker:
+    """
+    Chunks de frases inteiras com até `max_tokens` tokens.
+
+    Um parágrafo novo fecha o chunk quando ele já tem pelo menos
+    `min_tokens`; do contrário, parágrafos curtos (seções de lista, títulos)
+    são agrupados. Frases maiores que o orçamento são quebradas entre
+    palavras. A sobreposição repete frases inteiras do chunk anterior (até
+    `overlap_tokens`) e não atravessa a fronteira de parágrafo.
+    """
+
+    name = "sentence"
+
+    def __init__(self, max_tokens: int = 120, overlap_tokens: int = 24, min_tokens: int = 48):
+        if overlap_tokens >= max_tokens:
+            raise ValueError("overlap_tokens deve ser menor que max_tokens")
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.min_tokens = min(min_tokens, max_tokens)
+
+    @property
+    def signature(self) -> str:
+        return f"sentence-v1/{self.max_tokens}/{self.overlap_tokens}/{self.min_tokens}"
+
+    # --- Unidades (frases) --------------------------------------------------
+
+    def _sentences(self, text: str, start: int, end: int):
+        """Offsets (início, fim) das frases de uma linha lógica"""
+        begin = start
+        for m in _SENTENCE_END_RE.finditer(text, start, end):
+            word = re.search(r'(\w+)\W*$', text[max(begin, m.start() - 12):m.start() + 1])
+            if word and word.group(1).lower() in _ABBREVIATIONS:
+                continue
+            yield begin, m.end()
+            begin = m.end()
+            while begin < end and text[begin].isspace():
+                begin += 1
+        if begin < end:
+            yield begin, end
+
+    def _lines(self, text: str, start: int, end: int):
+        """
+        Linhas lógicas de um parágrafo: quebras de linha "duras" (itens de lista,
+        linha terminada em pontuação) separam; quebras moles (texto de PDF
+        quebrado pela largura da página) são juntadas.
+        """
+        line_start = previous_end = None
+        previous = ""
+        for m in _LINE_RE.finditer(text, start, end):
+            line = m.group()
+            if not line.strip():
+                continue
+            if line_start is None:
+                line_start = m.start()
+            elif _BULLET_RE.match(line) or previous.endswith(_HARD_LINE_END):
+                yield line_start, previous_end
+                line_start = m.start()
+            previous, previous_end = line.rstrip(), m.end()
+        if line_start is not None:
+            yield line_start, previous_end
+
+    def _split_long(self, text: str, start: int, end: int):
+        """Quebra uma frase maior que o orçamento entre palavras"""
+        tokens = list(_TOKEN_RE.finditer(text, start, end))
+        for i in range(0, len(tokens), self.max_tokens):
+            piece = tokens[i:i + self.max_tokens]
+            piece_end = tokens[i + self.max_tokens].start() if i + self.max_tokens < len(tokens) else end
+            yield piece[0].start(), piece_end, len(piece)
+
+    def units(self, text: str):
+        """[(início, fim, tokens, começa_parágrafo)] de todas as frases do texto"""
+        units = []
+        paragraph_start = 0
+        bounds = [m.span() for m in _PARAGRAPH_RE.finditer(text)] + [(len(text), len(text))]
+        for paragraph_end, next_start in bounds:
+            first = True
+            for line_start, line_end in self._lines(text, paragraph_start, paragraph_end):
+                for s, e in self._sentences(text, line_start, line_end):
+                    while e > s and text[e - 1].isspace():
+                        e -= 1
+                    if e <= s:
+                        continue
+                    tokens = count_tokens(text[s:e])
+                    if tokens > self.max_tokens:
+                        for piece in self._split_long(text, s, e):
+                            units.append((*piece, first))
+                            first = False
+                    elif tokens:
+                        units.append((s, e, tokens, first))
+                        first = False
+            paragraph_start = next_start
+        return units
+
+    # --- Empacotamento ------------------------------------------------------
+
+    def split(self, text: str, source: str = "", page_starts: Sequence[int] = (0,)) -> List[Chunk]:
+        units = self.units(text)
+        chunks = []
+        i, n = 0, len(units)
+        while i < n:
+            total = units[i][2]
+            j = i + 1
+            while j < n and total + units[j][2] <= self.max_tokens:
+                if units[j][3] and total >= self.min_tokens:
+                    break
+                total += units[j][2]
+                j += 1
+
+            start, end = units[i][0], units[j - 1][1]
+            chunks.append(Chunk(text[start:end], source, page_of(page_starts, start), start, end))
+            if j >= n:
+                break
+
+            # Sobreposição: frases finais do chunk, sem voltar para antes de um parágrafo
+            k, overlap = j, 0
+            if not units[j][3]:
+                while k - 1 > i and overlap + units[k - 1][2] <= self.overlap_tokens:
+                    k -= 1
+                    overlap += units[k][2]
+                    if units[k][3]:
+                        break
+            i = k
+        return chunks
+
+
+_CHUNKERS = {
+    "sentence": SentenceChunker,
+    "fixed": FixedChunker,
+}
+
+
+def get_chunker(name: str = None, **kwargs):
+    """
+    Cria o chunker pelo nome (padrão: KB_CHUNKER ou 'sentence'). Sem kwargs,
+    o SentenceChunker lê KB_CHUNK_TOKENS e KB_CHUNK_OVERLAP do ambiente.
+    """
+    name = name or os.environ.get("KB_CHUNKER", "sentence")
+    if name not in _CHUNKERS:
+        logger.warning(f"[RAG] Chunker '{name}' desconhecido, usando 'sentence'.")
+        name = "sentence"
+    if name == "sentence" and not kwargs:
+        if os.environ.get("KB_CHUNK_TOKENS"):
+            kwargs["max_tokens"] = int(os.environ["KB_CHUNK_TOKENS"])
+        if os.environ.get("KB_CHUNK_OVERLAP"):
+            kwargs["overlap_tokens"] = int(os.environ["KB_CHUNK_OVERLAP"])
+    return _CHUNKERS[name](**kwargs)
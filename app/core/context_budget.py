@@ -0,0 +1,180 @@
+# app/core/context_budget.py
+"""
+Montagem do contexto do prompt dentro de um orçamento de tokens.
+
+Cada trecho candidato (memória, preferências, contexto empresarial, chunks
+da base de conhecimento) recebe uma nota = peso da seção x (relevância da
+fonte + cobertura dos termos da mensagem do usuário). Os de maior nota
+entram até o orçamento; trechos obrigatórios (personalidade, instruções)
+entram sempre. O texto final mantém a ordem fixa das seções.
+"""
+import logging
+import math
+import os
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from app.core.bm25 import fold_accents, tokenize
+
+logger = logging.getLogger(__name__)
+
+_PUNCTUATION = '.,;:!?()[]"\'-/*#'
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimativa local de tokens BPE (sem tokenizer externo): ~1.5 token por
+    palavra em português + 1 por sinal de pontuação. Erra para mais.
+    """
+    if not text:
+        return 0
+    return math.ceil(len(text.split()) * 1.5) + sum(map(text.count, _PUNCTUATION))
+
+
+@dataclass
+class Section:
+    header: str = ""        # título da seção no prompt ("" = sem título)
+    joiner: str = "\n"      # separador entre os trechos da seção
+    weight: float = 1.0     # peso da seção na nota dos trechos
+
+
+# Ordem em que as seções aparecem no prompt
+DEFAULT_SECTIONS: Dict[str, Section] = {
+    'personality': Section(),
+    'memory': Section("CONTEXTO DA MEMÓRIA:", "\n", 1.0),
+    'preferences': Section("PREFERÊNCIAS CONHECIDAS:", "; ", 0.8),
+    'business': Section("CONTEXTO EMPRESARIAL:", "; ", 0.9),
+    'knowledge': Section("BASE DE CONHECIMENTO RELEVANTE:", "\n\n", 1.2),
+    'instructions': Section(),
+}
+
+
+@dataclass
+class Snippet:
+    section: str
+    text: str
+    score: float = 0.0      # relevância informada pela fonte, 0..1 (ex.: score do BM25 normalizado)
+    required: bool = False
+    tokens: int = 0
+    value: float = 0.0      # nota final calculada pelo assembler
+
+
+@dataclass
+class AssembledContext:
+    text: str
+    budget: int
+    used: int
+    included: List[Snippet] = field(default_factory=list)
+    dropped: List[Snippet] = field(default_factory=list)
+
+    def usage(self) -> Dict[str, object]:
+        by_section: Dict[str, int] = {}
+        for snippet in self.included:
+            by_section[snippet.section] = by_section.get(snippet.section, 0) + snippet.tokens
+        return {
+            'budget': self.budget,
+            'used': self.used,
+            'utilization': round(self.used / self.budget, 3) if self.budget else 0.0,
+            'included': len(self.included),
+            'dropped': len(self.dropped),
+            'dropped_tokens': sum(s.tokens for s in self.dropped),
+            'by_section': by_section,
+        }
+
+
+class ContextAssembler:
+    """Escolhe e ordena os trechos do contexto dentro de `budget_tokens`"""
+
+    def __init__(self, budget_tokens: Optional[int] = None, sections: Optional[Dict[str, Section]] = None,
+                 token_counter: Callable[[str], int] = estimate_tokens, history: int = 200):
+        self.budget_tokens = budget_tokens or int(os.environ.get('CONTEXT_TOKEN_BUDGET', '1800'))
+        self.sections = sections or DEFAULT_SECTIONS
+        self.count_tokens = token_counter
+        self.recent_usage = deque(maxlen=history)
+        self.stats_counters = {'requests': 0, 'over_budget': 0, 'snippets_dropped': 0, 'tokens_dropped': 0}
+
+    def score(self, snippet: Snippet, query_terms: frozenset) -> float:
+        section = self.sections.get(snippet.section)
+        weight = section.weight if section else 1.0
+        coverage = 0.0
+        if query_terms:
+            # Termo da consulta no início de alguma palavra do trecho ('campanha' casa 'campanhas')
+            text = " " + fold_accents(snippet.text.lower())
+            coverage = sum(term in text for term in query_terms) / len(query_terms)
+        return weight * (snippet.score + coverage)
+
+    def assemble(self, query: str, snippets: List[Snippet], budget_tokens: Optional[int] = None) -> AssembledContext:
+        budget = budget_tokens or self.budget_tokens
+        query_terms = frozenset(" " + term for term in tokenize(query or ''))
+
+        used = 0
+        included, dropped, optional, seen = [], [], [], set()
+        for snippet in snippets:
+            text = snippet.text.strip() if snippet.text else ''
+            key = (snippet.section, text)
+            if not text or key in seen:
+                continue
+            seen.add(key)
+            snippet.text = text
+            snippet.tokens = self.count_tokens(text)
+            if snippet.required:
+                used += snippet.tokens
+                included.append(snippet)
+            else:
+                snippet.value = self.score(snippet, query_terms)
+                optional.append(snippet)
+
+        # Título da seção é cobrado uma vez, quando o primeiro trecho dela entra
+        opened = {s.section for s in included}
+        for snippet in sorted(optional, key=lambda s: -s.value):
+            section = self.sections.get(snippet.section)
+            header_cost = 0 if snippet.section in opened or not section else self.count_tokens(section.header)
+            if used + snippet.tokens + header_cost <= budget:
+                used += snippet.tokens + header_cost
+                opened.add(snippet.section)
+                included.append(snippet)
+            else:
+                dropped.append(snippet)
+
+        assembled = AssembledContext(self._render(snippets, included), budget, used, included, dropped)
+        self._record(assembled)
+        return assembled
+
+    def _render(self, snippets: List[Snippet], included: List[Snippet]) -> str:
+        """Seções na ordem fixa; dentro de cada uma, trechos na ordem original"""
+        chosen = {id(s) for s in included}
+        by_section: Dict[str, List[str]] = {}
+        for snippet in snippets:
+            if id(snippet) in chosen:
+                by_section.setdefault(snippet.section, []).append(snippet.text)
+
+        blocks = []
+        names = list(self.sections) + [name for name in by_section if name not in self.sections]
+        for name in names:
+            texts = by_section.get(name)
+            if not texts:
+                continue
+            section = self.sections.get(name, Section())
+            body = section.joiner.join(texts)
+            blocks.append(f"{section.header}\n{body}" if section.header else body)
+        return "\n\n".join(blocks)
+
+    def _record(self, assembled: AssembledContext):
+        usage = assembled.usage()
+        self.recent_usage.append(usage)
+        self.stats_counters['requests'] += 1
+        self.stats_counters['over_budget'] += assembled.used > assembled.budget
+        self.stats_counters['snippets_dropped'] += usage['dropped']
+        self.stats_counters['tokens_dropped'] += usage['dropped_tokens']
+
+    def get_stats(self) -> Dict[str, object]:
+        recent = list(self.recent_usage)
+        used = sorted(u['used'] for u in recent)
+        return {
+            **self.stats_counters,
+            'budget': self.budget_tokens,
+            'avg_used': round(sum(used) / len(used), 1) if used else 0.0,
+            'p95_used': used[min(int(len(used) * 0.95), len(used) - 1)] if used else 0,
+            'avg_utilization': round(sum(u['utilization'] for u in recent) / len(recent), 3) if recent else 0.0,
+        }
@@ -0,0 +1,292 @@
+# app/core/conversation_store.py
+"""
+Histórico das conversas, por usuário.
+
+Cada usuário ativo tem um ring buffer (deque) com os últimos turnos
+(usuário/assistente) no formato de mensagens do chat completions: o fast path
+e o sistema de memória leem os últimos N turnos sem ir ao banco. O banco
+(tabela `conversations`, índice composto (phone_number, timestamp)) só é lido
+uma vez, quando o usuário volta a ficar ativo; as trocas são gravadas em
+write-behind: vão para uma fila e um worker insere em lote a cada
+`CONVERSATION_FLUSH_INTERVAL` segundos (ou assim que juntar `batch_size`
+linhas). Os usuários menos recentes saem da memória quando o limite é atingido.
+
+A chave é o telefone: 'wa:5511...' (sessão do app), 'whatsapp:+5511...' e
+'+5511...' caem no mesmo histórico.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_PREFIXES = ('wa:', 'whatsapp:')
+
+
+def conversation_key(session_or_phone: str) -> str:
+    """'wa:5511999' / 'whatsapp:+5511999' / '+5511999' -> '+5511999'"""
+    key = (session_or_phone or '').strip()
+    for prefix in _PREFIXES:
+        if key.startswith(prefix):
+            key = key[len(prefix):]
+            break
+    return '+' + key if key.isdigit() else key
+
+
+class SQLConversationBackend:
+    """Leitura dos últimos turnos e inserção em lote na tabela conversations (models.Conversation)"""
+
+    def __init__(self, database_uri: Optional[str] = None, engine_options: Optional[Dict] = None):
+        from sqlalchemy import create_engine
+        from models import Conversation
+        from config import Config
+
+        uri = database_uri or Config.SQLALCHEMY_DATABASE_URI
+        options = Config.SQLALCHEMY_ENGINE_OPTIONS if engine_options is None else engine_options
+        if uri.startswith('sqlite'):
+            # Opções de pool do Postgres não se aplicam ao SQLite
+            options = {}
+
+        self.engine = create_engine(uri, **options)
+        self.table = Conversation.__table__
+        self.table.create(bind=self.engine, checkfirst=True)
+        # Tabelas antigas só têm o índice em phone_number: o composto é criado à parte
+        for index in self.table.indexes:
+            index.create(bind=self.engine, checkfirst=True)
+
+    def load_recent(self, phone: str, limit: int) -> List[Dict[str, Any]]:
+        """Últimas `limit` trocas do telefone, da mais antiga para a mais recente"""
+        from sqlalchemy import select
+
+        c = self.table.c
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                select(c.user_message, c.bot_response, c.timestamp)
+                .where(c.phone_number == phone)
+                .order_by(c.timestamp.desc())
+                .limit(limit)
+            ).all()
+        return [{'user_message': r[0], 'bot_response': r[1], 'timestamp': r[2]} for r in reversed(rows)]
+
+    def insert_many(self, rows: List[Dict[str, Any]]):
+        """Um INSERT executemany numa única transação"""
+        with self.engine.begin() as conn:
+            conn.execute(self.table.insert(), rows)
+
+
+class ConversationStore:
+    """
+    Últimos `max_turns` turnos por usuário; no máximo `max_sessions` usuários
+    em memória (LRU). Leituras devolvem cópias, seguras para montar prompts.
+    `backend=None` mantém só a memória (sem leitura nem gravação no banco).
+    """
+
+    def __init__(self, max_turns: Optional[int] = None, max_sessions: int = 5000,
+                 backend: Any = 'auto', flush_interval: Optional[float] = None,
+                 batch_size: int = 200, max_pending: int = 20000):
+        self.max_turns = max_turns or int(os.environ.get('CONVERSATION_HISTORY_TURNS', '20'))
+        self.max_sessions = max_sessions
+        self.flush_interval = (flush_interval if flush_interval is not None
+                               else float(os.environ.get('CONVERSATION_FLUSH_INTERVAL', '1.0')))
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self._sessions: 'OrderedDict[str, Deque[Dict[str, Any]]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._pending: List[Dict[str, Any]] = []
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._flusher: Optional[threading.Thread] = None
+        self._stop = False
+        self.stats_counters = {'appends': 0, 'reads': 0, 'evicted_sessions': 0, 'db_loads': 0, 'load_errors': 0,
+                               'queued': 0, 'flushed': 0, 'flush_batches': 0, 'flush_errors': 0, 'dropped': 0}
+
+        if backend == 'auto':
+            backend = self._default_backend()
+        self.backend = backend
+        if self.backend is not None:
+            atexit.register(self.close)
+
+    @staticmethod
+    def _default_backend():
+        if os.environ.get('CONVERSATION_PERSIST', '1') == '0':
+            return None
+        try:
+            return SQLConversationBackend()
+        except Exception as e:
+            logger.warning(f"[HISTORY] Histórico sem persistência (somente RAM): {e}")
+            return None
+
+    # --- Ring buffers ---------------------------------------------------------------
+
+    def _ring(self, key: str) -> Deque[Dict[str, Any]]:
+        """Ring buffer do usuário; na primeira vez carrega os últimos turnos do banco (fora do lock)"""
+        with self._lock:
+            turns = self._sessions.get(key)
+            if turns is not None:
+                self._sessions.move_to_end(key)
+                return turns
+
+        rows: List[Dict[str, Any]] = []
+        if self.backend is not None:
+            # Trocas ainda na fila do write-behind não estão no banco; as que forem gravadas
+            # durante a leitura aparecem nas duas listas e são deduplicadas
+            with self._cond:
+                rows = [row for row in self._pending if row['phone_number'] == key]
+            try:
+                rows += self.backend.load_recent(key, (self.max_turns + 1) // 2)
+                self._count('db_loads')
+            except Exception as e:
+                self._count('load_errors')
+                logger.error(f"[HISTORY] Erro carregando histórico de {key}: {e}")
+        unique = {(row['timestamp'], row['user_message']): row for row in rows}
+        loaded = []
+        for row in sorted(unique.values(), key=lambda r: r['timestamp']):
+            at = row['timestamp'].timestamp()
+            loaded.append({'role': 'user', 'content': row['user_message'], 'at': at})
+            loaded.append({'role': 'assistant', 'content': row['bot_response'], 'at': at})
+
+        with self._lock:
+            turns = self._sessions.get(key)
+            if turns is None:
+                turns = self._sessions[key] = deque((t for t in loaded if t['content']), maxlen=self.max_turns)
+                if len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self.stats_counters['evicted_sessions'] += 1
+            else:
+                self._sessions.move_to_end(key)
+            return turns
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self.stats_counters[name] += amount
+
+    def append(self, session_id: str, role: str, content: str):
+        """Só no ring buffer (não grava no banco); trocas completas vão por append_exchange"""
+        if not content:
+            return
+        turns = self._ring(conversation_key(session_id))
+        with self._lock:
+            turns.append({'role': role, 'content': content, 'at': time.time()})
+            self.stats_counters['appends'] += 1
+
+    def append_exchange(self, session_id: str, user_text: str, assistant_texts: List[str],
+                        message_type: str = 'text', transcribed_text: Optional[str] = None):
+        """Registra a troca no ring buffer e enfileira a linha para o insert em lote"""
+        reply = "\n\n".join(t for t in assistant_texts if t)
+        self.append(session_id, 'user', user_text)
+        self.append(session_id, 'assistant', reply)
+        if self.backend is None or not (user_text or reply):
+            return
+        row = {'phone_number': conversation_key(session_id), 'user_message': user_text or '',
+               'bot_response': reply, 'message_type': message_type, 'transcribed_text': transcribed_text,
+               'timestamp': datetime.utcnow()}
+        with self._cond:
+            if self._stop:
+                return
+            self._pending.append(row)
+            self.stats_counters['queued'] += 1
+            if len(self._pending) > self.max_pending:
+                # Banco fora do ar por muito tempo: descarta as mais antigas (o ring buffer continua valendo)
+                dropped = len(self._pending) - self.max_pending
+                del self._pending[:dropped]
+                self.stats_counters['dropped'] += dropped
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name='history-flusher', daemon=True)
+                self._flusher.start()
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify_all()
+
+    # --- Leitura --------------------------------------------------------------------
+
+    def last(self, session_id: str, n: Optional[int] = None) -> List[Dict[str, str]]:
+        """Últimos n turnos como mensagens {'role', 'content'} (mais antigo primeiro)"""
+        turns = self._ring(conversation_key(session_id))
+        with self._lock:
+            self.stats_counters['reads'] += 1
+            selected = list(turns)[-n:] if n else list(turns)
+        return [{'role': turn['role'], 'content': turn['content']} for turn in selected]
+
+    def recent_exchanges(self, session_id: str, n: int = 3) -> List[Tuple[str, str]]:
+        """Últimas n trocas (mensagem do usuário, resposta), mais antiga primeiro"""
+        exchanges, user = [], None
+        for turn in self.last(session_id):
+            if turn['role'] == 'user':
+                user = turn['content']
+            elif user is not None:
+                exchanges.append((user, turn['content']))
+                user = None
+        return exchanges[-n:]
+
+    def forget(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(conversation_key(session_id), None)
+
+    # --- Write-behind ---------------------------------------------------------------
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                if not self._stop and len(self._pending) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+                if self._stop:
+                    return
+            self.flush()
+
+    def flush(self) -> int:
+        """Insere em lote todas as trocas pendentes; retorna quantas foram gravadas"""
+        if self.backend is None:
+            return 0
+        with self._flush_lock:
+            with self._cond:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+            try:
+                self.backend.insert_many(batch)
+            except Exception as e:
+                logger.error(f"[HISTORY] Erro gravando {len(batch)} trocas em lote: {e}")
+                with self._cond:
+                    self.stats_counters['flush_errors'] += 1
+                    self._pending[:0] = batch  # volta para o início da fila, na ordem
+                return 0
+            with self._cond:
+                self.stats_counters['flushed'] += len(batch)
+                self.stats_counters['flush_batches'] += 1
+            return len(batch)
+
+    def close(self):
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        self.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = {
+                **self.stats_counters,
+                'sessions': len(self._sessions),
+                'turns': sum(len(turns) for turns in self._sessions.values()),
+                'max_turns': self.max_turns,
+            }
+        with self._cond:
+            stats['pending_writes'] = len(self._pending)
+        stats['persistence'] = type(self.backend).__name__ if self.backend else 'ram_only'
+        return stats
+
+
+_store: Optional[ConversationStore] = None
+_store_lock = threading.Lock()
+
+
+def get_conversation_store() -> ConversationStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ConversationStore()
+    return _store
@@ -0,0 +1,236 @@
+# app/core/delivery.py
+"""
+Entrega ordenada por destinatário, com áudio especulativo.
+
+O texto da resposta sai assim que fica pronto; a síntese do áudio (TTS) começa
+na hora, em paralelo, e a nota de voz entra na fila do destinatário como um
+"lugar reservado": é enviada quando o áudio fica pronto, sem passar na frente
+nem ficar atrás do que foi enfileirado depois. Cada destinatário tem uma fila
+FIFO drenada por um worker de cada vez; destinatários diferentes andam em paralelo.
+Enquanto a nota de voz da frente da fila sintetiza, a fila fica estacionada sem
+ocupar worker: o fim do TTS (ou o prazo `audio_deadline_s`) a coloca de volta no pool.
+
+O TTS devolve um handle (`tts-pendente:<n>`) no lugar da URL; `send_media`
+aceita o handle, `resolve` espera a URL final (para cache/histórico) e
+`voice_status` informa o estado da síntese sem esperar.
+"""
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from app.core.metrics import LatencyStats
+
+logger = logging.getLogger(__name__)
+
+HANDLE_PREFIX = "tts-pendente:"
+
+
+def is_pending_handle(value: str) -> bool:
+    return isinstance(value, str) and value.startswith(HANDLE_PREFIX)
+
+
+class OrderedDelivery:
+    """
+    - send_text(to, body) / send_media(to, url): funções de envio (devolvem o JSON de status)
+    - synthesize(text): gera o áudio e devolve a URL pública (ou None)
+    - audio_deadline_s: espera máxima pelo áudio; depois disso a nota de voz é
+      descartada para não travar as próximas mensagens do destinatário
+    """
+
+    def __init__(self, send_text: Callable[[str, str], str], send_media: Callable[[str, str], str],
+                 synthesize: Callable[[str], Optional[str]], workers: Optional[int] = None,
+                 audio_deadline_s: Optional[float] = None, max_pending: int = 1000):
+        workers = workers or int(os.environ.get('DELIVERY_WORKERS', '16'))
+        self.audio_deadline_s = (audio_deadline_s if audio_deadline_s is not None
+                                 else float(os.environ.get('VOICE_DEADLINE_S', '30')))
+        self.max_pending = max_pending
+        self._send_text = send_text
+        self._send_media = send_media
+        self._synthesize = synthesize
+        self._senders = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="delivery")
+        self._tts = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="delivery-tts")
+        # Itens: [job, future, TTS que o job espera (ou None), início da espera]
+        self._queues: Dict[str, Deque[List[Any]]] = {}
+        self._active: set = set()
+        self._parked: Dict[str, threading.Timer] = {}  # destinatário -> timer do prazo do áudio
+        # Handles das notas de voz (os mais antigos saem depois de max_pending)
+        self._pending: 'OrderedDict[str, Future]' = OrderedDict()
+        self._last_text_at: Dict[str, float] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        # "text_to_audio": entrega do texto -> entrega do áudio; "tts"; "audio_wait": fila parada esperando o TTS
+        self.latency = LatencyStats()
+        self.stats_counters = {'texts': 0, 'voice_started': 0, 'audio_sent': 0, 'audio_failed': 0,
+                               'audio_dropped': 0, 'send_errors': 0}
+
+    # --- fila por destinatário ---
+    def _submit(self, to: str, job: Callable[[], Any], gate: Optional[Future] = None) -> Future:
+        future: Future = Future()
+        with self._lock:
+            self._queues.setdefault(to, deque()).append([job, future, gate, None])
+            if to in self._active:
+                return future
+            self._active.add(to)
+        self._senders.submit(self._drain, to)
+        return future
+
+    def _drain(self, to: str):
+        while True:
+            with self._lock:
+                queue = self._queues.get(to)
+                if not queue:
+                    self._queues.pop(to, None)
+                    self._active.discard(to)
+                    return
+                entry = queue[0]
+                job, future, gate, waiting_since = entry
+                remaining = 0.0
+                if gate is not None and not gate.done():
+                    now = time.perf_counter()
+                    if waiting_since is None:
+                        entry[3] = waiting_since = now
+                    remaining = self.audio_deadline_s - (now - waiting_since)
+                if remaining > 0:
+                    # Áudio ainda sintetizando: estaciona a fila e libera o worker
+                    timer = threading.Timer(remaining, self._resume, (to,))
+                    timer.daemon = True
+                    self._parked[to] = timer
+                else:
+                    queue.popleft()
+            if remaining > 0:
+                timer.start()
+                gate.add_done_callback(lambda _, to=to: self._resume(to))
+                return
+            if gate is not None:
+                waited = time.perf_counter() - waiting_since if waiting_since is not None else 0.0
+                self.latency.record("audio_wait", waited * 1000)
+            try:
+                future.set_result(job())
+            except Exception as e:
+                with self._lock:
+                    self.stats_counters['send_errors'] += 1
+                logger.error(f"[DELIVERY] Falha na entrega para {to}: {e}", exc_info=True)
+                future.set_exception(e)
+
+    def _resume(self, to: str):
+        """TTS terminou ou o prazo venceu: a fila estacionada volta para o pool (uma vez)"""
+        with self._lock:
+            timer = self._parked.pop(to, None)
+        if timer is None:
+            return
+        timer.cancel()
+        self._senders.submit(self._drain, to)
+
+    # --- áudio ---
+    def start_voice(self, text: str) -> str:
+        """Começa a sintetizar agora e devolve o handle da nota de voz"""
+        handle = f"{HANDLE_PREFIX}{next(self._ids)}"
+
+        def synthesize():
+            with self.latency.measure("tts"):
+                return self._synthesize(text)
+
+        future = self._tts.submit(synthesize)
+        with self._lock:
+            self._pending[handle] = future
+            while len(self._pending) > self.max_pending:
+                self._pending.popitem(last=False)
+            self.stats_counters['voice_started'] += 1
+        return handle
+
+    def resolve(self, handle: str, timeout: Optional[float] = None) -> Optional[str]:
+        """URL final do áudio (espera a síntese); URLs comuns passam direto"""
+        if not is_pending_handle(handle):
+            return handle
+        with self._lock:
+            future = self._pending.get(handle)
+        if future is None:
+            return None
+        try:
+            return future.result(timeout=self.audio_deadline_s if timeout is None else timeout)
+        except FutureTimeout:
+            return None
+        except Exception as e:
+            logger.error(f"[DELIVERY] Falha no TTS de {handle}: {e}")
+            return None
+
+    def voice_status(self, handle: str) -> Tuple[str, Optional[str]]:
+        """Sem esperar: ('pending', None), ('ready', url) ou ('failed', None)"""
+        future = self._tts_future(handle)
+        if future is None:
+            return 'failed', None
+        if not future.done():
+            return 'pending', None
+        if future.exception() is not None:
+            return 'failed', None
+        url = future.result()
+        return ('ready', url) if url else ('failed', None)
+
+    def _tts_future(self, handle: str) -> Optional[Future]:
+        with self._lock:
+            return self._pending.get(handle)
+
+    def _audio_outcome(self, handle: str, future: Optional[Future]) -> Tuple[Optional[str], str]:
+        """Sem esperar (o _drain só chega aqui com o TTS pronto ou o prazo vencido): (url, '') ou (None, motivo)"""
+        if future is None:
+            return None, 'audio_failed'
+        if not future.done():
+            return None, 'audio_dropped'
+        try:
+            url = future.result()
+        except Exception as e:
+            logger.error(f"[DELIVERY] Falha no TTS de {handle}: {e}")
+            return None, 'audio_failed'
+        return url, ('' if url else 'audio_failed')
+
+    # --- envios ---
+    def send_text(self, to: str, body: str) -> Future:
+        def job():
+            output = self._send_text(to, body)
+            if '"sucesso"' in str(output):
+                with self._lock:
+                    self._last_text_at[to] = time.perf_counter()
+                    self.stats_counters['texts'] += 1
+            return output
+        return self._submit(to, job)
+
+    def send_media(self, to: str, media_url: str) -> Future:
+        """Reserva o lugar na fila; com handle, o envio sai quando o áudio fica pronto"""
+        gate = self._tts_future(media_url) if is_pending_handle(media_url) else None
+
+        def job():
+            if is_pending_handle(media_url):
+                url, outcome = self._audio_outcome(media_url, gate)
+                if not url:
+                    with self._lock:
+                        self.stats_counters[outcome] += 1
+                    logger.warning(f"[DELIVERY] Nota de voz {media_url} para {to} não ficou pronta ({outcome}); seguindo a fila")
+                    return '{"status": "erro", "detalhe": "audio indisponivel"}'
+            else:
+                url = media_url
+            output = self._send_media(to, url)
+            if '"sucesso"' in str(output):
+                with self._lock:
+                    text_at = self._last_text_at.pop(to, None)
+                    self.stats_counters['audio_sent'] += 1
+                if text_at is not None:
+                    self.latency.record("text_to_audio", (time.perf_counter() - text_at) * 1000)
+            return output
+        return self._submit(to, job, gate)
+
+    def send_voice_note(self, to: str, text: str) -> str:
+        """Atalho: sintetiza `text` e reserva a nota de voz na fila; devolve o handle"""
+        handle = self.start_voice(text)
+        self.send_media(to, handle)
+        return handle
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self.stats_counters)
+            pending, queued = len(self._pending), sum(len(q) for q in self._queues.values())
+        return {**counters, 'pending_voice': pending, 'queued': queued, 'latency': self.latency.snapshot()}
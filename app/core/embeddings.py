@@ -0,0 +1,196 @@
+# app/core/embeddings.py
+"""
+Busca semântica por embeddings densos para a base de conhecimento.
+
+Os embeddings dos chunks ficam em uma matriz float32 contígua (salva em .npy
+e aberta via memory-map); cada consulta é um único produto matriz-vetor
+seguido de argpartition para o top-k.
+"""
+import logging
+import os
+import zlib
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core.bm25 import tokenize
+
+logger = logging.getLogger(__name__)
+
+
+class HashingEmbedder:
+    """
+    Embedder local e determinístico (feature hashing com sinal).
+
+    Usa os tokens normalizados do BM25 e os trigramas de caracteres de cada
+    token, então tolera variações de grafia. Não depende de rede: serve para
+    testes offline e como fallback.
+    """
+
+    name = "hashing"
+
+    def __init__(self, dim: int = 384, char_ngrams: int = 3, tokenizer: Callable[[str], List[str]] = tokenize):
+        self.dim = dim
+        self.char_ngrams = char_ngrams
+        self.tokenizer = tokenizer
+
+    def _features(self, text: str) -> List[str]:
+        features = []
+        n = self.char_ngrams
+        for token in self.tokenizer(text):
+            features.append(token)
+            if n and len(token) > n:
+                padded = f"#{token}#"
+                features.extend(padded[i:i + n] for i in range(len(padded) - n + 1))
+        return features
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """Matriz (len(texts), dim) float32 com linhas normalizadas (L2)"""
+        rows, cols, signs = [], [], []
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                h = zlib.crc32(feature.encode("utf-8"))
+                rows.append(row)
+                cols.append(h % self.dim)
+                signs.append(1.0 if h & 0x80000000 else -1.0)
+
+        flat = np.asarray(rows, dtype=np.int64) * self.dim + np.asarray(cols, dtype=np.int64)
+        matrix = np.bincount(flat, weights=signs, minlength=len(texts) * self.dim)
+        matrix = matrix.reshape(len(texts), self.dim).astype(np.float32)
+        return _normalize_rows(matrix)
+
+
+class OpenAIEmbedder:
+    """Embeddings da OpenAI (text-embedding-3-*) em lotes"""
+
+    name = "openai"
+
+    def __init__(self, model: str = "text-embedding-3-small", dim: int = 1536,
+                 batch_size: int = 256, client=None):
+        self.model = model
+        self.dim = dim
+        self.batch_size = batch_size
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            from openai import OpenAI
+            self._client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+        return self._client
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        matrix = np.empty((len(texts), self.dim), dtype=np.float32)
+        for start in range(0, len(texts), self.batch_size):
+            batch = list(texts[start:start + self.batch_size])
+            response = self.client.embeddings.create(model=self.model, input=batch, dimensions=self.dim)
+            for offset, item in enumerate(response.data):
+                matrix[start + offset] = item.embedding
+        return _normalize_rows(matrix)
+
+
+_EMBEDDERS = {
+    "hashing": HashingEmbedder,
+    "openai": OpenAIEmbedder,
+}
+
+
+def register_embedder(name: str, factory):
+    """Registra um embedder adicional (qualquer objeto com `dim` e `embed(texts)`)."""
+    _EMBEDDERS[name] = factory
+
+
+def get_embedder(name: Optional[str] = None, **kwargs):
+    """Cria o embedder pelo nome (padrão: KB_EMBEDDER ou 'hashing')."""
+    name = name or os.environ.get("KB_EMBEDDER", "hashing")
+    if name not in _EMBEDDERS:
+        logger.warning(f"[RAG] Embedder '{name}' desconhecido, usando 'hashing'.")
+        name = "hashing"
+    return _EMBEDDERS[name](**kwargs)
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return matrix
+
+
+class DenseIndex:
+    """
+    Matriz (n_chunks, dim) float32 de embeddings normalizados.
+
+    O produto interno equivale ao cosseno; a matriz pode ser salva em .npy e
+    reaberta com mmap, sem copiar para a RAM do processo.
+    """
+
+    def __init__(self, embedder=None, matrix: Optional[np.ndarray] = None):
+        self.embedder = embedder or get_embedder()
+        self.matrix = matrix if matrix is not None else np.empty((0, self.embedder.dim), dtype=np.float32)
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return self.matrix.nbytes
+
+    def build(self, texts: Sequence[str], batch_size: int = 512) -> "DenseIndex":
+        """Gera os embeddings de todos os textos direto na matriz final"""
+        matrix = np.empty((len(texts), self.embedder.dim), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            matrix[start:start + batch_size] = self.embedder.embed(texts[start:start + batch_size])
+        self.matrix = matrix
+        return self
+
+    def add(self, texts: Sequence[str]) -> List[int]:
+        """Acrescenta textos ao índice; retorna os ids atribuídos"""
+        start = len(self)
+        self.matrix = np.vstack([self.matrix, self.embedder.embed(texts)])
+        return list(range(start, len(self)))
+
+    def save(self, path: str):
+        np.save(path, np.ascontiguousarray(self.matrix, dtype=np.float32))
+
+    @classmethod
+    def load(cls, path: str, embedder=None, mmap: bool = True) -> "DenseIndex":
+        """Abre a matriz salva; com mmap as páginas são lidas sob demanda"""
+        embedder = embedder or get_embedder()
+        matrix = np.load(path, mmap_mode="r" if mmap else None)
+        if matrix.ndim != 2 or matrix.shape[1] != embedder.dim:
+            raise ValueError(f"Dimensão do índice {matrix.shape} incompatível com o embedder ({embedder.dim})")
+        return cls(embedder, matrix)
+
+    def search(self, query: str, top_k: int = 3, min_score: float = 0.0) -> List[Tuple[float, int]]:
+        """Retorna [(score, doc_id)] dos top_k chunks mais similares à consulta"""
+        return self.search_batch([query], top_k, min_score)[0]
+
+    def search_batch(self, queries: Sequence[str], top_k: int = 3,
+                     min_score: float = 0.0) -> List[List[Tuple[float, int]]]:
+        """Várias consultas em um único produto matriz-matriz"""
+        if len(self) == 0 or top_k <= 0:
+            return [[] for _ in queries]
+        return self.search_vectors(self.embedder.embed(queries), top_k, min_score)
+
+    def search_vectors(self, vectors: np.ndarray, top_k: int = 3,
+                       min_score: float = 0.0) -> List[List[Tuple[float, int]]]:
+        """Como search_batch, para consultas já convertidas em embeddings"""
+        n = len(self)
+        if n == 0 or top_k <= 0:
+            return [[] for _ in range(len(vectors))]
+
+        scores = vectors @ self.matrix.T  # (n_queries, n_chunks)
+        k = min(top_k, n)
+        if k < n:
+            candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            candidates = np.broadcast_to(np.arange(n), (len(vectors), n))
+
+        results = []
+        for row, ids in enumerate(candidates):
+            row_scores = scores[row, ids]
+            order = np.argsort(-row_scores, kind="stable")
+            results.append([
+                (float(row_scores[i]), int(ids[i])) for i in order if row_scores[i] > min_score
+            ])
+        return results
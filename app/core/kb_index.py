@@ -0,0 +1,439 @@
+# app/core/kb_index.py
+"""
+Índice pré-construído da base de conhecimento em disco, por segmentos.
+
+Cada arquivo-fonte vira um segmento imutável em
+`documents/.kb_index/segments/<chave>/` (chunks com página/offsets, postings
+do BM25 e, opcionalmente, embeddings), onde a chave é o hash do conteúdo do
+arquivo, da versão do formato e dos parâmetros do chunker (app.core.chunking). Os workers abrem os segmentos
+via mmap; só arquivos novos ou alterados são processados. Uma geração
+(KBGeneration) é o conjunto imutável de segmentos servido às consultas.
+
+Uso: python -m app.core.kb_index build [--embeddings] [--index-dir DIR] [arquivos...]
+     python -m app.core.kb_index status [arquivos...]
+"""
+import argparse
+import bisect
+import hashlib
+import logging
+import mmap
+import os
+import shutil
+import sys
+import threading
+import time
+from array import array
+from collections.abc import Sequence
+from typing import Dict, List, Optional, Tuple
+
+from app.core.bm25 import BM25Index, SegmentedBM25
+from app.core.chunking import Chunk, get_chunker
+from app.utils import jsoncodec
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 3
+DEFAULT_DOCUMENTS_DIR = os.environ.get("KB_DOCUMENTS_DIR", "documents")
+DEFAULT_INDEX_DIR = os.environ.get("KB_INDEX_DIR", os.path.join(DEFAULT_DOCUMENTS_DIR, ".kb_index"))
+SUPPORTED_EXTENSIONS = ('.pdf', '.txt')
+# Chunker padrão: KB_CHUNKER / KB_CHUNK_TOKENS / KB_CHUNK_OVERLAP
+DEFAULT_CHUNKER = get_chunker()
+
+
+# --- Leitura das fontes ------------------------------------------------------
+
+def discover_sources(directory: str = DEFAULT_DOCUMENTS_DIR) -> List[str]:
+    """Arquivos PDF/TXT do diretório (ignora ocultos, como o próprio índice)"""
+    if not os.path.isdir(directory):
+        return []
+    return sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if not name.startswith('.') and name.lower().endswith(SUPPORTED_EXTENSIONS)
+    )
+
+
+def extract_pages(path: str) -> List[str]:
+    """Texto de cada página de um PDF (o TXT é uma página só; o pdfplumber só é importado quando há PDF)"""
+    if path.endswith('.pdf'):
+        import pdfplumber
+
+        pages = []
+        with pdfplumber.open(path) as pdf:
+            for page in pdf.pages:
+                page_text = page.extract_text()
+                # Páginas vazias entram para manter a numeração
+                pages.append(page_text + "\n\n" if page_text else "")
+        return pages
+    if path.endswith('.txt'):
+        with open(path, 'r', encoding='utf-8') as f:
+            return [f.read()]
+    return []
+
+
+def extract_text(path: str) -> str:
+    return "".join(extract_pages(path))
+
+
+def chunk_document(source: str, chunker=None) -> List[Chunk]:
+    """Extrai o arquivo e divide em chunks com página e offsets"""
+    chunker = chunker or DEFAULT_CHUNKER
+    pages = extract_pages(source)
+    page_starts, offset = [], 0
+    for page in pages:
+        page_starts.append(offset)
+        offset += len(page)
+    return chunker.split("".join(pages), source, page_starts or [0])
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def segment_key(digest: str, chunker=None) -> str:
+    """Chave do segmento: conteúdo do arquivo + formato + chunker + byte order"""
+    chunker = chunker or DEFAULT_CHUNKER
+    payload = f"{FORMAT_VERSION}|{chunker.signature}|{sys.byteorder}|{digest}"
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+# --- Leitura mapeada ---------------------------------------------------------
+
+def _map_file(path: str):
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _uint_view(buffer, typecode: str):
+    return memoryview(buffer).cast(typecode) if len(buffer) else memoryview(array(typecode))
+
+
+class MappedChunks(Sequence):
+    """Chunks sobre um blob UTF-8 mapeado; cada um só é decodificado quando acessado"""
+
+    def __init__(self, blob, offsets):
+        self._blob = blob
+        self._offsets = offsets
+
+    def __len__(self):
+        return max(len(self._offsets) - 1, 0)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return bytes(self._blob[self._offsets[i]:self._offsets[i + 1]]).decode('utf-8')
+
+
+# --- Segmentos ---------------------------------------------------------------
+
+class Segment:
+    """Chunks + BM25 (+ embeddings sob demanda) de um arquivo-fonte; imutável"""
+
+    def __init__(self, source: str, digest: str, chunks: Sequence, bm25: BM25Index,
+                 meta: Sequence[int], chunker: str, path: Optional[str] = None):
+        self.source = source
+        self.digest = digest
+        self.chunks = chunks
+        self.bm25 = bm25
+        self.meta = meta  # (página, início, fim) de cada chunk, achatados
+        self.chunker = chunker  # assinatura do chunker que gerou os chunks
+        self.path = path  # None: segmento só em memória
+        self._dense: Dict[Tuple[str, int], object] = {}
+        self._dense_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def chunk(self, i: int) -> Chunk:
+        """Chunk com os metadados de origem"""
+        page, start, end = self.meta[3 * i:3 * i + 3]
+        return Chunk(self.chunks[i], self.source, page, start, end)
+
+    @classmethod
+    def from_file(cls, source: str, digest: str, chunker=None) -> 'Segment':
+        """Processa o arquivo direto para a memória (sem gravar em disco)"""
+        chunker = chunker or DEFAULT_CHUNKER
+        chunks = chunk_document(source, chunker)
+        texts = [chunk.text for chunk in chunks]
+        return cls(source, digest, texts, BM25Index(texts), _chunk_meta(chunks), chunker.signature)
+
+    @classmethod
+    def open(cls, path: str, source: Optional[str] = None) -> 'Segment':
+        """Abre um segmento gravado; chunks e postings ficam mapeados em memória"""
+        with open(os.path.join(path, "manifest.json"), encoding='utf-8') as f:
+            manifest = jsoncodec.loads(f.read())
+        if manifest.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Formato {manifest.get('version')} != {FORMAT_VERSION}")
+
+        offsets = _uint_view(_map_file(os.path.join(path, "chunk_offsets.bin")), 'Q')
+        chunks = MappedChunks(_map_file(os.path.join(path, "chunks.bin")), offsets)
+
+        docs = _uint_view(_map_file(os.path.join(path, "postings_docs.bin")), 'I')
+        tfs = _uint_view(_map_file(os.path.join(path, "postings_tfs.bin")), 'I')
+        with open(os.path.join(path, "terms.json"), encoding='utf-8') as f:
+            terms = jsoncodec.loads(f.read())
+        postings = {
+            term: (docs[start:start + df], tfs[start:start + df])
+            for term, (start, df) in terms.items()
+        }
+        doc_lengths = _uint_view(_map_file(os.path.join(path, "doc_lengths.bin")), 'I')
+        bm25 = BM25Index.from_postings(postings, doc_lengths)
+        meta = _uint_view(_map_file(os.path.join(path, "chunk_meta.bin")), 'I')
+        return cls(source or manifest["source"], manifest["digest"], chunks, bm25,
+                   meta, manifest["chunker"], path)
+
+    def dense(self, embedder):
+        """DenseIndex do segmento para o embedder (gravado ao lado do segmento)"""
+        from app.core.embeddings import DenseIndex
+
+        key = (embedder.name, embedder.dim)
+        with self._dense_lock:
+            index = self._dense.get(key)
+            if index is None:
+                if self.path is None:
+                    index = DenseIndex(embedder).build(list(self.chunks))
+                else:
+                    path = os.path.join(self.path, f"embeddings-{embedder.name}-{embedder.dim}.npy")
+                    if not os.path.exists(path):
+                        tmp = f"{path}.tmp-{os.getpid()}.npy"
+                        DenseIndex(embedder).build(list(self.chunks)).save(tmp)
+                        os.replace(tmp, path)
+                    index = DenseIndex.load(path, embedder)
+                self._dense[key] = index
+            return index
+
+
+def _chunk_meta(chunks: List[Chunk]) -> array:
+    meta = array('I')
+    for chunk in chunks:
+        meta.extend((chunk.page, chunk.start, chunk.end))
+    return meta
+
+
+def _write_segment(path: str, source: str, digest: str, chunks: List[Chunk], chunker):
+    os.makedirs(path)
+    texts = [chunk.text for chunk in chunks]
+    encoded = [text.encode('utf-8') for text in texts]
+    offsets = array('Q', [0])
+    for data in encoded:
+        offsets.append(offsets[-1] + len(data))
+    with open(os.path.join(path, "chunks.bin"), 'wb') as f:
+        f.write(b''.join(encoded))
+    with open(os.path.join(path, "chunk_offsets.bin"), 'wb') as f:
+        offsets.tofile(f)
+
+    bm25 = BM25Index(texts)
+    docs, tfs, terms = array('I'), array('I'), {}
+    for term, (term_docs, term_tfs) in bm25.postings.items():
+        terms[term] = [len(docs), len(term_docs)]
+        docs.extend(term_docs)
+        tfs.extend(term_tfs)
+    for name, data in (("postings_docs.bin", docs), ("postings_tfs.bin", tfs),
+                       ("doc_lengths.bin", bm25.doc_lengths), ("chunk_meta.bin", _chunk_meta(chunks))):
+        with open(os.path.join(path, name), 'wb') as f:
+            data.tofile(f)
+    with open(os.path.join(path, "terms.json"), 'w', encoding='utf-8') as f:
+        f.write(jsoncodec.dumps(terms))
+
+    manifest = {
+        "version": FORMAT_VERSION,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "source": source,
+        "digest": digest,
+        "chunker": chunker.signature,
+        "n_chunks": len(chunks),
+        "n_terms": len(terms),
+    }
+    # O manifest é o último arquivo: sem ele o diretório não é considerado válido
+    with open(os.path.join(path, "manifest.json"), 'w', encoding='utf-8') as f:
+        f.write(jsoncodec.dumps(manifest))
+
+
+def segment_path(index_dir: str, digest: str, chunker=None) -> str:
+    return os.path.join(index_dir, "segments", segment_key(digest, chunker))
+
+
+def load_segment(source: str, digest: str, index_dir: Optional[str] = DEFAULT_INDEX_DIR,
+                 chunker=None) -> Segment:
+    """Abre o segmento do arquivo, processando e gravando se ainda não existir"""
+    chunker = chunker or DEFAULT_CHUNKER
+    if not index_dir:
+        return Segment.from_file(source, digest, chunker)
+
+    final = segment_path(index_dir, digest, chunker)
+    if not os.path.exists(os.path.join(final, "manifest.json")):
+        chunks = chunk_document(source, chunker)
+        # Grava em diretório temporário e publica com rename atômico; se outro
+        # worker publicar o mesmo segmento antes, a cópia dele é mantida
+        parent = os.path.dirname(final)
+        os.makedirs(parent, exist_ok=True)
+        tmp = os.path.join(parent, f".tmp-{os.path.basename(final)}-{os.getpid()}-{threading.get_ident()}")
+        shutil.rmtree(tmp, ignore_errors=True)
+        _write_segment(tmp, source, digest, chunks, chunker)
+        try:
+            os.rename(tmp, final)
+            logger.info(f"[RAG] Segmento gravado para {source}: {len(chunks)} chunks")
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+    return Segment.open(final, source)
+
+
+def prune_segments(index_dir: str, keep_digests: List[str], chunker=None) -> int:
+    """Remove segmentos que nenhuma fonte atual usa; retorna quantos foram removidos"""
+    root = os.path.join(index_dir, "segments")
+    if not os.path.isdir(root):
+        return 0
+    keep = {segment_key(d, chunker) for d in keep_digests}
+    removed = 0
+    for name in os.listdir(root):
+        if name not in keep and not name.startswith('.'):
+            # Workers que ainda mapeiam o segmento seguem com os arquivos abertos
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+            removed += 1
+    return removed
+
+
+# --- Gerações ----------------------------------------------------------------
+
+class GenerationChunks(Sequence):
+    """Visão contínua sobre os chunks de todos os segmentos da geração"""
+
+    def __init__(self, segments: List[Segment], bases: List[int], total: int):
+        self._segments = segments
+        self._bases = bases
+        self._total = total
+
+    def __len__(self):
+        return self._total
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += self._total
+        if not 0 <= i < self._total:
+            raise IndexError(i)
+        s = bisect.bisect_right(self._bases, i) - 1
+        return self._segments[s].chunks[i - self._bases[s]]
+
+    def chunk(self, i: int) -> Chunk:
+        """Chunk i com arquivo, página e offsets"""
+        s = bisect.bisect_right(self._bases, i) - 1
+        return self._segments[s].chunk(i - self._bases[s])
+
+
+class KBGeneration:
+    """
+    Conjunto imutável de segmentos servido às consultas. Uma recarga monta
+    uma geração nova ao lado e troca a referência; consultas em andamento
+    continuam na geração antiga até terminar.
+    """
+
+    def __init__(self, segments: List[Segment], number: int = 0, embedder=None):
+        self.segments = segments
+        self.number = number
+        self.created_at = time.time()
+        self.sources = {segment.source: segment.digest for segment in segments}
+        self.bm25 = SegmentedBM25([segment.bm25 for segment in segments])
+        self.bases = self.bm25.bases
+        self.chunks = GenerationChunks(segments, self.bases, len(self.bm25))
+        self.embedder = embedder
+        self.dense = [segment.dense(embedder) for segment in segments] if embedder else None
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def search(self, query: str, top_k: int = 3) -> List[Tuple[float, int]]:
+        """[(score, doc_id)]: semântica se a geração tem embeddings, senão BM25"""
+        if not self.dense:
+            return self.bm25.search(query, top_k)
+
+        vector = self.embedder.embed([query])
+        hits = []
+        for base, index in zip(self.bases, self.dense):
+            hits.extend((score, base + doc_id) for score, doc_id in index.search_vectors(vector, top_k)[0])
+        hits.sort(key=lambda hit: (-hit[0], hit[1]))
+        return hits[:top_k]
+
+    def retrieve(self, query: str, top_k: int = 3) -> List[str]:
+        return [self.chunks[doc_id] for _, doc_id in self.search(query, top_k)]
+
+    def retrieve_chunks(self, query: str, top_k: int = 3) -> List[Chunk]:
+        """Como retrieve, com a origem de cada trecho (para citar arquivo/página)"""
+        return [self.chunks.chunk(doc_id) for _, doc_id in self.search(query, top_k)]
+
+
+def open_generation(sources: Dict[str, str], index_dir: Optional[str] = DEFAULT_INDEX_DIR,
+                    embedder=None, previous: Optional[KBGeneration] = None,
+                    chunker=None) -> KBGeneration:
+    """
+    Monta a geração para {arquivo: sha256}. Segmentos da geração anterior com
+    o mesmo conteúdo e chunker são reaproveitados (inclusive embeddings já calculados).
+    """
+    chunker = chunker or DEFAULT_CHUNKER
+    reusable = {segment.digest: segment for segment in previous.segments} if previous else {}
+    segments = []
+    for source, digest in sources.items():
+        segment = reusable.get(digest)
+        if segment is None or segment.source != source or segment.chunker != chunker.signature:
+            try:
+                segment = load_segment(source, digest, index_dir, chunker)
+            except Exception as e:
+                if not index_dir:
+                    logger.error(f"[RAG] Erro carregando {source}: {e}")
+                    continue
+                logger.error(f"[RAG] Segmento em disco indisponível para {source}, processando em memória: {e}")
+                try:
+                    segment = Segment.from_file(source, digest, chunker)
+                except Exception as e:
+                    logger.error(f"[RAG] Erro carregando {source}: {e}")
+                    continue
+        segments.append(segment)
+    number = previous.number + 1 if previous else 1
+    return KBGeneration(segments, number, embedder)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Índice pré-construído da base de conhecimento")
+    parser.add_argument("command", choices=["build", "status"])
+    parser.add_argument("files", nargs="*")
+    parser.add_argument("--index-dir", default=DEFAULT_INDEX_DIR)
+    parser.add_argument("--embeddings", action="store_true", help="gera também a matriz de embeddings")
+    args = parser.parse_intermixed_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    files = args.files or discover_sources()
+    sources = {path: file_sha256(path) for path in files if os.path.exists(path)}
+
+    if args.command == "status":
+        print(f"Chunker: {DEFAULT_CHUNKER.signature}")
+        missing = 0
+        for path, digest in sources.items():
+            fresh = os.path.exists(os.path.join(segment_path(args.index_dir, digest), "manifest.json"))
+            missing += not fresh
+            print(f"  {'ok' if fresh else 'pendente':<9}{path} ({digest[:12]})")
+        return 1 if missing else 0
+
+    embedder = None
+    if args.embeddings:
+        from app.core.embeddings import get_embedder
+        embedder = get_embedder()
+    t0 = time.perf_counter()
+    generation = open_generation(sources, args.index_dir, embedder)
+    removed = prune_segments(args.index_dir, list(sources.values()))
+    print(f"Índice pronto: {len(generation.segments)} segmentos, {len(generation)} chunks "
+          f"({removed} segmentos antigos removidos) em {time.perf_counter() - t0:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
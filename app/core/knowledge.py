@@ -0,0 +1,253 @@
+# app/core/knowledge.py
+"""
+Serviço da base de conhecimento: mantém a geração atual do índice e a
+recarrega de forma incremental quando documentos entram, mudam ou saem
+(watcher do diretório ou upload pelo endpoint de admin).
+"""
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core import kb_index
+from app.core.chunking import Chunk
+
+logger = logging.getLogger(__name__)
+
+
+class KnowledgeService:
+    """
+    Base de conhecimento com recarga a quente.
+
+    A geração servida (`self.generation`) é imutável; `reload()` monta a
+    próxima ao lado, reaproveitando os segmentos dos arquivos que não mudaram,
+    e troca a referência de uma vez. Consultas nunca esperam uma recarga nem
+    veem um índice pela metade.
+    """
+
+    def __init__(self, documents_dir: Optional[str] = None, file_paths: Optional[List[str]] = None,
+                 retrieval_mode: Optional[str] = None, embedder=None,
+                 index_dir: Optional[str] = kb_index.DEFAULT_INDEX_DIR,
+                 watch_interval: Optional[float] = None, chunker=None):
+        self.documents_dir = documents_dir
+        self.file_paths = file_paths
+        self.index_dir = index_dir
+        # 'bm25' (padrão) ou 'semantic' (embeddings densos, app.core.embeddings)
+        self.retrieval_mode = retrieval_mode or os.environ.get('KB_RETRIEVAL_MODE', 'bm25')
+        self._embedder = embedder
+        self.chunker = chunker or kb_index.DEFAULT_CHUNKER
+        self.generation = kb_index.KBGeneration([], 0)
+
+        self._reload_lock = threading.Lock()
+        self._digests: Dict[str, tuple] = {}  # caminho -> (tamanho, mtime_ns, sha256)
+        self.stats_counters = {'reloads': 0, 'reload_errors': 0, 'segments_added': 0,
+                               'segments_removed': 0, 'last_reload_ms': 0.0}
+
+        if watch_interval is None:
+            watch_interval = float(os.environ.get('KB_WATCH_INTERVAL', '15')) if documents_dir else 0
+        self.watch_interval = watch_interval
+        self._watcher: Optional[threading.Thread] = None
+        self._watcher_pid = None
+        self._stop = threading.Event()
+
+        self.reload(force=True)
+        self.ensure_watcher()
+
+    # --- Fontes ---------------------------------------------------------------
+
+    def sources(self) -> List[str]:
+        if self.documents_dir:
+            return kb_index.discover_sources(self.documents_dir)
+        return list(self.file_paths or [])
+
+    def _digest(self, path: str) -> str:
+        """sha256 do arquivo, recalculado só quando tamanho/mtime mudam"""
+        st = os.stat(path)
+        cached = self._digests.get(path)
+        if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+            return cached[2]
+        digest = kb_index.file_sha256(path)
+        self._digests[path] = (st.st_size, st.st_mtime_ns, digest)
+        return digest
+
+    def _current_sources(self) -> Dict[str, str]:
+        sources = {}
+        for path in self.sources():
+            if os.path.exists(path):
+                sources[path] = self._digest(path)
+            else:
+                logger.warning(f"[RAG] Arquivo não encontrado: {path}")
+        return sources
+
+    # --- Recarga ----------------------------------------------------------------
+
+    def _embedder_for_mode(self):
+        if self.retrieval_mode != 'semantic':
+            return None
+        if self._embedder is None:
+            from app.core.embeddings import get_embedder
+            self._embedder = get_embedder()
+        return self._embedder
+
+    def reload(self, force: bool = False) -> bool:
+        """Reindexa só o que mudou e troca a geração; retorna True se trocou"""
+        with self._reload_lock:
+            t0 = time.perf_counter()
+            current = self.generation
+            try:
+                sources = self._current_sources()
+                if not force and sources == current.sources:
+                    return False
+
+                try:
+                    generation = kb_index.open_generation(
+                        sources, self.index_dir, self._embedder_for_mode(), previous=current,
+                        chunker=self.chunker,
+                    )
+                except Exception as e:
+                    if self.retrieval_mode != 'semantic':
+                        raise
+                    logger.error(f"[RAG] Índice semântico indisponível, usando BM25: {e}")
+                    generation = kb_index.open_generation(sources, self.index_dir, None, previous=current,
+                                                          chunker=self.chunker)
+            except Exception as e:
+                self.stats_counters['reload_errors'] += 1
+                logger.error(f"[RAG] Erro recarregando a base de conhecimento: {e}")
+                return False
+
+            # Troca atômica: leitores pegam a referência antiga ou a nova, nunca um meio-termo
+            self.generation = generation
+
+            old, new = set(current.sources.values()), set(generation.sources.values())
+            added, removed = len(new - old), len(old - new)
+            self.stats_counters['reloads'] += 1
+            self.stats_counters['segments_added'] += added
+            self.stats_counters['segments_removed'] += removed
+            self.stats_counters['last_reload_ms'] = round((time.perf_counter() - t0) * 1000, 1)
+            if removed and self.index_dir:
+                kb_index.prune_segments(self.index_dir, list(new), self.chunker)
+            logger.info(
+                f"[RAG] Geração {generation.number}: {len(generation.segments)} documentos, "
+                f"{len(generation)} chunks (+{added} / -{removed}) em {self.stats_counters['last_reload_ms']}ms"
+            )
+            return True
+
+    def add_document(self, filename: str, data: bytes) -> str:
+        """Grava um documento enviado no diretório monitorado; retorna o caminho"""
+        if not self.documents_dir:
+            raise ValueError("Base de conhecimento sem diretório de documentos")
+        name = os.path.basename(filename or '')
+        if not name or name.startswith('.') or not name.lower().endswith(kb_index.SUPPORTED_EXTENSIONS):
+            raise ValueError(f"Tipo de arquivo não suportado: {filename!r}")
+
+        os.makedirs(self.documents_dir, exist_ok=True)
+        path = os.path.join(self.documents_dir, name)
+        tmp = os.path.join(self.documents_dir, f".upload-{os.getpid()}-{name}")
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        # O watcher nunca vê o arquivo pela metade
+        os.replace(tmp, path)
+        logger.info(f"[RAG] Documento recebido: {path} ({len(data)} bytes)")
+        return path
+
+    # --- Watcher ----------------------------------------------------------------
+
+    def ensure_watcher(self):
+        """Inicia o watcher (também após fork do gunicorn, que não herda threads)"""
+        if not self.documents_dir or self.watch_interval <= 0:
+            return
+        if self._watcher is not None and self._watcher_pid == os.getpid():
+            return
+        self._watcher_pid = os.getpid()
+        self._watcher = threading.Thread(target=self._watch_loop, name='kb-watcher', daemon=True)
+        self._watcher.start()
+
+    def _signature(self):
+        entries = []
+        for path in kb_index.discover_sources(self.documents_dir):
+            try:
+                st = os.stat(path)
+                entries.append((path, st.st_size, st.st_mtime_ns))
+            except OSError:
+                continue
+        return tuple(entries)
+
+    def _watch_loop(self):
+        last = self._signature()
+        while not self._stop.wait(self.watch_interval):
+            signature = self._signature()
+            if signature != last:
+                last = signature
+                self.reload()
+
+    def stop(self):
+        self._stop.set()
+
+    # --- Consulta ---------------------------------------------------------------
+
+    @property
+    def chunks(self):
+        return self.generation.chunks
+
+    @property
+    def index(self):
+        return self.generation.bm25
+
+    def retrieve_relevant(self, query: str, top_k: int = 3) -> List[str]:
+        """Busca chunks relevantes (semântica se habilitada, senão BM25)"""
+        self.ensure_watcher()
+        generation = self.generation  # uma geração do início ao fim da consulta
+        if not len(generation):
+            return []
+        return generation.retrieve(query, top_k)
+
+    def retrieve_chunks(self, query: str, top_k: int = 3) -> List[Chunk]:
+        """Como retrieve_relevant, com arquivo/página/offsets de cada trecho"""
+        self.ensure_watcher()
+        generation = self.generation
+        if not len(generation):
+            return []
+        return generation.retrieve_chunks(query, top_k)
+
+    def retrieve_scored(self, query: str, top_k: int = 3) -> List[Tuple[float, Chunk]]:
+        """[(score, trecho)] para quem precisa ponderar os trechos (ex.: orçamento de contexto)"""
+        self.ensure_watcher()
+        generation = self.generation
+        if not len(generation):
+            return []
+        return [(score, generation.chunks.chunk(doc_id)) for score, doc_id in generation.search(query, top_k)]
+
+    def get_context_for_query(self, query: str) -> str:
+        """Retorna contexto formatado para a query"""
+        relevant_chunks = self.retrieve_relevant(query)
+        if relevant_chunks:
+            context = "\n\n".join(relevant_chunks)
+            return f"CONTEXTO RELEVANTE DA BIOGRAFIA:\n{context}\n"
+        return ""
+
+    def get_stats(self) -> Dict[str, Any]:
+        generation = self.generation
+        return {
+            'generation': generation.number,
+            'documents': {segment.source: len(segment) for segment in generation.segments},
+            'chunks': len(generation),
+            'retrieval_mode': 'semantic' if generation.dense else 'bm25',
+            'chunker': self.chunker.signature,
+            'watching': bool(self._watcher and self._watcher.is_alive()),
+            **self.stats_counters,
+        }
+
+
+_service: Optional[KnowledgeService] = None
+_service_lock = threading.Lock()
+
+
+def get_knowledge_service() -> KnowledgeService:
+    """Instância compartilhada sobre todos os documentos de KB_DOCUMENTS_DIR"""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = KnowledgeService(documents_dir=kb_index.DEFAULT_DOCUMENTS_DIR)
+    return _service
@@ -0,0 +1,73 @@
+# app/core/metrics.py
+"""
+Métricas de latência por operação (chamadas de ferramenta, runs do assistente).
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict
+
+
+class _OperationStats:
+    __slots__ = ('count', 'errors', 'total_ms', 'max_ms', 'samples')
+
+    def __init__(self, window: int):
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.samples = deque(maxlen=window)
+
+
+def _percentile(ordered, fraction: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+class LatencyStats:
+    """Contagem, erros, média, máximo e p50/p95 (últimas `window` amostras) por operação"""
+
+    def __init__(self, window: int = 512):
+        self.window = window
+        self._ops: Dict[str, _OperationStats] = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, elapsed_ms: float, ok: bool = True):
+        with self._lock:
+            op = self._ops.get(name)
+            if op is None:
+                op = self._ops[name] = _OperationStats(self.window)
+            op.count += 1
+            op.errors += not ok
+            op.total_ms += elapsed_ms
+            op.max_ms = max(op.max_ms, elapsed_ms)
+            op.samples.append(elapsed_ms)
+
+    @contextmanager
+    def measure(self, name: str):
+        """Mede o bloco; exceções contam como erro e são propagadas"""
+        t0 = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self.record(name, (time.perf_counter() - t0) * 1000, ok)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            ops = {name: (op.count, op.errors, op.total_ms, op.max_ms, sorted(op.samples))
+                   for name, op in self._ops.items()}
+        return {
+            name: {
+                'count': count,
+                'errors': errors,
+                'avg_ms': round(total / count, 1) if count else 0.0,
+                'p50_ms': round(_percentile(samples, 0.50), 1),
+                'p95_ms': round(_percentile(samples, 0.95), 1),
+                'max_ms': round(max_ms, 1),
+            }
+            for name, (count, errors, total, max_ms, samples) in ops.items()
+        }
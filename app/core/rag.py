@@ -0,0 +1,147 @@
+# app/core/rag.py
+"""
+Consulta RAG usada pela ferramenta `rag_query` do assistente.
+
+Resultados de busca ficam em cache LRU+TTL pela consulta normalizada (e pela
+geração do índice, então uma recarga invalida tudo sem limpeza explícita).
+Por sessão, lembra os trechos já entregues à thread do assistente: um trecho
+repetido volta só como referência, sem reenviar o texto.
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from app.core.bm25 import tokenize
+from app.core.chunking import Chunk
+from app.utils.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(query: str) -> str:
+    """Chave de cache: termos do BM25 sem ordem/repetição ('Bandeirante, marketing?' == 'marketing bandeirante')"""
+    terms = sorted(set(tokenize(query or '')))
+    return " ".join(terms) if terms else " ".join((query or '').lower().split())
+
+
+class _SessionContext:
+    __slots__ = ('delivered', 'last_seen')
+
+    def __init__(self):
+        self.delivered: 'OrderedDict[tuple, None]' = OrderedDict()  # (arquivo, início, fim)
+        self.last_seen = time.monotonic()
+
+
+class RAGQueryService:
+    """Busca na base de conhecimento com cache de consultas e memória de trechos por sessão"""
+
+    def __init__(self, knowledge=None, top_k: int = 3, cache_size: Optional[int] = None,
+                 cache_ttl: Optional[float] = None, session_ttl: Optional[float] = None,
+                 session_chunks: int = 32, max_sessions: int = 5000):
+        self._knowledge = knowledge
+        self.top_k = top_k
+        self.cache = TTLCache(
+            max_size=cache_size or int(os.environ.get('RAG_CACHE_SIZE', '1024')),
+            ttl=cache_ttl if cache_ttl is not None else float(os.environ.get('RAG_CACHE_TTL', '600')),
+        )
+        self.session_ttl = session_ttl if session_ttl is not None else float(os.environ.get('RAG_SESSION_TTL', '1800'))
+        self.session_chunks = session_chunks
+        self.max_sessions = max_sessions
+        self._sessions: 'OrderedDict[str, _SessionContext]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats_counters = {'queries': 0, 'retrievals': 0, 'chunks_sent': 0, 'chunks_reused': 0}
+
+    @property
+    def knowledge(self):
+        if self._knowledge is None:
+            from app.core.knowledge import get_knowledge_service
+            self._knowledge = get_knowledge_service()
+        return self._knowledge
+
+    # --- Sessões ------------------------------------------------------------------
+
+    def _session(self, session_id: str) -> _SessionContext:
+        now = time.monotonic()
+        with self._lock:
+            context = self._sessions.get(session_id)
+            if context is None or now - context.last_seen > self.session_ttl:
+                context = self._sessions[session_id] = _SessionContext()
+            context.last_seen = now
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return context
+
+    def forget_session(self, session_id: str):
+        """Esquece os trechos entregues (ex.: a thread do assistente foi recriada)"""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    # --- Consulta -----------------------------------------------------------------
+
+    def search(self, query: str) -> Tuple[Any, Tuple[int, ...]]:
+        """(geração, ids dos top-k chunks), com cache pela consulta normalizada"""
+        self.knowledge.ensure_watcher()
+        generation = self.knowledge.generation  # ids só valem dentro da geração em que foram buscados
+        if not query or not len(generation):
+            return generation, ()
+        key = (generation.number, normalize_query(query))
+        doc_ids = self.cache.get(key)
+        if doc_ids is None:
+            doc_ids = tuple(doc_id for _, doc_id in generation.search(query, self.top_k))
+            self.cache.set(key, doc_ids)
+            self.stats_counters['retrievals'] += 1
+        return generation, doc_ids
+
+    def query(self, session_id: Optional[str], query: str) -> Dict[str, Any]:
+        """
+        Trechos relevantes para a sessão: {'trechos': [...], 'reaproveitados': n}.
+        Trechos já entregues a esta sessão vêm sem o texto (`ja_enviado`).
+        """
+        self.stats_counters['queries'] += 1
+        generation, doc_ids = self.search(query)
+        context = self._session(session_id) if session_id else None
+
+        results, reused = [], 0
+        for doc_id in doc_ids:
+            chunk: Chunk = generation.chunks.chunk(doc_id)
+            item = {'fonte': os.path.basename(chunk.source), 'pagina': chunk.page}
+            key = (chunk.source, chunk.start, chunk.end)  # estável entre gerações
+            if context is not None and key in context.delivered:
+                context.delivered.move_to_end(key)
+                item['ja_enviado'] = True
+                reused += 1
+            else:
+                item['texto'] = chunk.text
+                if context is not None:
+                    context.delivered[key] = None
+                    while len(context.delivered) > self.session_chunks:
+                        context.delivered.popitem(last=False)
+            results.append(item)
+
+        self.stats_counters['chunks_sent'] += len(results) - reused
+        self.stats_counters['chunks_reused'] += reused
+        return {'trechos': results, 'reaproveitados': reused}
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats_counters,
+            'sessions': len(self._sessions),
+            'cache': self.cache.get_stats(),
+        }
+
+
+_service: Optional[RAGQueryService] = None
+_service_lock = threading.Lock()
+
+
+def get_rag_service() -> RAGQueryService:
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = RAGQueryService()
+    return _service
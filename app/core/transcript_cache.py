@@ -0,0 +1,226 @@
+# app/core/transcript_cache.py
+"""
+Cache de transcrições por hash do conteúdo do áudio.
+
+Retentativas do webhook da Twilio e notas de voz encaminhadas fazem o mesmo
+áudio ser transcrito de novo. A chave é o SHA-256 dos bytes da mídia (calculado
+durante o download), então um encaminhamento com outra URL também acerta.
+Camadas:
+- URL -> hash (memória): a retentativa do webhook com a mesma MediaUrl nem baixa
+- hash -> transcrição em memória (TTLCache, LRU)
+- hash -> transcrição em disco (`TRANSCRIPT_CACHE_DIR`, um JSON por áudio,
+  compartilhado entre workers e sobrevive a restart)
+Num acerto não há download (URL conhecida), transcodificação nem Whisper. Uma
+retentativa que chega enquanto a primeira ainda transcreve espera por ela
+(até `TRANSCRIPT_WAIT_S`) em vez de transcrever de novo.
+"""
+import logging
+import os
+import shutil
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app.utils import jsoncodec
+from app.utils.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+class TranscriptCache:
+    """
+    `download(url)` -> (caminho, sha256) ou None; `transcribe(caminho)` -> texto.
+    Só textos aceitos por `cacheable` são guardados (mensagens de erro e
+    transcrições parciais não: a próxima chamada transcreve de novo).
+    `directory` vazio desliga a camada em disco.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, ttl: Optional[float] = None,
+                 directory: Optional[str] = None, url_ttl: Optional[float] = None):
+        self.enabled = os.environ.get('TRANSCRIPT_CACHE_ENABLED', '1') != '0'
+        self.ttl = ttl if ttl is not None else float(os.environ.get('TRANSCRIPT_CACHE_TTL', str(30 * 86400)))
+        max_entries = max_entries or int(os.environ.get('TRANSCRIPT_CACHE_SIZE', '2048'))
+        self.directory = (directory if directory is not None
+                          else os.environ.get('TRANSCRIPT_CACHE_DIR', os.path.join('.cache', 'transcripts')))
+        self._memory = TTLCache(max_size=max_entries, ttl=self.ttl)
+        self._urls = TTLCache(max_size=max_entries,
+                              ttl=url_ttl if url_ttl is not None else float(os.environ.get('TRANSCRIPT_URL_TTL', '86400')))
+        self.wait_s = float(os.environ.get('TRANSCRIPT_WAIT_S', '120'))
+        self._inflight: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        self.stats_counters = {'lookups': 0, 'url_hits': 0, 'joined_hits': 0, 'memory_hits': 0, 'disk_hits': 0,
+                               'misses': 0, 'uncacheable': 0,
+                               'stored': 0, 'disk_errors': 0, 'saved_s': 0.0, 'spent_s': 0.0}
+
+    # --- Camada em disco -----------------------------------------------------------
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], f"{digest}.json")
+
+    def _read_disk(self, digest: str) -> Optional[Dict[str, Any]]:
+        if not self.directory:
+            return None
+        path = self._path(digest)
+        try:
+            with open(path, 'rb') as f:
+                entry = jsoncodec.loads(f.read())
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            self._count('disk_errors')
+            logger.warning(f"[TRANSCRIPT CACHE] Entrada ilegível {path}: {e}")
+            return None
+        if time.time() - entry.get('created_at', 0) > self.ttl:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return entry
+
+    def _write_disk(self, digest: str, entry: Dict[str, Any]):
+        if not self.directory:
+            return
+        path = self._path(digest)
+        tmp = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.write(jsoncodec.dumps(entry))
+            os.replace(tmp, path)
+        except OSError as e:
+            self._count('disk_errors')
+            logger.warning(f"[TRANSCRIPT CACHE] Falha ao gravar {path}: {e}")
+
+    # --- Consulta ------------------------------------------------------------------
+
+    def _count(self, name: str, amount: float = 1):
+        with self._lock:
+            self.stats_counters[name] += amount
+
+    def get(self, digest: str) -> Tuple[Optional[Dict[str, Any]], str]:
+        """(entrada, camada) com camada 'memory' | 'disk' | 'miss'"""
+        entry = self._memory.get(digest)
+        if entry is not None:
+            return entry, 'memory'
+        entry = self._read_disk(digest)
+        if entry is not None:
+            self._memory.set(digest, entry)
+            return entry, 'disk'
+        return None, 'miss'
+
+    def put(self, digest: str, text: str, cost_s: float, media_url: Optional[str] = None):
+        entry = {'text': text, 'cost_s': round(cost_s, 3), 'created_at': time.time()}
+        self._memory.set(digest, entry)
+        if media_url:
+            self._urls.set(media_url, digest)
+        self._write_disk(digest, entry)
+        self._count('stored')
+
+    def transcribe(self, media_url: str, download: Callable[[str], Optional[Tuple[str, str]]],
+                   transcribe: Callable[[str], str],
+                   cacheable: Callable[[str], bool] = lambda text: True) -> Optional[str]:
+        """Transcrição do áudio da URL (do cache quando possível); None se o download falhar"""
+        if not self.enabled:
+            downloaded = download(media_url)
+            return transcribe(downloaded[0]) if downloaded else None
+
+        self._count('lookups')
+        started = time.perf_counter()
+        text = self._by_url(media_url, 'url_hits', 0.0)
+        if text is not None:
+            return text
+
+        with self._lock:
+            event = self._inflight.get(media_url)
+            owner = event is None
+            if owner:
+                event = self._inflight[media_url] = threading.Event()
+        if not owner:
+            # Retentativa enquanto a primeira chamada ainda transcreve: espera em vez de repetir
+            event.wait(self.wait_s)
+            text = self._by_url(media_url, 'joined_hits', time.perf_counter() - started)
+            if text is not None:
+                return text
+        try:
+            return self._fetch(media_url, download, transcribe, cacheable)
+        finally:
+            if owner:
+                with self._lock:
+                    self._inflight.pop(media_url, None)
+                event.set()
+
+    def _by_url(self, media_url: str, kind: str, waited_s: float) -> Optional[str]:
+        digest = self._urls.get(media_url)
+        if digest is None:
+            return None
+        entry, _ = self.get(digest)
+        return self._hit(kind, entry, max(0.0, entry['cost_s'] - waited_s), media_url) if entry else None
+
+    def _fetch(self, media_url: str, download, transcribe, cacheable) -> Optional[str]:
+        started = time.perf_counter()
+        downloaded = download(media_url)
+        if not downloaded:
+            self._count('misses')
+            return None
+        path, digest = downloaded
+        download_s = time.perf_counter() - started
+        entry, tier = self.get(digest)
+        if entry is not None:
+            self._urls.set(media_url, digest)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            # O download já foi pago; a economia é só transcodificação + ASR
+            return self._hit(f'{tier}_hits', entry, max(0.0, entry['cost_s'] - download_s), media_url)
+
+        self._count('misses')
+        text = transcribe(path)
+        cost = time.perf_counter() - started
+        self._count('spent_s', cost)
+        if cacheable(text):
+            self.put(digest, text, cost, media_url)
+        else:
+            self._count('uncacheable')
+        return text
+
+    def _hit(self, kind: str, entry: Dict[str, Any], saved_s: float, media_url: str) -> str:
+        with self._lock:
+            self.stats_counters[kind] += 1
+            self.stats_counters['saved_s'] += saved_s
+        logger.info(f"[TRANSCRIPT CACHE] {kind.split('_')[0]} para {media_url[-40:]} (economia de {saved_s:.1f}s)")
+        return entry['text']
+
+    def clear(self, disk: bool = False):
+        self._memory.clear()
+        self._urls.clear()
+        if disk and self.directory and os.path.isdir(self.directory):
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self.stats_counters)
+        hits = sum(counters[kind] for kind in ('url_hits', 'joined_hits', 'memory_hits', 'disk_hits'))
+        return {
+            **counters,
+            'enabled': self.enabled,
+            'directory': self.directory or None,
+            'entries': len(self._memory),
+            'hit_rate': round(hits / counters['lookups'], 3) if counters['lookups'] else 0.0,
+            'saved_s': round(counters['saved_s'], 1),
+            'spent_s': round(counters['spent_s'], 1),
+        }
+
+
+_cache: Optional[TranscriptCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_transcript_cache() -> TranscriptCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = TranscriptCache()
+    return _cache
@@ -0,0 +1,431 @@
+# app/core/user_stats.py
+"""
+Contabilidade de usuários em lote, com rollups diários.
+
+Em vez de carregar a linha de `users`, somar `total_messages` em Python e
+gravar a cada mensagem (uma ida ao banco por mensagem e contagem perdida
+quando dois workers fazem o mesmo ao mesmo tempo), cada mensagem só soma um
+delta em memória. Um worker grava os deltas a cada
+`USER_STATS_FLUSH_INTERVAL` segundos, em lote e numa transação:
+- `users`: os novos entram com `INSERT ... ON CONFLICT DO NOTHING RETURNING`
+  (só quem inseriu conta o usuário como novo) e os totais com
+  `total_messages = total_messages + n`, atômico qualquer que seja o número
+  de workers;
+- `stats_daily` (rollup por dia e métrica: conversations, audio_messages,
+  text_messages, new_users): `value = value + n` na mesma transação.
+
+Os totais do `/stats` (usuários, conversas, áudio, texto) são a soma dos
+rollups: lidos do banco na partida (e a cada `USER_STATS_RESYNC_S`, em
+segundo plano, para incluir o que os outros workers gravaram; poucas linhas
+por dia, nenhuma varredura de `conversations`) e somados a cada mensagem
+deste processo. As séries por dia/semana/mês para os painéis saem dos
+mesmos rollups. Na primeira partida com a tabela vazia os rollups são
+preenchidos a partir de `conversations` e `users`.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.conversation_store import conversation_key
+
+logger = logging.getLogger(__name__)
+
+# Métrica do rollup -> chave do /stats
+TOTALS = {
+    'new_users': 'total_users',
+    'conversations': 'total_conversations',
+    'audio_messages': 'audio_messages',
+    'text_messages': 'text_messages',
+}
+BUCKETS = ('day', 'week', 'month')
+
+
+def _as_date(value: Any) -> Optional[date]:
+    """date(timestamp) volta como date no Postgres e como texto no SQLite"""
+    if value is None or isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def bucket_start(day: date, bucket: str) -> date:
+    """Início do período: o próprio dia, a segunda-feira da semana ou o dia 1 do mês"""
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    return day
+
+
+class SQLUserStatsBackend:
+    """Upsert em lote em users e stats_daily; totais e séries lidos dos rollups (models)"""
+
+    def __init__(self, database_uri: Optional[str] = None, engine_options: Optional[Dict] = None):
+        from sqlalchemy import create_engine
+        from models import Conversation, StatsDaily, User
+        from config import Config
+
+        uri = database_uri or Config.SQLALCHEMY_DATABASE_URI
+        options = Config.SQLALCHEMY_ENGINE_OPTIONS if engine_options is None else engine_options
+        if uri.startswith('sqlite'):
+            # Opções de pool do Postgres não se aplicam ao SQLite
+            options = {}
+
+        self.engine = create_engine(uri, **options)
+        self.users = User.__table__
+        self.conversations = Conversation.__table__
+        self.rollups = StatsDaily.__table__
+        for table in (self.users, self.conversations, self.rollups):
+            table.create(bind=self.engine, checkfirst=True)
+        self._backfill()
+
+    def _insert(self):
+        """INSERT com ON CONFLICT do dialeto; None se o dialeto não tiver"""
+        dialect = self.engine.dialect.name
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        elif dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            return None
+        return insert
+
+    def _backfill(self):
+        """Tabela de rollups vazia: preenche uma vez a partir do histórico (GROUP BY dia)"""
+        from sqlalchemy import func, select
+
+        c, u = self.conversations.c, self.users.c
+        with self.engine.begin() as conn:
+            if conn.execute(select(self.rollups.c.day).limit(1)).first() is not None:
+                return
+            today = datetime.utcnow().date()
+            counts: Dict[Tuple[date, str], int] = defaultdict(int)
+            day = func.date(c.timestamp)
+            for value, message_type, n in conn.execute(
+                    select(day, c.message_type, func.count()).group_by(day, c.message_type)):
+                value = _as_date(value) or today
+                counts[(value, 'conversations')] += n
+                if message_type in ('audio', 'text'):
+                    counts[(value, f'{message_type}_messages')] += n
+            first = func.date(u.first_message_date)
+            for value, n in conn.execute(select(first, func.count()).group_by(first)):
+                counts[(_as_date(value) or today, 'new_users')] += n
+            if counts:
+                # Outro worker pode ter preenchido ao mesmo tempo: as linhas dele prevalecem
+                self._add_rollups(conn, counts, only_new=True)
+                logger.info(f"[USER STATS] Rollups preenchidos a partir do histórico: {len(counts)} linhas")
+
+    def _add_rollups(self, conn, counts: Dict[Tuple[date, str], int], only_new: bool = False):
+        from sqlalchemy.exc import IntegrityError
+
+        r = self.rollups.c
+        rows = [{'day': day, 'metric': metric, 'value': n} for (day, metric), n in counts.items() if n]
+        if not rows:
+            return
+        insert = self._insert()
+        if insert is not None:
+            stmt = insert(self.rollups)
+            if only_new:
+                stmt = stmt.on_conflict_do_nothing(index_elements=[r.day, r.metric])
+            else:
+                stmt = stmt.on_conflict_do_update(index_elements=[r.day, r.metric],
+                                                  set_={'value': r.value + stmt.excluded.value})
+            conn.execute(stmt, rows)
+            return
+        # Sem upsert no dialeto: UPDATE atômico (value = value + n) e INSERT se a linha não existir
+        for row in rows:
+            if not only_new:
+                updated = conn.execute(self.rollups.update()
+                                       .where(r.day == row['day'], r.metric == row['metric'])
+                                       .values(value=r.value + row['value']))
+                if updated.rowcount:
+                    continue
+            try:
+                with conn.begin_nested():
+                    conn.execute(self.rollups.insert(), row)
+            except IntegrityError:
+                if not only_new:
+                    raise
+
+    def load_totals(self) -> Dict[str, int]:
+        """Totais do /stats: soma dos rollups (linhas = dias x métricas)"""
+        from sqlalchemy import func, select
+
+        r = self.rollups.c
+        with self.engine.connect() as conn:
+            sums = dict(conn.execute(select(r.metric, func.sum(r.value)).group_by(r.metric)).all())
+        return {key: int(sums.get(metric) or 0) for metric, key in TOTALS.items()}
+
+    def load_series(self, since: date) -> Dict[Tuple[date, str], int]:
+        """Rollups a partir de `since` (inclusive)"""
+        from sqlalchemy import select
+
+        r = self.rollups.c
+        with self.engine.connect() as conn:
+            rows = conn.execute(select(r.day, r.metric, r.value).where(r.day >= since)).all()
+        return {(_as_date(day), metric): value for day, metric, value in rows}
+
+    def upsert_many(self, rows: List[Dict[str, Any]], daily: Dict[Tuple[date, str], int]) -> Dict[date, int]:
+        """
+        Soma os deltas dos usuários e dos rollups numa transação; retorna os
+        usuários novos por dia da primeira mensagem (já somados em new_users)
+        """
+        from sqlalchemy import bindparam, select
+
+        u = self.users.c
+        phones = [row['phone_number'] for row in rows]
+        created = set()
+        insert = self._insert()
+        with self.engine.begin() as conn:
+            if insert is not None:
+                # Só a transação que de fato inseriu recebe o telefone de volta
+                for start in range(0, len(rows), 500):
+                    stmt = (insert(self.users)
+                            .values([{**row, 'total_messages': 0} for row in rows[start:start + 500]])
+                            .on_conflict_do_nothing(index_elements=[u.phone_number])
+                            .returning(u.phone_number))
+                    created.update(conn.execute(stmt).scalars())
+            else:
+                existing = set(conn.execute(select(u.phone_number).where(u.phone_number.in_(phones))).scalars())
+                new_rows = [{**row, 'total_messages': 0} for row in rows if row['phone_number'] not in existing]
+                if new_rows:
+                    conn.execute(self.users.insert(), new_rows)
+                created = {row['phone_number'] for row in new_rows}
+            conn.execute(
+                self.users.update().where(u.phone_number == bindparam('b_phone')).values(
+                    total_messages=u.total_messages + bindparam('b_total'),
+                    last_message_date=bindparam('b_last')),
+                [{'b_phone': row['phone_number'], 'b_total': row['total_messages'],
+                  'b_last': row['last_message_date']} for row in rows]
+            )
+            new_users: Dict[date, int] = defaultdict(int)
+            for row in rows:
+                if row['phone_number'] in created:
+                    new_users[row['first_message_date'].date()] += 1
+            counts = dict(daily)
+            for day, n in new_users.items():
+                counts[(day, 'new_users')] = counts.get((day, 'new_users'), 0) + n
+            self._add_rollups(conn, counts)
+        return dict(new_users)
+
+
+class UserStats:
+    """
+    Deltas por usuário e por dia acumulados em memória e gravados em lote;
+    agregados do `/stats` e séries lidos da memória. `backend=None` mantém só
+    os contadores do processo.
+    """
+
+    def __init__(self, backend: Any = 'auto', flush_interval: Optional[float] = None,
+                 resync_interval: Optional[float] = None, series_days: Optional[int] = None):
+        self.flush_interval = (flush_interval if flush_interval is not None
+                               else float(os.environ.get('USER_STATS_FLUSH_INTERVAL', '2.0')))
+        self.resync_interval = (resync_interval if resync_interval is not None
+                                else float(os.environ.get('USER_STATS_RESYNC_S', '300')))
+        self.series_days = series_days or int(os.environ.get('USER_STATS_SERIES_DAYS', '90'))
+        self._pending: Dict[str, Dict[str, Any]] = {}  # telefone -> linha com o delta
+        self._pending_daily: Dict[Tuple[date, str], int] = defaultdict(int)  # (dia, métrica) -> delta
+        self._known: set = set()  # só sem banco: usuários já vistos (com banco, o upsert diz quem é novo)
+        self._totals = {key: 0 for key in TOTALS.values()}
+        self._unsynced = dict(self._totals)  # somado desde a última leitura do banco
+        self._daily: Dict[Tuple[date, str], int] = {}  # rollups lidos do banco (últimos `series_days` dias)
+        self._daily_unsynced: Dict[Tuple[date, str], int] = defaultdict(int)
+        self._synced_at = 0.0
+        self._flush_failing = False  # último lote falhou (banco fora do ar)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+        self.stats_counters = {'recorded': 0, 'flushed_rows': 0, 'flush_batches': 0, 'flush_errors': 0,
+                               'new_users': 0, 'resyncs': 0, 'resync_errors': 0}
+
+        if backend == 'auto':
+            backend = self._default_backend()
+        self.backend = backend
+        if self.backend is not None:
+            self._resync()
+            atexit.register(self.close)
+
+    @staticmethod
+    def _default_backend():
+        if os.environ.get('USER_STATS_PERSIST', '1') == '0':
+            return None
+        try:
+            return SQLUserStatsBackend()
+        except Exception as e:
+            logger.warning(f"[USER STATS] Contabilidade sem persistência (somente RAM): {e}")
+            return None
+
+    # --- Escrita --------------------------------------------------------------------
+
+    def _bump(self, day: date, metric: str, amount: int = 1, pending: bool = True):
+        """Soma no total e na série deste processo (e na fila do rollup); chamar com o lock"""
+        self._unsynced[TOTALS[metric]] += amount
+        self._daily_unsynced[(day, metric)] += amount
+        if pending:
+            self._pending_daily[(day, metric)] += amount
+
+    def record_message(self, session_or_phone: str, message_type: str = 'text', at: Optional[datetime] = None):
+        """Conta uma mensagem (uma troca) do usuário; nenhuma ida ao banco"""
+        phone = conversation_key(session_or_phone)
+        if not phone:
+            return
+        at = at or datetime.utcnow()
+        day = at.date()
+        with self._lock:
+            row = self._pending.get(phone)
+            if row is None:
+                row = self._pending[phone] = {'phone_number': phone, 'total_messages': 0, 'is_active': True,
+                                              'first_message_date': at, 'last_message_date': at}
+            row['total_messages'] += 1
+            row['first_message_date'] = min(row['first_message_date'], at)
+            row['last_message_date'] = max(row['last_message_date'], at)
+            self.stats_counters['recorded'] += 1
+            self._bump(day, 'conversations')
+            if message_type in ('audio', 'text'):
+                self._bump(day, f'{message_type}_messages')
+            if self.backend is None and phone not in self._known:
+                self._known.add(phone)
+                self._bump(day, 'new_users')
+            if self.backend is not None and self._worker is None:
+                self._worker = threading.Thread(target=self._run, name='user-stats-flusher', daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+            if self.resync_interval > 0 and time.monotonic() - self._synced_at >= self.resync_interval:
+                self._resync()
+
+    def flush(self) -> int:
+        """Grava em lote os deltas pendentes; retorna quantos usuários foram gravados"""
+        if self.backend is None:
+            return 0
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                daily, self._pending_daily = self._pending_daily, defaultdict(int)
+            if not batch:
+                return 0
+            rows = list(batch.values())
+            try:
+                new_users = self.backend.upsert_many(rows, dict(daily))
+            except Exception as e:
+                logger.error(f"[USER STATS] Erro gravando {len(rows)} usuários em lote: {e}")
+                with self._lock:
+                    self.stats_counters['flush_errors'] += 1
+                    self._flush_failing = True
+                    # Devolve os deltas, somando aos que chegaram enquanto isso
+                    for phone, row in batch.items():
+                        current = self._pending.get(phone)
+                        if current is None:
+                            self._pending[phone] = row
+                        else:
+                            current['total_messages'] += row['total_messages']
+                            current['first_message_date'] = min(current['first_message_date'],
+                                                                row['first_message_date'])
+                            current['last_message_date'] = max(current['last_message_date'],
+                                                               row['last_message_date'])
+                    for key, n in daily.items():
+                        self._pending_daily[key] += n
+                return 0
+            with self._lock:
+                self._flush_failing = False
+                for day, n in new_users.items():
+                    self._bump(day, 'new_users', n, pending=False)  # já gravado no rollup pelo backend
+                self.stats_counters['new_users'] += sum(new_users.values())
+                self.stats_counters['flushed_rows'] += len(rows)
+                self.stats_counters['flush_batches'] += 1
+            return len(rows)
+
+    def _resync(self):
+        """Relê totais e séries dos rollups (inclui o que outros workers gravaram)"""
+        with self._flush_lock:
+            try:
+                totals = self.backend.load_totals()
+                daily = self.backend.load_series(datetime.utcnow().date() - timedelta(days=self.series_days))
+            except Exception as e:
+                with self._lock:
+                    self.stats_counters['resync_errors'] += 1
+                logger.error(f"[USER STATS] Erro lendo rollups no banco: {e}")
+                return
+            with self._lock:
+                # Com o flush travado, o banco tem tudo menos a fila: o que não foi gravado continua somado
+                self._totals = totals
+                self._daily = daily
+                self._unsynced = {key: 0 for key in totals}
+                self._daily_unsynced = defaultdict(int)
+                for (day, metric), n in self._pending_daily.items():
+                    self._bump(day, metric, n, pending=False)
+                self._synced_at = time.monotonic()
+                self.stats_counters['resyncs'] += 1
+
+    # --- Leitura --------------------------------------------------------------------
+
+    def snapshot(self) -> Dict[str, int]:
+        """Totais para o /stats, sem consultar o banco"""
+        with self._lock:
+            return {key: self._totals[key] + self._unsynced[key] for key in self._totals}
+
+    def series(self, days: int = 30, bucket: str = 'day') -> List[Dict[str, Any]]:
+        """
+        Série dos últimos `days` dias (hoje incluso) por dia, semana ou mês:
+        [{'start': 'AAAA-MM-DD', 'conversations', 'audio_messages', 'text_messages', 'new_users'}],
+        períodos sem mensagens com zero. Além de `series_days` lê os rollups do banco.
+        """
+        if bucket not in BUCKETS:
+            raise ValueError(f"bucket deve ser um de {BUCKETS}")
+        today = datetime.utcnow().date()
+        since = today - timedelta(days=max(days, 1) - 1)
+        if days > self.series_days and self.backend is not None:
+            # Leitura nova do banco: já inclui o que foi gravado desde o último resync, então só
+            # a fila entra por cima (com o flush travado, nenhum lote fica entre os dois)
+            with self._flush_lock:
+                counts = self.backend.load_series(since)
+                with self._lock:
+                    for key, n in self._pending_daily.items():
+                        counts[key] = counts.get(key, 0) + n
+        else:
+            with self._lock:
+                counts = dict(self._daily)
+                for key, n in self._daily_unsynced.items():
+                    counts[key] = counts.get(key, 0) + n
+
+        buckets: Dict[date, Dict[str, int]] = {}
+        day = since
+        while day <= today:
+            buckets.setdefault(bucket_start(day, bucket), {metric: 0 for metric in TOTALS})
+            day += timedelta(days=1)
+        for (day, metric), n in counts.items():
+            if since <= day <= today and metric in TOTALS:
+                buckets[bucket_start(day, bucket)][metric] += n
+        return [{'start': start.isoformat(), **values} for start, values in sorted(buckets.items())]
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = {**self.stats_counters, 'pending_users': len(self._pending),
+                     'pending_messages': sum(row['total_messages'] for row in self._pending.values()),
+                     'rollup_rows': len(self._daily), 'flush_failing': self._flush_failing}
+        stats['persistence'] = type(self.backend).__name__ if self.backend else 'ram_only'
+        return stats
+
+
+_stats: Optional[UserStats] = None
+_stats_lock = threading.Lock()
+
+
+def get_user_stats() -> UserStats:
+    global _stats
+    if _stats is None:
+        with _stats_lock:
+            if _stats is None:
+                _stats = UserStats()
+    return _stats
@@ -0,0 +1,221 @@
+# app/core/vad.py
+"""
+VAD local (sem modelo) e compactação de silêncio antes do ASR.
+
+Trabalha direto no PCM16 mono já decodificado (o WAV do ffmpeg para o Whisper,
+o PCM cru da Realtime API). O áudio é dividido em quadros de `frame_ms` e, de
+uma vez para todos os quadros (NumPy), calcula energia (dBFS) e taxa de
+cruzamentos por zero:
+- fala = energia acima do piso de ruído do próprio áudio + `margin_db` (nunca
+  abaixo de `min_energy_db`) e ZCR baixa; quadros bem mais fortes que o limiar
+  contam como fala mesmo com ZCR alta (fricativas: "s", "f", "x")
+- pausas curtas dentro da fala são preenchidas, rajadas curtas (cliques) descartadas
+- o silêncio do início/fim sai (fica `pad_ms` de margem) e pausas longas são
+  encurtadas para `keep_pause_ms`
+
+Se nenhum trecho de fala for encontrado o áudio segue intacto (nunca perde fala
+por um limiar ruim).
+"""
+import logging
+import os
+import threading
+import wave
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class VadConfig:
+    frame_ms: int = 20
+    margin_db: float = 8.0
+    min_energy_db: float = -55.0
+    zcr_max: float = 0.25
+    strong_db: float = 10.0
+    min_speech_ms: int = 60
+    min_silence_ms: int = 300
+    pad_ms: int = 200
+    keep_pause_ms: int = 400
+
+    @classmethod
+    def from_env(cls) -> 'VadConfig':
+        env = lambda name, default: type(default)(os.environ.get(f'VAD_{name.upper()}', default))
+        return cls(**{name: env(name, value) for name, value in cls().__dict__.items()})
+
+
+@dataclass
+class VadResult:
+    sample_rate: int
+    original_samples: int
+    kept_samples: int
+    segments: List[Tuple[int, int]] = field(default_factory=list)  # (início, fim) em amostras, no original
+
+    @property
+    def original_ms(self) -> float:
+        return self.original_samples * 1000 / self.sample_rate
+
+    @property
+    def kept_ms(self) -> float:
+        return self.kept_samples * 1000 / self.sample_rate
+
+    @property
+    def speech_found(self) -> bool:
+        return bool(self.segments)
+
+
+def _runs(mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Início e fim (exclusivo) de cada sequência de True"""
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def _spans(starts: np.ndarray, ends: np.ndarray, size: int) -> np.ndarray:
+    """Máscara com True em [start, end) para cada par"""
+    delta = np.zeros(size + 1, dtype=np.int32)
+    np.add.at(delta, starts, 1)
+    np.add.at(delta, ends, -1)
+    return np.cumsum(delta[:-1]) > 0
+
+
+def speech_mask(pcm: np.ndarray, sample_rate: int, config: Optional[VadConfig] = None) -> np.ndarray:
+    """Um booleano por quadro de `frame_ms`: True = fala"""
+    config = config or VadConfig()
+    frame = max(1, sample_rate * config.frame_ms // 1000)
+    n_frames = len(pcm) // frame
+    if n_frames == 0:
+        return np.zeros(0, dtype=bool)
+    frames = pcm[:n_frames * frame].reshape(n_frames, frame).astype(np.float32) / 32768.0
+
+    energy_db = 10 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+    signs = np.signbit(frames)
+    zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (frame - 1)
+
+    noise_floor = np.percentile(energy_db, 10)
+    threshold = max(config.min_energy_db, noise_floor + config.margin_db)
+    mask = (energy_db > threshold) & ((zcr < config.zcr_max) | (energy_db > threshold + config.strong_db))
+
+    # Preenche pausas curtas entre trechos de fala (fechamento)
+    starts, ends = _runs(~mask)
+    short = (starts > 0) & (ends < n_frames) & (ends - starts < config.min_silence_ms // config.frame_ms)
+    mask |= _spans(starts[short], ends[short], n_frames)
+    # Descarta rajadas curtas (cliques, batidas no microfone)
+    starts, ends = _runs(mask)
+    short = ends - starts < max(1, config.min_speech_ms // config.frame_ms)
+    return mask & ~_spans(starts[short], ends[short], n_frames)
+
+
+def speech_segments(pcm: np.ndarray, sample_rate: int, config: Optional[VadConfig] = None) -> List[Tuple[int, int]]:
+    """Trechos de fala (início, fim) em amostras, já com a margem `pad_ms`"""
+    config = config or VadConfig()
+    frame = max(1, sample_rate * config.frame_ms // 1000)
+    pad = sample_rate * config.pad_ms // 1000
+    starts, ends = _runs(speech_mask(pcm, sample_rate, config))
+    segments = []
+    for start, end in zip(starts * frame, ends * frame):
+        start, end = max(0, int(start) - pad), min(len(pcm), int(end) + pad)
+        if segments and start <= segments[-1][1]:
+            segments[-1] = (segments[-1][0], end)
+        else:
+            segments.append((start, end))
+    return segments
+
+
+def join_segments(pcm: np.ndarray, segments: List[Tuple[int, int]], sample_rate: int,
+                  keep_pause_ms: int) -> np.ndarray:
+    """Concatena os trechos; entre dois deles fica no máximo keep_pause_ms de silêncio (o meio da pausa original)"""
+    keep = sample_rate * keep_pause_ms // 1000
+    parts = [pcm[segments[0][0]:segments[0][1]]]
+    for (_, prev_end), (start, end) in zip(segments, segments[1:]):
+        gap = start - prev_end
+        if gap > keep:
+            middle = prev_end + (gap - keep) // 2
+            parts.append(pcm[middle:middle + keep])
+        else:
+            parts.append(pcm[prev_end:start])
+        parts.append(pcm[start:end])
+    return np.concatenate(parts)
+
+
+def compact(pcm: np.ndarray, sample_rate: int, config: Optional[VadConfig] = None) -> Tuple[np.ndarray, VadResult]:
+    """Remove o silêncio das pontas e encurta pausas longas; devolve (pcm, VadResult)"""
+    config = config or VadConfig()
+    segments = speech_segments(pcm, sample_rate, config)
+    if not segments:
+        return pcm, VadResult(sample_rate, len(pcm), len(pcm))
+    out = join_segments(pcm, segments, sample_rate, config.keep_pause_ms)
+    return out, VadResult(sample_rate, len(pcm), len(out), segments)
+
+
+# --- integração (WAV do Whisper, PCM cru da Realtime API) ---
+
+VAD_ENABLED = os.environ.get('VAD_ENABLED', '1') != '0'
+_stats_lock = threading.Lock()
+stats_counters = {'clips': 0, 'no_speech': 0, 'bytes_in': 0, 'bytes_out': 0, 'audio_in_ms': 0.0, 'audio_out_ms': 0.0}
+
+
+def record(result: VadResult):
+    with _stats_lock:
+        stats_counters['clips'] += 1
+        stats_counters['no_speech'] += not result.speech_found
+        stats_counters['bytes_in'] += result.original_samples * 2
+        stats_counters['bytes_out'] += result.kept_samples * 2
+        stats_counters['audio_in_ms'] += result.original_ms
+        stats_counters['audio_out_ms'] += result.kept_ms
+
+
+def get_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        counters = dict(stats_counters)
+    counters['saved_ratio'] = round(1 - counters['bytes_out'] / counters['bytes_in'], 3) if counters['bytes_in'] else 0.0
+    counters['audio_in_ms'] = round(counters['audio_in_ms'], 1)
+    counters['audio_out_ms'] = round(counters['audio_out_ms'], 1)
+    return {**counters, 'enabled': VAD_ENABLED}
+
+
+def compact_pcm_bytes(data: bytes, sample_rate: int = 16000, config: Optional[VadConfig] = None) -> bytes:
+    """PCM16 LE mono cru -> PCM compactado (o mesmo objeto se não houver fala ou o VAD estiver desligado)"""
+    if not VAD_ENABLED or len(data) < 4:
+        return data
+    pcm = np.frombuffer(data[:len(data) - len(data) % 2], dtype='<i2')
+    out, result = compact(pcm, sample_rate, config or VadConfig.from_env())
+    record(result)
+    if not result.speech_found:
+        logger.info("[VAD] Nenhum trecho de fala detectado; áudio enviado intacto")
+        return data
+    logger.info(f"[VAD] {result.original_ms:.0f}ms -> {result.kept_ms:.0f}ms ({len(result.segments)} trechos)")
+    return out.astype('<i2').tobytes()
+
+
+def read_wav(path: str) -> Tuple[np.ndarray, int]:
+    with wave.open(path, 'rb') as wav:
+        if wav.getsampwidth() != 2 or wav.getnchannels() != 1:
+            raise ValueError(f"WAV precisa ser PCM16 mono: {path}")
+        return np.frombuffer(wav.readframes(wav.getnframes()), dtype='<i2'), wav.getframerate()
+
+
+def write_wav(path: str, pcm: np.ndarray, sample_rate: int):
+    with wave.open(path, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm.astype('<i2').tobytes())
+
+
+def compact_wav_file(path: str, config: Optional[VadConfig] = None) -> Optional[VadResult]:
+    """Compacta o WAV no lugar; None se o VAD estiver desligado ou o arquivo não for PCM16 mono"""
+    if not VAD_ENABLED:
+        return None
+    try:
+        pcm, sample_rate = read_wav(path)
+    except (ValueError, wave.Error, EOFError) as e:
+        logger.warning(f"[VAD] Ignorado: {e}")
+        return None
+    out, result = compact(pcm, sample_rate, config or VadConfig.from_env())
+    record(result)
+    if result.speech_found and result.kept_samples < result.original_samples:
+        write_wav(path, out, sample_rate)
+        logger.info(f"[VAD] {result.original_ms:.0f}ms -> {result.kept_ms:.0f}ms ({len(result.segments)} trechos)")
+    return result
@@ -1,57 +1,145 @@
 # app/functions.py
-import logging, os, requests, json
+import logging, os, requests, threading
+from concurrent.futures import TimeoutError as FutureTimeout
 from app.clients import twilio_client as tc
 from app.clients import elevenlabs_client as ec
 from app.utils.wa import normalize_wa
+from app.utils import jsoncodec
+from app.core.rag import get_rag_service
+from app.core.delivery import OrderedDelivery, is_pending_handle
+from app.core import chunked_asr
+from app.core.transcript_cache import get_transcript_cache
 
 logger = logging.getLogger(__name__)
 
+# "speculative": o TTS não bloqueia (devolve um handle e sintetiza em paralelo) e os envios
+# passam pela fila ordenada por destinatário; "inline": TTS e envios síncronos, como antes
+VOICE_DELIVERY = os.environ.get("VOICE_DELIVERY", "speculative")
+# Espera máxima pela confirmação de um envio enfileirado (a fila pode ter uma nota de voz na frente)
+SEND_RESULT_TIMEOUT_S = float(os.environ.get("DELIVERY_SEND_TIMEOUT_S", "45"))
+_delivery = None
+_delivery_lock = threading.Lock()
+
+# Contexto mínimo quando a base de conhecimento não responde
+RAG_FALLBACK_CONTEXT = "Endrigo Almada é um empresário brasileiro, especialista em marketing digital e vendas online. Trabalha com negócios digitais há mais de 10 anos e é conhecido por suas estratégias inovadoras."
+
+def _transcribe_downloaded(raw_path: str):
+    wav_path = tc.prepare_audio(raw_path)
+    if not wav_path: return tc.TRANSCRIPTION_FAILED_MESSAGE
+    return tc.transcrever_audio_com_whisper(wav_path)
+
+def _is_transcript(text: str):
+    # Transcrição parcial (blocos perdidos) não é guardada: a retentativa tenta de novo
+    return (text not in (tc.AUDIO_NOT_FOUND_MESSAGE, tc.TRANSCRIPTION_FAILED_MESSAGE)
+            and chunked_asr.MISSING_CHUNK not in text)
+
 def transcribe_audio(media_url: str):
     logger.info(f"FUNCTION: Transcrevendo áudio de {media_url}")
-    wav_path = tc.download_and_prepare_audio(media_url)
-    if not wav_path: return "Falha ao baixar o áudio."
-    return tc.transcrever_audio_com_whisper(wav_path)
+    # Mesmo áudio (retentativa do webhook, nota encaminhada) sai do cache por hash do conteúdo
+    text = get_transcript_cache().transcribe(media_url, tc.download_audio, _transcribe_downloaded,
+                                             cacheable=_is_transcript)
+    if text is None: return "Falha ao baixar o áudio."
+    return text
 
 def tts_generate_and_store(text: str):
     logger.info(f"FUNCTION: Gerando áudio: '{text[:30]}...'")
+    if VOICE_DELIVERY == "speculative":
+        return get_delivery().start_voice(text)
     return ec.gerar_audio_e_salvar(text)
 
 def rag_query(session_id: str, query: str):
-    logger.info(f"FUNCTION: Consultando RAG para sessão {session_id}")
-    # Retorna contexto biográfico básico do Endrigo
-    return "Endrigo Almada é um empresário brasileiro, especialista em marketing digital e vendas online. Trabalha com negócios digitais há mais de 10 anos e é conhecido por suas estratégias inovadoras."
+    logger.info(f"FUNCTION: Consultando RAG para sessão {session_id}: '{(query or '')[:50]}'")
+    try:
+        result = get_rag_service().query(session_id, query)
+    except Exception as e:
+        logger.error(f"Falha na consulta RAG: {e}", exc_info=True)
+        return jsoncodec.dumps({"status": "erro", "trechos": [], "contexto_basico": RAG_FALLBACK_CONTEXT})
+    if not result["trechos"]:
+        return jsoncodec.dumps({"status": "sem_resultados", "trechos": [], "contexto_basico": RAG_FALLBACK_CONTEXT})
+    if result["reaproveitados"]:
+        result["observacao"] = "Trechos com ja_enviado=true já foram enviados nesta conversa; use o texto anterior."
+    return jsoncodec.dumps({"status": "sucesso", **result})
 
-def send_whatsapp_message(to: str, body: str):
+def _twilio_send_text(to: str, body: str):
     from_number = os.environ.get("TWILIO_PHONE_NUMBER")
     logger.info(f"FUNCTION: Enviando texto para {to}")
     try:
         bot_num = normalize_wa(from_number)
         user_num = normalize_wa(to)
         msg = tc.twilio_client.messages.create(to=user_num, from_=bot_num, body=body)
-        return json.dumps({"status": "sucesso", "sid": msg.sid})
+        return jsoncodec.dumps({"status": "sucesso", "sid": msg.sid})
     except Exception as e:
         logger.error(f"Falha ao enviar texto via função: {e}")
-        return json.dumps({"status": "erro", "detalhe": str(e)})
+        return jsoncodec.dumps({"status": "erro", "detalhe": str(e)})
 
-def send_whatsapp_media(to: str, media_url: str):
+def _twilio_send_media(to: str, media_url: str):
     from_number = os.environ.get("TWILIO_PHONE_NUMBER")
     logger.info(f"FUNCTION: Enviando mídia para {to}")
     try:
         bot_num = normalize_wa(from_number)
         user_num = normalize_wa(to)
         msg = tc.twilio_client.messages.create(to=user_num, from_=bot_num, media_url=[media_url])
-        return json.dumps({"status": "sucesso", "sid": msg.sid})
+        return jsoncodec.dumps({"status": "sucesso", "sid": msg.sid})
     except Exception as e:
         logger.error(f"Falha ao enviar mídia via função: {e}")
-        return json.dumps({"status": "erro", "detalhe": str(e)})
+        return jsoncodec.dumps({"status": "erro", "detalhe": str(e)})
+
+def get_delivery() -> OrderedDelivery:
+    global _delivery
+    if _delivery is None:
+        with _delivery_lock:
+            if _delivery is None:
+                _delivery = OrderedDelivery(_twilio_send_text, _twilio_send_media, ec.gerar_audio_e_salvar)
+    return _delivery
+
+def _queued_result(future):
+    """Resultado do envio; passado o prazo, o envio continua na fila e é dado como enfileirado"""
+    try:
+        return future.result(timeout=SEND_RESULT_TIMEOUT_S)
+    except FutureTimeout:
+        logger.warning(f"Envio sem confirmação em {SEND_RESULT_TIMEOUT_S:.0f}s; segue na fila")
+        return jsoncodec.dumps({"status": "sucesso", "enfileirado": True})
+
+def send_whatsapp_message(to: str, body: str):
+    if VOICE_DELIVERY == "speculative":
+        # Espera a vez na fila do destinatário (uma nota de voz anterior ainda pode estar saindo)
+        return _queued_result(get_delivery().send_text(to, body))
+    return _twilio_send_text(to, body)
+
+def send_whatsapp_media(to: str, media_url: str):
+    if VOICE_DELIVERY == "speculative":
+        future = get_delivery().send_media(to, media_url)
+        if is_pending_handle(media_url):
+            # O áudio ainda está sendo gerado: o lugar na fila já está garantido
+            return jsoncodec.dumps({"status": "sucesso", "enfileirado": True})
+        return _queued_result(future)
+    return _twilio_send_media(to, media_url)
+
+def send_voice_reply(to: str, text: str):
+    """Nota de voz com o texto já enviado: sintetiza em paralelo e entra na fila depois do texto. Devolve o handle."""
+    logger.info(f"FUNCTION: Nota de voz especulativa para {to}")
+    return get_delivery().send_voice_note(to, text)
+
+def resolve_media_urls(media: list) -> list:
+    """Troca handles de notas de voz pelas URLs finais (espera a síntese); descarta as que falharam"""
+    urls = [get_delivery().resolve(m) if is_pending_handle(m) else m for m in media]
+    return [url for url in urls if url]
 
 def probe_media_url(url: str):
     logger.info(f"FUNCTION: Verificando URL: {url}")
+    if is_pending_handle(url):
+        # Nota de voz especulativa: não espera a síntese; enquanto gera, o handle é válido para envio
+        state, final_url = get_delivery().voice_status(url)
+        if state == 'pending':
+            return jsoncodec.dumps({"ok": True, "pendente": True})
+        if state == 'failed':
+            return jsoncodec.dumps({"ok": False, "error": "falha na geração do áudio"})
+        url = final_url
     try:
         r = requests.head(url, allow_redirects=True, timeout=5)
-        return json.dumps({ "ok": r.status_code == 200, "status": r.status_code })
+        return jsoncodec.dumps({ "ok": r.status_code == 200, "status": r.status_code })
     except Exception as e:
-        return json.dumps({"ok": False, "error": str(e)})
+        return jsoncodec.dumps({"ok": False, "error": str(e)})
 
 AVAILABLE_FUNCTIONS = {
     "transcribe_audio": transcribe_audio, "rag_query": rag_query,
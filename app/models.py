@@ -23,6 +23,7 @@ class User(db.Model):
 class Conversation(db.Model):
     """Modelo para conversas"""
     __tablename__ = 'conversations'
+    __table_args__ = (db.Index('ix_conversations_phone_timestamp', 'phone_number', 'timestamp'),)
     
     id = db.Column(db.Integer, primary_key=True)
     phone_number = db.Column(db.String(20), nullable=False, index=True)
@@ -33,4 +34,15 @@ class Conversation(db.Model):
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     
     def __repr__(self):
-        return f'<Conversation {self.id}: {self.phone_number}>'
\ No newline at end of file
+        return f'<Conversation {self.id}: {self.phone_number}>'
+
+class StatsDaily(db.Model):
+    """Rollup diário por métrica (conversations, audio_messages, text_messages, new_users)"""
+    __tablename__ = 'stats_daily'
+
+    day = db.Column(db.Date, primary_key=True)
+    metric = db.Column(db.String(32), primary_key=True)
+    value = db.Column(db.Integer, default=0, nullable=False)
+
+    def __repr__(self):
+        return f'<StatsDaily {self.day} {self.metric}={self.value}>'
\ No newline at end of file
@@ -1,12 +1,16 @@
 # app/routes.py
+import hmac
 import logging
-from flask import Blueprint, request
+import os
+from flask import Blueprint, jsonify, request
 from twilio.twiml.messaging_response import MessagingResponse
 from app import EXECUTOR
 from app.services import handle_new_message
 
 logger = logging.getLogger(__name__)
 whatsapp_bp = Blueprint("whatsapp_bp", __name__)
+kb_admin_bp = Blueprint("kb_admin_bp", __name__, url_prefix="/admin/kb")
+admin_bp = Blueprint("admin_bp", __name__, url_prefix="/admin")
 
 @whatsapp_bp.route("/webhook/whatsapp", methods=["POST"])
 def whatsapp_webhook():
@@ -29,4 +33,88 @@ def twilio_status():
         f"Status={data.get('MessageStatus')}, "
         f"Erro={data.get('ErrorCode')}"
     )
-    return ("", 204)
\ No newline at end of file
+    return ("", 204)
+
+# --- Administração da base de conhecimento ---------------------------------
+
+def _admin_authorized() -> bool:
+    """Exige o header X-Admin-Token igual a ADMIN_TOKEN (sem a variável, tudo é negado)."""
+    expected = os.environ.get("ADMIN_TOKEN", "")
+    received = request.headers.get("X-Admin-Token", "")
+    return bool(expected) and hmac.compare_digest(expected, received)
+
+@kb_admin_bp.before_request
+@admin_bp.before_request
+def _check_admin_token():
+    if not _admin_authorized():
+        return jsonify({"erro": "não autorizado"}), 403
+
+@admin_bp.route("/metrics", methods=["GET"])
+def orchestrator_metrics():
+    """Latência por ferramenta/run do orquestrador e estatísticas do cache do RAG."""
+    from app.clients.openai_client import get_orchestrator_metrics
+
+    return jsonify(get_orchestrator_metrics())
+
+@admin_bp.route("/stats", methods=["GET"])
+def user_stats():
+    """Totais e série dos rollups diários: ?days=30&bucket=day|week|month."""
+    from app.core.user_stats import BUCKETS, get_user_stats
+
+    days = max(1, min(request.args.get("days", 30, type=int), 730))
+    bucket = request.args.get("bucket", "day")
+    if bucket not in BUCKETS:
+        return jsonify({"erro": f"bucket deve ser um de {', '.join(BUCKETS)}"}), 400
+    stats = get_user_stats()
+    return jsonify({"totals": stats.snapshot(), "bucket": bucket, "series": stats.series(days, bucket)})
+
+@admin_bp.route("/answer-cache/bypass", methods=["POST"])
+def answer_cache_bypass():
+    """Liga/desliga o cache de respostas para uma sessão: {"session_id": "wa:...", "bypass": true}."""
+    from app.core.answer_cache import get_answer_cache
+
+    data = request.get_json(silent=True) or {}
+    session_id = data.get("session_id")
+    if not session_id:
+        return jsonify({"erro": "informe session_id"}), 400
+    get_answer_cache().set_bypass(session_id, bool(data.get("bypass", True)))
+    return jsonify({"session_id": session_id, "bypass": get_answer_cache().is_bypassed(session_id)})
+
+@admin_bp.route("/answer-cache", methods=["DELETE"])
+def answer_cache_clear():
+    """Descarta todas as respostas em cache (ex.: depois de mudar as instruções do assistente)."""
+    from app.core.answer_cache import get_answer_cache
+
+    get_answer_cache().clear()
+    return ("", 204)
+
+@kb_admin_bp.route("/documents", methods=["POST"])
+def kb_upload_document():
+    """Recebe um PDF/TXT e agenda a reindexação incremental (só o arquivo novo é processado)."""
+    from app.core.knowledge import get_knowledge_service
+
+    upload = request.files.get("file")
+    if upload is None:
+        return jsonify({"erro": "envie o arquivo no campo 'file'"}), 400
+    service = get_knowledge_service()
+    try:
+        path = service.add_document(upload.filename, upload.read())
+    except ValueError as e:
+        return jsonify({"erro": str(e)}), 400
+
+    EXECUTOR.submit(service.reload)
+    logger.info(f"[KB ADMIN] Documento {path} recebido, reindexação agendada")
+    return jsonify({"status": "agendado", "arquivo": os.path.basename(path)}), 202
+
+@kb_admin_bp.route("/reload", methods=["POST"])
+def kb_reload():
+    from app.core.knowledge import get_knowledge_service
+
+    EXECUTOR.submit(get_knowledge_service().reload)
+    return jsonify({"status": "agendado"}), 202
+
+@kb_admin_bp.route("/status", methods=["GET"])
+def kb_status():
+    from app.core.knowledge import get_knowledge_service
+
+    return jsonify(get_knowledge_service().get_stats())
@@ -1,9 +1,62 @@
 # app/services.py
 import logging
+import os
+import time
 from app.clients import openai_client
+from app.core.answer_cache import get_answer_cache
+from app.core.conversation_store import get_conversation_store
+from app.core.user_stats import get_user_stats
 
 logger = logging.getLogger(__name__)
 
+# Modo de resposta para texto: "fast" (chat completions com streaming; o assistente
+# completo só quando o modelo pede a base de conhecimento) ou "assistant" (sempre o run)
+RESPONSE_MODE = os.environ.get("RESPONSE_MODE", "fast")
+# Nota de voz automática nas respostas do fast path: o texto sai primeiro e o áudio segue na fila
+VOICE_REPLIES = os.environ.get("VOICE_REPLIES", "0") == "1"
+
+def _reply_from_cache(session_id: str, user_input: str, from_user: str, cached) -> None:
+    """Reenvia a resposta em cache (texto + áudio já gerado) e registra a troca na thread."""
+    from app.functions import send_whatsapp_message, send_whatsapp_media
+
+    for text in cached.texts:
+        send_whatsapp_message(to=from_user, body=text)
+    for media_url in cached.media:
+        send_whatsapp_media(to=from_user, media_url=media_url)
+    get_conversation_store().append_exchange(session_id, user_input, cached.texts)
+    openai_client.record_exchange(session_id, user_input, cached.texts)
+
+def _is_stateless(session_id: str) -> bool:
+    """Sessão sem histórico nem thread do assistente: a resposta não depende da conversa nem do usuário"""
+    return session_id not in openai_client.user_thread_map and not get_conversation_store().last(session_id, 1)
+
+def _respond(session_id: str, user_input: str, from_user: str, to_bot: str, is_media: bool):
+    """Escolhe o modo, responde e registra a latência por modo. Retorna (modo, resposta ou None)."""
+    started = time.perf_counter()
+    # Áudio chega como URL e precisa do transcribe_audio do assistente
+    if RESPONSE_MODE == "fast" and not is_media:
+        outcome = openai_client.fast_path_response(session_id, user_input, from_user, voice_reply=VOICE_REPLIES)
+        if outcome["status"] == "completed":
+            openai_client.ORCHESTRATOR_METRICS.record("mode.fast", (time.perf_counter() - started) * 1000)
+            # A thread do assistente precisa da troca caso uma próxima mensagem seja escalada
+            openai_client.record_exchange(session_id, user_input, outcome["texts"])
+            return "fast", outcome
+        if outcome["status"] == "escalate" and outcome["texts"]:
+            # Prefácio já enviado ("Deixa eu verificar…"): vai para a thread antes do run do assistente
+            openai_client.record_exchange(session_id, user_input, outcome["texts"])
+        elif outcome["status"] == "error" and (outcome["texts"] or outcome["media"]):
+            # Falhou depois de responder em parte: não repete a resposta pelo assistente (e não vai para o cache)
+            openai_client.ORCHESTRATOR_METRICS.record("mode.fast", (time.perf_counter() - started) * 1000, ok=False)
+            get_conversation_store().append_exchange(session_id, user_input, outcome["texts"])
+            return "fast", None
+        logger.info(f"[HANDLE] Fast path -> assistente ({outcome['status']}: {outcome['reason']}) sessão={session_id}")
+
+    reply = openai_client.orchestrate_assistant_response(session_id, user_input, from_user, to_bot)
+    mode = "escalated" if RESPONSE_MODE == "fast" and not is_media else "assistant"
+    openai_client.ORCHESTRATOR_METRICS.record(f"mode.{mode}", (time.perf_counter() - started) * 1000,
+                                              ok=reply is not None)
+    return mode, reply
+
 def handle_new_message(payload: dict):
     waid = payload.get("WaId")
     from_user = payload.get("From")
@@ -15,6 +68,32 @@ def handle_new_message(payload: dict):
         logger.error(f"[HANDLE] Payload inválido, abortando: {payload}")
         return
 
+    # Contabilidade do usuário: só um delta em memória, gravado em lote
+    get_user_stats().record_message(session_id, "audio" if payload.get("MediaUrl0") else "text")
+
+    # Só perguntas em texto passam pelo cache de respostas (áudio chega como URL), e só na
+    # primeira mensagem da sessão: o cache é global e respostas com histórico são de uma conversa só
+    answer_cache = get_answer_cache() if not payload.get("MediaUrl0") else None
+    stateless = bool(answer_cache) and _is_stateless(session_id)
+    if answer_cache:
+        cached = answer_cache.lookup(session_id, user_input, stateless=stateless)
+        if cached:
+            _reply_from_cache(session_id, user_input, from_user, cached)
+            logger.info(f"[HANDLE] Respondido pelo cache para sessão={session_id}")
+            return
+
     logger.info(f"[HANDLE] Iniciando para sessão={session_id}")
-    openai_client.orchestrate_assistant_response(session_id, user_input, from_user, to_bot)
-    logger.info(f"[HANDLE] Finalizado para sessão={session_id}")
\ No newline at end of file
+    mode, reply = _respond(session_id, user_input, from_user, to_bot, bool(payload.get("MediaUrl0")))
+    if reply:
+        if not payload.get("MediaUrl0"):
+            get_conversation_store().append_exchange(session_id, user_input, reply["texts"])
+        else:
+            # A transcrição fica na thread do assistente; o histórico guarda a troca como áudio
+            get_conversation_store().append_exchange(session_id, "[Mensagem de áudio]", reply["texts"],
+                                                     message_type="audio")
+        if answer_cache and stateless:
+            from app.functions import resolve_media_urls
+            # Notas de voz especulativas: o cache guarda a URL final (a resposta já foi entregue)
+            media = resolve_media_urls(reply["media"])
+            answer_cache.store(session_id, user_input, reply["texts"], media, reply["elapsed_ms"], stateless=True)
+    logger.info(f"[HANDLE] Finalizado para sessão={session_id} (modo={mode})")
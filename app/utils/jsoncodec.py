@@ -0,0 +1,156 @@
+# app/utils/jsoncodec.py
+"""
+Camada de codec JSON para os caminhos quentes (Realtime API e webhook).
+
+Usa a implementação mais rápida disponível (orjson > ujson > json da stdlib)
+e oferece leitura "preguiçosa" de eventos do Realtime: o campo `type` é lido
+sem desserializar o payload inteiro, então deltas de áudio em base64 podem ser
+roteados sem materializar o dict.
+"""
+import json
+import logging
+import os
+import re
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# backend -> (dumps que retorna str, loads que aceita str/bytes)
+_BACKENDS: Dict[str, Tuple[Callable[[Any], str], Callable[[Any], Any]]] = {
+    "stdlib": (lambda obj: json.dumps(obj, ensure_ascii=False, separators=(",", ":")), json.loads),
+}
+
+try:
+    import orjson
+
+    _BACKENDS["orjson"] = (lambda obj: orjson.dumps(obj).decode("utf-8"), orjson.loads)
+except ImportError:
+    pass
+
+try:
+    import ujson
+
+    _BACKENDS["ujson"] = (lambda obj: ujson.dumps(obj, ensure_ascii=False), ujson.loads)
+except ImportError:
+    pass
+
+_PREFERENCE = ("orjson", "ujson", "stdlib")
+
+_dumps, _loads = _BACKENDS["stdlib"]
+BACKEND = "stdlib"
+
+
+def register_backend(name: str, dumps: Callable[[Any], str], loads: Callable[[Any], Any]):
+    """Registra um backend adicional (ex.: simdjson) para uso via set_backend."""
+    _BACKENDS[name] = (dumps, loads)
+
+
+def set_backend(name: Optional[str] = None) -> str:
+    """Seleciona o backend. Sem nome, escolhe o mais rápido instalado."""
+    global _dumps, _loads, BACKEND
+    if name and name not in _BACKENDS:
+        logger.warning(f"[CODEC] Backend '{name}' indisponível, usando detecção automática.")
+        name = None
+    if not name:
+        name = next(n for n in _PREFERENCE if n in _BACKENDS)
+    _dumps, _loads = _BACKENDS[name]
+    BACKEND = name
+    return name
+
+
+def available_backends():
+    return sorted(_BACKENDS)
+
+
+def dumps(obj: Any) -> str:
+    """Serializa para str (compatível com ws.send de frames de texto)."""
+    return _dumps(obj)
+
+
+def loads(data: Any) -> Any:
+    """Desserializa str ou bytes."""
+    return _loads(data)
+
+
+# --- Leitura preguiçosa de eventos do Realtime ------------------------------
+
+# O servidor envia "type" como primeira chave; quando isso não acontecer,
+# caímos no parse completo.
+_TYPE_PREFIX = re.compile(r'\s*\{\s*"type"\s*:\s*"([^"\\]+)"')
+_DELTA_KEY = re.compile(r'"delta"\s*:\s*"')
+_RESPONSE_ID = re.compile(r'"response_id"\s*:\s*"([^"\\]+)"')
+
+
+def peek_type(raw: Any) -> Optional[str]:
+    """Retorna o `type` do evento lendo só o início da mensagem."""
+    head = raw[:256].decode("utf-8", "ignore") if isinstance(raw, (bytes, bytearray)) else raw
+    m = _TYPE_PREFIX.match(head, 0, 256)
+    if m:
+        return m.group(1)
+    try:
+        return loads(raw).get("type")
+    except Exception:
+        return None
+
+
+def extract_delta(raw: Any) -> str:
+    """Extrai o campo `delta` (base64) de um evento sem desserializá-lo."""
+    if isinstance(raw, (bytes, bytearray)):
+        raw = raw.decode("utf-8")
+    # Os metadados ficam antes do delta; limitar a busca evita varrer o base64
+    m = _DELTA_KEY.search(raw, 0, 512) or _DELTA_KEY.search(raw)
+    if m:
+        start = m.end()
+        end = raw.find('"', start)
+        # base64 nunca contém escapes; se houver, o parse completo resolve
+        if end != -1 and raw.find("\\", start, end) == -1:
+            return raw[start:end]
+    return loads(raw).get("delta", "") or ""
+
+
+def peek_response_id(raw: Any) -> Optional[str]:
+    """Retorna o `response_id` de um evento de delta lendo só os metadados (antes do base64)."""
+    head = raw[:512].decode("utf-8", "ignore") if isinstance(raw, (bytes, bytearray)) else raw[:512]
+    m = _RESPONSE_ID.search(head)
+    if m:
+        return m.group(1)
+    try:
+        return loads(raw).get("response_id")
+    except Exception:
+        return None
+
+
+class LazyEvent:
+    """Evento do Realtime com `type` imediato e dict materializado sob demanda."""
+
+    __slots__ = ("raw", "type", "_event")
+
+    def __init__(self, raw: Any):
+        self.raw = raw
+        self.type = peek_type(raw)
+        self._event = None
+
+    @property
+    def delta(self) -> str:
+        if self._event is not None:
+            return self._event.get("delta", "") or ""
+        return extract_delta(self.raw)
+
+    def as_dict(self) -> Dict[str, Any]:
+        if self._event is None:
+            self._event = loads(self.raw)
+        return self._event
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key == "type":
+            return self.type
+        return self.as_dict().get(key, default)
+
+
+def encode_audio_append(base64_chunk: str) -> str:
+    """Monta `input_audio_buffer.append` sem passar o base64 pelo serializador."""
+    return '{"type":"input_audio_buffer.append","audio":"' + base64_chunk + '"}'
+
+
+set_backend(os.environ.get("JSON_CODEC") or None)
+logger.info(f"[CODEC] Backend JSON ativo: {BACKEND}")
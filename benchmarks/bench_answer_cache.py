@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Benchmark do cache de respostas na frente do orquestrador
+Simula um fluxo de mensagens com perguntas frequentes escritas de vários jeitos
+e perguntas únicas; mede hit rate (exato / quase-duplicata), falsos acertos e
+o tempo de LLM economizado com um run simulado de `--run-ms`
+
+Uso: python benchmarks/bench_answer_cache.py [--messages 5000] [--run-ms 6000] [--similarity 0.9]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.answer_cache import AnswerCache
+
+# Cada grupo: jeitos diferentes de fazer a mesma pergunta
+FAQ = [
+    ["quem é você", "Quem é você?", "quem e vc", "quem é vc??", "quem é você?? kkk"],
+    ["o que você faz", "O que vc faz?", "oq vc faz", "o que voce faz?"],
+    ["você consegue mandar áudio", "consegue mandar áudio?", "vc consegue mandar audio",
+     "voce consegue mandar um audio"],
+    ["qual o seu instagram", "qual seu instagram?", "qual o seu insta"],
+    ["oi tudo bem", "oi, tudo bem?", "Oi tudo bem??"],
+    ["onde fica a agência", "onde fica a agencia?", "onde fica a sua agência"],
+    ["quanto custa um site", "Quanto custa um site?", "quanto custa um site?!"],
+]
+# Perguntas parecidas com as frequentes, mas com outra resposta (não podem acertar o cache)
+DISTINCT = [
+    "você consegue mandar vídeo", "qual o seu email", "quanto custa o plano 2", "quanto custa o plano 1",
+    "você não trabalha com marketing", "você trabalha com marketing", "o que você fez ontem",
+    "onde fica o estúdio", "boa noite", "quem é o seu sócio",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--run-ms", type=float, default=6000.0, help="duração simulada de um run do assistente")
+    parser.add_argument("--similarity", type=float, default=0.9)
+    parser.add_argument("--faq-share", type=float, default=0.4, help="fração de mensagens que são FAQ")
+    args = parser.parse_args()
+
+    rng = random.Random(5)
+    answer_of = {}
+    for group, variants in enumerate(FAQ):
+        for variant in variants:
+            answer_of[variant] = f"faq-{group}"
+    for i, question in enumerate(DISTINCT):
+        answer_of[question] = f"distinct-{i}"
+
+    results = {}
+    for label, similarity in (("só hash exato", 0.0), (f"hash + quase-duplicata ({args.similarity})", args.similarity)):
+        cache = AnswerCache(similarity=similarity)
+        false_hits = 0
+        lookup_s = 0.0
+        for n in range(args.messages):
+            roll = rng.random()
+            if roll < args.faq_share:
+                question = rng.choice(rng.choice(FAQ))
+            elif roll < args.faq_share + 0.1:
+                question = rng.choice(DISTINCT)
+            else:
+                question = f"pergunta única número {n} sobre o projeto {rng.randrange(10 ** 6)}"
+            session = f"wa:{rng.randrange(500)}"
+
+            # Cenário do cache: cada pergunta chega como primeira mensagem da sessão (sem histórico)
+            t0 = time.perf_counter()
+            cached = cache.lookup(session, question, stateless=True)
+            lookup_s += time.perf_counter() - t0
+            if cached is not None:
+                false_hits += cached.texts[0] != answer_of.get(question, question)
+            else:
+                cache.store(session, question, [answer_of.get(question, question)], [], args.run_ms,
+                            stateless=True)
+
+        stats = cache.get_stats()
+        results[label] = (stats, false_hits, lookup_s * 1e6 / args.messages)
+
+    print(f"{args.messages} mensagens | {args.faq_share:.0%} FAQ | run simulado de {args.run_ms:.0f}ms")
+    print("-" * 96)
+    print(f"{'modo':<34}{'hit rate':>10}{'exatos':>9}{'quase':>8}{'falsos':>8}{'runs poupados':>15}"
+          f"{'LLM poupado':>13}")
+    for label, (stats, false_hits, lookup_us) in results.items():
+        saved_runs = stats['exact_hits'] + stats['near_hits']
+        print(f"{label:<34}{stats['hit_rate']:>10.1%}{stats['exact_hits']:>9}{stats['near_hits']:>8}"
+              f"{false_hits:>8}{saved_runs:>15}{stats['saved_llm_ms'] / 60000:>11.1f}min")
+        print(f"{'':<34}lookup médio: {lookup_us:.1f}µs")
+
+
+if __name__ == "__main__":
+    main()
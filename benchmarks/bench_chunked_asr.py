@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Benchmark da transcrição em blocos paralelos (app/core/chunked_asr.py)
+Sobe um servidor ASR local no formato da API do Whisper
+(POST /v1/audio/transcriptions, multipart) que "reconhece" cada frase do áudio
+pela frequência fundamental e responde com uma palavra por frase (f100, f105...),
+com latência de ida e volta + upload + processamento proporcional à duração.
+Compara, para notas de voz de durações crescentes, o envio único (fluxo
+anterior) com os blocos em paralelo: tempo total e se o texto costurado é
+igual ao da transcrição única (ordem e cortes nas pausas)
+
+Uso: python benchmarks/bench_chunked_asr.py [--durations 30,60,120,300,600] [--parallelism 4] [--scale 0.05]
+"""
+import argparse
+import io
+import os
+import sys
+import threading
+import time
+import urllib.request
+import uuid
+import wave
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from app.core import chunked_asr, vad
+
+SR = 16000
+
+
+def synth_voice_note(seconds: float, rng: np.random.Generator) -> np.ndarray:
+    """Frases com f0 constante (100, 105, 110... Hz) separadas por pausas"""
+    parts, i, total = [np.zeros(int(rng.uniform(0.5, 1.5) * SR))], 0, 0.0
+    while total < seconds:
+        n = int(rng.uniform(1.5, 4.0) * SR)
+        t = np.arange(n) / SR
+        f0 = 100 + 5 * (i % 30)
+        tone = sum(np.sin(2 * np.pi * f0 * k * t) / k for k in range(1, 6))
+        parts.append(tone / np.abs(tone).max() * 10 ** (rng.uniform(-20, -12) / 20))
+        parts.append(np.zeros(int(rng.uniform(0.5, 1.5) * SR)))
+        total += (len(parts[-1]) + n) / SR
+        i += 1
+    signal = np.concatenate(parts)
+    signal += rng.normal(0, 10 ** (-60 / 20), len(signal))
+    return np.clip(signal * 32767, -32768, 32767).astype(np.int16)
+
+
+def recognize(pcm: np.ndarray, sample_rate: int) -> str:
+    """Uma palavra por frase: f0 pelo pico do espectro"""
+    words = []
+    for start, end in vad.speech_segments(pcm, sample_rate, vad.VadConfig(pad_ms=0)):
+        spectrum = np.abs(np.fft.rfft(pcm[start:end].astype(np.float32)))
+        freqs = np.fft.rfftfreq(end - start, 1 / sample_rate)
+        words.append(f"f{int(round(freqs[np.argmax(spectrum)] / 5) * 5)}")
+    return " ".join(words)
+
+
+def make_server(args):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers['Content-Length']))
+            message = BytesParser().parsebytes(
+                b"Content-Type: " + self.headers['Content-Type'].encode() + b"\r\n\r\n" + body)
+            data = next(part.get_payload(decode=True) for part in message.get_payload()
+                        if part.get_filename())
+            with wave.open(io.BytesIO(data)) as wav:
+                sample_rate = wav.getframerate()
+                pcm = np.frombuffer(wav.readframes(wav.getnframes()), dtype='<i2')
+            duration = len(pcm) / sample_rate
+            upload_ms = len(data) * 8 / (args.uplink_mbps * 1e6) * 1000
+            time.sleep((args.fixed_ms + upload_ms + duration * args.ms_per_s) * args.scale / 1000)
+            text = recognize(pcm, sample_rate).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Content-Length", str(len(text)))
+            self.end_headers()
+            self.wfile.write(text)
+
+        def log_message(self, *_):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def client_for(server):
+    url = f"http://127.0.0.1:{server.server_address[1]}/v1/audio/transcriptions"
+
+    def transcribe(data: bytes) -> str:
+        boundary = uuid.uuid4().hex
+        body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"model\"\r\n\r\nwhisper-1\r\n"
+                f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"bloco.wav\"\r\n"
+                f"Content-Type: audio/wav\r\n\r\n").encode() + data + f"\r\n--{boundary}--\r\n".encode()
+        request = urllib.request.Request(url, data=body, method="POST",
+                                         headers={"Content-Type": f"multipart/form-data; boundary={boundary}"})
+        with urllib.request.urlopen(request) as response:
+            return response.read().decode()
+    return transcribe
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--durations", default="30,60,120,300,600", help="segundos de fala por nota de voz")
+    parser.add_argument("--parallelism", type=int, default=4)
+    parser.add_argument("--fixed-ms", type=float, default=600.0, help="ida e volta da API")
+    parser.add_argument("--ms-per-s", type=float, default=50.0, help="processamento por segundo de áudio")
+    parser.add_argument("--uplink-mbps", type=float, default=8.0)
+    parser.add_argument("--scale", type=float, default=0.05)
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.WARNING)
+    server = make_server(args)
+    transcribe = client_for(server)
+    rng = np.random.default_rng(9)
+    print(f"ASR local: {args.fixed_ms:.0f}ms + upload {args.uplink_mbps:.0f}Mbps + {args.ms_per_s:.0f}ms/s de áudio | "
+          f"paralelismo {args.parallelism} | escala {args.scale}")
+    print("-" * 96)
+    print(f"{'duração':>9}{'blocos':>8}{'envio único':>13}{'em blocos':>11}{'speedup':>9}"
+          f"{'único s/min':>13}{'blocos s/min':>14}{'texto igual':>13}")
+    for seconds in (float(d) for d in args.durations.split(",")):
+        pcm = synth_voice_note(seconds, rng)
+        compacted, _ = vad.compact(pcm, SR)
+
+        t0 = time.perf_counter()
+        serial_text = transcribe(chunked_asr.encode_wav(compacted, SR))
+        serial = (time.perf_counter() - t0) / args.scale
+
+        t0 = time.perf_counter()
+        chunked_text, info = chunked_asr.transcribe_long(pcm, SR, transcribe, parallelism=args.parallelism)
+        chunked = (time.perf_counter() - t0) / args.scale
+
+        minutes = len(pcm) / SR / 60
+        print(f"{len(pcm) / SR:>8.0f}s{info['chunks']:>8}{serial:>12.1f}s{chunked:>10.1f}s{serial / chunked:>8.1f}x"
+              f"{serial / minutes:>13.1f}{chunked / minutes:>14.1f}{'sim' if serial_text == chunked_text else 'NÃO':>13}")
+    server.shutdown()
+    print("(tempos na escala real; s/min = segundos de espera por minuto de áudio)")
+
+
+if __name__ == "__main__":
+    main()
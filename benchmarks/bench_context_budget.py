@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Benchmark da montagem do contexto com orçamento de tokens
+Compara o prompt concatenado sem limite (versão anterior do handler) com o
+ContextAssembler à medida que memória e trechos da base crescem; mede tokens
+estimados do prompt, tempo de montagem e se os trechos relevantes à mensagem
+continuam no prompt
+
+Uso: python benchmarks/bench_context_budget.py [--budget 1800] [--requests 2000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.context_budget import ContextAssembler, Snippet, estimate_tokens
+
+WORDS = ("marketing publicidade empresa clientes vendas automação webhook integração campanha agência "
+         "filmagem lançamento imobiliário produto estratégia conteúdo orçamento equipe projeto").split()
+PERSONALITY = "Endrigo Almada - Clone Digital Profissional Avançado. " + "instrução de personalidade " * 180
+INSTRUCTIONS = ("IMPORTANTE: Baseie suas respostas na base de conhecimento fornecida.\n"
+                "Responda de forma natural mantendo continuidade total da conversa.")
+
+
+def sentence(rng: random.Random, n: int) -> str:
+    return " ".join(rng.choices(WORDS, k=n))
+
+
+def legacy_prompt(memory, preferences, business, chunks) -> str:
+    """Cópia da concatenação anterior do _handle_text_message"""
+    return f"""
+{PERSONALITY}
+
+CONTEXTO DA MEMÓRIA:
+{chr(10).join(memory)}
+
+PREFERÊNCIAS CONHECIDAS:
+{'; '.join(preferences)}
+
+CONTEXTO EMPRESARIAL:
+{'; '.join(business)}
+
+BASE DE CONHECIMENTO RELEVANTE:
+{(chr(10) * 2).join(chunks)}
+
+{INSTRUCTIONS}
+            """
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--budget", type=int, default=1800)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(3)
+    assembler = ContextAssembler(budget_tokens=args.budget)
+    print(f"orçamento de {args.budget} tokens | {args.requests} montagens por linha")
+    print("-" * 92)
+    print(f"{'memória/base':<16}{'legado tokens':>15}{'orçamento tokens':>18}{'descartados':>13}"
+          f"{'relevante mantido':>19}{'µs/montagem':>13}")
+    for items, chunk_words in ((3, 60), (10, 120), (10, 250), (10, 400)):
+        memory = [f"Usuário: {sentence(rng, 18)}... Endrigo: {sentence(rng, 18)}..." for _ in range(3)]
+        preferences = [sentence(rng, 12) for _ in range(items)]
+        business = [sentence(rng, 12) for _ in range(items)]
+        chunks = [sentence(rng, chunk_words) for _ in range(6)]
+        query = "quanto custa a consultoria de tráfego pago?"
+        # O trecho mais relevante da base é o último da lista de resultados do BM25
+        chunks[-1] = query + " " + chunks[-1]
+
+        snippets = lambda: (
+            [Snippet('personality', PERSONALITY, required=True)]
+            + [Snippet('memory', m, score=(i + 1) / 3) for i, m in enumerate(memory)]
+            + [Snippet('preferences', p, score=(i + 1) / items) for i, p in enumerate(preferences)]
+            + [Snippet('business', b, score=(i + 1) / items) for i, b in enumerate(business)]
+            + [Snippet('knowledge', c, score=1.0 - i / 10) for i, c in enumerate(chunks)]
+            + [Snippet('instructions', INSTRUCTIONS, required=True)]
+        )
+
+        t0 = time.perf_counter()
+        for _ in range(args.requests):
+            assembled = assembler.assemble(query, snippets())
+        assemble_us = (time.perf_counter() - t0) * 1e6 / args.requests
+
+        legacy_tokens = estimate_tokens(legacy_prompt(memory, preferences, business, chunks))
+        kept = chunks[-1] in assembled.text
+        print(f"{f'{items} itens/{chunk_words}p':<16}{legacy_tokens:>15}{assembled.used:>18}"
+              f"{len(assembled.dropped):>13}{'sim' if kept else 'não':>19}{assemble_us:>13.1f}")
+    print(f"Estatísticas: {assembler.get_stats()}")
+
+
+if __name__ == "__main__":
+    main()
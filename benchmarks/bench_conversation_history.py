@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Benchmark do histórico de conversas (app/core/conversation_store.py)
+Usa um SQLite em arquivo temporário com a tabela `conversations` já com
+histórico (`--rows` linhas de `--users` usuários) e compara, por mensagem:
+- legado: SELECT das últimas 3 trocas (índice só em phone_number: todas as linhas
+  do usuário vão para um sort) + INSERT com commit por mensagem, como em main_old.whatsapp_webhook
+- índice composto (phone_number, timestamp): mesma consulta sem sort
+- ConversationStore: últimas 3 trocas do ring buffer (banco só no primeiro
+  acesso do usuário) + insert em lote pelo write-behind
+O backend SQLite do benchmark tem a mesma interface do SQLConversationBackend
+(load_recent/insert_many) com a mesma consulta. Mede o tempo no caminho da
+mensagem, consultas ao banco e o plano de execução da consulta.
+
+Uso: python benchmarks/bench_conversation_history.py [--rows 300000] [--users 5000] [--messages 5000]
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from app.core.conversation_store import ConversationStore
+from app.core.metrics import LatencyStats
+
+SCHEMA = """
+CREATE TABLE conversations (
+    id INTEGER PRIMARY KEY, phone_number VARCHAR(20) NOT NULL, user_message TEXT NOT NULL,
+    bot_response TEXT NOT NULL, message_type VARCHAR(10), transcribed_text TEXT, thread_id VARCHAR(100),
+    timestamp TIMESTAMP)
+"""
+LAST_N = ("SELECT user_message, bot_response, timestamp FROM conversations "
+          "WHERE phone_number = ? ORDER BY timestamp DESC LIMIT ?")
+INSERT = ("INSERT INTO conversations (phone_number, user_message, bot_response, message_type, transcribed_text, "
+          "timestamp) VALUES (:phone_number, :user_message, :bot_response, :message_type, :transcribed_text, "
+          ":timestamp)")
+
+
+class SQLiteBackend:
+    """Mesma interface e consulta do SQLConversationBackend, em sqlite3"""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        self.lock = threading.Lock()
+        self.queries = 0
+
+    def load_recent(self, phone, limit):
+        with self.lock:
+            self.queries += 1
+            rows = self.conn.execute(LAST_N, (phone, limit)).fetchall()
+        return [{'user_message': r[0], 'bot_response': r[1], 'timestamp': r[2]} for r in reversed(rows)]
+
+    def insert_many(self, rows):
+        with self.lock:
+            self.queries += 1
+            with self.conn:
+                self.conn.executemany(INSERT, rows)
+
+
+def build_db(path: str, args, rng, composite: bool) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=FULL")
+    conn.execute(SCHEMA)
+    conn.execute("CREATE INDEX ix_conversations_phone_number ON conversations (phone_number)")
+    if composite:
+        conn.execute("CREATE INDEX ix_conversations_phone_timestamp ON conversations (phone_number, timestamp)")
+    start = datetime.utcnow() - timedelta(days=90)
+    phones = rng.integers(0, args.users, args.rows)
+    offsets = np.sort(rng.uniform(0, 90 * 86400, args.rows))
+    with conn:
+        conn.executemany(
+            "INSERT INTO conversations (phone_number, user_message, bot_response, message_type, timestamp) "
+            "VALUES (?, ?, ?, 'text', ?)",
+            ((f"+55119{p:08d}", f"mensagem {i} " * 8, f"resposta {i} " * 20, start + timedelta(seconds=float(t)))
+             for i, (p, t) in enumerate(zip(phones, offsets))))
+    return conn
+
+
+def plan(conn) -> str:
+    rows = conn.execute("EXPLAIN QUERY PLAN " + LAST_N, ("+5511900000001", 3)).fetchall()
+    return " | ".join(r[-1] for r in rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=300000, help="linhas já existentes em conversations")
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--messages", type=int, default=5000, help="mensagens novas no teste")
+    parser.add_argument("--active", type=int, default=800, help="usuários ativos no período")
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.WARNING)
+    rng = np.random.default_rng(11)
+    active = rng.choice(args.users, args.active, replace=False)
+    senders = [f"+55119{active[min(int(z) - 1, args.active - 1)]:08d}" for z in rng.zipf(1.3, args.messages)]
+
+    tmpdir = tempfile.mkdtemp(prefix="bench_history_")
+    print(f"{args.rows:,} linhas de {args.users:,} usuários | {args.messages:,} mensagens de {args.active} ativos")
+    print("-" * 100)
+    print(f"{'cenário':<30}{'p50':>9}{'p95':>9}{'msg/s':>9}{'consultas':>11}{'commits':>9}  plano da consulta")
+    try:
+        for name, composite, store in (("legado (índice phone_number)", False, False),
+                                       ("índice composto", True, False),
+                                       ("ring buffer + lote", True, True)):
+            conn = build_db(os.path.join(tmpdir, f"{name[:6]}.db"), args, rng, composite)
+            latency = LatencyStats(window=args.messages)
+            backend = SQLiteBackend(conn)
+            history = ConversationStore(max_turns=20, backend=backend, flush_interval=1.0) if store else None
+            started = time.perf_counter()
+            for i, phone in enumerate(senders):
+                t0 = time.perf_counter()
+                if history is not None:
+                    context = history.recent_exchanges(phone, 3)
+                    history.append_exchange(phone, f"nova {i}", [f"resposta nova {i}"])
+                else:
+                    context = backend.load_recent(phone, 3)
+                    backend.insert_many([{'phone_number': phone, 'user_message': f"nova {i}",
+                                          'bot_response': f"resposta nova {i}", 'message_type': 'text',
+                                          'transcribed_text': None, 'timestamp': datetime.utcnow()}])
+                latency.record("message", (time.perf_counter() - t0) * 1e6)  # em µs
+            if history is not None:
+                history.close()
+            elapsed = time.perf_counter() - started
+            snap = latency.snapshot()["message"]
+            commits = history.stats_counters['flush_batches'] if history else args.messages
+            total = conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+            assert total == args.rows + args.messages, total
+            print(f"{name:<30}{snap['p50_ms']:>7.0f}µs{snap['p95_ms']:>7.0f}µs{args.messages / elapsed:>9.0f}"
+                  f"{backend.queries:>11,}{commits:>9,}  {plan(conn)}")
+            conn.close()
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    print("(p50/p95 = tempo no caminho da mensagem: ler as últimas 3 trocas + registrar a nova)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Benchmark do FactExtractor compilado vs 15 re.findall + varreduras de palavras-chave
+Mede mensagens/s em textos com tamanho real de WhatsApp e confere paridade
+
+Uso: python benchmarks/bench_fact_extractor.py [--messages 2000] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from advanced_memory_system import FactExtractor, TOPIC_KEYWORDS, TECH_TERMS, BUSINESS_TERMS
+
+LEGACY_PATTERNS = [
+    ('Preferência: ', 3, [
+        r'eu gosto de (.+?)(?:\.|,|$)', r'eu prefiro (.+?)(?:\.|,|$)',
+        r'minha preferência é (.+?)(?:\.|,|$)', r'eu sempre (.+?)(?:\.|,|$)',
+        r'não gosto de (.+?)(?:\.|,|$)',
+    ]),
+    ('Contexto empresarial: ', 5, [
+        r'minha empresa (.+?)(?:\.|,|$)', r'meu negócio (.+?)(?:\.|,|$)',
+        r'trabalho com (.+?)(?:\.|,|$)', r'nosso cliente (.+?)(?:\.|,|$)',
+        r'estou desenvolvendo (.+?)(?:\.|,|$)',
+    ]),
+    ('Info pessoal: ', 2, [
+        r'meu nome é (.+?)(?:\.|,|$)', r'me chamo (.+?)(?:\.|,|$)',
+        r'sou de (.+?)(?:\.|,|$)', r'moro em (.+?)(?:\.|,|$)', r'tenho (.+?) anos',
+    ]),
+]
+
+# Trechos típicos de mensagens (texto digitado e transcrições de voice note)
+SNIPPETS = [
+    "oi, tudo bem?", "bom dia!", "pode me mandar o orçamento", "obrigado pela ajuda.",
+    "eu gosto de conteúdo curto e direto", "eu prefiro falar por áudio",
+    "não gosto de ligações longas", "eu sempre reviso as campanhas na segunda",
+    "minha empresa vende insumos agrícolas no interior", "meu negócio é uma clínica odontológica",
+    "trabalho com marketing digital há oito anos", "nosso cliente principal é o varejo",
+    "estou desenvolvendo um bot de atendimento no whatsapp", "meu nome é Carla Mendes",
+    "me chamo Rafael", "sou de Ribeirão Preto", "moro em Campinas", "tenho 37 anos",
+    "queria entender como a inteligência artificial ajuda no funil de vendas",
+    "qual o roi esperado dessa estratégia de conversão", "vocês integram via api ou webhook?",
+    "a gente usa python e sql para os relatórios de métricas e kpi",
+    "a publicidade no instagram não está trazendo lead qualificado",
+    "Então, deixa eu te explicar melhor o cenário daqui da empresa", "hoje o dia foi corrido",
+]
+
+
+def build_messages(count: int, seed: int = 42) -> list:
+    """Mistura de mensagens curtas (1 trecho), médias (3) e transcrições longas (12)"""
+    rng = random.Random(seed)
+    messages = []
+    for _ in range(count):
+        size = rng.choices([1, 3, 12], weights=[5, 4, 1])[0]
+        parts = [rng.choice(SNIPPETS) for _ in range(size)]
+        messages.append(rng.choice([". ", ", ", " "]).join(parts))
+    return messages
+
+
+def legacy_analyze(text: str):
+    """Cópia do caminho anterior: 15 findall + 3 lower() + varreduras separadas"""
+    facts = []
+    for label, min_len, patterns in LEGACY_PATTERNS:
+        text_lower = text.lower()
+        values = []
+        for pattern in patterns:
+            for match in re.findall(pattern, text_lower):
+                if len(match.strip()) > min_len:
+                    values.append(f"{label}{match.strip()}")
+        facts.append(values)
+    topics = [kw for kw in TOPIC_KEYWORDS if kw in text.lower()][:5]
+    technical = any(term in text.lower() for term in TECH_TERMS)
+    mature = any(term in text.lower() for term in BUSINESS_TERMS)
+    return facts, topics, technical, mature
+
+
+def compiled_analyze(extractor: FactExtractor):
+    def run(text: str):
+        a = extractor.analyze(text)
+        return [a.preferences, a.business_context, a.personal_info], a.topics, a.technical, a.business_mature
+    return run
+
+
+def measure(fn, messages, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for msg in messages:
+            fn(msg)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    messages = build_messages(args.messages)
+    compiled = compiled_analyze(FactExtractor())
+
+    mismatches = sum(1 for m in messages if legacy_analyze(m) != compiled(m))
+    avg_len = sum(map(len, messages)) / len(messages)
+    print(f"{len(messages)} mensagens | {avg_len:.0f} caracteres em média | divergências: {mismatches}")
+    print("-" * 60)
+    print(f"{'extrator':<28}{'mensagens/s':>14}{'µs/mensagem':>16}")
+
+    results = {}
+    for name, fn in (("antigo (15 findall)", legacy_analyze), ("compilado (uma passada)", compiled)):
+        elapsed = measure(fn, messages, args.repeat)
+        results[name] = elapsed
+        print(f"{name:<28}{len(messages) / elapsed:>14,.0f}{elapsed / len(messages) * 1e6:>16.1f}")
+
+    legacy, fast = results.values()
+    print("-" * 60)
+    print(f"speedup: {legacy / fast:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
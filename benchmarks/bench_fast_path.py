@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Benchmark dos modos de resposta para texto em app/services.handle_new_message
+"assistant": sempre o run do assistente (thread, polling, resposta enviada por
+ferramenta); "fast": chat completions com streaming e histórico da conversa,
+escalando para o assistente só quando o modelo pede a base de conhecimento
+(`--escalate` = fração das mensagens). A OpenAI e o Twilio são simulados com
+latências fixas; `--scale` encurta todos os tempos na mesma proporção
+
+Uso: python benchmarks/bench_fast_path.py [--sessions 8] [--messages 4] [--escalate 0.2] [--scale 0.1]
+"""
+import argparse
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["ANSWER_CACHE_ENABLED"] = "0"  # mensagens únicas: mede só os modos
+
+from app import functions, services
+from app.clients import openai_client
+
+REPLY = ("Claro! Dá para montar uma campanha enxuta começando pelo seu público mais quente.\n\n"
+         "Me conta o ticket médio e quanto você investe hoje em anúncios que eu te passo os próximos passos.")
+
+
+class FakeOpenAI:
+    """chat.completions (streaming) e beta.threads.* com latências simuladas"""
+
+    def __init__(self, args, rng: random.Random):
+        self.s = lambda ms: ms * args.scale / 1000
+        self.args = args
+        self.rng = rng
+        self.ids = itertools.count(1)
+        self.runs = {}
+        self.lock = threading.Lock()
+        self.calls = {'chat': 0, 'threads': 0, 'messages': 0, 'runs': 0, 'retrieves': 0}
+        runs = SimpleNamespace(create=self._run_create, retrieve=self._run_retrieve,
+                               submit_tool_outputs=self._submit, cancel=lambda **_: None)
+        messages = SimpleNamespace(create=self._message_create, list=lambda **_: SimpleNamespace(data=[]))
+        self.beta = SimpleNamespace(threads=SimpleNamespace(create=self._thread_create, runs=runs, messages=messages))
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._chat_create))
+
+    def _count(self, name):
+        with self.lock:
+            self.calls[name] += 1
+
+    # --- chat completions ---
+    def _chat_create(self, messages, stream=False, **_):
+        self._count('chat')
+        escalate = messages[-1]['role'] == 'user' and self.rng.random() < self.args.escalate
+        return self._stream(escalate)
+
+    def _stream(self, escalate: bool):
+        chunk = lambda **delta: SimpleNamespace(choices=[SimpleNamespace(
+            delta=SimpleNamespace(content=delta.get('content'), tool_calls=delta.get('tool_calls')))])
+        time.sleep(self.s(self.args.first_token_ms))
+        if escalate:
+            call = lambda **kw: SimpleNamespace(index=0, id=kw.get('id'), function=SimpleNamespace(
+                name=kw.get('name'), arguments=kw.get('arguments')))
+            yield chunk(tool_calls=[call(id="call_1", name=openai_client.ESCALATE_TOOL, arguments='{"moti')])
+            time.sleep(self.s(self.args.token_ms) * 6)
+            yield chunk(tool_calls=[call(arguments='vo": "precos"}')])
+            return
+        for i, word in enumerate(REPLY.split(" ")):
+            if i:
+                time.sleep(self.s(self.args.token_ms))
+            yield chunk(content=(" " if i else "") + word)
+
+    # --- assistants ---
+    def _thread_create(self, **_):
+        time.sleep(self.s(self.args.api_ms))
+        self._count('threads')
+        return SimpleNamespace(id=f"thread_{next(self.ids)}")
+
+    def _message_create(self, **_):
+        time.sleep(self.s(self.args.api_ms))
+        self._count('messages')
+
+    def _run_create(self, **_):
+        time.sleep(self.s(self.args.api_ms))
+        self._count('runs')
+        run_id = f"run_{next(self.ids)}"
+        # O assistente chama send_whatsapp_message com a resposta e depois conclui
+        self.runs[run_id] = {'action_at': time.monotonic() + self.s(self.args.run_ms), 'done_at': None}
+        return SimpleNamespace(id=run_id, status="queued")
+
+    def _run_retrieve(self, thread_id: str, run_id: str):
+        time.sleep(self.s(self.args.api_ms))
+        self._count('retrieves')
+        run, now = self.runs[run_id], time.monotonic()
+        if run['done_at'] is not None:
+            status = "completed" if now >= run['done_at'] else "in_progress"
+            return SimpleNamespace(id=run_id, status=status, last_error=None, required_action=None)
+        if now < run['action_at']:
+            return SimpleNamespace(id=run_id, status="in_progress", last_error=None, required_action=None)
+        call = SimpleNamespace(id="call_1", function=SimpleNamespace(
+            name="send_whatsapp_message", arguments=functions.jsoncodec.dumps({"body": REPLY})))
+        action = SimpleNamespace(submit_tool_outputs=SimpleNamespace(tool_calls=[call]))
+        return SimpleNamespace(id=run_id, status="requires_action", last_error=None, required_action=action)
+
+    def _submit(self, thread_id: str, run_id: str, tool_outputs):
+        time.sleep(self.s(self.args.api_ms))
+        self.runs[run_id]['done_at'] = time.monotonic() + self.s(self.args.finish_ms)
+
+
+def install_fakes(args, fake: FakeOpenAI, deliveries: dict):
+    def send_whatsapp_message(to: str, body: str):
+        time.sleep(fake.s(args.twilio_ms))
+        deliveries.setdefault(to, time.perf_counter())
+        return '{"status": "sucesso", "sid": "SM1"}'
+
+    openai_client.client = fake
+    openai_client.ASSISTANT_ID = "asst"
+    openai_client.POLL_MIN_S = 0.3 * args.scale
+    openai_client.POLL_MAX_S = 1.5 * args.scale
+    openai_client.send_whatsapp_message = send_whatsapp_message
+    functions.send_whatsapp_message = send_whatsapp_message
+    openai_client.AVAILABLE_FUNCTIONS["send_whatsapp_message"] = send_whatsapp_message
+
+
+def run_mode(mode: str, args):
+    fake = FakeOpenAI(args, random.Random(11))
+    deliveries = {}
+    install_fakes(args, fake, deliveries)
+    services.RESPONSE_MODE = mode
+    openai_client.ORCHESTRATOR_METRICS = type(openai_client.ORCHESTRATOR_METRICS)()
+    openai_client.user_thread_map.clear()
+    first, total = [], []
+
+    def conversation(session: int):
+        for n in range(args.messages):
+            to = f"whatsapp:+5511{session:08d}#{n}"  # destino por mensagem: separa as entregas
+            payload = {"WaId": f"5511{session:08d}", "From": to, "To": "whatsapp:+1415",
+                       "Body": f"mensagem {n} da sessão {session}: quanto custa uma campanha?"}
+            t0 = time.perf_counter()
+            services.handle_new_message(payload)
+            total.append(time.perf_counter() - t0)
+            if to in deliveries:
+                first.append(deliveries[to] - t0)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.sessions) as pool:
+        list(pool.map(conversation, range(args.sessions)))
+    wall = time.perf_counter() - t0
+    return first, total, wall, fake.calls, openai_client.ORCHESTRATOR_METRICS.snapshot()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--messages", type=int, default=4, help="mensagens por sessão")
+    parser.add_argument("--escalate", type=float, default=0.2, help="fração escalada para o assistente")
+    parser.add_argument("--api-ms", type=float, default=150.0, help="latência de cada chamada da API de Assistants")
+    parser.add_argument("--run-ms", type=float, default=2500.0, help="run até pedir o envio da resposta")
+    parser.add_argument("--finish-ms", type=float, default=400.0, help="run até concluir após as ferramentas")
+    parser.add_argument("--first-token-ms", type=float, default=450.0)
+    parser.add_argument("--token-ms", type=float, default=15.0)
+    parser.add_argument("--twilio-ms", type=float, default=200.0)
+    parser.add_argument("--scale", type=float, default=0.1)
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.WARNING)
+    total_msgs = args.sessions * args.messages
+    print(f"{args.sessions} sessões x {args.messages} mensagens | run {args.run_ms:.0f}ms | "
+          f"1º token {args.first_token_ms:.0f}ms | escalonamento {args.escalate:.0%} | escala {args.scale}")
+    print("-" * 108)
+    print(f"{'modo':<12}{'1ª msg p50':>11}{'1ª msg p95':>11}{'total p50':>11}{'total p95':>11}{'msgs/s':>8}"
+          f"{'chat':>6}{'runs':>6}{'polls':>7}   latência por modo (p50 ms, contagem)")
+
+    pct = lambda values, f: sorted(values)[min(int(len(values) * f), len(values) - 1)] / args.scale * 1000
+    for mode in ("assistant", "fast"):
+        first, total, wall, calls, metrics = run_mode(mode, args)
+        per_mode = ", ".join(f"{name[5:]} {m['p50_ms'] / args.scale:.0f} ({m['count']})"
+                             for name, m in sorted(metrics.items()) if name.startswith("mode."))
+        print(f"{mode:<12}{pct(first, 0.5):>9.0f}ms{pct(first, 0.95):>9.0f}ms{pct(total, 0.5):>9.0f}ms"
+              f"{pct(total, 0.95):>9.0f}ms{total_msgs / wall * args.scale:>8.2f}{calls['chat']:>6}"
+              f"{calls['runs']:>6}{calls['retrieves']:>7}   {per_mode}")
+    print("(1ª msg: do webhook até o primeiro texto entregue ao Twilio; tempos na escala real)")
+
+
+if __name__ == "__main__":
+    main()
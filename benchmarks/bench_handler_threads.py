@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Benchmark de sessões concorrentes no AdvancedWhatsAppHandler
+Compara o fluxo anterior do _handle_text_message (cliente OpenAI e thread novos
+por mensagem, polling com time.sleep dentro do event loop) com o motor de run
+compartilhado do orquestrador (thread por sessão, chamadas bloqueantes no pool de runs).
+A API de Assistants é simulada com latências fixas; `--scale` encurta todos os
+tempos (rede, run e polling) na mesma proporção
+
+Uso: python benchmarks/bench_handler_threads.py [--sessions 20] [--messages 3] [--run-ms 2500] [--scale 0.1]
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.clients import openai_client
+
+
+class FakeAssistantsClient:
+    """beta.threads.* com latência de rede simulada; o run completa após `run_ms`"""
+
+    def __init__(self, api_ms: float, run_ms: float, scale: float):
+        self.api_s = api_ms * scale / 1000
+        self.run_s = run_ms * scale / 1000
+        self.ids = itertools.count(1)
+        self.finish_at = {}
+        self.calls = {'threads': 0, 'messages': 0, 'runs': 0, 'retrieves': 0}
+        runs = SimpleNamespace(create=self._run_create, retrieve=self._run_retrieve,
+                               cancel=lambda **_: None, submit_tool_outputs=lambda **_: None)
+        messages = SimpleNamespace(create=self._message_create, list=self._message_list)
+        self.beta = SimpleNamespace(threads=SimpleNamespace(create=self._thread_create, runs=runs,
+                                                            messages=messages))
+
+    def _thread_create(self, **_):
+        time.sleep(self.api_s)
+        self.calls['threads'] += 1
+        return SimpleNamespace(id=f"thread_{next(self.ids)}")
+
+    def _message_create(self, **_):
+        time.sleep(self.api_s)
+        self.calls['messages'] += 1
+
+    def _message_list(self, **_):
+        time.sleep(self.api_s)
+        text = SimpleNamespace(text=SimpleNamespace(value="resposta do assistente"))
+        return SimpleNamespace(data=[SimpleNamespace(content=[text])])
+
+    def _run_create(self, **_):
+        time.sleep(self.api_s)
+        self.calls['runs'] += 1
+        run_id = f"run_{next(self.ids)}"
+        self.finish_at[run_id] = time.monotonic() + self.run_s
+        return SimpleNamespace(id=run_id, status="queued")
+
+    def _run_retrieve(self, thread_id: str, run_id: str):
+        time.sleep(self.api_s)
+        self.calls['retrieves'] += 1
+        done = time.monotonic() >= self.finish_at[run_id]
+        return SimpleNamespace(id=run_id, status="completed" if done else "in_progress", last_error=None)
+
+
+async def legacy_text_message(fake: FakeAssistantsClient, client_init_s: float, scale: float, message: str) -> str:
+    """Cópia do fluxo anterior do _handle_text_message (com o cliente simulado)"""
+    time.sleep(client_init_s)  # OpenAI(...) novo: sem pool de conexões, novo handshake TLS
+    client = fake
+    thread = client.beta.threads.create(messages=[{"role": "user", "content": message}])
+    run = client.beta.threads.runs.create(thread_id=thread.id, assistant_id="asst")
+    timeout = 15 * scale
+    start_time = time.time()
+    while run.status not in ["completed", "failed", "cancelled"]:
+        if time.time() - start_time > timeout:
+            break
+        time.sleep(1 * scale)
+        run = client.beta.threads.runs.retrieve(thread_id=thread.id, run_id=run.id)
+    messages = client.beta.threads.messages.list(thread_id=thread.id)
+    return messages.data[0].content[0].text.value
+
+
+async def shared_text_message(session_id: str, message: str, scale: float) -> str:
+    outcome = await openai_client.ask_assistant_async(
+        session_id, message, from_user=f"whatsapp:+{session_id[3:]}",
+        assistant_id="asst", additional_instructions="contexto", timeout=15 * scale, fetch_reply=True,
+    )
+    return outcome["reply"]
+
+
+async def measure(handle, sessions: int, messages: int):
+    """Sessões conversando ao mesmo tempo (cada uma espera a resposta antes da próxima mensagem)"""
+    latencies, lag = [], [0.0]
+
+    async def heartbeat():
+        while True:
+            t0 = time.perf_counter()
+            await asyncio.sleep(0.005)
+            lag[0] = max(lag[0], time.perf_counter() - t0 - 0.005)
+
+    async def conversation(session: int):
+        for n in range(messages):
+            t0 = time.perf_counter()
+            await handle(f"wa:5511{session:08d}", f"mensagem {n} da sessão {session}")
+            latencies.append(time.perf_counter() - t0)
+
+    beat = asyncio.create_task(heartbeat())
+    await asyncio.sleep(0.01)
+    t0 = time.perf_counter()
+    await asyncio.gather(*(conversation(s) for s in range(sessions)))
+    wall = time.perf_counter() - t0
+    await asyncio.sleep(0.01)  # deixa o heartbeat registrar o último atraso
+    beat.cancel()
+    latencies.sort()
+    return wall, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.95)], lag[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=3, help="mensagens por sessão")
+    parser.add_argument("--api-ms", type=float, default=150.0, help="latência de cada chamada da API")
+    parser.add_argument("--run-ms", type=float, default=2500.0, help="duração de um run do assistente")
+    parser.add_argument("--client-init-ms", type=float, default=120.0,
+                        help="custo de criar um cliente OpenAI novo (conexão fria)")
+    parser.add_argument("--scale", type=float, default=0.1)
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.INFO)
+    total = args.sessions * args.messages
+    print(f"{args.sessions} sessões x {args.messages} mensagens | API {args.api_ms:.0f}ms | "
+          f"run {args.run_ms:.0f}ms | escala {args.scale}")
+    print("-" * 102)
+    print(f"{'fluxo':<40}{'msgs/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'loop travado ms':>17}{'threads':>9}{'polls':>8}")
+
+    fake = FakeAssistantsClient(args.api_ms, args.run_ms, args.scale)
+    init_s = args.client_init_ms * args.scale / 1000
+    legacy = lambda session, message: legacy_text_message(fake, init_s, args.scale, message)
+    results = [("anterior (thread nova, sleep no loop)", fake, asyncio.run(measure(legacy, args.sessions, args.messages)))]
+
+    fake = FakeAssistantsClient(args.api_ms, args.run_ms, args.scale)
+    openai_client.client = fake
+    openai_client.POLL_MIN_S *= args.scale
+    openai_client.POLL_MAX_S *= args.scale
+    shared = lambda session, message: shared_text_message(session, message, args.scale)
+    results.append(("motor compartilhado (pool de runs)", fake,
+                    asyncio.run(measure(shared, args.sessions, args.messages))))
+
+    for label, client, (wall, p50, p95, lag) in results:
+        # Tempos devolvidos na escala real (divididos por --scale)
+        print(f"{label:<40}{total / wall * args.scale:>9.2f}{p50 / args.scale * 1000:>9.0f}"
+              f"{p95 / args.scale * 1000:>9.0f}{lag / args.scale * 1000:>17.0f}"
+              f"{client.calls['threads']:>9}{client.calls['retrieves']:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Benchmark do codec JSON nos eventos da Realtime API
+Mede eventos/s e CPU gasta por minuto de áudio (downlink e uplink)
+
+Uso: python benchmarks/bench_jsoncodec.py [--minutes 1] [--repeat 5]
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils import jsoncodec
+
+OUTPUT_RATE = 24000 * 2   # bytes/s de PCM16 24kHz mono (resposta)
+INPUT_RATE = 16000 * 2    # bytes/s de PCM16 16kHz mono (voice note)
+DELTA_MS = 100            # tamanho típico de um response.audio.delta
+UPLINK_CHUNK = 32768      # mesmo chunk usado em send_audio_to_realtime
+
+
+def build_downlink_events(minutes: float) -> list:
+    """Eventos response.audio.delta equivalentes a `minutes` de áudio."""
+    pcm = os.urandom(int(OUTPUT_RATE * DELTA_MS / 1000))
+    delta = base64.b64encode(pcm).decode()
+    total = int(minutes * 60 * 1000 / DELTA_MS)
+    return [
+        json.dumps({
+            "type": "response.audio.delta",
+            "event_id": f"event_{i}",
+            "response_id": "resp_bench",
+            "item_id": "item_bench",
+            "output_index": 0,
+            "content_index": 0,
+            "delta": delta,
+        })
+        for i in range(total)
+    ]
+
+
+def build_uplink_chunks(minutes: float) -> list:
+    b64 = base64.b64encode(os.urandom(int(INPUT_RATE * minutes * 60))).decode()
+    return [b64[i:i + UPLINK_CHUNK] for i in range(0, len(b64), UPLINK_CHUNK)]
+
+
+def measure(fn, items, repeat: int):
+    best_wall, best_cpu = float("inf"), float("inf")
+    for _ in range(repeat):
+        w0, c0 = time.perf_counter(), time.process_time()
+        fn(items)
+        best_wall = min(best_wall, time.perf_counter() - w0)
+        best_cpu = min(best_cpu, time.process_time() - c0)
+    return best_wall, best_cpu
+
+
+def downlink_stdlib(events):
+    for raw in events:
+        event = json.loads(raw)
+        if event.get("type") == "response.audio.delta":
+            event.get("delta", "")
+
+
+def downlink_codec_full(events):
+    for raw in events:
+        event = jsoncodec.loads(raw)
+        if event.get("type") == "response.audio.delta":
+            event.get("delta", "")
+
+
+def downlink_codec_lazy(events):
+    for raw in events:
+        if jsoncodec.peek_type(raw) == "response.audio.delta":
+            jsoncodec.extract_delta(raw)
+
+
+def uplink_stdlib(chunks):
+    for chunk in chunks:
+        json.dumps({"type": "input_audio_buffer.append", "audio": chunk})
+
+
+def uplink_codec(chunks):
+    for chunk in chunks:
+        jsoncodec.encode_audio_append(chunk)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--minutes", type=float, default=1.0)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    events = build_downlink_events(args.minutes)
+    chunks = build_uplink_chunks(args.minutes)
+
+    print(f"Backend ativo: {jsoncodec.BACKEND} (disponíveis: {', '.join(jsoncodec.available_backends())})")
+    print(f"Downlink: {len(events)} eventos | Uplink: {len(chunks)} eventos | {args.minutes} min de áudio")
+    print("-" * 72)
+    print(f"{'caminho':<28}{'eventos/s':>14}{'CPU ms/min áudio':>20}{'wall ms':>10}")
+
+    cases = [
+        ("downlink json.loads", downlink_stdlib, events),
+        (f"downlink {jsoncodec.BACKEND} completo", downlink_codec_full, events),
+        ("downlink peek + delta", downlink_codec_lazy, events),
+        ("uplink json.dumps", uplink_stdlib, chunks),
+        ("uplink encode_audio_append", uplink_codec, chunks),
+    ]
+    for name, fn, items in cases:
+        wall, cpu = measure(fn, items, args.repeat)
+        rate = len(items) / wall if wall else float("inf")
+        print(f"{name:<28}{rate:>14,.0f}{cpu * 1000 / args.minutes:>20.2f}{wall * 1000:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
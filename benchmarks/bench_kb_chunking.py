@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Benchmark dos chunkers da base de conhecimento nos documentos do repositório
+Compara a janela fixa de 400/300 caracteres com o chunker de frases: tamanho
+do índice, palavras/fatos cortados e hit@k em perguntas com resposta conhecida
+
+Uso: python benchmarks/bench_kb_chunking.py [--configs fixed:400:300,sentence:120:24,sentence:80:16]
+"""
+import argparse
+import os
+import re
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core import kb_index
+from app.core.chunking import count_tokens, get_chunker
+from app.core.embeddings import HashingEmbedder
+
+DOCS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "documents")
+
+# (pergunta, trecho da resposta no texto): acerto = trecho inteiro em um dos top-k chunks
+QUESTIONS = [
+    ("Quando ele fundou a produtora de filmes?", "2015: Fundou Manada Filmes"),
+    ("Quantos funcionários a agência chegou a ter?", "Chegou a ter 42 funcionários"),
+    ("Qual foi o resultado no Bandeirante?", "aumentaram o engajamento da torcida em 25%"),
+    ("Quais clientes grandes ele atendeu?", "Katayama Alimentos"),
+    ("Para onde ele costuma viajar?", "foi aos EUA 12 vezes, maioria para Flórida/Orlando"),
+    ("Em que ele investe o dinheiro?", "mercado de ações, fundos imobiliários, possui três imóveis"),
+    ("De quem ele comprou a parte na sociedade?", "Comprou a parte do sócio Juliano"),
+    ("Quando conheceu o Amir Mansour?", "2017: Conheceu Amir Mansour"),
+    ("Qual o objetivo da Desigual IA LABS?", "Objetivo: Vender agentes autônomos com marketing explosivo"),
+    ("Quais são as fraquezas dele com clientes?", "Dificuldade de manter alguns clientes"),
+    ("Para qual time de futebol ele torce?", "torcedor do Palmeiras"),
+    ("Como começou a carreira?", "Office boy da faculdade, depois monitor de informática (17 cursos)"),
+    ("O que a empresa oferece para a equipe no almoço?", "Fornecimento gratuito de almoço para equipe há mais de 10 anos"),
+    ("Quantos funcionários já passaram pela empresa?", "Mais de 400 funcionários em 22 anos sem processos trabalhistas"),
+    ("Quais desafios ele antecipa no projeto de IA?", "Formar engenheiros de prompt"),
+    ("O que ele faz para o agronegócio?", "Marketing rural, marketplace B2B, gestão digital de safras"),
+    ("Quais soluções para o setor imobiliário?", "CRM personalizado, geração de leads, tours virtuais"),
+    ("Como ele reage a situações de estresse?", "Situações de estresse causam frustração"),
+    ("Em quanto tempo recuperou o investimento na Manada?", "Recuperação de investimento em 3 meses"),
+    ("Quando a empresa quase faliu?", "quase faliu em 2012"),
+    ("Qual o tamanho do prédio da empresa?", "prédio de quase 1000m² com estúdio e auditório"),
+    ("Qual a idade e o signo dele?", "41 anos, canceriano, líder nato e generoso"),
+]
+
+
+def squash(text: str) -> str:
+    return " ".join(text.split())
+
+
+def load_sources() -> list:
+    sources = [os.path.join(DOCS_DIR, "biografia_endrigo_completa.txt")]
+    try:
+        import pdfplumber  # noqa: F401
+        sources.append(os.path.join(DOCS_DIR, "bio_endrigo.pdf"))
+    except ImportError:
+        print("pdfplumber não instalado: PDF fora da medição")
+    return sources
+
+
+def facts(text: str) -> list:
+    """Itens de lista do documento (cada um é um fato que não deveria ser cortado)"""
+    return [squash(m.group(1)) for m in re.finditer(r"^\s*- (.{12,})$", text, re.M)]
+
+
+def cut_words(text: str, chunks) -> int:
+    """Fronteiras de chunk que caem no meio de uma palavra"""
+    cuts = 0
+    for chunk in chunks:
+        for pos in (chunk.start, chunk.end):
+            if 0 < pos < len(text) and text[pos - 1].isalnum() and text[pos].isalnum():
+                cuts += 1
+    return cuts
+
+
+def directory_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(path) for name in names)
+
+
+def evaluate(spec: str, sources: list, embedder) -> dict:
+    name, *params = spec.split(":")
+    if name == "fixed":
+        chunker = get_chunker("fixed", size=int(params[0]), step=int(params[1]))
+    else:
+        chunker = get_chunker("sentence", max_tokens=int(params[0]), overlap_tokens=int(params[1]))
+
+    texts = {source: kb_index.extract_text(source) for source in sources}
+    chunks = [c for source in sources for c in kb_index.chunk_document(source, chunker)]
+    all_facts = [f for text in texts.values() for f in facts(text)]
+    squashed = [squash(c.text) for c in chunks]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        digests = {source: kb_index.file_sha256(source) for source in sources}
+        generation = kb_index.open_generation(digests, tmp, embedder, chunker=chunker)
+        index_bytes = directory_size(tmp)
+
+        row = {
+            "chunker": chunker.signature,
+            "chunks": len(chunks),
+            "tokens/chunk": sum(count_tokens(c.text) for c in chunks) / len(chunks),
+            "dup": sum(len(c.text) for c in chunks) / sum(len(t) for t in texts.values()),
+            "index KB": index_bytes / 1024,
+            "palavras cortadas": cut_words(texts[sources[0]], [c for c in chunks if c.source == sources[0]]),
+            "fatos inteiros": sum(any(f in c for c in squashed) for f in all_facts) / len(all_facts),
+        }
+        for mode in ("bm25", "semantic"):
+            hits1 = hits3 = context_tokens = 0
+            for question, answer in QUESTIONS:
+                if mode == "bm25":
+                    ids = [doc_id for _, doc_id in generation.bm25.search(question, 3)]
+                else:
+                    ids = [doc_id for _, doc_id in generation.search(question, 3)]
+                found = [answer in squash(generation.chunks[doc_id]) for doc_id in ids]
+                hits1 += bool(found[:1] and found[0])
+                hits3 += any(found)
+                context_tokens += sum(count_tokens(generation.chunks[doc_id]) for doc_id in ids)
+            row[f"{mode} hit@1"] = hits1 / len(QUESTIONS)
+            row[f"{mode} hit@3"] = hits3 / len(QUESTIONS)
+            row[f"{mode} ctx tokens"] = context_tokens / len(QUESTIONS)
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--configs", default="fixed:400:300,sentence:120:24,sentence:80:16")
+    args = parser.parse_args()
+
+    sources = load_sources()
+    embedder = HashingEmbedder()
+    print(f"Fontes: {', '.join(os.path.basename(s) for s in sources)} | {len(QUESTIONS)} perguntas")
+    rows = [evaluate(spec, sources, embedder) for spec in args.configs.split(",")]
+
+    width = 24
+    print("-" * (22 + width * len(rows)))
+    print(f"{'':<22}" + "".join(f"{row['chunker']:>{width}}" for row in rows))
+    for key in rows[0]:
+        if key == "chunker":
+            continue
+        cells = []
+        for row in rows:
+            value = row[key]
+            if "hit" in key or key in ("fatos inteiros",):
+                cells.append(f"{value:>{width}.0%}")
+            elif isinstance(value, float):
+                cells.append(f"{value:>{width}.2f}" if key == "dup" else f"{value:>{width}.1f}")
+            else:
+                cells.append(f"{value:>{width}}")
+        print(f"{key:<22}" + "".join(cells))
+
+
+if __name__ == "__main__":
+    main()
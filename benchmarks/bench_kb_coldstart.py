@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Benchmark de cold start da base de conhecimento, com e sem índice pré-construído
+Cada cenário roda em um processo novo (como um worker do gunicorn subindo)
+
+Uso: python benchmarks/bench_kb_coldstart.py [--mb 5] [--runs 3]
+"""
+import argparse
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BOOT = """
+import time, sys
+sys.path.insert(0, {root!r})
+t0 = time.perf_counter()
+from knowledge_base_manager import KnowledgeBase
+kb = KnowledgeBase({sources!r}, retrieval_mode={mode!r}, index_dir={index_dir!r})
+kb.retrieve_relevant("diretor de marketing do bandeirante")
+print(f"{{(time.perf_counter() - t0) * 1000:.1f}} {{len(kb.chunks)}}")
+"""
+
+
+def build_sources(tmp: str, mb: float) -> list:
+    """Biografia real (+ PDF se o pdfplumber estiver instalado) + TXT sintético de `mb` MB"""
+    sources = [shutil.copy(os.path.join(ROOT, "documents", "biografia_endrigo_completa.txt"), tmp)]
+    try:
+        import pdfplumber  # noqa: F401
+        sources.append(shutil.copy(os.path.join(ROOT, "documents", "bio_endrigo.pdf"), tmp))
+    except ImportError:
+        print("pdfplumber não instalado: PDF fora da medição")
+
+    if mb > 0:
+        with open(sources[0], encoding="utf-8") as f:
+            words = f.read().split()
+        rng = random.Random(3)
+        path = os.path.join(tmp, "corpus_sintetico.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            written = 0
+            while written < mb * 1024 * 1024:
+                line = " ".join(rng.choices(words, k=40)) + "\n"
+                f.write(line)
+                written += len(line.encode("utf-8"))
+        sources.append(path)
+    return sources
+
+
+def boot(sources: list, index_dir, mode: str = "bm25"):
+    code = BOOT.format(root=ROOT, sources=sources, mode=mode, index_dir=index_dir)
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    ms, chunks = out.stdout.split()[-2:]
+    return float(ms), int(chunks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--mb", type=float, default=5.0, help="tamanho do TXT sintético")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sources = build_sources(tmp, args.mb)
+        index_dir = os.path.join(tmp, ".kb_index")
+        print(f"Fontes: {', '.join(os.path.basename(s) for s in sources)}")
+        print("-" * 64)
+        print(f"{'cenário':<44}{'boot ms':>10}{'chunks':>10}")
+
+        for mode in ("bm25", "semantic"):
+            shutil.rmtree(index_dir, ignore_errors=True)
+            scenarios = [
+                (f"[{mode}] sem índice (processa arquivos)", None, args.runs),
+                (f"[{mode}] 1º boot (constrói o índice)", index_dir, 1),
+                (f"[{mode}] com índice (mmap)", index_dir, args.runs),
+            ]
+            for name, directory, runs in scenarios:
+                results = [boot(sources, directory, mode) for _ in range(runs)]
+                best = min(ms for ms, _ in results)
+                print(f"{name:<44}{best:>10.1f}{results[0][1]:>10}")
+
+
+if __name__ == "__main__":
+    main()
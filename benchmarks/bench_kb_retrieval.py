@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Benchmark da busca da base de conhecimento: sobreposição de palavras vs BM25
+Escala o corpus dos dois documentos atuais até 10k documentos e mede latência
+por consulta, tempo de indexação e hit@3 em consultas plantadas
+
+Uso: python benchmarks/bench_kb_retrieval.py [--sizes 60,1000,10000] [--queries 200]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.bm25 import BM25Index, tokenize
+
+DOCS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "documents")
+
+
+def load_real_chunks() -> list:
+    """Chunks 400/300 da biografia em TXT (o PDF exige pdfplumber)"""
+    with open(os.path.join(DOCS_DIR, "biografia_endrigo_completa.txt"), encoding="utf-8") as f:
+        text = f.read()
+    return [text[i:i + 400] for i in range(0, len(text), 300)]
+
+
+def build_corpus(size: int, real_chunks: list, rng: random.Random) -> list:
+    """Chunks reais + documentos sintéticos com vocabulário em cauda longa (Zipf)"""
+    if size <= len(real_chunks):
+        return real_chunks[:size]
+    base_words = re.findall(r"\w+", " ".join(real_chunks).lower())
+    vocab = list(dict.fromkeys(base_words)) + [f"termo{i}" for i in range(20000)]
+    weights = [1 / (rank + 1) for rank in range(len(vocab))]
+    corpus = list(real_chunks)
+    while len(corpus) < size:
+        corpus.append(" ".join(rng.choices(vocab, weights=weights, k=65)))
+    return corpus
+
+
+def legacy_retrieve(chunks: list, query: str, top_k: int = 3) -> list:
+    """Cópia do retrieve_relevant anterior (re-tokeniza todo o corpus por consulta)"""
+    query_words = set(re.findall(r"\w+", query.lower()))
+    scored = []
+    for i, chunk in enumerate(chunks):
+        score = len(query_words.intersection(set(re.findall(r"\w+", chunk.lower()))))
+        if score > 0:
+            scored.append((score, i))
+    scored.sort(reverse=True)
+    return [i for _, i in scored[:top_k]]
+
+
+def planted_queries(corpus: list, index: BM25Index, count: int, rng: random.Random) -> list:
+    """Consulta = 2 termos raros de um documento alvo + 2 palavras comuns"""
+    queries = []
+    while len(queries) < count:
+        target = rng.randrange(len(corpus))
+        terms = sorted(set(tokenize(corpus[target])), key=lambda t: len(index.postings[t][0]))
+        if len(terms) < 2:
+            continue
+        queries.append((f"{terms[0]} {terms[1]} com os clientes da empresa", target))
+    return queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="60,1000,10000")
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    real_chunks = load_real_chunks()
+    print(f"Corpus real: {len(real_chunks)} chunks (TXT)")
+    print("-" * 86)
+    print(f"{'docs':>7}{'indexação ms':>15}{'antigo ms/q':>14}{'BM25 ms/q':>12}{'speedup':>10}"
+          f"{'hit@3 antigo':>14}{'hit@3 BM25':>14}")
+
+    for size in (int(s) for s in args.sizes.split(",")):
+        corpus = build_corpus(size, real_chunks, rng)
+
+        t0 = time.perf_counter()
+        index = BM25Index(corpus)
+        build_ms = (time.perf_counter() - t0) * 1000
+
+        queries = planted_queries(corpus, index, args.queries, rng)
+        # O caminho antigo é O(corpus) por consulta: amostra menor nos corpora grandes
+        legacy_queries = queries[:max(10, args.queries * 200 // max(size, 1))]
+
+        t0 = time.perf_counter()
+        legacy_hits = sum(target in legacy_retrieve(corpus, q) for q, target in legacy_queries)
+        legacy_ms = (time.perf_counter() - t0) * 1000 / len(legacy_queries)
+
+        t0 = time.perf_counter()
+        bm25_hits = sum(target in [d for _, d in index.search(q, 3)] for q, target in queries)
+        bm25_ms = (time.perf_counter() - t0) * 1000 / len(queries)
+
+        print(f"{size:>7}{build_ms:>15.1f}{legacy_ms:>14.3f}{bm25_ms:>12.3f}{legacy_ms / bm25_ms:>9.0f}x"
+              f"{legacy_hits / len(legacy_queries):>14.0%}{bm25_hits / len(queries):>14.0%}")
+
+
+if __name__ == "__main__":
+    main()
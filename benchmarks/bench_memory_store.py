@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Benchmark do MemoryStore vs dicts ilimitados do AdvancedMemorySystem antigo
+Mede memória residente por 10k usuários e custo de update_memory com 50 fatos
+
+Uso: python benchmarks/bench_memory_store.py [--users 10000] [--facts 12]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from advanced_memory_system import AdvancedMemorySystem, MemoryFact
+from memory_store import MemoryStore
+
+CATEGORIES = (('preferences', 7), ('business_context', 8), ('personal_info', 6))
+
+
+def make_fact(phone: str, category: str, importance: int, i: int) -> MemoryFact:
+    return MemoryFact(
+        type=category,
+        content=f"{category}: conteúdo típico de fato extraído número {i} do usuário {phone}",
+        timestamp=datetime.now(),
+        importance=importance,
+        context="Mensagem original do usuário com cerca de cem caracteres de contexto para o fato"[:100],
+        user_phone=phone,
+    )
+
+
+def legacy_update_memory(long_term_memory: dict, fact: MemoryFact):
+    """Cópia do update_memory anterior (scan linear + sort + truncate)"""
+    user_phone = fact.user_phone
+    if user_phone not in long_term_memory:
+        long_term_memory[user_phone] = {
+            'preferences': [], 'business_context': [], 'personal_info': [], 'insights': []
+        }
+    memory_category = long_term_memory[user_phone]
+    fact_dict = asdict(fact)
+    fact_dict['timestamp'] = fact.timestamp.isoformat()
+    if fact.type in memory_category:
+        existing_contents = [f['content'] for f in memory_category[fact.type]]
+        if fact.content not in existing_contents:
+            memory_category[fact.type].append(fact_dict)
+            memory_category[fact.type].sort(key=lambda x: x['importance'], reverse=True)
+            memory_category[fact.type] = memory_category[fact.type][:50]
+
+
+def footprint(users: int, facts: int, build) -> float:
+    """MB alocados para `users` usuários com `facts` fatos por categoria"""
+    tracemalloc.start()
+    holder = build(users, facts)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del holder
+    return current / 1024 / 1024
+
+
+def build_legacy(users: int, facts: int):
+    memory = {}
+    for u in range(users):
+        phone = f"+55119{u:08d}"
+        for category, importance in CATEGORIES:
+            for i in range(facts):
+                legacy_update_memory(memory, make_fact(phone, category, importance, i))
+    return memory
+
+
+def build_store(max_users: int):
+    def build(users: int, facts: int):
+        memory = AdvancedMemorySystem(MemoryStore(max_users=max_users, backend=None))
+        for u in range(users):
+            phone = f"+55119{u:08d}"
+            for category, importance in CATEGORIES:
+                for i in range(facts):
+                    memory.update_memory(make_fact(phone, category, importance, i))
+        return memory
+    return build
+
+
+def update_cost(n_updates: int):
+    """µs por update_memory em uma categoria já cheia (50 fatos)"""
+    facts = [make_fact("+5511900000000", "business_context", 8, i) for i in range(50 + n_updates)]
+
+    legacy = {}
+    for f in facts[:50]:
+        legacy_update_memory(legacy, f)
+    t0 = time.perf_counter()
+    for f in facts[50:]:
+        legacy_update_memory(legacy, f)
+    legacy_us = (time.perf_counter() - t0) / n_updates * 1e6
+
+    memory = AdvancedMemorySystem(MemoryStore(backend=None))
+    for f in facts[:50]:
+        memory.update_memory(f)
+    t0 = time.perf_counter()
+    for f in facts[50:]:
+        memory.update_memory(f)
+    store_us = (time.perf_counter() - t0) / n_updates * 1e6
+    return legacy_us, store_us
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--facts", type=int, default=12, help="fatos por categoria por usuário")
+    parser.add_argument("--lru", type=int, default=2000, help="limite de residentes do cenário com LRU")
+    args = parser.parse_args()
+
+    print(f"{args.users} usuários x {len(CATEGORIES)} categorias x {args.facts} fatos")
+    print("-" * 60)
+    per_10k = 10000 / args.users
+    legacy_mb = footprint(args.users, args.facts, build_legacy)
+    store_mb = footprint(args.users, args.facts, build_store(args.users))
+    lru_mb = footprint(args.users, args.facts, build_store(args.lru))
+    print(f"{'dicts antigos (ilimitado)':<34}{legacy_mb * per_10k:>10.1f} MB / 10k usuários")
+    print(f"{'MemoryStore (todos residentes)':<34}{store_mb * per_10k:>10.1f} MB / 10k usuários")
+    print(f"{f'MemoryStore (LRU {args.lru})':<34}{lru_mb:>10.1f} MB totais (limitado)")
+
+    legacy_us, store_us = update_cost(2000)
+    print("-" * 60)
+    print(f"update_memory com categoria cheia: antigo {legacy_us:.1f} µs | store {store_us:.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Benchmark do OptimizedPipeline (ASR -> LLM -> TTS) com estágios locais simulados
+ASR, LLM e TTS são substituídos por funções com latências típicas (sleep), então
+o resultado mede só a orquestração: modo sequencial (um estágio de cada vez,
+um único áudio) x streaming (ASR por segmento em paralelo, tokens do LLM indo
+para o TTS frase a frase). Reporta primeiro áudio, total e as métricas por estágio
+
+Uso: python benchmarks/bench_pipeline_stages.py [--requests 20] [--concurrency 4] [--segments 4]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from optimized_pipeline import OptimizedPipeline
+
+REPLY = ("Claro, posso te ajudar com isso! A gente começa entendendo o público da sua marca. "
+         "Depois montamos a campanha com conteúdo em vídeo e anúncios segmentados. "
+         "Em duas semanas você já vê os primeiros resultados. Quer que eu te mande uma proposta?")
+
+
+def make_stages(args, rng: random.Random):
+    jitter = lambda ms: ms * rng.uniform(0.85, 1.15) / 1000
+
+    def asr(segment: bytes) -> str:
+        time.sleep(jitter(args.asr_ms + args.asr_ms_per_kb * len(segment) / 1024))
+        return "quero montar uma campanha"
+
+    def llm(transcript: str, context):
+        time.sleep(jitter(args.first_token_ms))
+        for word in REPLY.split(" "):
+            time.sleep(jitter(args.token_ms))
+            yield word + " "
+
+    def tts(text: str) -> bytes:
+        time.sleep(jitter(args.tts_ms + args.tts_ms_per_char * len(text)))
+        return b"\xff\xfb" + text.encode()
+
+    return asr, llm, tts
+
+
+async def run_mode(pipeline: OptimizedPipeline, args, audio: list):
+    results = []
+    limit = asyncio.Semaphore(args.concurrency)
+
+    async def one():
+        async with limit:
+            result = await pipeline.process_with_streaming(audio, {})
+            results.append(result['latency_metrics'])
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(args.requests)))
+    return results, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--segments", type=int, default=4, help="segmentos de áudio por mensagem")
+    parser.add_argument("--segment-kb", type=int, default=24)
+    parser.add_argument("--asr-ms", type=float, default=180.0)
+    parser.add_argument("--asr-ms-per-kb", type=float, default=6.0)
+    parser.add_argument("--first-token-ms", type=float, default=350.0)
+    parser.add_argument("--token-ms", type=float, default=12.0)
+    parser.add_argument("--tts-ms", type=float, default=220.0)
+    parser.add_argument("--tts-ms-per-char", type=float, default=2.5)
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.INFO)
+    audio = [os.urandom(args.segment_kb * 1024) for _ in range(args.segments)]
+    print(f"{args.requests} mensagens ({args.concurrency} simultâneas) | {args.segments} segmentos de "
+          f"{args.segment_kb}KB | resposta de {len(REPLY)} caracteres")
+    print("-" * 100)
+    print(f"{'modo':<14}{'1º áudio p50':>13}{'1º áudio p95':>13}{'total p50':>11}{'ASR':>8}{'LLM':>8}"
+          f"{'TTS':>8}{'1º token':>10}{'seg. TTS':>10}{'msgs/s':>8}")
+
+    for label, streaming in (("sequencial", False), ("streaming", True)):
+        asr, llm, tts = make_stages(args, random.Random(7))
+        pipeline = OptimizedPipeline(asr=asr, llm=llm, tts=tts, autotune=False)
+        pipeline.streaming_enabled = streaming
+        metrics, wall = asyncio.run(run_mode(pipeline, args, audio))
+
+        def pct(values, fraction):
+            values = sorted(values)
+            return values[min(int(len(values) * fraction), len(values) - 1)]
+
+        avg = lambda attr: sum(getattr(m, attr) for m in metrics) / len(metrics)
+        first_audio = [m.first_audio_latency for m in metrics]
+        print(f"{label:<14}{pct(first_audio, 0.5):>11.0f}ms{pct(first_audio, 0.95):>11.0f}ms"
+              f"{pct([m.total_latency for m in metrics], 0.5):>9.0f}ms{avg('asr_latency'):>8.0f}"
+              f"{avg('llm_latency'):>8.0f}{avg('tts_latency'):>8.0f}{avg('first_token_latency'):>10.0f}"
+              f"{avg('tts_segments'):>10.1f}{len(metrics) / wall:>8.2f}")
+    print("(ASR/LLM/TTS/1º token: média em ms, medidos pelo próprio pipeline)")
+
+
+if __name__ == "__main__":
+    main()
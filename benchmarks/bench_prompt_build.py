@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Benchmark da montagem do prompt contextual do PersonalityManager
+Compara o f-string completo por mensagem (versão anterior) com os templates
+pré-compilados + bloco do usuário memoizado; confere que o texto é idêntico
+
+Uso: python benchmarks/bench_prompt_build.py [--users 200] [--messages 20000] [--update-every 10]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from personality_manager import PersonalityManager
+
+
+def legacy_prompt(pm: PersonalityManager, conversation_history, user_phone: str) -> str:
+    """Cópia do generate_contextual_prompt anterior"""
+    recent_context = pm.extract_recent_context(conversation_history)
+    user_profile = pm.get_user_profile(user_phone)
+
+    return f"""
+{pm.base_personality['core']['name']} - Clone Digital Profissional Avançado
+
+CONTEXTO ATUAL DA CONVERSA:
+{recent_context}
+
+PERFIL DO USUÁRIO:
+{user_profile}
+
+INSTRUÇÕES DE PERSONALIDADE v4:
+1. Tom: {pm.base_personality['style']['tone']} com {pm.base_personality['style']['energy_level']}
+2. Linguagem: {pm.base_personality['style']['language']} com expressões naturais
+3. Expertise: Demonstre conhecimento em {', '.join(pm.base_personality['core']['expertise'])}
+4. Método: Use {pm.base_personality['behavior']['explanation_method']} 
+5. Abordagem: Seja {pm.base_personality['behavior']['problem_solving']}
+6. Valor: Entregue {pm.base_personality['context']['value_proposition']}
+
+MEMÓRIA DE CONVERSA ATIVA:
+{pm.format_conversation_memory(user_phone)}
+
+PADRÕES COMPORTAMENTAIS APRENDIDOS:
+{pm.get_behavioral_insights(user_phone)}
+        """
+
+
+def build_manager(users: int, rng: random.Random) -> PersonalityManager:
+    pm = PersonalityManager()
+    words = ("marketing publicidade empresa clientes vendas ia automação webhook api integração "
+             "campanha agência filmagem lançamento imobiliário").split()
+    for u in range(users):
+        phone = f"+55119{u:08d}"
+        for _ in range(rng.randint(1, 25)):
+            text = " ".join(rng.choices(words, k=rng.randint(5, 30)))
+            pm.update_user_profile(phone, {'message_text': text})
+            pm.learn_behavioral_pattern(phone, {'content': text, 'message_type': rng.choice(['text', 'audio'])})
+    return pm
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--update-every", type=int, default=10,
+                        help="a cada N mensagens o perfil do usuário muda (invalida o bloco)")
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.INFO)
+    rng = random.Random(11)
+    pm = build_manager(args.users, rng)
+    phones = list(pm.conversation_memory)
+    history = [{'timestamp': f"2026-10-19 10:{i:02d}", 'message_text': f"mensagem {i} " * 12} for i in range(8)]
+    stream = [rng.choice(phones) for _ in range(args.messages)]
+
+    mismatches = sum(legacy_prompt(pm, history, p) != pm.generate_contextual_prompt(history, p) for p in phones)
+
+    def run(build, with_updates: bool) -> float:
+        t0 = time.perf_counter()
+        for i, phone in enumerate(stream):
+            if with_updates and i % args.update_every == 0:
+                pm.learn_behavioral_pattern(phone, {'content': 'cliente', 'message_type': 'text'})
+            build(pm, history, phone)
+        return (time.perf_counter() - t0) * 1e6 / len(stream)
+
+    def allocated(build) -> float:
+        """Pico médio de memória alocada durante a montagem de um prompt (tracemalloc)"""
+        tracemalloc.start()
+        peaks = []
+        for phone in stream[:2000]:
+            current = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            build(pm, history, phone)
+            peaks.append(tracemalloc.get_traced_memory()[1] - current)
+        tracemalloc.stop()
+        return sum(peaks) / len(peaks)
+
+    new = lambda m, h, p: m.generate_contextual_prompt(h, p)
+    print(f"{args.users} usuários | {len(stream)} mensagens | prompt de {len(new(pm, history, phones[0]))} caracteres")
+    print(f"Divergências de texto (legado x compilado): {mismatches}")
+    print("-" * 74)
+    print(f"{'cenário':<40}{'legado µs':>11}{'compilado µs':>14}{'speedup':>9}")
+    for label, updates in (("perfis estáveis", False), (f"perfil muda a cada {args.update_every} msgs", True)):
+        legacy_us = run(legacy_prompt, updates)
+        new_us = run(new, updates)
+        print(f"{label:<40}{legacy_us:>11.2f}{new_us:>14.2f}{legacy_us / new_us:>8.1f}x")
+    print(f"{'pico alocado médio por prompt (bytes)':<40}{allocated(legacy_prompt):>11.0f}{allocated(new):>14.0f}")
+    print(f"Blocos de usuário: {pm.prompt_stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Benchmark da entrega especulativa (app/core/delivery.OrderedDelivery)
+Cada resposta pronta do LLM vira texto + nota de voz. "inline" é o fluxo
+anterior (o TTS termina antes de qualquer envio, cada resposta na sua thread do
+webhook); "especulativo" manda o texto na hora e reserva o lugar do áudio na fila
+do destinatário. Mede do fim do LLM até a entrega do texto e do áudio, o
+intervalo texto -> áudio e as entregas fora de ordem por destinatário.
+Twilio e ElevenLabs são simulados com latências (o TTS com cauda longa)
+
+Uso: python benchmarks/bench_speculative_delivery.py [--recipients 20] [--replies 3] [--interval-ms 1200] [--scale 0.1]
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.delivery import OrderedDelivery
+
+
+class FakeServices:
+    """Envios do Twilio e síntese da ElevenLabs; registra (destino, tipo, resposta, instante)"""
+
+    def __init__(self, args, rng: random.Random):
+        self.args = args
+        self.rng = rng
+        self.rng_lock = threading.Lock()
+        self.log = []
+        self.log_lock = threading.Lock()
+
+    def sleep(self, ms: float):
+        time.sleep(ms * self.args.scale / 1000)
+
+    def tts_ms(self) -> float:
+        with self.rng_lock:
+            # Cauda longa: 15% das sínteses demoram 3x
+            slow = self.rng.random() < 0.15
+            return self.args.tts_ms * (3 if slow else 1) * self.rng.uniform(0.8, 1.2)
+
+    def _record(self, to: str, kind: str, reply: str):
+        with self.log_lock:
+            self.log.append((to, kind, reply, time.perf_counter()))
+
+    def send_text(self, to: str, body: str) -> str:
+        self.sleep(self.args.twilio_ms)
+        self._record(to, 'texto', body)
+        return '{"status": "sucesso"}'
+
+    def send_media(self, to: str, media_url: str) -> str:
+        self.sleep(self.args.twilio_ms)
+        self._record(to, 'audio', media_url.rsplit('/', 1)[-1])
+        return '{"status": "sucesso"}'
+
+    def synthesize(self, text: str) -> str:
+        self.sleep(self.tts_ms())
+        return f"https://storage/{text}"
+
+
+def run_inline(services: FakeServices, reply: str, to: str):
+    """Fluxo anterior: TTS primeiro, depois áudio e texto"""
+    url = services.synthesize(reply)
+    services.send_media(to, url)
+    services.send_text(to, reply)
+
+
+def run_speculative(delivery: OrderedDelivery, reply: str, to: str):
+    sent = delivery.send_text(to, reply)
+    # O lugar do áudio é reservado logo atrás do texto, antes de qualquer resposta seguinte
+    delivery.send_media(to, delivery.start_voice(reply))
+    sent.result()
+
+
+def measure(args, mode: str):
+    services = FakeServices(args, random.Random(5))
+    delivery = OrderedDelivery(services.send_text, services.send_media, services.synthesize,
+                               workers=args.recipients * 2, audio_deadline_s=args.deadline_s * args.scale)
+    ready_at = {}
+    # Respostas ficam prontas a cada `interval-ms` por destinatário; cada uma numa thread do webhook
+    webhook = ThreadPoolExecutor(max_workers=args.recipients * args.replies)
+    t0 = time.perf_counter()
+    futures = []
+    for n in range(args.replies):
+        for r in range(args.recipients):
+            to, reply = f"whatsapp:+55{r:04d}", f"r{r}-{n}"
+            start = t0 + (n * args.interval_ms + r * 7) * args.scale / 1000
+
+            def job(to=to, reply=reply, start=start):
+                time.sleep(max(0.0, start - time.perf_counter()))
+                ready_at[reply] = time.perf_counter()
+                if mode == "inline":
+                    run_inline(services, reply, to)
+                else:
+                    run_speculative(delivery, reply, to)
+            futures.append(webhook.submit(job))
+    for future in futures:
+        future.result()
+    webhook.shutdown(wait=True)
+    # Espera as notas de voz pendentes
+    while delivery.get_stats()['queued'] or len(services.log) < 2 * args.recipients * args.replies:
+        time.sleep(0.01)
+
+    delivered = {}
+    out_of_order = 0
+    last_seen = {}
+    for to, kind, reply, at in sorted(services.log, key=lambda entry: entry[3]):
+        delivered[(reply, kind)] = at
+        # Ordem esperada por destinatário: texto e áudio da resposta n antes de qualquer coisa da n+1
+        n = int(reply.rsplit('-', 1)[1])
+        if n < last_seen.get(to, 0):
+            out_of_order += 1
+        last_seen[to] = max(last_seen.get(to, 0), n)
+    to_ms = lambda seconds: seconds / args.scale * 1000
+    text = sorted(to_ms(delivered[(reply, 'texto')] - ready_at[reply]) for reply in ready_at)
+    audio = sorted(to_ms(delivered[(reply, 'audio')] - ready_at[reply]) for reply in ready_at
+                   if (reply, 'audio') in delivered)
+    gap = sorted(to_ms(delivered[(reply, 'audio')] - delivered[(reply, 'texto')]) for reply in ready_at
+                 if (reply, 'audio') in delivered)
+    return text, audio, gap, out_of_order, delivery.get_stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--recipients", type=int, default=20)
+    parser.add_argument("--replies", type=int, default=3, help="respostas por destinatário")
+    parser.add_argument("--interval-ms", type=float, default=1200.0, help="intervalo entre respostas do mesmo destinatário")
+    parser.add_argument("--tts-ms", type=float, default=1400.0)
+    parser.add_argument("--twilio-ms", type=float, default=250.0)
+    parser.add_argument("--deadline-s", type=float, default=30.0)
+    parser.add_argument("--scale", type=float, default=0.1)
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.WARNING)
+    pct = lambda values, f: values[min(int(len(values) * f), len(values) - 1)] if values else 0.0
+    print(f"{args.recipients} destinatários x {args.replies} respostas a cada {args.interval_ms:.0f}ms | "
+          f"TTS {args.tts_ms:.0f}ms (15% 3x) | Twilio {args.twilio_ms:.0f}ms | escala {args.scale}")
+    print("-" * 100)
+    print(f"{'modo':<14}{'texto p50':>11}{'texto p95':>11}{'áudio p50':>11}{'áudio p95':>11}"
+          f"{'texto->áudio p50':>18}{'p95':>8}{'fora de ordem':>15}")
+    for mode in ("inline", "especulativo"):
+        text, audio, gap, out_of_order, stats = measure(args, mode)
+        print(f"{mode:<14}{pct(text, 0.5):>9.0f}ms{pct(text, 0.95):>9.0f}ms{pct(audio, 0.5):>9.0f}ms"
+              f"{pct(audio, 0.95):>9.0f}ms{pct(gap, 0.5):>16.0f}ms{pct(gap, 0.95):>6.0f}ms{out_of_order:>15}")
+    print("(do fim do LLM até a entrega; texto->áudio negativo = áudio antes do texto; tempos na escala real)")
+
+
+if __name__ == "__main__":
+    main()
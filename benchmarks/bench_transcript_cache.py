@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Benchmark do cache de transcrições (app/core/transcript_cache.py)
+Reproduz um tráfego de notas de voz com chegadas de Poisson: áudios novos,
+retentativas do webhook (mesma MediaUrl, chegam `--retry-after` s depois, em
+geral com a primeira ainda transcrevendo) e encaminhamentos (mesmos bytes, URL
+nova, áudios populares por Zipf). Download, transcodificação e ASR são
+simulados com o modelo de custo dos outros benchmarks (arquivos temporários
+de verdade, hash durante o "download"). Depois simula um restart: memória
+vazia e uma segunda hora de tráfego que só acerta pela camada em disco.
+Compara com o fluxo sem cache (TRANSCRIPT_CACHE_ENABLED=0)
+
+Uso: python benchmarks/bench_transcript_cache.py [--messages 400] [--retry 0.12] [--forward 0.2] [--scale 0.01]
+"""
+import argparse
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from app.core import transcript_cache
+from app.core.metrics import LatencyStats
+
+
+def build_trace(args, rng: np.random.Generator, first_note: int = 0, previous: int = 0):
+    """[(chegada s, url, id do áudio)]; `previous` áudios de uma hora anterior podem ser encaminhados"""
+    trace, notes, t = [], [], 0.0
+    for i in range(args.messages):
+        t += rng.exponential(3600 / args.messages)
+        roll = rng.random()
+        pool = previous + len(notes)
+        if roll < args.forward and pool:
+            note = min(int(rng.zipf(1.6)) - 1, pool - 1)  # áudios antigos são os mais encaminhados
+            trace.append((t, f"https://api.twilio.com/Media/fw{first_note}-{i}", note))
+        else:
+            note = first_note + len(notes)
+            notes.append(note)
+            url = f"https://api.twilio.com/Media/me{note}"
+            trace.append((t, url, note))
+            if rng.random() < args.retry:
+                trace.append((t + args.retry_after, url, note))
+    return sorted(trace), first_note + len(notes)
+
+
+def make_stand_ins(args, tmpdir: str, durations):
+    def download(url: str):
+        note = int(url.rsplit("me", 1)[1]) if "/me" in url else FORWARDS[url]
+        time.sleep(args.download_ms * args.scale / 1000)
+        data = f"opus-{note}".encode() * 64
+        path = os.path.join(tmpdir, f"{hashlib.md5(url.encode()).hexdigest()}.ogg")
+        with open(path, "wb") as f:
+            f.write(data)
+        return path, hashlib.sha256(data).hexdigest()
+
+    def transcribe(path: str) -> str:
+        with open(path, "rb") as f:
+            note = int(f.read(64).split(b"-")[1].split(b"o")[0])
+        os.remove(path)
+        seconds = durations[note]
+        time.sleep((args.transcode_ms + args.asr_fixed_ms + seconds * args.asr_ms_per_s) * args.scale / 1000)
+        return f"transcrição {note}"
+    return download, transcribe
+
+
+FORWARDS = {}
+
+
+def replay(trace, cache, download, transcribe, scale: float):
+    latency = LatencyStats(window=len(trace))
+    asr_calls = [0]
+
+    def counted(path):
+        asr_calls[0] += 1
+        return transcribe(path)
+
+    def run(url):
+        t0 = time.perf_counter()
+        text = cache.transcribe(url, download, counted)
+        latency.record("transcribe", (time.perf_counter() - t0) / scale * 1000)
+        return text
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=64) as pool:
+        futures = []
+        for arrival, url, _ in trace:
+            delay = arrival * scale - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+            futures.append((pool.submit(run, url), url))
+        texts = [(future.result(), url) for future, url in futures]
+    return latency.snapshot()["transcribe"], asr_calls[0], texts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--messages", type=int, default=400, help="mensagens de áudio por hora")
+    parser.add_argument("--retry", type=float, default=0.12, help="fração de webhooks repetidos")
+    parser.add_argument("--retry-after", type=float, default=15.0, help="segundos até a retentativa")
+    parser.add_argument("--forward", type=float, default=0.2, help="fração de notas encaminhadas")
+    parser.add_argument("--download-ms", type=float, default=400.0)
+    parser.add_argument("--transcode-ms", type=float, default=250.0)
+    parser.add_argument("--asr-fixed-ms", type=float, default=600.0)
+    parser.add_argument("--asr-ms-per-s", type=float, default=50.0)
+    parser.add_argument("--scale", type=float, default=0.01)
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.WARNING)
+    rng = np.random.default_rng(5)
+    hour1, notes = build_trace(args, rng)
+    hour2, notes = build_trace(args, rng, first_note=notes, previous=notes)
+    for hour in (hour1, hour2):
+        for _, url, note in hour:
+            if "/fw" in url:
+                FORWARDS[url] = note
+    durations = rng.lognormal(np.log(20), 0.8, notes).clip(2, 300)
+
+    print(f"{args.messages} áudios/hora | retentativas {args.retry:.0%} (após {args.retry_after:.0f}s) | "
+          f"encaminhados {args.forward:.0%} | escala {args.scale}")
+    print("-" * 104)
+    print(f"{'cenário':<26}{'chamadas':>9}{'ASR':>6}{'acertos':>9}{'url':>6}{'espera':>8}{'mem':>6}{'disco':>7}"
+          f"{'p50':>9}{'p95':>9}{'economia':>11}")
+    tmpdir = tempfile.mkdtemp(prefix="bench_transcripts_")
+    try:
+        download, transcribe = make_stand_ins(args, tmpdir, durations)
+        cache_dir = os.path.join(tmpdir, "cache")
+        scenarios = [("sem cache (hora 1)", hour1, False, False), ("com cache (hora 1)", hour1, True, False),
+                     ("sem cache (hora 2)", hour2, False, False), ("restart + disco (hora 2)", hour2, True, True)]
+        cache = None
+        reference = {}
+        for name, trace, enabled, restart in scenarios:
+            os.environ['TRANSCRIPT_CACHE_ENABLED'] = '1' if enabled else '0'
+            if enabled and (cache is None or restart):
+                cache = transcript_cache.TranscriptCache(directory=cache_dir)
+            current = cache if enabled else transcript_cache.TranscriptCache(directory="")
+            before = dict(current.stats_counters)
+            snap, asr_calls, texts = replay(trace, current, download, transcribe, args.scale)
+            stats = {k: current.stats_counters[k] - before[k] for k in before}
+            same = all(reference.setdefault(url, text) == text for text, url in texts)
+            hits = stats['url_hits'] + stats['joined_hits'] + stats['memory_hits'] + stats['disk_hits']
+            print(f"{name:<26}{len(trace):>9}{asr_calls:>6}{hits / len(trace):>9.1%}{stats['url_hits']:>6}"
+                  f"{stats['joined_hits']:>8}{stats['memory_hits']:>6}{stats['disk_hits']:>7}"
+                  f"{snap['p50_ms']:>7.0f}ms{snap['p95_ms']:>7.0f}ms{stats['saved_s'] / args.scale:>10.0f}s"
+                  f"{'' if same else '  TEXTO DIVERGENTE'}")
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    print("(economia = segundos de download/transcodificação/ASR evitados, na escala real)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Benchmark da contabilidade de usuários (app/core/user_stats.py)
+SQLite em arquivo temporário (WAL), `--threads` workers com conexões próprias
+processando `--messages` mensagens de usuários com popularidade Zipf:
+- legado: SELECT do usuário, total_messages + 1 em Python, UPDATE/INSERT e
+  commit por mensagem (como main_old.whatsapp_webhook): mede o tempo no
+  caminho da mensagem, commits e incrementos perdidos na corrida entre workers
+- UserStats: delta em memória e upsert em lote
+  (INSERT ... ON CONFLICT DO UPDATE SET total_messages = total_messages + n)
+Depois compara, para tabelas de conversas crescentes, o /stats legado (quatro
+COUNT(*)), a releitura dos totais pelos rollups diários (stats_daily, feita na
+partida e a cada USER_STATS_RESYNC_S) e o /stats pelos agregados em memória.
+O backend SQLite do benchmark tem a mesma interface do SQLUserStatsBackend
+(load_totals/load_series/upsert_many) e o mesmo SQL.
+
+Uso: python benchmarks/bench_user_stats.py [--threads 8] [--messages 8000] [--users 500]
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from app.core.metrics import LatencyStats
+from app.core.user_stats import TOTALS, UserStats
+
+SCHEMA = """
+CREATE TABLE users (id INTEGER PRIMARY KEY, phone_number VARCHAR(20) NOT NULL UNIQUE, first_name VARCHAR(50),
+    last_name VARCHAR(50), is_active BOOLEAN, first_message_date TIMESTAMP, last_message_date TIMESTAMP,
+    total_messages INTEGER NOT NULL DEFAULT 0);
+CREATE TABLE conversations (id INTEGER PRIMARY KEY, phone_number VARCHAR(20) NOT NULL, user_message TEXT NOT NULL,
+    bot_response TEXT NOT NULL, message_type VARCHAR(10), transcribed_text TEXT, thread_id VARCHAR(100),
+    timestamp TIMESTAMP);
+CREATE INDEX ix_conversations_phone_number ON conversations (phone_number);
+CREATE TABLE stats_daily (day DATE NOT NULL, metric VARCHAR(32) NOT NULL, value INTEGER NOT NULL,
+    PRIMARY KEY (day, metric));
+"""
+NEW_USERS = ("INSERT INTO users (phone_number, total_messages, is_active, first_message_date, last_message_date) "
+             "VALUES {} ON CONFLICT (phone_number) DO NOTHING RETURNING phone_number")
+ADD_TOTALS = ("UPDATE users SET total_messages = total_messages + :total_messages, "
+              "last_message_date = :last_message_date WHERE phone_number = :phone_number")
+ADD_ROLLUP = ("INSERT INTO stats_daily (day, metric, value) VALUES (?, ?, ?) "
+              "ON CONFLICT (day, metric) DO UPDATE SET value = stats_daily.value + excluded.value")
+BACKFILL = ("INSERT INTO stats_daily (day, metric, value) "
+            "SELECT date(timestamp), 'conversations', COUNT(*) FROM conversations GROUP BY 1 UNION ALL "
+            "SELECT date(timestamp), message_type || '_messages', COUNT(*) FROM conversations "
+            "WHERE message_type IN ('audio', 'text') GROUP BY 1, 2 UNION ALL "
+            "SELECT COALESCE(date(first_message_date), date('now')), 'new_users', COUNT(*) FROM users GROUP BY 1 "
+            "ON CONFLICT (day, metric) DO NOTHING")
+LEGACY_STATS = ("SELECT COUNT(*) FROM users", "SELECT COUNT(*) FROM conversations",
+                "SELECT COUNT(*) FROM conversations WHERE message_type = 'audio'",
+                "SELECT COUNT(*) FROM conversations WHERE message_type = 'text'")
+
+
+def connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+
+class SQLiteBackend:
+    """Mesma interface e SQL do SQLUserStatsBackend, em sqlite3"""
+
+    def __init__(self, path: str):
+        self.conn = connect(path)
+        self.commits = 0
+        with self.conn:
+            if self.conn.execute("SELECT 1 FROM stats_daily LIMIT 1").fetchone() is None:
+                self.conn.execute(BACKFILL)
+
+    def load_totals(self):
+        sums = dict(self.conn.execute("SELECT metric, SUM(value) FROM stats_daily GROUP BY metric"))
+        return {key: sums.get(metric, 0) for metric, key in TOTALS.items()}
+
+    def load_series(self, since):
+        rows = self.conn.execute("SELECT day, metric, value FROM stats_daily WHERE day >= ?", (since.isoformat(),))
+        return {(date.fromisoformat(day), metric): value for day, metric, value in rows}
+
+    def upsert_many(self, rows, daily):
+        created = set()
+        with self.conn:
+            for start in range(0, len(rows), 500):
+                chunk = rows[start:start + 500]
+                params = [v for row in chunk for v in (row['phone_number'], 0, True, row['first_message_date'],
+                                                       row['last_message_date'])]
+                created.update(r[0] for r in self.conn.execute(
+                    NEW_USERS.format(",".join(["(?, ?, ?, ?, ?)"] * len(chunk))), params))
+            self.conn.executemany(ADD_TOTALS, rows)
+            new_users = defaultdict(int)
+            for row in rows:
+                if row['phone_number'] in created:
+                    new_users[row['first_message_date'].date()] += 1
+            counts = dict(daily)
+            for day, n in new_users.items():
+                counts[(day, 'new_users')] = counts.get((day, 'new_users'), 0) + n
+            self.conn.executemany(ADD_ROLLUP, [(day.isoformat(), metric, n) for (day, metric), n in counts.items()])
+        self.commits += 1
+        return dict(new_users)
+
+
+def legacy_message(conn: sqlite3.Connection, phone: str):
+    """Leitura-modificação-escrita do main_old (SQL equivalente ao ORM)"""
+    row = conn.execute("SELECT id, total_messages FROM users WHERE phone_number = ?", (phone,)).fetchone()
+    now = datetime.utcnow()
+    if row is None:
+        conn.execute("INSERT INTO users (phone_number, total_messages, is_active, first_message_date, "
+                     "last_message_date) VALUES (?, 1, 1, ?, ?)", (phone, now, now))
+    else:
+        conn.execute("UPDATE users SET total_messages = ?, last_message_date = ? WHERE id = ?",
+                     (row[1] + 1, now, row[0]))
+    conn.commit()
+
+
+def run_workers(args, senders, handle):
+    latency = LatencyStats(window=len(senders))
+    errors = [0]
+    chunks = np.array_split(np.arange(len(senders)), args.threads)
+
+    def worker(indexes, state):
+        for i in indexes:
+            t0 = time.perf_counter()
+            try:
+                handle(senders[i], state)
+            except sqlite3.Error:
+                errors[0] += 1
+            latency.record("message", (time.perf_counter() - t0) * 1e6)
+
+    threads = [threading.Thread(target=worker, args=(chunk, {})) for chunk in chunks]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latency.snapshot()["message"], time.perf_counter() - started, errors[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--messages", type=int, default=8000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--sizes", default="100000,1000000", help="linhas em conversations para o /stats")
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.WARNING)
+    rng = np.random.default_rng(13)
+    senders = [f"+55119{min(int(z), args.users):08d}" for z in rng.zipf(1.2, args.messages)]
+    tmpdir = tempfile.mkdtemp(prefix="bench_user_stats_")
+    try:
+        print(f"{args.messages:,} mensagens de {len(set(senders))} usuários em {args.threads} workers")
+        print("-" * 92)
+        print(f"{'cenário':<26}{'p50':>9}{'p95':>10}{'msg/s':>9}{'commits':>9}{'erros':>7}{'contadas':>10}{'perdidas':>10}")
+        for name in ("legado (ler-somar-gravar)", "UserStats (upsert em lote)"):
+            path = os.path.join(tmpdir, f"{name[:6]}.db")
+            connect(path).executescript(SCHEMA)
+            if name.startswith("legado"):
+
+                def handle(phone, state):
+                    conn = state.get('conn') or state.setdefault('conn', connect(path))
+                    legacy_message(conn, phone)
+                snap, elapsed, errors = run_workers(args, senders, handle)
+                commits = args.messages - errors
+            else:
+                backend = SQLiteBackend(path)
+                stats = UserStats(backend=backend, flush_interval=0.5, resync_interval=0)
+                snap, elapsed, errors = run_workers(args, senders, lambda phone, state: stats.record_message(phone))
+                stats.close()
+                commits = backend.commits
+                rollup = backend.load_totals()
+                assert rollup['total_conversations'] == args.messages, rollup
+                assert rollup['total_users'] == len(set(senders)), rollup
+            counted = connect(path).execute("SELECT SUM(total_messages) FROM users").fetchone()[0]
+            print(f"{name:<26}{snap['p50_ms']:>7.0f}µs{snap['p95_ms']:>8.0f}µs{args.messages / elapsed:>9.0f}"
+                  f"{commits:>9,}{errors:>7}{counted:>10,}{args.messages - counted:>10,}")
+
+        print()
+        print(f"{'conversas':>12}{'/stats legado':>16}{'relê rollups':>15}{'/stats agregado':>18}{'rollups':>9}")
+        for size in (int(n) for n in args.sizes.split(",")):
+            path = os.path.join(tmpdir, f"stats-{size}.db")
+            conn = connect(path)
+            conn.executescript(SCHEMA)
+            start = datetime.utcnow() - timedelta(days=365)
+            with conn:
+                conn.executemany("INSERT INTO users (phone_number, total_messages) VALUES (?, 0)",
+                                 ((f"+55119{u:08d}",) for u in range(size // 50)))
+                conn.executemany(
+                    "INSERT INTO conversations (phone_number, user_message, bot_response, message_type, timestamp) "
+                    "VALUES (?, 'mensagem', 'resposta', ?, ?)",
+                    ((f"+55119{i % (size // 50):08d}", 'audio' if i % 4 == 0 else 'text', start + timedelta(seconds=i))
+                     for i in range(size)))
+            t0 = time.perf_counter()
+            for _ in range(5):
+                legacy = [conn.execute(sql).fetchone()[0] for sql in LEGACY_STATS]
+            legacy_ms = (time.perf_counter() - t0) * 1000 / 5
+            backend = SQLiteBackend(path)  # preenche os rollups a partir do histórico
+            t0 = time.perf_counter()
+            for _ in range(100):
+                backend.load_totals()
+            resync_ms = (time.perf_counter() - t0) * 1000 / 100
+            stats = UserStats(backend=backend, resync_interval=0)
+            t0 = time.perf_counter()
+            for _ in range(1000):
+                totals = stats.snapshot()
+            snapshot_ms = (time.perf_counter() - t0) * 1000 / 1000
+            assert list(totals.values()) == legacy, (totals, legacy)
+            rollups = conn.execute("SELECT COUNT(*) FROM stats_daily").fetchone()[0]
+            print(f"{size:>12,}{legacy_ms:>14.1f}ms{resync_ms:>13.2f}ms{snapshot_ms * 1000:>16.1f}µs{rollups:>9,}")
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Benchmark do VAD local (app/core/vad.py) antes do ASR
+Gera notas de voz sintéticas em PCM16 16kHz (sílabas vozeadas com harmônicos,
+fricativas de ruído, pausas, silêncio nas pontas e ruído de fundo), com o
+gabarito de onde há fala, e mede: bytes enviados, tempo do VAD, fala
+preservada (amostras do gabarito que sobrevivem ao corte) e a latência do ASR
+por um modelo de custo (upload + processamento proporcional à duração).
+Com `--clips DIR` usa WAVs PCM16 mono reais (sem gabarito); com `--whisper`
+transcreve original e compactado pela API e compara as palavras
+
+Uso: python benchmarks/bench_vad.py [--clips DIR] [--whisper] [--repeat 20]
+"""
+import argparse
+import glob
+import os
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from app.core import vad
+
+SR = 16000
+# (nome, duração aproximada da fala em s, silêncio nas pontas em s, pausa máxima em s, ruído de fundo dBFS)
+PROFILES = [
+    ("curto", 6, (1.0, 1.5), 0.8, -62),
+    ("médio", 25, (1.5, 2.5), 1.5, -58),
+    ("pausado", 40, (2.0, 3.0), 4.0, -58),
+    ("ruidoso", 25, (1.0, 2.0), 1.5, -42),
+    ("longo", 120, (1.0, 2.0), 2.5, -55),
+]
+
+
+def synth_clip(speech_s: float, edges, max_pause: float, noise_db: float, rng: np.random.Generator):
+    """(pcm int16, gabarito booleano por amostra)"""
+    parts, truth = [], []
+
+    def add(signal, is_speech):
+        parts.append(signal)
+        truth.append(np.full(len(signal), is_speech))
+
+    silence = lambda seconds: np.zeros(int(seconds * SR))
+    add(silence(rng.uniform(*edges)), False)
+    spoken = 0.0
+    while spoken < speech_s:
+        for _ in range(rng.integers(3, 9)):  # sílabas de uma frase
+            if rng.random() < 0.25:
+                n = int(rng.uniform(0.08, 0.15) * SR)
+                noise = np.diff(rng.normal(0, 1, n + 1))  # fricativa: ruído de alta frequência
+                add(noise * 10 ** (rng.uniform(-30, -22) / 20) / noise.std(), True)
+            else:
+                n = int(rng.uniform(0.15, 0.3) * SR)
+                t = np.arange(n) / SR
+                f0 = rng.uniform(100, 220)
+                voiced = sum(np.sin(2 * np.pi * f0 * k * t) / k for k in range(1, 8))
+                envelope = np.sin(np.pi * np.arange(n) / n) ** 0.6
+                add(voiced * envelope * 10 ** (rng.uniform(-22, -12) / 20) / np.abs(voiced).max(), True)
+            spoken += len(parts[-1]) / SR
+            add(silence(rng.uniform(0.02, 0.08)), True)  # coarticulação: ainda é fala
+        add(silence(rng.uniform(0.3, max_pause)), False)
+    add(silence(rng.uniform(*edges)), False)
+
+    signal = np.concatenate(parts)
+    t = np.arange(len(signal)) / SR
+    background = (rng.normal(0, 1, len(signal)) + 0.5 * np.sin(2 * np.pi * 60 * t)) * 10 ** (noise_db / 20)
+    pcm = np.clip((signal + background) * 32767, -32768, 32767).astype(np.int16)
+    return pcm, np.concatenate(truth)
+
+
+def retained(truth: np.ndarray, segments) -> float:
+    kept = np.zeros(len(truth), dtype=bool)
+    for start, end in segments:
+        kept[start:end] = True
+    return (truth & kept).sum() / truth.sum() if segments else 1.0
+
+
+def asr_latency_ms(seconds: float, nbytes: int, args) -> float:
+    """Modelo: ida e volta fixa + upload + processamento proporcional à duração"""
+    return args.asr_fixed_ms + nbytes * 8 / (args.uplink_mbps * 1e6) * 1000 + seconds * args.asr_ms_per_s
+
+
+def whisper_words(path: str):
+    from openai import OpenAI
+    client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+    with open(path, "rb") as audio_file:
+        t0 = time.perf_counter()
+        text = client.audio.transcriptions.create(model="whisper-1", file=audio_file, response_format="text")
+    return re.findall(r"\w+", str(text).lower()), (time.perf_counter() - t0) * 1000
+
+
+def word_match(reference, hypothesis) -> float:
+    """1 - WER (distância de edição por palavras)"""
+    if not reference:
+        return 1.0 if not hypothesis else 0.0
+    prev = list(range(len(hypothesis) + 1))
+    for i, ref in enumerate(reference, 1):
+        cur = [i] + [0] * len(hypothesis)
+        for j, hyp in enumerate(hypothesis, 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ref != hyp))
+        prev = cur
+    return max(0.0, 1 - prev[-1] / len(reference))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clips", help="diretório com WAVs PCM16 mono")
+    parser.add_argument("--whisper", action="store_true", help="transcreve pela API (OPENAI_API_KEY)")
+    parser.add_argument("--repeat", type=int, default=20, help="repetições para medir o tempo do VAD")
+    parser.add_argument("--asr-fixed-ms", type=float, default=350.0)
+    parser.add_argument("--asr-ms-per-s", type=float, default=45.0, help="processamento do ASR por segundo de áudio")
+    parser.add_argument("--uplink-mbps", type=float, default=8.0)
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.INFO)
+    rng = np.random.default_rng(3)
+    if args.clips:
+        clips = [(os.path.basename(path), *vad.read_wav(path), None)
+                 for path in sorted(glob.glob(os.path.join(args.clips, "*.wav")))]
+    else:
+        clips = []
+        for name, speech, edges, pause, noise in PROFILES:
+            pcm, truth = synth_clip(speech, edges, pause, noise, rng)
+            clips.append((name, pcm, SR, truth))
+
+    config = vad.VadConfig()
+    print(f"{len(clips)} clipes | {config}")
+    print("-" * 118)
+    print(f"{'clipe':<10}{'duração':>9}{'após VAD':>10}{'bytes':>11}{'enviados':>11}{'VAD ms':>8}{'x tempo real':>13}"
+          f"{'fala mantida':>14}{'ASR antes':>11}{'ASR depois':>11}")
+    totals = [0, 0, 0.0, 0.0]
+    for name, pcm, sample_rate, truth in clips:
+        t0 = time.perf_counter()
+        for _ in range(args.repeat):
+            out, result = vad.compact(pcm, sample_rate, config)
+        vad_ms = (time.perf_counter() - t0) * 1000 / args.repeat
+        before = asr_latency_ms(result.original_ms / 1000, pcm.nbytes, args)
+        after = asr_latency_ms(result.kept_ms / 1000, out.nbytes, args)
+        kept = f"{retained(truth, result.segments):.2%}" if truth is not None else "-"
+        print(f"{name:<10}{result.original_ms / 1000:>8.1f}s{result.kept_ms / 1000:>9.1f}s{pcm.nbytes:>11,}"
+              f"{out.nbytes:>11,}{vad_ms:>8.1f}{result.original_ms / vad_ms:>12.0f}x{kept:>14}"
+              f"{before:>9.0f}ms{after:>9.0f}ms")
+        totals = [totals[0] + pcm.nbytes, totals[1] + out.nbytes, totals[2] + before, totals[3] + after]
+
+        if args.whisper:
+            with tempfile.TemporaryDirectory() as tmp:
+                vad.write_wav(os.path.join(tmp, "a.wav"), pcm, sample_rate)
+                vad.write_wav(os.path.join(tmp, "b.wav"), out, sample_rate)
+                words_a, ms_a = whisper_words(os.path.join(tmp, "a.wav"))
+                words_b, ms_b = whisper_words(os.path.join(tmp, "b.wav"))
+            print(f"{'':<10}whisper: {ms_a:.0f}ms -> {ms_b:.0f}ms | palavras iguais {word_match(words_a, words_b):.1%}")
+    print("-" * 118)
+    print(f"total: bytes {totals[0]:,} -> {totals[1]:,} ({1 - totals[1] / totals[0]:.1%} a menos) | "
+          f"ASR (modelo) {totals[2]:.0f}ms -> {totals[3]:.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Simulador do LatencyAutotuner: replay de traces de latência no pipeline real
+Cada linha do trace (JSONL gravado pelo OptimizedPipeline com PIPELINE_TRACE_PATH)
+traz o tempo de cada chamada aos serviços de uma mensagem; o simulador roda o
+OptimizedPipeline com estágios locais que reproduzem esses tempos (escalados por
+`--scale`) e compara parâmetros fixos x autotuner ao longo do trace.
+Sem `--trace`, gera um trace sintético em fases (normal, TTS lento, ASR lento, normal)
+
+Uso: python benchmarks/sim_autotuner.py [--trace pipeline_trace.jsonl] [--per-phase 60] [--scale 0.1]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from dataclasses import replace
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils import jsoncodec
+from optimized_pipeline import LatencyMetrics, OptimizedPipeline
+from pipeline_autotuner import LatencyAutotuner
+
+# Fases do trace sintético: (nome, ASR ms/chamada, ms até 1º token, ms/token, TTS ms fixo, TTS ms/caractere)
+PHASES = [
+    ("normal", 90, 170, 7, 80, 0.8),
+    ("TTS lento", 90, 170, 7, 160, 2.0),
+    ("ASR lento", 240, 170, 7, 80, 0.8),
+    ("normal", 90, 170, 7, 80, 0.8),
+]
+WORDS = "a gente monta a campanha com vídeo e anúncios para o seu público".split()
+KNOBS = ('parallel_workers', 'tts_segment_chars', 'coalesce_ms')
+TIME_FIELDS = ('asr_latency', 'llm_latency', 'tts_latency', 'total_latency',
+               'first_token_latency', 'first_audio_latency')
+
+
+def synthetic_trace(per_phase: int, rng: random.Random):
+    jitter = lambda ms: round(ms * rng.lognormvariate(0, 0.2), 1)
+    for phase, (name, asr_ms, first_token_ms, token_ms, tts_ms, tts_per_char) in enumerate(PHASES):
+        for _ in range(per_phase):
+            tts = []
+            for _ in range(3):
+                chars = rng.randint(40, 140)
+                tts.append([chars, jitter(tts_ms + tts_per_char * chars)])
+            yield {
+                'phase': f"{phase + 1}. {name}",
+                'asr': [jitter(asr_ms) for _ in range(4)],
+                'llm': [jitter(first_token_ms), token_ms, rng.randint(50, 80)],
+                'tts': tts,
+            }
+
+
+def tts_model(pairs):
+    """Reta ms = fixo + por_caractere * caracteres (mínimos quadrados sobre as chamadas da mensagem)"""
+    if len(pairs) < 2:
+        return (pairs[0][1] if pairs else 0.0), 0.0
+    n = len(pairs)
+    mean_c = sum(c for c, _ in pairs) / n
+    mean_ms = sum(ms for _, ms in pairs) / n
+    var = sum((c - mean_c) ** 2 for c, _ in pairs)
+    slope = max(0.0, sum((c - mean_c) * (ms - mean_ms) for c, ms in pairs) / var) if var else 0.0
+    return max(0.0, mean_ms - slope * mean_c), slope
+
+
+class TraceReplay:
+    """Estágios locais que dormem os tempos da mensagem atual do trace"""
+
+    def __init__(self, scale: float):
+        self.scale = scale
+        self.record = None
+        self.segment_size = 1024
+
+    def asr(self, segment: bytes) -> str:
+        calls = self.record['asr']
+        time.sleep(sum(calls) / len(calls) * self.scale / 1000)
+        return "mensagem"
+
+    def llm(self, transcript: str, context):
+        first_token_ms, token_ms, count = self.record['llm']
+        time.sleep(first_token_ms * self.scale / 1000)
+        for i in range(int(count)):
+            if i:
+                time.sleep(token_ms * self.scale / 1000)
+            end = ". " if i % 12 == 11 else " "
+            yield WORDS[i % len(WORDS)] + end
+
+    def tts(self, text: str) -> bytes:
+        fixed, per_char = tts_model(self.record['tts'])
+        time.sleep((fixed + per_char * len(text)) * self.scale / 1000)
+        return b"audio"
+
+
+def unscale(metrics: LatencyMetrics, scale: float) -> LatencyMetrics:
+    return replace(metrics, **{name: getattr(metrics, name) / scale for name in TIME_FIELDS})
+
+
+async def replay(trace, scale: float, autotune: bool):
+    stages = TraceReplay(scale)
+    pipeline = OptimizedPipeline(asr=stages.asr, llm=stages.llm, tts=stages.tts, autotune=False)
+    # O autotuner decide em tempo real (ms sem escala) sobre uma cópia dos parâmetros
+    knobs = SimpleNamespace(max_latency_target=pipeline.max_latency_target,
+                            **{name: getattr(pipeline, name) for name in KNOBS})
+    tuner = LatencyAutotuner(knobs) if autotune else None
+
+    rows = []
+    for record in trace:
+        stages.record = record
+        for name in KNOBS:
+            value = getattr(knobs, name)
+            setattr(pipeline, name, value * scale if name == 'coalesce_ms' else value)
+        segments = [b"\0" * stages.segment_size for _ in record['asr']]
+        result = await pipeline.process_with_streaming(segments, {})
+        metrics = unscale(result['latency_metrics'], scale)
+        if tuner:
+            tuner.observe(metrics)
+        rows.append((record.get('phase', 'trace'), metrics.first_audio_latency,
+                     {name: getattr(knobs, name) for name in KNOBS}))
+    return rows, tuner
+
+
+def summarize(rows, target: float):
+    phases = {}
+    for phase, first_audio, knobs in rows:
+        entry = phases.setdefault(phase, {'values': [], 'knobs': knobs})
+        entry['values'].append(first_audio)
+        entry['knobs'] = knobs
+    out = {}
+    for phase, entry in phases.items():
+        values = sorted(entry['values'])
+        out[phase] = (values[len(values) // 2], values[min(int(len(values) * 0.95), len(values) - 1)],
+                      sum(v <= target for v in values) / len(values), entry['knobs'])
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--trace", help="JSONL gravado com PIPELINE_TRACE_PATH")
+    parser.add_argument("--per-phase", type=int, default=60, help="mensagens por fase do trace sintético")
+    parser.add_argument("--scale", type=float, default=0.1, help="fator de tempo do replay")
+    parser.add_argument("--write-trace", help="salva o trace sintético neste arquivo")
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.WARNING)
+    if args.trace:
+        with open(args.trace, encoding='utf-8') as f:
+            trace = [jsoncodec.loads(line) for line in f if line.strip()]
+    else:
+        trace = list(synthetic_trace(args.per_phase, random.Random(42)))
+        if args.write_trace:
+            with open(args.write_trace, 'w', encoding='utf-8') as f:
+                f.writelines(jsoncodec.dumps(record) + "\n" for record in trace)
+
+    target = OptimizedPipeline(asr=str, llm=str, tts=str, autotune=False).max_latency_target
+    static_rows, _ = asyncio.run(replay(trace, args.scale, autotune=False))
+    tuned_rows, tuner = asyncio.run(replay(trace, args.scale, autotune=True))
+    static, tuned = summarize(static_rows, target), summarize(tuned_rows, target)
+
+    print(f"{len(trace)} mensagens | target {target}ms (1º áudio) | escala {args.scale}")
+    print("-" * 104)
+    print(f"{'fase':<16}{'fixo p50':>10}{'p95':>8}{'no target':>11}{'autotuner p50':>15}{'p95':>8}"
+          f"{'no target':>11}   parâmetros no fim da fase (workers/seg/coalesce)")
+    for phase in static:
+        s50, s95, s_ok, _ = static[phase]
+        t50, t95, t_ok, knobs = tuned[phase]
+        print(f"{phase:<16}{s50:>8.0f}ms{s95:>6.0f}ms{s_ok:>11.0%}{t50:>13.0f}ms{t95:>6.0f}ms{t_ok:>11.0%}   "
+              f"{knobs['parallel_workers']}/{knobs['tts_segment_chars']}/"
+              f"{knobs['coalesce_ms']:.0f}")
+
+    decisions = tuner.decision_log()
+    print(f"\nDecisões do autotuner: {len(decisions)}")
+    for decision in decisions[-15:]:
+        change = (f"{decision['knob']} {decision['from']} -> {decision['to']}" if decision['knob']
+                  else decision['action'])
+        print(f"  #{decision['observed']:<4} {change:<32} {decision['reason']}")
+
+
+if __name__ == "__main__":
+    main()
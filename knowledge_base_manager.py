@@ -1,81 +1,40 @@
-import os
-import logging
-import pdfplumber
-import re
-from typing import List, Dict
+from typing import Any, Dict, List, Optional
 
-class KnowledgeBase:
+from app.core import kb_index
+from app.core.knowledge import KnowledgeService, get_knowledge_service
+
+class KnowledgeBase(KnowledgeService):
     """Sistema RAG simples para busca de contexto em documentos PDF"""
     
-    def __init__(self, file_paths: List[str]):
-        self.chunks = []
-        self.file_paths = file_paths
-        self.load_files()
-        
-    def load_files(self):
-        """Carrega e processa arquivos PDF e TXT"""
-        for path in self.file_paths:
-            if os.path.exists(path):
-                try:
-                    text = ""
-                    if path.endswith('.pdf'):
-                        # Processa PDFs
-                        with pdfplumber.open(path) as pdf:
-                            for page in pdf.pages:
-                                if page.extract_text():
-                                    text += page.extract_text() + "\n"
-                    elif path.endswith('.txt'):
-                        # Processa arquivos de texto
-                        with open(path, 'r', encoding='utf-8') as f:
-                            text = f.read()
-                    
-                    # Divide em chunks de 400 caracteres
-                    chunks = [text[i:i+400] for i in range(0, len(text), 300)]
-                    self.chunks.extend(chunks)
-                    logging.info(f"✅ Carregado {len(chunks)} chunks de {path}")
-                    
-                except Exception as e:
-                    logging.error(f"❌ Erro carregando {path}: {e}")
-            else:
-                logging.warning(f"⚠️ Arquivo não encontrado: {path}")
-    
-    def retrieve_relevant(self, query: str, top_k: int = 3) -> List[str]:
-        """Busca chunks relevantes usando correspondência de palavras-chave"""
-        if not self.chunks:
-            return []
-            
-        query_words = set(re.findall(r'\w+', query.lower()))
-        scored_chunks = []
-        
-        for chunk in self.chunks:
-            chunk_words = set(re.findall(r'\w+', chunk.lower()))
-            # Score baseado em intersecção de palavras
-            score = len(query_words.intersection(chunk_words))
-            if score > 0:
-                scored_chunks.append((score, chunk))
-        
-        # Ordena por score e retorna top_k
-        scored_chunks.sort(reverse=True)
-        return [chunk for _, chunk in scored_chunks[:top_k]]
-    
-    def get_context_for_query(self, query: str) -> str:
-        """Retorna contexto formatado para a query"""
-        relevant_chunks = self.retrieve_relevant(query)
-        if relevant_chunks:
-            context = "\n\n".join(relevant_chunks)
-            return f"CONTEXTO RELEVANTE DA BIOGRAFIA:\n{context}\n"
-        return ""
+    def __init__(self, file_paths: List[str], retrieval_mode: Optional[str] = None, embedder=None,
+                 index_dir: Optional[str] = kb_index.DEFAULT_INDEX_DIR, chunker=None):
+        # Lista fixa de arquivos: recarrega via reload(), sem watcher de diretório.
+        # Índice em disco por arquivo (mmap); index_dir=None processa tudo em memória
+        super().__init__(file_paths=file_paths, retrieval_mode=retrieval_mode,
+                         embedder=embedder, index_dir=index_dir, chunker=chunker)
+
+class KnowledgeBaseManager:
+    """Interface usada pelo AdvancedWhatsAppHandler sobre o serviço compartilhado"""
+
+    def __init__(self, service: Optional[KnowledgeService] = None):
+        self.service = service or get_knowledge_service()
+
+    def retrieve_scored(self, query: str, top_k: int = 3):
+        return self.service.retrieve_scored(query, top_k)
+
+    def retrieve_relevant_context(self, query: str) -> str:
+        return self.service.get_context_for_query(query)
+
+    def inject_context_for_realtime(self, query: str, top_k: int = 3) -> Dict[str, Any]:
+        """Trechos no formato aceito por RealtimeVoiceClone.inject_context"""
+        return {'insights': self.service.retrieve_relevant(query, top_k)}
 
 # Instância global para reutilização
 knowledge_base = None
 
 def initialize_knowledge_base():
-    """Inicializa a base de conhecimento"""
+    """Inicializa a base de conhecimento (todos os PDF/TXT de documents/, com recarga automática)"""
     global knowledge_base
     if knowledge_base is None:
-        file_paths = [
-            "documents/bio_endrigo.pdf",
-            "documents/biografia_endrigo_completa.txt"
-        ]
-        knowledge_base = KnowledgeBase(file_paths)
-    return knowledge_base
\ No newline at end of file
+        knowledge_base = get_knowledge_service()
+    return knowledge_base
@@ -62,12 +62,22 @@ def serve_audio(filename):
 db = SQLAlchemy(app)
 
 # Importar modelos
-from models import Conversation, User, Base
+from models import Base
 
 # Criar tabelas
 with app.app_context():
     Base.metadata.create_all(bind=db.engine)
 
+# Histórico: últimas trocas de cada usuário em memória e inserts em lote (write-behind)
+from app.core.conversation_store import ConversationStore, SQLConversationBackend
+conversation_history = ConversationStore(backend=SQLConversationBackend(
+    app.config['SQLALCHEMY_DATABASE_URI'], app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})))
+
+# Contadores por usuário somados em memória e gravados em lote (upsert atômico); /stats sem COUNT(*)
+from app.core.user_stats import BUCKETS, SQLUserStatsBackend, UserStats
+user_stats = UserStats(backend=SQLUserStatsBackend(
+    app.config['SQLALCHEMY_DATABASE_URI'], app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})))
+
 @app.route("/webhook/whatsapp", methods=['POST', 'GET'])
 def whatsapp_webhook():
     if request.method == 'GET':
@@ -86,17 +96,7 @@ def whatsapp_webhook():
     media_url = request.values.get('MediaUrl0', '')
     from_number = request.values.get('From', '').replace('whatsapp:', '')
     
-    # 2. Gerenciar usuário no banco
-    user = db.session.query(User).filter_by(phone_number=from_number).first()
-    if not user:
-        user = User(phone_number=from_number, total_messages=0)
-        db.session.add(user)
-        db.session.flush()  # Para garantir que o objeto tenha os valores padrão
-    
-    user.last_message_date = datetime.utcnow()
-    user.total_messages = (user.total_messages if user.total_messages is not None else 0) + 1
-    
-    # 3. Processar mensagem
+    # 2-3. Processar mensagem (o usuário é contabilizado junto com a conversa, no passo 5)
     message_type = 'text'
     transcribed_text = None
     
@@ -141,12 +141,12 @@ def whatsapp_webhook():
     if body:
         try:
             # Sistema rápido com contexto das últimas mensagens
-            recent_conversations = db.session.query(Conversation).filter_by(phone_number=from_number).order_by(Conversation.timestamp.desc()).limit(3).all()
+            recent_conversations = conversation_history.recent_exchanges(from_number, 3)
             
             context = "Histórico recente:\n"
-            for conv in reversed(recent_conversations):
-                if conv.user_message and conv.bot_response:
-                    context += f"Usuário: {conv.user_message[:100]}\nEndrigo: {conv.bot_response[:100]}\n"
+            for user_message, bot_response in recent_conversations:
+                if user_message and bot_response:
+                    context += f"Usuário: {user_message[:100]}\nEndrigo: {bot_response[:100]}\n"
             
             prompt = f"""Você é Endrigo Almada, especialista em marketing digital com 22 anos de experiência.
 
@@ -196,17 +196,10 @@ Responda como Endrigo:"""
     else:
         reply = "Fala! Sou o Endrigo Digital, seu parceiro em marketing digital e inteligência artificial! 🎯 Como posso revolucionar seu negócio hoje?"
 
-    # 5. Salvar conversa no banco
-    conversation = Conversation(
-        phone_number=from_number,
-        user_message=body,
-        bot_response=reply,
-        message_type=message_type,
-        transcribed_text=transcribed_text,
-        thread_id=None  # Chat Completion não usa threads
-    )
-    db.session.add(conversation)
-    db.session.commit()
+    # 5. Salvar conversa e contabilizar o usuário: em memória na hora, no banco no próximo lote
+    conversation_history.append_exchange(from_number, body, [reply], message_type=message_type,
+                                         transcribed_text=transcribed_text)
+    user_stats.record_message(from_number, message_type)
 
     # 6. Gerar resposta em áudio (sempre quando possível)
     audio_file_path = None
@@ -280,9 +273,10 @@ Responda como Endrigo:"""
 @app.route("/")
 def home():
     try:
-        # Estatísticas básicas do banco
-        total_users = db.session.query(User).count()
-        total_conversations = db.session.query(Conversation).count()
+        # Estatísticas básicas (agregados em memória, sem COUNT no banco)
+        totals = user_stats.snapshot()
+        total_users = totals['total_users']
+        total_conversations = totals['total_conversations']
         return f"""
         <h1>Clone Digital do Endrigo – Online! 🎤</h1>
         <p><strong>Usuários:</strong> {total_users}</p>
@@ -320,30 +314,27 @@ def health():
 @app.route("/stats")
 def stats():
     """Endpoint para estatísticas detalhadas"""
-    try:
-        total_users = db.session.query(User).count()
-        total_conversations = db.session.query(Conversation).count()
-        audio_messages = db.session.query(Conversation).filter_by(message_type='audio').count()
-        text_messages = db.session.query(Conversation).filter_by(message_type='text').count()
-        
-        return {
-            "total_users": total_users,
-            "total_conversations": total_conversations,
-            "audio_messages": audio_messages,
-            "text_messages": text_messages,
-            "database_status": "connected",
-            "elevenlabs_configured": bool(os.getenv("ELEVENLABS_API_KEY")),
-            "elevenlabs_voice_id": os.getenv("ELEVENLABS_VOICE_ID", "padrão")
-        }
-    except Exception as e:
-        # Se houver erro de conexão, tentar reconectar
-        db.session.rollback()
-        return {
-            "error": "Erro de conexão com banco de dados",
-            "database_status": "error",
-            "elevenlabs_configured": bool(os.getenv("ELEVENLABS_API_KEY")),
-            "elevenlabs_voice_id": os.getenv("ELEVENLABS_VOICE_ID", "padrão")
-        }, 500
+    # Agregados mantidos pelo UserStats: nenhuma varredura das tabelas por requisição
+    counters = user_stats.get_stats()
+    # Sem backend (banco indisponível na partida) ou com o último lote falhando, o banco está com erro
+    db_ok = user_stats.backend is not None and not counters['flush_failing']
+    return {
+        **user_stats.snapshot(),
+        "database_status": "connected" if db_ok else "error",
+        "stats_persistence": counters['persistence'],
+        "stats_flush_errors": counters['flush_errors'],
+        "elevenlabs_configured": bool(os.getenv("ELEVENLABS_API_KEY")),
+        "elevenlabs_voice_id": os.getenv("ELEVENLABS_VOICE_ID", "padrão")
+    }
+
+@app.route("/stats/series")
+def stats_series():
+    """Série para painéis a partir dos rollups diários: ?days=30&bucket=day|week|month"""
+    days = max(1, min(request.args.get("days", 30, type=int), 730))
+    bucket = request.args.get("bucket", "day")
+    if bucket not in BUCKETS:
+        return {"error": f"bucket deve ser um de {', '.join(BUCKETS)}"}, 400
+    return {"days": days, "bucket": bucket, "series": user_stats.series(days, bucket)}
 
 @app.route("/voice-info")
 def voice_info():
@@ -445,11 +436,10 @@ def advanced_system_status():
         
         # Adiciona estatísticas do banco atual
         try:
-            total_users = db.session.query(User).count()
-            total_conversations = db.session.query(Conversation).count()
+            totals = user_stats.snapshot()
             status['database'] = {
-                'total_users': total_users,
-                'total_conversations': total_conversations,
+                'total_users': totals['total_users'],
+                'total_conversations': totals['total_conversations'],
                 'status': 'connected'
             }
         except Exception as e:
@@ -569,13 +559,9 @@ def whatsapp_realtime_webhook():
                 # Processa memória em background (não bloqueia)
                 try:
                     if ADVANCED_SYSTEM_AVAILABLE:
-                        import threading
-                        threading.Thread(
-                            target=lambda: advanced_handler.memory_system.process_conversation(
-                                from_number, message_body, response_text
-                            ),
-                            daemon=True
-                        ).start()
+                        advanced_handler.memory_pipeline.submit(
+                            from_number, message_body, response_text
+                        )
                 except Exception:
                     pass  # Memória é opcional
                 
@@ -0,0 +1,192 @@
+"""
+Pipeline de Ingestão de Memória (write-behind)
+Tira process_conversation/update_user_profile do caminho da resposta: eventos
+vão para uma fila limitada, agrupada por usuário, processada em micro-lotes
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+
+class ConversationEvent:
+    """Uma troca mensagem/resposta aguardando ingestão"""
+
+    __slots__ = ('user_message', 'ai_response', 'message_type', 'enqueued_at')
+
+    def __init__(self, user_message: str, ai_response: str, message_type: str = 'text'):
+        self.user_message = user_message
+        self.ai_response = ai_response
+        self.message_type = message_type
+        self.enqueued_at = time.perf_counter()
+
+
+class MemoryIngestPipeline:
+    """
+    Worker dedicado que aplica as atualizações de memória em micro-lotes.
+
+    - Coalescência: eventos do mesmo usuário ficam juntos e são aplicados em
+      uma única chamada a process_conversations (um carregamento do usuário)
+    - Micro-lotes: o worker espera `batch_window` para acumular eventos e
+      processa até `batch_size` usuários por rodada
+    - Backpressure: no máximo `max_pending` eventos na fila; acima disso o
+      produtor espera até `timeout` e, se continuar cheio, o evento é descartado
+      (memória é opcional, a resposta ao usuário não)
+    """
+
+    def __init__(self, memory_system: Any, personality_manager: Any = None,
+                 max_pending: int = 2000, batch_size: int = 64, batch_window: float = 0.05,
+                 put_timeout: float = 0.1):
+        self.memory_system = memory_system
+        self.personality_manager = personality_manager
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.put_timeout = put_timeout
+
+        self._queue: 'OrderedDict[str, List[ConversationEvent]]' = OrderedDict()
+        self._pending = 0
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        self._worker: Optional[threading.Thread] = None
+        self._stop = False
+        self.stats_counters = {
+            'submitted': 0, 'processed': 0, 'coalesced': 0, 'dropped': 0,
+            'batches': 0, 'errors': 0, 'max_lag_ms': 0.0, 'last_lag_ms': 0.0,
+        }
+        atexit.register(self.close)
+
+    # --- Produtor -------------------------------------------------------------
+
+    def submit(self, user_phone: str, user_message: str, ai_response: str,
+               message_type: str = 'text', timeout: Optional[float] = None) -> bool:
+        """
+        Enfileira a troca para ingestão. Retorna False se descartada por fila cheia.
+        Chamadores dentro de um event loop devem usar timeout=0 para nunca bloquear.
+        """
+        event = ConversationEvent(user_message or '', ai_response or '', message_type)
+        wait = self.put_timeout if timeout is None else timeout
+
+        with self._cond:
+            if self._stop:
+                return False
+            if self._pending >= self.max_pending:
+                deadline = time.monotonic() + wait
+                while self._pending >= self.max_pending and not self._stop:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.stats_counters['dropped'] += 1
+                        logging.warning(f"⚠️ Fila de memória cheia ({self._pending}): evento de {user_phone} descartado")
+                        return False
+                    self._cond.wait(remaining)
+
+            events = self._queue.get(user_phone)
+            if events is None:
+                self._queue[user_phone] = [event]
+            else:
+                events.append(event)
+                self.stats_counters['coalesced'] += 1
+            self._pending += 1
+            self.stats_counters['submitted'] += 1
+
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name='memory-ingest', daemon=True)
+                self._worker.start()
+            self._cond.notify_all()
+        return True
+
+    # --- Worker ---------------------------------------------------------------
+
+    def _take_batch(self) -> Dict[str, List[ConversationEvent]]:
+        with self._cond:
+            while not self._queue and not self._stop:
+                self._cond.wait()
+            if not self._queue:
+                return {}
+
+        # Janela curta para acumular mais eventos (e coalescer os do mesmo usuário)
+        if self.batch_window > 0 and not self._stop:
+            time.sleep(self.batch_window)
+
+        with self._cond:
+            batch = {}
+            while self._queue and len(batch) < self.batch_size:
+                phone, events = self._queue.popitem(last=False)
+                batch[phone] = events
+            taken = sum(len(events) for events in batch.values())
+            self._pending -= taken
+            self._in_flight += taken
+            self._cond.notify_all()  # libera produtores em espera
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return  # parada solicitada e fila vazia
+            self._process_batch(batch)
+
+    def _process_batch(self, batch: Dict[str, List[ConversationEvent]]):
+        processed = 0
+        oldest = time.perf_counter()
+        for phone, events in batch.items():
+            oldest = min(oldest, events[0].enqueued_at)
+            try:
+                self.memory_system.process_conversations(
+                    phone, [(e.user_message, e.ai_response) for e in events]
+                )
+                if self.personality_manager is not None:
+                    for e in events:
+                        self.personality_manager.update_user_profile(phone, {
+                            'message_text': e.user_message,
+                            'message_type': e.message_type,
+                            'response_generated': e.ai_response
+                        })
+            except Exception as ex:
+                logging.error(f"Erro na ingestão de memória para {phone}: {ex}")
+                with self._cond:
+                    self.stats_counters['errors'] += 1
+            processed += len(events)
+
+        lag_ms = (time.perf_counter() - oldest) * 1000
+        with self._cond:
+            self._in_flight -= processed
+            self.stats_counters['processed'] += processed
+            self.stats_counters['batches'] += 1
+            self.stats_counters['last_lag_ms'] = round(lag_ms, 1)
+            self.stats_counters['max_lag_ms'] = round(max(self.stats_counters['max_lag_ms'], lag_ms), 1)
+            self._cond.notify_all()
+
+    # --- Controle -------------------------------------------------------------
+
+    def drain(self, timeout: float = 5.0) -> bool:
+        """Espera a fila esvaziar; retorna False se o tempo acabar antes"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._pending or self._in_flight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._worker is None:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout: float = 5.0):
+        """Processa o que restou na fila e encerra o worker"""
+        self.drain(timeout)
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._cond:
+            batches = self.stats_counters['batches']
+            return {
+                'queued_events': self._pending,
+                'queued_users': len(self._queue),
+                'in_flight': self._in_flight,
+                'max_pending': self.max_pending,
+                'avg_batch_events': round(self.stats_counters['processed'] / batches, 1) if batches else 0,
+                **self.stats_counters,
+            }
@@ -0,0 +1,402 @@
+"""
+Armazenamento de Memória por Usuário para o AdvancedMemorySystem
+Deduplicação O(1) por hash, heap com os fatos mais importantes, limite LRU
+de usuários residentes e persistência write-behind no banco do config.Config
+"""
+import atexit
+import copy
+import heapq
+import itertools
+import logging
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from app.utils import jsoncodec
+
+FACT_CATEGORIES = ('preferences', 'business_context', 'personal_info', 'insights')
+
+
+class CategoryFacts:
+    """
+    Fatos de uma categoria: heap de mínimo por importância + set de conteúdos.
+    O set usa o hash já cacheado em cada str, sem alocar nada além do slot.
+    """
+
+    __slots__ = ('heap', 'hashes', 'limit')
+
+    def __init__(self, limit: int = 50):
+        # (importance, -seq, fact): no topo fica o menos importante e, nos
+        # empates, o mais recente, que é o descartado pelo sort+truncate antigo
+        self.heap = []
+        self.hashes = set()
+        self.limit = limit
+
+    def add(self, fact: Dict[str, Any], seq: int) -> bool:
+        """Adiciona o fato se for inédito e couber entre os `limit` mais importantes"""
+        content = fact['content']
+        if content in self.hashes:
+            return False
+
+        entry = (fact['importance'], -seq, fact)
+        if len(self.heap) < self.limit:
+            heapq.heappush(self.heap, entry)
+        elif entry[0] > self.heap[0][0]:
+            evicted = heapq.heapreplace(self.heap, entry)
+            self.hashes.discard(evicted[2]['content'])
+        else:
+            return False
+
+        self.hashes.add(content)
+        return True
+
+    def as_list(self) -> List[Dict[str, Any]]:
+        """Fatos em ordem de importância decrescente (e de chegada nos empates)"""
+        return [fact for _, _, fact in sorted(self.heap, key=lambda e: (-e[0], -e[1]))]
+
+    def __len__(self):
+        return len(self.heap)
+
+
+class UserMemoryRecord:
+    """Tudo o que o sistema de memória mantém para um usuário"""
+
+    __slots__ = ('facts', 'sections', 'dirty')
+
+    def __init__(self):
+        self.facts: Dict[str, CategoryFacts] = {}
+        self.sections: Dict[str, Dict[str, Any]] = {}  # 'summary', 'insights', ...
+        self.dirty = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'facts': {cat: bucket.as_list() for cat, bucket in self.facts.items()},
+            'sections': self.sections,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], limit: int, seq: Iterator[int]) -> 'UserMemoryRecord':
+        record = cls()
+        for category, facts in data.get('facts', {}).items():
+            bucket = record.facts.setdefault(category, CategoryFacts(limit))
+            for fact in facts:
+                bucket.add(fact, next(seq))
+        record.sections = data.get('sections', {})
+        return record
+
+
+class SQLMemoryBackend:
+    """Persistência em lote na tabela user_memories (models.UserMemory)"""
+
+    def __init__(self, database_uri: Optional[str] = None, engine_options: Optional[Dict] = None):
+        from sqlalchemy import create_engine
+        from models import UserMemory
+        from config import Config
+
+        uri = database_uri or Config.SQLALCHEMY_DATABASE_URI
+        options = Config.SQLALCHEMY_ENGINE_OPTIONS if engine_options is None else engine_options
+        if uri.startswith('sqlite'):
+            # Opções de pool do Postgres não se aplicam ao SQLite
+            options = {}
+
+        self.engine = create_engine(uri, **options)
+        self.table = UserMemory.__table__
+        self.table.create(bind=self.engine, checkfirst=True)
+
+    def load(self, phone: str) -> Optional[Dict[str, Any]]:
+        from sqlalchemy import select
+
+        with self.engine.connect() as conn:
+            row = conn.execute(
+                select(self.table.c.data).where(self.table.c.phone_number == phone)
+            ).first()
+        return jsoncodec.loads(row[0]) if row else None
+
+    def save_many(self, payloads: Dict[str, str]):
+        """Upsert em lote: uma transação para todos os usuários pendentes"""
+        now = datetime.utcnow()
+        rows = [{'phone_number': p, 'data': d, 'updated_at': now} for p, d in payloads.items()]
+        dialect = self.engine.dialect.name
+
+        with self.engine.begin() as conn:
+            if dialect in ('postgresql', 'sqlite'):
+                if dialect == 'postgresql':
+                    from sqlalchemy.dialects.postgresql import insert
+                else:
+                    from sqlalchemy.dialects.sqlite import insert
+                stmt = insert(self.table)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[self.table.c.phone_number],
+                    set_={'data': stmt.excluded.data, 'updated_at': stmt.excluded.updated_at}
+                )
+                conn.execute(stmt, rows)
+            else:
+                conn.execute(
+                    self.table.delete().where(self.table.c.phone_number.in_(list(payloads)))
+                )
+                conn.execute(self.table.insert(), rows)
+
+
+class _SectionView(Mapping):
+    """
+    Visão dict-like (somente leitura) compatível com os antigos dicts por telefone.
+    Acesso por chave carrega o usuário do banco; len/iteração cobrem só os residentes.
+    """
+
+    def __init__(self, store: 'MemoryStore', render: Callable[[UserMemoryRecord], Any],
+                 has: Callable[[UserMemoryRecord], bool]):
+        self._store = store
+        self._render = render
+        self._has = has
+
+    def __getitem__(self, phone):
+        record = self._store.get(phone, create=False)
+        with self._store._lock:
+            if record is None or not self._has(record):
+                raise KeyError(phone)
+            return self._render(record)
+
+    def __iter__(self):
+        return iter([p for p, r in self._store.resident_items() if self._has(r)])
+
+    def __len__(self):
+        return sum(1 for _, r in self._store.resident_items() if self._has(r))
+
+
+class MemoryStore:
+    """
+    Memória de longo prazo limitada e indexada.
+
+    - Dedup O(1) por categoria via set de hashes do conteúdo
+    - Heap mantendo os `facts_per_category` fatos mais importantes
+    - LRU global de usuários residentes (`max_users`)
+    - Write-behind: usuários alterados são gravados em lote a cada `flush_interval`
+    """
+
+    def __init__(self, max_users: int = 5000, facts_per_category: int = 50,
+                 flush_interval: float = 5.0, backend: Any = 'auto'):
+        self.max_users = max_users
+        self.facts_per_category = facts_per_category
+        self.flush_interval = flush_interval
+
+        self._users: 'OrderedDict[str, UserMemoryRecord]' = OrderedDict()
+        self._pending: Dict[str, str] = {}  # usuários despejados ainda não gravados
+        self._flushing: Dict[str, str] = {}  # lote em gravação (o get lê daqui, não do banco)
+        self._seq = itertools.count()
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._flusher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.stats_counters = {'evicted': 0, 'loaded': 0, 'flushed': 0, 'flush_errors': 0,
+                               'serialize_errors': 0}
+
+        if backend == 'auto':
+            backend = self._default_backend()
+        self.backend = backend
+        if self.backend is not None:
+            atexit.register(self.close)
+
+        self.long_term_view = _SectionView(
+            self, lambda r: {cat: b.as_list() for cat, b in r.facts.items()}, lambda r: bool(r.facts)
+        )
+        self.summaries_view = _SectionView(
+            self, lambda r: copy.deepcopy(r.sections['summary']), lambda r: 'summary' in r.sections
+        )
+        self.insights_view = _SectionView(
+            self, lambda r: copy.deepcopy(r.sections['insights']), lambda r: 'insights' in r.sections
+        )
+
+    @staticmethod
+    def _default_backend():
+        try:
+            return SQLMemoryBackend()
+        except Exception as e:
+            logging.warning(f"Memória sem persistência (somente RAM): {e}")
+            return None
+
+    # --- Residência / LRU ---------------------------------------------------
+
+    def get(self, phone: str, create: bool = True) -> Optional[UserMemoryRecord]:
+        """Retorna o registro do usuário, carregando do banco se necessário (fora do lock)"""
+        while True:
+            with self._lock:
+                record = self._users.get(phone)
+                if record is not None:
+                    self._users.move_to_end(phone)
+                    return record
+                had_pending = phone in self._pending or phone in self._flushing
+
+            data = None
+            if not had_pending and self.backend is not None:
+                # Ida ao banco sem o lock: não trava a memória dos outros usuários
+                try:
+                    data = self.backend.load(phone)
+                except Exception as e:
+                    logging.error(f"Erro carregando memória de {phone}: {e}")
+
+            with self._lock:
+                # Outra thread pode ter carregado (ou despejado) o usuário durante a leitura
+                record = self._users.get(phone)
+                if record is not None:
+                    self._users.move_to_end(phone)
+                    return record
+                pending = self._pending.pop(phone, None)
+                dirty = pending is not None
+                if pending is None:
+                    # Lote em gravação: é a versão mais nova (se falhar, o flush marca o registro sujo)
+                    pending = self._flushing.get(phone)
+                if pending is None and had_pending:
+                    continue  # o flush terminou de gravar a versão pendente: lê do banco
+                if pending is not None:
+                    data = pending
+
+                if data is not None:
+                    if isinstance(data, str):
+                        data = jsoncodec.loads(data)
+                    record = UserMemoryRecord.from_dict(data, self.facts_per_category, self._seq)
+                    record.dirty = dirty
+                    self.stats_counters['loaded'] += 1
+                elif create:
+                    record = UserMemoryRecord()
+                else:
+                    return None
+
+                self._users[phone] = record
+                self._evict_if_needed()
+                return record
+
+    def _evict_if_needed(self):
+        while len(self._users) > self.max_users:
+            phone, record = self._users.popitem(last=False)
+            self.stats_counters['evicted'] += 1
+            if record.dirty and self.backend is not None:
+                # Ainda não gravado: segue para o próximo lote do write-behind
+                payload = self._serialize(phone, record)
+                if payload is not None:
+                    self._pending[phone] = payload
+
+    def _serialize(self, phone: str, record: UserMemoryRecord) -> Optional[str]:
+        try:
+            return jsoncodec.dumps(record.to_dict())
+        except Exception as e:
+            logging.error(f"Erro serializando memória de {phone}: {e}")
+            self.stats_counters['serialize_errors'] += 1
+            return None
+
+    def resident_items(self) -> List:
+        with self._lock:
+            return list(self._users.items())
+
+    # --- Escrita -------------------------------------------------------------
+
+    def add_fact(self, phone: str, category: str, fact: Dict[str, Any]) -> bool:
+        """Adiciona um fato; retorna False se duplicado, fora do top-N ou categoria inválida"""
+        if category not in FACT_CATEGORIES:
+            return False
+
+        def add(record: UserMemoryRecord) -> bool:
+            bucket = record.facts.get(category)
+            if bucket is None:
+                bucket = record.facts[category] = CategoryFacts(self.facts_per_category)
+            added = bucket.add(fact, next(self._seq))
+            if added:
+                self._mark_dirty(record)
+            return added
+
+        return self._apply(phone, add)
+
+    def update_section(self, phone: str, name: str, factory: Callable[[], Dict[str, Any]],
+                       update: Callable[[Dict[str, Any]], Any]) -> Any:
+        """Aplica `update` à seção do usuário sob o lock e marca o registro para gravação"""
+
+        def apply(record: UserMemoryRecord) -> Any:
+            data = record.sections.get(name)
+            if data is None:
+                data = record.sections[name] = factory()
+            result = update(data)
+            self._mark_dirty(record)
+            return result
+
+        return self._apply(phone, apply)
+
+    def _apply(self, phone: str, fn: Callable[[UserMemoryRecord], Any]) -> Any:
+        """Executa `fn` no registro residente sob o lock; a carga do banco (get) fica fora dele"""
+        while True:
+            record = self.get(phone)
+            with self._lock:
+                # Despejado entre o get e o lock: a alteração se perderia no registro órfão
+                if self._users.get(phone) is record:
+                    return fn(record)
+
+    def _mark_dirty(self, record: UserMemoryRecord):
+        record.dirty = True
+        if self.backend is not None and self._flusher is None:
+            self._start_flusher()
+
+    # --- Write-behind --------------------------------------------------------
+
+    def _start_flusher(self):
+        self._flusher = threading.Thread(target=self._flush_loop, name='memory-flusher', daemon=True)
+        self._flusher.start()
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                # A thread não é recriada: um erro aqui não pode encerrar o write-behind
+                logging.error(f"Erro no write-behind da memória: {e}")
+
+    def flush(self) -> int:
+        """Grava em lote todos os usuários alterados; retorna quantos foram gravados"""
+        if self.backend is None:
+            return 0
+        with self._flush_lock:
+            with self._lock:
+                batch = dict(self._pending)
+                self._pending.clear()
+                for phone, record in self._users.items():
+                    if record.dirty:
+                        # Falha de serialização mantém o usuário sujo para o próximo lote
+                        payload = self._serialize(phone, record)
+                        if payload is not None:
+                            batch[phone] = payload
+                            record.dirty = False
+                self._flushing = batch
+            if not batch:
+                return 0
+            try:
+                self.backend.save_many(batch)
+                self.stats_counters['flushed'] += len(batch)
+                return len(batch)
+            except Exception as e:
+                logging.error(f"Erro gravando memória em lote ({len(batch)} usuários): {e}")
+                self.stats_counters['flush_errors'] += 1
+                with self._lock:
+                    for phone, payload in batch.items():
+                        record = self._users.get(phone)
+                        if record is not None:
+                            record.dirty = True
+                        else:
+                            self._pending.setdefault(phone, payload)
+                return 0
+            finally:
+                with self._lock:
+                    self._flushing = {}
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'resident_users': len(self._users),
+                'max_users': self.max_users,
+                'dirty_users': sum(1 for r in self._users.values() if r.dirty),
+                'pending_writes': len(self._pending),
+                'persistence': type(self.backend).__name__ if self.backend else 'ram_only',
+                **self.stats_counters,
+            }
@@ -1,13 +1,15 @@
 import os
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, Text, Date, DateTime, Boolean, Index
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
 
 class Conversation(Base):
     __tablename__ = 'conversations'
+    # Últimas N do usuário (WHERE phone_number = ? ORDER BY timestamp DESC LIMIT N): N linhas pelo índice, sem sort
+    __table_args__ = (Index('ix_conversations_phone_timestamp', 'phone_number', 'timestamp'),)
     
     id = Column(Integer, primary_key=True)
     phone_number = Column(String(20), nullable=False, index=True)
@@ -34,4 +36,26 @@ class User(Base):
     total_messages = Column(Integer, default=0, nullable=False)
     
     def __repr__(self):
-        return f'<User {self.phone_number}>'
\ No newline at end of file
+        return f'<User {self.phone_number}>'
+
+class StatsDaily(Base):
+    __tablename__ = 'stats_daily'
+    # Rollup por dia e métrica (conversations, audio_messages, text_messages, new_users),
+    # somado a cada lote do app.core.user_stats: o /stats não varre conversations
+    
+    day = Column(Date, primary_key=True)
+    metric = Column(String(32), primary_key=True)
+    value = Column(Integer, default=0, nullable=False)
+    
+    def __repr__(self):
+        return f'<StatsDaily {self.day} {self.metric}={self.value}>'
+
+class UserMemory(Base):
+    __tablename__ = 'user_memories'
+    
+    phone_number = Column(String(20), primary_key=True)
+    data = Column(Text, nullable=False)  # JSON com fatos, resumo e insights
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<UserMemory {self.phone_number}>'
@@ -1,234 +1,504 @@
 """
 Pipeline Otimizado para Latência Ultra-Baixa
-Implementa processamento streaming e paralelo
+Motor em estágios com streaming: ASR -> LLM -> TTS
+- ASR: gerador assíncrono de transcrições parciais (segmentos de áudio em paralelo, entregues em ordem)
+- LLM: recebe a transcrição e produz tokens em streaming
+- TTS: sintetiza frase a frase assim que o LLM fecha um trecho, sem esperar a resposta inteira
+Estágios ligados por filas limitadas, executados num pool de threads compartilhado
 """
 import asyncio
-import time
-import logging
-from typing import Dict, Any, Optional
 import concurrent.futures
-from dataclasses import dataclass
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+from app.core.metrics import LatencyStats
+from app.utils import jsoncodec
+from pipeline_autotuner import LatencyAutotuner
 
 @dataclass
 class LatencyMetrics:
-    """Métricas de latência do pipeline"""
-    asr_latency: float = 0.0  # Automatic Speech Recognition
-    llm_latency: float = 0.0  # Large Language Model
-    tts_latency: float = 0.0  # Text-to-Speech
+    """Métricas de latência do pipeline (ms, da última execução)"""
+    asr_latency: float = 0.0  # Automatic Speech Recognition: início -> transcrição completa
+    llm_latency: float = 0.0  # Large Language Model: transcrição -> último token
+    tts_latency: float = 0.0  # Text-to-Speech: primeiro segmento enviado -> último áudio pronto
     total_latency: float = 0.0
     target_latency: float = 525.0  # ms
+    first_token_latency: float = 0.0  # início -> primeiro token do LLM
+    first_audio_latency: float = 0.0  # início -> primeiro áudio pronto (latência percebida)
+    asr_segments: int = 0
+    tts_segments: int = 0
+    # Tempo de cada chamada aos serviços (trace para replay): asr [ms], tts [[caracteres, ms]],
+    # llm [ms até o 1º token, ms médio por token, tokens]
+    service_calls: Dict[str, list] = field(default_factory=lambda: {'asr': [], 'llm': [], 'tts': []})
+
+
+# Fim de frase: pontuação final seguida de espaço, ou quebra de linha
+_SENTENCE_END_RE = re.compile(r'[.!?…]+["\')\]]*\s+|\n+')
+
+DEFAULT_SYSTEM_PROMPT = (
+    "Você é Endrigo Almada respondendo a uma mensagem de voz no WhatsApp. "
+    "Responda em português brasileiro, de forma natural, curta e falada."
+)
+
+_END = object()
+_executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_pipeline_executor() -> concurrent.futures.ThreadPoolExecutor:
+    """Pool de longa duração para as chamadas bloqueantes dos estágios (rede, disco)"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=int(os.environ.get('PIPELINE_WORKERS', '16')),
+                    thread_name_prefix='pipeline',
+                )
+    return _executor
+
+
+# --- Estágios padrão (serviços reais) ------------------------------------------
+
+def whisper_asr(segment: bytes) -> str:
+    """Transcreve um segmento de áudio com o Whisper"""
+    from openai_service import transcribe_audio_message
+
+    with tempfile.NamedTemporaryFile(suffix='.ogg', delete=False) as audio_file:
+        audio_file.write(segment)
+    try:
+        return transcribe_audio_message(audio_file.name)
+    finally:
+        os.unlink(audio_file.name)
+
+
+def chat_completion_llm(transcript: str, context: Dict[str, Any]) -> Iterator[str]:
+    """Tokens da resposta via chat completions em streaming"""
+    from openai_service import openai_client
+
+    messages = [{"role": "system", "content": context.get('system_prompt') or DEFAULT_SYSTEM_PROMPT}]
+    if context.get('recent_conversation'):
+        messages.append({"role": "system", "content": f"Conversa recente:\n{context['recent_conversation']}"})
+    messages.append({"role": "user", "content": transcript})
+
+    stream = openai_client.chat.completions.create(
+        model=os.environ.get('PIPELINE_LLM_MODEL', 'gpt-4o-mini'),
+        messages=messages, max_tokens=300, temperature=0.7, stream=True, timeout=8,
+    )
+    for event in stream:
+        delta = event.choices[0].delta.content if event.choices else None
+        if delta:
+            yield delta
+
+
+def elevenlabs_tts(text: str) -> Optional[str]:
+    """Sintetiza o trecho com a voz clonada; retorna o caminho do mp3"""
+    from elevenlabs_service import generate_voice_response
+    return generate_voice_response(text)
+
 
 class OptimizedPipeline:
-    def __init__(self):
+    """
+    ASR, LLM e TTS plugáveis (funções bloqueantes, executadas no pool):
+    - asr(segmento: bytes) -> str
+    - llm(transcrição: str, contexto: dict) -> iterador de tokens
+    - tts(texto: str) -> áudio (caminho/bytes) ou None
+
+    Parâmetros ajustáveis em tempo de execução (pelo LatencyAutotuner, se
+    ativo): parallel_workers (segmentos de ASR/TTS em voo por requisição), tts_segment_chars
+    (tamanho mínimo de um segmento de TTS) e coalesce_ms (quanto uma frase
+    curta espera pela próxima antes de ir sozinha para o TTS).
+    """
+
+    def __init__(self, asr: Optional[Callable[[bytes], str]] = None,
+                 llm: Optional[Callable[[str, Dict[str, Any]], Iterator[str]]] = None,
+                 tts: Optional[Callable[[str], Any]] = None,
+                 executor: Optional[concurrent.futures.Executor] = None, queue_size: int = 32,
+                 autotune: Optional[bool] = None, trace_path: Optional[str] = None):
         self.streaming_enabled = True
-        self.chunk_size = 1024  # bytes para processamento
         self.max_latency_target = 525  # ms
         self.parallel_workers = 3
+        self.tts_segment_chars = 60
+        self.coalesce_ms = 150.0
+        self.queue_size = queue_size
+        self.asr = asr or whisper_asr
+        self.llm = llm or chat_completion_llm
+        self.tts = tts or elevenlabs_tts
+        self.executor = executor or get_pipeline_executor()
         self.metrics = LatencyMetrics()
-        
-    async def process_with_streaming(self, audio_input: bytes, context: Dict[str, Any]) -> Dict[str, Any]:
-        """Processamento principal com streaming otimizado"""
-        start_time = time.time()
-        
+        # Janela das últimas execuções por estágio (asr, llm, tts, first_audio, total)
+        self.stage_stats = LatencyStats(window=256)
+        if autotune is None:
+            autotune = os.environ.get('PIPELINE_AUTOTUNE', '1') != '0'
+        self.autotuner = LatencyAutotuner(self) if autotune else None
+        # JSONL com os tempos dos serviços por execução, para o simulador do autotuner
+        self.trace_path = trace_path or os.environ.get('PIPELINE_TRACE_PATH')
+        self._trace_lock = threading.Lock()
+
+    async def process_with_streaming(self, audio_input, context: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Processa o áudio (bytes de um arquivo ou iterável/async-iterável de
+        segmentos) e devolve transcrição, texto da resposta e os segmentos de
+        áudio sintetizados, em ordem
+        """
+        metrics = LatencyMetrics(target_latency=self.max_latency_target)
+        segments = [audio_input] if isinstance(audio_input, (bytes, bytearray)) else audio_input
+        start = time.perf_counter()
+
         try:
-            # Fase 1: Processamento paralelo de chunks
-            if self.streaming_enabled and len(audio_input) > self.chunk_size * 2:
-                result = await self._process_streaming_chunks(audio_input, context)
+            if self.streaming_enabled:
+                result = await self._run_streaming(segments, context or {}, metrics, start)
             else:
-                result = await self._process_single_chunk(audio_input, context)
-            
-            # Calcula latência total
-            total_latency = (time.time() - start_time) * 1000  # ms
-            self.metrics.total_latency = total_latency
-            
+                result = await self._run_sequential(segments, context or {}, metrics, start)
+
+            metrics.total_latency = (time.perf_counter() - start) * 1000
+            self.metrics = metrics
+            self._record_stage_stats(metrics, ok=True)
+            self._write_trace(metrics)
+            if self.autotuner:
+                self.autotuner.observe(metrics)
+
             # Log de performance
             self._log_performance_metrics()
-            
-            result['latency_metrics'] = self.metrics
+
+            result['success'] = bool(result['text'])
+            result['latency_metrics'] = metrics
             result['performance_score'] = self._calculate_performance_score()
-            
             return result
-            
+
         except Exception as e:
+            metrics.total_latency = (time.perf_counter() - start) * 1000
+            self.metrics = metrics
+            self._record_stage_stats(metrics, ok=False)
             logging.error(f"Erro no pipeline otimizado: {e}")
             return {
                 'success': False,
                 'error': str(e),
-                'latency_metrics': self.metrics
+                'latency_metrics': metrics
             }
-    
-    async def _process_streaming_chunks(self, audio_input: bytes, context: Dict[str, Any]) -> Dict[str, Any]:
-        """Processa áudio em chunks paralelos para reduzir latência"""
-        chunks = self._split_into_chunks(audio_input)
-        
-        # Processa chunks em paralelo
-        with concurrent.futures.ThreadPoolExecutor(max_workers=self.parallel_workers) as executor:
-            loop = asyncio.get_event_loop()
-            
-            # Cria tasks para processamento paralelo
-            chunk_tasks = []
-            for i, chunk in enumerate(chunks):
-                task = loop.run_in_executor(
-                    executor,
-                    self._process_chunk_sync,
-                    chunk, context, i
-                )
-                chunk_tasks.append(task)
-            
-            # Aguarda todos os chunks processados
-            chunk_results = await asyncio.gather(*chunk_tasks, return_exceptions=True)
-        
-        # Combina resultados dos chunks
-        return self._combine_chunk_results(chunk_results)
-    
-    async def _process_single_chunk(self, audio_input: bytes, context: Dict[str, Any]) -> Dict[str, Any]:
-        """Processa áudio como chunk único (fallback)"""
-        return await asyncio.to_thread(self._process_chunk_sync, audio_input, context, 0)
-    
-    def _process_chunk_sync(self, chunk: bytes, context: Dict[str, Any], chunk_index: int) -> Dict[str, Any]:
-        """Processamento síncrono de um chunk individual"""
-        start_chunk_time = time.time()
-        
+
+    # --- Modo streaming -------------------------------------------------------
+
+    async def _run_streaming(self, segments, context: Dict[str, Any], metrics: LatencyMetrics,
+                             start: float) -> Dict[str, Any]:
+        tokens: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        transcript_parts: List[str] = []
+
+        async def transcript_then_llm():
+            try:
+                async for partial in self.asr_stage(segments, metrics):
+                    transcript_parts.append(partial)
+                metrics.asr_latency = (time.perf_counter() - start) * 1000
+                await self.llm_stage(" ".join(transcript_parts).strip(), context, tokens, metrics, stop)
+            except Exception as e:
+                # ASR (ou o LLM antes do _END) falhou: o TTS recebe o erro em vez de esperar a fila para sempre
+                await tokens.put(e)
+
+        producer = asyncio.ensure_future(transcript_then_llm())
         try:
-            # Simula processamento do chunk
-            # Na implementação real, aqui seria:
-            # 1. ASR do chunk
-            # 2. Processamento LLM
-            # 3. TTS do resultado
-            
-            chunk_latency = (time.time() - start_chunk_time) * 1000
-            
-            return {
-                'success': True,
-                'chunk_index': chunk_index,
-                'chunk_latency': chunk_latency,
-                'processed_data': f"Chunk {chunk_index} processado",
-                'chunk_size': len(chunk)
-            }
-            
-        except Exception as e:
-            return {
-                'success': False,
-                'chunk_index': chunk_index,
-                'error': str(e)
-            }
-    
-    def _split_into_chunks(self, audio_data: bytes) -> list:
-        """Divide áudio em chunks otimizados"""
-        chunks = []
-        
-        # Calcula tamanho ideal do chunk baseado no tamanho total
-        total_size = len(audio_data)
-        optimal_chunk_size = min(self.chunk_size, total_size // self.parallel_workers)
-        
-        if optimal_chunk_size < 512:  # Chunk mínimo
-            optimal_chunk_size = 512
-        
-        # Divide em chunks
-        for i in range(0, total_size, optimal_chunk_size):
-            chunk = audio_data[i:i + optimal_chunk_size]
-            chunks.append(chunk)
-        
-        logging.info(f"Áudio dividido em {len(chunks)} chunks de ~{optimal_chunk_size} bytes")
-        return chunks
-    
-    def _combine_chunk_results(self, chunk_results: list) -> Dict[str, Any]:
-        """Combina resultados dos chunks processados"""
-        successful_chunks = [r for r in chunk_results if isinstance(r, dict) and r.get('success')]
-        failed_chunks = [r for r in chunk_results if not (isinstance(r, dict) and r.get('success'))]
-        
-        if not successful_chunks:
-            return {
-                'success': False,
-                'error': 'Nenhum chunk processado com sucesso',
-                'failed_chunks': len(failed_chunks)
-            }
-        
-        # Calcula métricas combinadas
-        total_chunk_latency = sum(chunk.get('chunk_latency', 0) for chunk in successful_chunks)
-        avg_chunk_latency = total_chunk_latency / len(successful_chunks)
-        
-        # Simula resultado final combinado
-        combined_result = {
-            'success': True,
-            'processed_chunks': len(successful_chunks),
-            'failed_chunks': len(failed_chunks),
-            'average_chunk_latency': avg_chunk_latency,
-            'total_processing_time': total_chunk_latency,
-            'combined_output': self._merge_chunk_outputs(successful_chunks)
+            text, audio_segments = await self.tts_stage(tokens, metrics, start)
+            await producer
+        finally:
+            if not producer.done():
+                # TTS falhou: libera a thread do LLM que possa estar presa na fila cheia
+                stop.set()
+                producer.cancel()
+                while not tokens.empty():
+                    tokens.get_nowait()
+        return {
+            'transcript': " ".join(transcript_parts).strip(),
+            'text': text,
+            'audio_segments': audio_segments,
         }
-        
-        return combined_result
-    
-    def _merge_chunk_outputs(self, successful_chunks: list) -> str:
-        """Merge outputs dos chunks em resultado final"""
-        # Ordena chunks pelo índice
-        sorted_chunks = sorted(successful_chunks, key=lambda x: x.get('chunk_index', 0))
-        
-        # Combina dados processados
-        merged_output = " ".join([
-            chunk.get('processed_data', '') for chunk in sorted_chunks
-        ])
-        
-        return merged_output
-    
+
+    async def asr_stage(self, segments, metrics: Optional[LatencyMetrics] = None) -> AsyncIterator[str]:
+        """Transcrições parciais na ordem dos segmentos, com até parallel_workers segmentos em voo"""
+        loop = asyncio.get_running_loop()
+        metrics = metrics or LatencyMetrics()
+        in_flight: deque = deque()
+        async for segment in self._asr_inputs(segments):
+            in_flight.append(loop.run_in_executor(self.executor, self._call_asr, segment, metrics))
+            metrics.asr_segments += 1
+            # Entrega o que já ficou pronto; segura a entrada quando o limite de voo é atingido
+            while in_flight and (in_flight[0].done() or len(in_flight) >= self.parallel_workers):
+                partial = await in_flight.popleft()
+                if partial:
+                    yield partial.strip()
+        while in_flight:
+            partial = await in_flight.popleft()
+            if partial:
+                yield partial.strip()
+
+    async def llm_stage(self, transcript: str, context: Dict[str, Any], tokens: asyncio.Queue,
+                        metrics: LatencyMetrics, stop: Optional[threading.Event] = None):
+        """Bombeia os tokens do LLM (gerador bloqueante, no pool) para a fila do TTS"""
+        if transcript:
+            loop = asyncio.get_running_loop()
+            stop = stop or threading.Event()
+
+            def pump():
+                # Fila cheia = TTS atrasado: o put bloqueia esta thread (backpressure)
+                try:
+                    for token in self._timed_tokens(transcript, context, metrics):
+                        if stop.is_set():
+                            return
+                        asyncio.run_coroutine_threadsafe(tokens.put(token), loop).result()
+                except Exception as e:
+                    if not stop.is_set():
+                        asyncio.run_coroutine_threadsafe(tokens.put(e), loop).result()
+
+            llm_started = time.perf_counter()
+            try:
+                await loop.run_in_executor(self.executor, pump)
+            finally:
+                metrics.llm_latency = (time.perf_counter() - llm_started) * 1000
+        await tokens.put(_END)
+
+    async def tts_stage(self, tokens: asyncio.Queue, metrics: LatencyMetrics, start: float):
+        """
+        Junta tokens em segmentos terminados em fim de frase e sintetiza cada um
+        assim que fecha. Frase curta (< tts_segment_chars) espera até
+        coalesce_ms por mais texto antes de ir sozinha.
+        """
+        loop = asyncio.get_running_loop()
+        limit = asyncio.Semaphore(self.parallel_workers)
+        pending: List[asyncio.Future] = []
+        parts: List[str] = []
+        buffer = ""
+        deadline = None
+        tts_started = None
+
+        async def synthesize(text: str, first: bool):
+            async with limit:
+                audio = await loop.run_in_executor(self.executor, self._call_tts, text, metrics)
+            if first:
+                metrics.first_audio_latency = (time.perf_counter() - start) * 1000
+            return audio
+
+        def flush(text: str):
+            nonlocal tts_started
+            text = text.strip()
+            if not text:
+                return
+            if tts_started is None:
+                tts_started = time.perf_counter()
+            parts.append(text)
+            pending.append(asyncio.ensure_future(synthesize(text, not pending)))
+
+        try:
+            while True:
+                timeout = None if deadline is None else max(0.0, deadline - loop.time())
+                try:
+                    token = await asyncio.wait_for(tokens.get(), timeout)
+                except asyncio.TimeoutError:
+                    token = None
+                if token is _END:
+                    break
+                if isinstance(token, BaseException):
+                    raise token
+                if token:
+                    if not metrics.first_token_latency:
+                        metrics.first_token_latency = (time.perf_counter() - start) * 1000
+                    buffer += token
+
+                cut = _last_sentence_end(buffer)
+                if cut and (token is None or cut >= self.tts_segment_chars):
+                    flush(buffer[:cut])
+                    buffer = buffer[cut:]
+                    deadline = None
+                elif cut and deadline is None:
+                    deadline = loop.time() + self.coalesce_ms / 1000
+            flush(buffer)
+
+            audio_segments = await asyncio.gather(*pending)
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            raise
+        if tts_started is not None:
+            metrics.tts_latency = (time.perf_counter() - tts_started) * 1000
+        metrics.tts_segments = len(parts)
+        return " ".join(parts), [audio for audio in audio_segments if audio]
+
+    # --- Modo sequencial (sem streaming) ---------------------------------------
+
+    async def _run_sequential(self, segments, context: Dict[str, Any], metrics: LatencyMetrics,
+                              start: float) -> Dict[str, Any]:
+        """Um estágio de cada vez: transcrição completa, resposta completa, um único áudio"""
+        loop = asyncio.get_running_loop()
+        transcript_parts = []
+        async for segment in self._asr_inputs(segments):
+            metrics.asr_segments += 1
+            transcript_parts.append(await loop.run_in_executor(self.executor, self._call_asr, segment, metrics))
+        transcript = " ".join(part.strip() for part in transcript_parts if part).strip()
+        metrics.asr_latency = (time.perf_counter() - start) * 1000
+
+        text, audio_segments = "", []
+        if transcript:
+            llm_started = time.perf_counter()
+            text = await loop.run_in_executor(
+                self.executor, lambda: "".join(self._timed_tokens(transcript, context, metrics))
+            )
+            text = text.strip()
+            metrics.llm_latency = (time.perf_counter() - llm_started) * 1000
+            metrics.first_token_latency = (time.perf_counter() - start) * 1000
+        if text:
+            tts_started = time.perf_counter()
+            audio = await loop.run_in_executor(self.executor, self._call_tts, text, metrics)
+            metrics.tts_latency = (time.perf_counter() - tts_started) * 1000
+            metrics.first_audio_latency = (time.perf_counter() - start) * 1000
+            metrics.tts_segments = 1
+            audio_segments = [audio] if audio else []
+        return {'transcript': transcript, 'text': text, 'audio_segments': audio_segments}
+
+    # --- Chamadas aos serviços (cronometradas) ----------------------------------
+
+    async def _asr_inputs(self, segments) -> AsyncIterator[bytes]:
+        """
+        Um segmento de entrada por chamada de ASR: cada segmento é um arquivo
+        ogg/wav completo e bytes concatenados não formam um arquivo válido
+        """
+        async for segment in _aiter(segments):
+            if segment:
+                yield bytes(segment)
+
+    def _call_asr(self, segment: bytes, metrics: LatencyMetrics) -> str:
+        t0 = time.perf_counter()
+        try:
+            return self.asr(segment)
+        finally:
+            metrics.service_calls['asr'].append(round((time.perf_counter() - t0) * 1000, 1))
+
+    def _timed_tokens(self, transcript: str, context: Dict[str, Any], metrics: LatencyMetrics) -> Iterator[str]:
+        t0 = time.perf_counter()
+        first_token_ms, count = 0.0, 0
+        try:
+            for token in self.llm(transcript, context):
+                if not count:
+                    first_token_ms = (time.perf_counter() - t0) * 1000
+                count += 1
+                yield token
+        finally:
+            per_token = ((time.perf_counter() - t0) * 1000 - first_token_ms) / max(1, count - 1)
+            metrics.service_calls['llm'] = [round(first_token_ms, 1), round(per_token, 2), count]
+
+    def _call_tts(self, text: str, metrics: LatencyMetrics):
+        t0 = time.perf_counter()
+        try:
+            return self.tts(text)
+        finally:
+            metrics.service_calls['tts'].append([len(text), round((time.perf_counter() - t0) * 1000, 1)])
+
+    def _write_trace(self, metrics: LatencyMetrics):
+        if not self.trace_path:
+            return
+        try:
+            line = jsoncodec.dumps({'at': round(time.time(), 3), **metrics.service_calls})
+            with self._trace_lock, open(self.trace_path, 'a', encoding='utf-8') as trace:
+                trace.write(line + "\n")
+        except Exception as e:
+            logging.warning(f"Falha ao gravar trace do pipeline: {e}")
+
+    # --- Métricas ---------------------------------------------------------------
+
+    def _record_stage_stats(self, metrics: LatencyMetrics, ok: bool):
+        self.stage_stats.record('total', metrics.total_latency, ok)
+        for name, value in (('asr', metrics.asr_latency), ('llm', metrics.llm_latency),
+                            ('tts', metrics.tts_latency), ('first_audio', metrics.first_audio_latency)):
+            if value:
+                self.stage_stats.record(name, value, ok)
+
     def _calculate_performance_score(self) -> float:
         """Calcula score de performance (0-100)"""
         if self.metrics.total_latency <= 0:
             return 0.0
-        
-        # Score baseado na latência vs target
-        latency_score = max(0, 100 - (self.metrics.total_latency / self.metrics.target_latency) * 50)
-        
+
+        # Score pela latência percebida (primeiro áudio) vs target
+        perceived = self.metrics.first_audio_latency or self.metrics.total_latency
+        latency_score = max(0, 100 - (perceived / self.metrics.target_latency) * 50)
+
         # Bonus por usar streaming
         streaming_bonus = 10 if self.streaming_enabled else 0
-        
-        # Penalty por falhas
-        success_penalty = 0  # Implementar baseado em taxa de sucesso
-        
+
+        # Penalty por falhas nas últimas execuções
+        total = self.stage_stats.snapshot().get('total', {})
+        success_penalty = 50 * total['errors'] / total['count'] if total.get('count') else 0
+
         final_score = min(100, latency_score + streaming_bonus - success_penalty)
-        return round(final_score, 2)
-    
+        return round(max(0.0, final_score), 2)
+
     def _log_performance_metrics(self):
         """Log das métricas de performance"""
         metrics = self.metrics
-        
-        status = "✅ EXCELENTE" if metrics.total_latency <= metrics.target_latency else "⚠️ ACIMA DO TARGET"
-        
+
+        perceived = metrics.first_audio_latency or metrics.total_latency
+        status = "✅ EXCELENTE" if perceived <= metrics.target_latency else "⚠️ ACIMA DO TARGET"
+
         logging.info(f"""
 MÉTRICAS DE PERFORMANCE - {status}
 =====================================
 🎯 Target: {metrics.target_latency}ms
-⚡ Total: {metrics.total_latency:.1f}ms
-🎤 ASR: {metrics.asr_latency:.1f}ms  
-🧠 LLM: {metrics.llm_latency:.1f}ms
-🗣️ TTS: {metrics.tts_latency:.1f}ms
+⚡ Total: {metrics.total_latency:.1f}ms (primeiro áudio em {metrics.first_audio_latency:.1f}ms)
+🎤 ASR: {metrics.asr_latency:.1f}ms ({metrics.asr_segments} segmentos)
+🧠 LLM: {metrics.llm_latency:.1f}ms (primeiro token em {metrics.first_token_latency:.1f}ms)
+🗣️ TTS: {metrics.tts_latency:.1f}ms ({metrics.tts_segments} segmentos)
 📊 Score: {self._calculate_performance_score()}/100
         """)
-    
-    def optimize_for_latency(self):
-        """Otimizações específicas para reduzir latência"""
-        # Reduz chunk size para processamento mais rápido
-        if self.metrics.total_latency > self.max_latency_target:
-            self.chunk_size = max(512, self.chunk_size - 256)
-            logging.info(f"Otimizando: chunk_size reduzido para {self.chunk_size}")
-        
-        # Aumenta workers paralelos se necessário
-        if self.metrics.total_latency > self.max_latency_target * 1.5:
-            self.parallel_workers = min(6, self.parallel_workers + 1)
-            logging.info(f"Otimizando: parallel_workers aumentado para {self.parallel_workers}")
-    
+
+    def optimize_for_latency(self) -> Optional[Dict[str, Any]]:
+        """Uma decisão do autotuner sobre a janela atual (ajusta no máximo um parâmetro)"""
+        if self.autotuner is None:
+            return None
+        return self.autotuner.evaluate()
+
     def get_optimization_suggestions(self) -> Dict[str, str]:
         """Retorna sugestões de otimização baseadas na performance"""
         suggestions = {}
-        
+
         if self.metrics.total_latency > self.metrics.target_latency:
             suggestions['latency'] = f"Latência {self.metrics.total_latency:.1f}ms acima do target {self.metrics.target_latency}ms"
-        
+
         if not self.streaming_enabled:
             suggestions['streaming'] = "Ativar streaming pode reduzir latência percebida"
-        
+
         if self.parallel_workers < 4:
             suggestions['parallelism'] = "Aumentar workers paralelos pode melhorar performance"
-        
-        return suggestions
\ No newline at end of file
+
+        return suggestions
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'streaming_enabled': self.streaming_enabled,
+            'target_latency': self.max_latency_target,
+            'parallel_workers': self.parallel_workers,
+            'tts_segment_chars': self.tts_segment_chars,
+            'coalesce_ms': self.coalesce_ms,
+            'performance_score': self._calculate_performance_score(),
+            'stages': self.stage_stats.snapshot(),
+            'autotuner': self.autotuner.get_stats() if self.autotuner else None,
+        }
+
+
+def _last_sentence_end(text: str) -> int:
+    """Posição logo após o último fim de frase em `text` (0 se não há frase completa)"""
+    cut = 0
+    for match in _SENTENCE_END_RE.finditer(text):
+        cut = match.end()
+    return cut
+
+
+async def _aiter(segments) -> AsyncIterator[bytes]:
+    if hasattr(segments, '__aiter__'):
+        async for segment in segments:
+            yield segment
+    else:
+        for segment in segments:
+            yield segment
@@ -4,15 +4,24 @@ Gerencia personalidade contextual e adaptativa
 """
 import json
 import logging
-from typing import Dict, List, Any
+from collections import OrderedDict
+from typing import Dict, List, Any, Tuple
 from datetime import datetime
 
+# Máximo de blocos de usuário pré-renderizados mantidos em memória (LRU)
+MAX_CACHED_USER_BLOCKS = 10000
+
 class PersonalityManager:
     def __init__(self):
         self.base_personality = self.load_base_personality()
         self.conversation_memory = {}
         self.context_history = []
         self.behavioral_patterns = {}
+        # Versão do perfil de cada usuário: muda a cada update/learn e invalida o bloco renderizado
+        self._profile_versions: Dict[str, int] = {}
+        self._user_blocks: 'OrderedDict[str, Tuple[int, str]]' = OrderedDict()
+        self.prompt_stats = {'user_block_hits': 0, 'user_block_renders': 0}
+        self.compile_prompt_templates()
         
     def load_base_personality(self) -> Dict[str, Any]:
         """Carrega personalidade base multi-camadas"""
@@ -55,34 +64,81 @@ class PersonalityManager:
             }
         }
     
-    def generate_contextual_prompt(self, conversation_history: List[Dict], user_phone: str) -> str:
-        """Gera prompt contextual baseado no histórico"""
-        recent_context = self.extract_recent_context(conversation_history)
-        user_profile = self.get_user_profile(user_phone)
-        
-        return f"""
-{self.base_personality['core']['name']} - Clone Digital Profissional Avançado
+    def compile_prompt_templates(self):
+        """
+        Pré-renderiza as partes estáticas do prompt (camadas da personalidade).
+        Chame de novo se base_personality for alterada em runtime.
+        """
+        core = self.base_personality['core']
+        style = self.base_personality['style']
+        behavior = self.base_personality['behavior']
+        context = self.base_personality['context']
+
+        self._prompt_head = f"""
+{core['name']} - Clone Digital Profissional Avançado
 
 CONTEXTO ATUAL DA CONVERSA:
-{recent_context}
+"""
+        self._prompt_profile_label = """
 
 PERFIL DO USUÁRIO:
-{user_profile}
+"""
+        self._prompt_instructions = f"""
 
 INSTRUÇÕES DE PERSONALIDADE v4:
-1. Tom: {self.base_personality['style']['tone']} com {self.base_personality['style']['energy_level']}
-2. Linguagem: {self.base_personality['style']['language']} com expressões naturais
-3. Expertise: Demonstre conhecimento em {', '.join(self.base_personality['core']['expertise'])}
-4. Método: Use {self.base_personality['behavior']['explanation_method']} 
-5. Abordagem: Seja {self.base_personality['behavior']['problem_solving']}
-6. Valor: Entregue {self.base_personality['context']['value_proposition']}
+1. Tom: {style['tone']} com {style['energy_level']}
+2. Linguagem: {style['language']} com expressões naturais
+3. Expertise: Demonstre conhecimento em {', '.join(core['expertise'])}
+4. Método: Use {behavior['explanation_method']} 
+5. Abordagem: Seja {behavior['problem_solving']}
+6. Valor: Entregue {context['value_proposition']}
 
 MEMÓRIA DE CONVERSA ATIVA:
-{self.format_conversation_memory(user_phone)}
+"""
+        self._prompt_insights_label = """
 
 PADRÕES COMPORTAMENTAIS APRENDIDOS:
-{self.get_behavioral_insights(user_phone)}
+"""
+        self._prompt_tail = """
         """
+        self._user_blocks.clear()
+
+    def _bump_profile_version(self, user_phone: str):
+        self._profile_versions[user_phone] = self._profile_versions.get(user_phone, 0) + 1
+
+    def _render_user_block(self, user_phone: str) -> str:
+        """Parte do prompt que depende só do usuário; memoizada até o perfil mudar"""
+        version = self._profile_versions.get(user_phone, 0)
+        cached = self._user_blocks.get(user_phone)
+        if cached is not None and cached[0] == version:
+            self._user_blocks.move_to_end(user_phone)
+            self.prompt_stats['user_block_hits'] += 1
+            return cached[1]
+
+        block = "".join((
+            self._prompt_profile_label,
+            self.get_user_profile(user_phone),
+            self._prompt_instructions,
+            self.format_conversation_memory(user_phone),
+            self._prompt_insights_label,
+            self.get_behavioral_insights(user_phone),
+            self._prompt_tail,
+        ))
+        # A versão foi lida antes de renderizar: se o perfil mudou no meio, a próxima chamada refaz
+        self._user_blocks[user_phone] = (version, block)
+        self._user_blocks.move_to_end(user_phone)
+        if len(self._user_blocks) > MAX_CACHED_USER_BLOCKS:
+            self._user_blocks.popitem(last=False)
+        self.prompt_stats['user_block_renders'] += 1
+        return block
+
+    def generate_contextual_prompt(self, conversation_history: List[Dict], user_phone: str) -> str:
+        """Gera prompt contextual baseado no histórico"""
+        return "".join((
+            self._prompt_head,
+            self.extract_recent_context(conversation_history),
+            self._render_user_block(user_phone),
+        ))
     
     def extract_recent_context(self, conversation_history: List[Dict]) -> str:
         """Extrai contexto relevante das últimas conversas"""
@@ -93,7 +149,7 @@ PADRÕES COMPORTAMENTAIS APRENDIDOS:
         context_summary = []
         
         for msg in recent_msgs:
-            timestamp = msg.get('timestamp', datetime.now())
+            timestamp = msg['timestamp'] if 'timestamp' in msg else datetime.now()
             content = msg.get('message_text', '')[:100]  # Primeiros 100 chars
             context_summary.append(f"[{timestamp}] {content}")
         
@@ -172,6 +228,8 @@ Estilo preferido: {profile.get('preferred_style', 'não definido')}
             # Mantém apenas últimas 20 memórias
             profile['key_memories'] = profile['key_memories'][-20:]
         
+        # Depois das alterações: quem ler a versão nova já vê o perfil atualizado
+        self._bump_profile_version(user_phone)
         logging.info(f"Perfil atualizado para {user_phone}: {profile['interaction_count']} interações")
     
     def learn_behavioral_pattern(self, user_phone: str, pattern_data: Dict[str, Any]):
@@ -193,4 +251,6 @@ Estilo preferido: {profile.get('preferred_style', 'não definido')}
         # Detecta nível técnico
         tech_words = ['api', 'webhook', 'integração', 'automatização']
         if any(word in pattern_data.get('content', '').lower() for word in tech_words):
-            patterns['technical_level'] = 'high'
\ No newline at end of file
+            patterns['technical_level'] = 'high'
+        
+        self._bump_profile_version(user_phone)
@@ -0,0 +1,178 @@
+"""
+Autotuner de Latência do Pipeline (controle em malha fechada)
+Observa a janela das últimas execuções e ajusta os parâmetros do
+OptimizedPipeline para manter o p95 do primeiro áudio no target (525ms):
+- acima do target: ataca o estágio gargalo (ASR -> mais workers;
+  TTS -> segmentos menores / menos espera de coalescência)
+- folga abaixo do target: devolve eficiência (menos workers, segmentos
+  maiores, mais coalescência)
+- zona morta (histerese), período de espera após cada ajuste, limites
+  rígidos por parâmetro e log das decisões
+"""
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, List, Optional
+
+
+@dataclass(frozen=True)
+class Knob:
+    """Parâmetro ajustável: limites rígidos e passo por decisão"""
+    name: str
+    minimum: float
+    maximum: float
+    step: float
+
+
+DEFAULT_KNOBS = {
+    'parallel_workers': Knob('parallel_workers', 1, 8, 1),
+    'tts_segment_chars': Knob('tts_segment_chars', 20, 200, 10),
+    'coalesce_ms': Knob('coalesce_ms', 0, 400, 25),
+}
+
+# Ajuste que reduz latência em cada estágio: (parâmetro, direção). Sem lote de
+# ASR: os segmentos são arquivos ogg/wav e bytes concatenados não formam um arquivo válido
+_TIGHTEN = {
+    'asr': (('parallel_workers', +1),),
+    'tts': (('tts_segment_chars', -1), ('coalesce_ms', -1)),
+}
+# Com folga: primeiro libera recursos, depois reduz chamadas ao TTS
+_RELAX = (('parallel_workers', -1), ('tts_segment_chars', +1), ('coalesce_ms', +1))
+
+
+def _percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+class LatencyAutotuner:
+    """
+    Controlador para um objeto com os atributos de `knobs` (o pipeline).
+
+    - window: execuções na janela de percentis
+    - min_samples: amostras novas exigidas antes de decidir (também é o período
+      de espera após um ajuste, já que a janela é zerada)
+    - hysteresis: zona morta relativa em torno do target; desfazer o último
+      ajuste de um parâmetro exige o dobro do desvio
+    """
+
+    def __init__(self, pipeline: Any, target_ms: Optional[float] = None, window: int = 40,
+                 min_samples: int = 12, hysteresis: float = 0.1, knobs: Optional[Dict[str, Knob]] = None,
+                 log_size: int = 200):
+        self.pipeline = pipeline
+        self.target_ms = target_ms or getattr(pipeline, 'max_latency_target', 525)
+        self.window = window
+        self.min_samples = min_samples
+        self.hysteresis = hysteresis
+        self.knobs = {name: knob for name, knob in (knobs or DEFAULT_KNOBS).items() if hasattr(pipeline, name)}
+        self.samples: Dict[str, Deque[float]] = {
+            name: deque(maxlen=window) for name in ('asr', 'llm', 'tts', 'first_audio')
+        }
+        self.decisions: Deque[Dict[str, Any]] = deque(maxlen=log_size)
+        self._last_direction: Dict[str, int] = {}
+        self._fresh = 0
+        self.observed = 0
+
+    def observe(self, metrics) -> Optional[Dict[str, Any]]:
+        """Registra uma execução (LatencyMetrics) e decide se a janela já permite"""
+        if not metrics.first_audio_latency:
+            return None  # execução sem áudio (falha ou transcrição vazia)
+        # Parcelas da latência percebida: ASR, tempo até o 1º token, 1º token -> 1º áudio
+        self.samples['asr'].append(metrics.asr_latency)
+        self.samples['llm'].append(max(0.0, metrics.first_token_latency - metrics.asr_latency))
+        self.samples['tts'].append(max(0.0, metrics.first_audio_latency - metrics.first_token_latency))
+        self.samples['first_audio'].append(metrics.first_audio_latency)
+        self.observed += 1
+        self._fresh += 1
+        if self._fresh < self.min_samples:
+            return None
+        return self.evaluate()
+
+    def evaluate(self) -> Optional[Dict[str, Any]]:
+        """Uma decisão sobre a janela atual; retorna o ajuste feito (ou None)"""
+        if not self.samples['first_audio']:
+            return None
+        p95 = _percentile(self.samples['first_audio'], 0.95)
+        error = (p95 - self.target_ms) / self.target_ms
+        if abs(error) <= self.hysteresis:
+            return None
+
+        p50 = {stage: _percentile(values, 0.5) for stage, values in self.samples.items()}
+        if error > 0:
+            # Gargalo entre os estágios que têm parâmetro (o LLM não tem); se os
+            # parâmetros dele estão no limite, tenta os do outro estágio
+            stages = sorted(_TIGHTEN, key=lambda stage: -p50[stage])
+            candidates = [candidate for stage in stages for candidate in _TIGHTEN[stage]]
+            action = 'tighten'
+            reason = f"p95 {p95:.0f}ms > target {self.target_ms:.0f}ms, gargalo {stages[0]}"
+            if p50['llm'] > p50[stages[0]]:
+                reason += f" (LLM domina com p50 {p50['llm']:.0f}ms, sem parâmetro)"
+        else:
+            candidates = _RELAX
+            action = 'relax'
+            reason = f"p95 {p95:.0f}ms com folga sob o target {self.target_ms:.0f}ms"
+
+        for name, direction in candidates:
+            decision = self._step(name, direction, abs(error), action, reason, p95, p50)
+            if decision:
+                return decision
+
+        if error > 0:
+            self._log('saturated', None, None, None, reason + "; parâmetros no limite", p95, p50)
+            self._fresh = 0
+        return None
+
+    def _step(self, name: str, direction: int, deviation: float, action: str, reason: str,
+              p95: float, p50: Dict[str, float]) -> Optional[Dict[str, Any]]:
+        knob = self.knobs.get(name)
+        if knob is None:
+            return None
+        if self._last_direction.get(name, direction) != direction and deviation <= 2 * self.hysteresis:
+            return None  # desfazer o último ajuste exige desvio maior (evita oscilação)
+        current = getattr(self.pipeline, name)
+        new = min(knob.maximum, max(knob.minimum, current + direction * knob.step))
+        if new == current:
+            return None
+        setattr(self.pipeline, name, type(current)(new))
+        self._last_direction[name] = direction
+        # Amostras antigas não refletem o novo ajuste
+        for values in self.samples.values():
+            values.clear()
+        self._fresh = 0
+        return self._log(action, name, current, getattr(self.pipeline, name), reason, p95, p50)
+
+    def _log(self, action: str, knob: Optional[str], old, new, reason: str,
+             p95: float, p50: Dict[str, float]) -> Dict[str, Any]:
+        decision = {
+            'at': time.time(),
+            'observed': self.observed,
+            'action': action,
+            'knob': knob,
+            'from': old,
+            'to': new,
+            'reason': reason,
+            'p95_first_audio_ms': round(p95, 1),
+            'p50_ms': {stage: round(value, 1) for stage, value in p50.items()},
+        }
+        self.decisions.append(decision)
+        if knob:
+            logging.info(f"🎛️ Autotuner: {knob} {old} -> {new} ({reason})")
+        else:
+            logging.warning(f"🎛️ Autotuner: {reason}")
+        return decision
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'target_ms': self.target_ms,
+            'observed': self.observed,
+            'window': len(self.samples['first_audio']),
+            'p95_first_audio_ms': round(_percentile(self.samples['first_audio'], 0.95), 1),
+            'knobs': {name: getattr(self.pipeline, name) for name in self.knobs},
+            'decisions': list(self.decisions)[-20:],
+        }
+
+    def decision_log(self) -> List[Dict[str, Any]]:
+        return list(self.decisions)
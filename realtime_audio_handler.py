@@ -4,15 +4,17 @@ Baseado no código JavaScript fornecido pelo usuário
 """
 import asyncio
 import websockets
-import json
 import logging
 import base64
 import tempfile
 import os
 import subprocess
+from collections import deque
 from typing import Optional, Dict, Any
 import requests
 from twilio.rest import Client
+from app.utils import jsoncodec
+from app.core.vad import compact_pcm_bytes
 
 class EndrigoRealtimeAudioClone:
     """
@@ -26,6 +28,19 @@ class EndrigoRealtimeAudioClone:
         self.current_user = None
         self.is_connected = False
         
+        # Barge-in: cada novo áudio de um usuário supera a resposta anterior dele. A instância
+        # é compartilhada (main_old), então os turnos são por remetente: o áudio de outro
+        # usuário não cancela nem descarta a resposta de quem está esperando
+        self.turn_id = 0  # contador global: ids de turno únicos entre usuários
+        self.user_turns: Dict[str, int] = {}  # remetente -> turno mais recente
+        self.response_turn = 0
+        self.response_user: Optional[str] = None  # dono da resposta ativa
+        self.sending_user: Optional[str] = None  # quem está enviando áudio para o buffer
+        self.requested_turns = deque()  # (turno, remetente) dos response.create sem response.created
+        self.response_in_progress = False
+        self.active_item_id = None
+        self.accepting_audio = True
+        
         # Configurações Twilio
         self.twilio_client = Client(
             os.environ.get('TWILIO_ACCOUNT_SID'),
@@ -84,7 +99,7 @@ class EndrigoRealtimeAudioClone:
         }
         
         if self.ws:
-            await self.ws.send(json.dumps(config))
+            await self.ws.send(jsoncodec.dumps(config))
             logging.info("🔧 Sessão de áudio configurada")
     
     def get_audio_optimized_prompt(self) -> str:
@@ -130,6 +145,8 @@ FOCO:
             
             # 2. Converte para formato Realtime API
             pcm_audio = await self.convert_to_realtime_format(audio_buffer)
+            # Silêncio das pontas e pausas longas não vão para o WebSocket
+            pcm_audio = compact_pcm_bytes(pcm_audio, 16000)
             base64_audio = base64.b64encode(pcm_audio).decode()
             
             # 3. Envia áudio para Realtime API
@@ -210,9 +227,12 @@ FOCO:
         if not self.ws:
             raise Exception("WebSocket não conectado")
         
+        # Barge-in: cancela a resposta anterior do mesmo usuário ainda em andamento
+        turn = await self.begin_turn(from_number)
+        
         # GARANTE: Armazena usuário atual para resposta
         self.current_user = from_number
-        self.audio_chunks = []  # Reset chunks para nova resposta
+        self.sending_user = from_number
         
         try:
             # GARANTE: Envio do áudio em chunks otimizados
@@ -222,15 +242,14 @@ FOCO:
             logging.info(f"📤 Enviando áudio em {total_chunks} chunks")
             
             for i in range(0, len(base64_audio), chunk_size):
-                chunk = base64_audio[i:i + chunk_size]
+                if self.is_superseded(turn, from_number):
+                    logging.info("⏭️ Turno superado por novo áudio - envio interrompido")
+                    return
                 
-                # GARANTE: Formato exato do evento
-                audio_event = {
-                    "type": "input_audio_buffer.append",
-                    "audio": chunk
-                }
+                chunk = base64_audio[i:i + chunk_size]
                 
-                await self.ws.send(json.dumps(audio_event))
+                # GARANTE: Formato exato do evento (base64 não passa pelo serializador)
+                await self.ws.send(jsoncodec.encode_audio_append(chunk))
                 
                 # Micro delay para evitar overload
                 await asyncio.sleep(0.01)
@@ -239,18 +258,24 @@ FOCO:
             commit_event = {
                 "type": "input_audio_buffer.commit"
             }
-            await self.ws.send(json.dumps(commit_event))
+            await self.ws.send(jsoncodec.dumps(commit_event))
+            self.sending_user = None
             
-            # GARANTE: Solicita resposta
+            # GARANTE: Solicita resposta; turno e remetente voltam no metadata do response.created
             response_event = {
-                "type": "response.create"
+                "type": "response.create",
+                "response": {"metadata": {"turn": str(turn), "user": from_number}}
             }
-            await self.ws.send(json.dumps(response_event))
+            self.requested_turns.append((turn, from_number))
+            await self.ws.send(jsoncodec.dumps(response_event))
+            self.response_in_progress = True
             
             logging.info("✅ Áudio enviado para Realtime API - aguardando resposta")
             
         except Exception as e:
             logging.error(f"❌ Erro enviando áudio para Realtime: {e}")
+            if self.sending_user == from_number:
+                self.sending_user = None
             raise
     
     async def listen_to_server_events(self):
@@ -258,8 +283,15 @@ FOCO:
         try:
             if self.ws:
                 async for message in self.ws:
-                    event = json.loads(message)
-                    await self.handle_server_event(event)
+                    # Deltas de áudio são roteados só pelo `type`, sem parse completo
+                    if jsoncodec.peek_type(message) == "response.audio.delta":
+                        # Após um cancelamento, deltas atrasados são descartados
+                        if self.accepting_audio:
+                            delta = jsoncodec.extract_delta(message)
+                            if delta:
+                                self.audio_chunks.append(delta)
+                        continue
+                    await self.handle_server_event(jsoncodec.loads(message))
         except Exception as e:
             logging.error(f"Erro listening eventos: {e}")
     
@@ -273,22 +305,42 @@ FOCO:
         if event_type == "response.audio.delta":
             # GARANTE: Captura chunks de áudio da resposta
             delta = event.get("delta", "")
-            if delta:
+            if delta and self.accepting_audio:
                 self.audio_chunks.append(delta)
                 logging.debug(f"🔊 Chunk áudio recebido: {len(delta)} chars")
             
         elif event_type == "response.done":
-            # GARANTE: Resposta completa - envia para WhatsApp
-            logging.info(f"✅ Resposta completa: {len(self.audio_chunks)} chunks")
-            await self.send_response_to_whatsapp()
+            self.response_in_progress = False
+            self.active_item_id = None
+            chunks, self.audio_chunks = self.audio_chunks, []
+            status = event.get("response", {}).get("status")
+            
+            owner, self.response_user = self.response_user, None
+            if status == "cancelled" or not owner or self.is_superseded(self.response_turn, owner):
+                logging.info(f"🗑️ Resposta superada descartada: {len(chunks)} chunks")
+                return
+            
+            # GARANTE: Resposta completa - envia para o dono da resposta sem bloquear o
+            # listener, para que um novo áudio dele possa cancelar a entrega em andamento
+            logging.info(f"✅ Resposta completa: {len(chunks)} chunks")
+            asyncio.create_task(
+                self.send_response_to_whatsapp(chunks, self.response_turn, owner)
+            )
             
         elif event_type == "error":
-            error_msg = event.get("error", {}).get("message", "Erro desconhecido")
+            error = event.get("error", {})
+            if error.get("code") == "response_cancel_not_active":
+                # Cancelamento chegou depois do fim da resposta: nada a fazer
+                logging.debug("Cancelamento ignorado: nenhuma resposta ativa")
+                return
+            
+            error_msg = error.get("message", "Erro desconhecido")
             logging.error(f"❌ Erro Realtime API: {error_msg}")
             
-            # Fallback: envia resposta de erro via texto se necessário
-            if self.current_user:
-                await self.send_error_fallback()
+            # Fallback: envia resposta de erro via texto para o dono da resposta, se houver
+            to_user = self.response_user or self.current_user
+            if to_user:
+                await self.send_error_fallback(to_user)
                 
         elif event_type == "response.text.done":
             # Log da transcrição para debug
@@ -305,15 +357,73 @@ FOCO:
             logging.info("🎤 Áudio confirmado pelo servidor")
             
         elif event_type == "response.created":
+            # Turno e dono são os de quem pediu a resposta, não os atuais: uma resposta criada
+            # depois de um barge-in (cancelamento atrasado) continua sendo do turno antigo
+            self.response_in_progress = True
+            requested, requester = self.requested_turns.popleft() if self.requested_turns else (0, None)
+            metadata = event.get("response", {}).get("metadata") or {}
+            self.response_turn = int(metadata["turn"]) if metadata.get("turn") else requested
+            self.response_user = metadata.get("user") or requester
+            self.accepting_audio = bool(self.response_user) and not self.is_superseded(
+                self.response_turn, self.response_user)
             logging.info("🤖 Gerando resposta...")
             
         elif event_type == "response.output_item.added":
+            self.active_item_id = event.get("item", {}).get("id")
             logging.info("📋 Item de resposta adicionado")
             
         else:
             logging.debug(f"🔍 Evento: {event_type}")
     
-    async def send_error_fallback(self):
+    async def begin_turn(self, from_number: str) -> int:
+        """
+        Abre um novo turno do remetente: cancela a resposta anterior só se for dele
+        (barge-in) e limpa o áudio parcial de um envio interrompido
+        """
+        # O turno avança antes de qualquer await: o envio antigo para no próximo chunk
+        self.turn_id += 1
+        turn = self.user_turns[from_number] = self.turn_id
+        if self.response_in_progress and self.response_user == from_number:
+            await self.cancel_active_response()
+        # O buffer de entrada é da sessão: não apaga o envio em andamento de outro usuário
+        if self.ws and self.sending_user in (None, from_number):
+            try:
+                await self.ws.send(jsoncodec.dumps({"type": "input_audio_buffer.clear"}))
+            except Exception as e:
+                logging.error(f"Erro limpando buffer de áudio: {e}")
+        return turn
+    
+    def is_superseded(self, turn: int, from_number: str) -> bool:
+        """Indica se um turno já foi superado por uma mensagem mais nova do mesmo remetente"""
+        return turn != self.user_turns.get(from_number)
+    
+    async def cancel_active_response(self):
+        """
+        Cancela a resposta em streaming e descarta o áudio já recebido.
+        Só é chamado para a resposta do próprio remetente do novo áudio.
+        """
+        self.audio_chunks = []
+        if not (self.ws and self.response_in_progress):
+            return
+        
+        self.accepting_audio = False
+        try:
+            await self.ws.send(jsoncodec.dumps({"type": "response.cancel"}))
+            
+            if self.active_item_id:
+                # Nada foi entregue ao WhatsApp: o usuário não ouviu nenhum trecho
+                await self.ws.send(jsoncodec.dumps({
+                    "type": "conversation.item.truncate",
+                    "item_id": self.active_item_id,
+                    "content_index": 0,
+                    "audio_end_ms": 0
+                }))
+            
+            logging.info("✂️ Resposta em andamento cancelada (barge-in)")
+        except Exception as e:
+            logging.error(f"Erro cancelando resposta: {e}")
+    
+    async def send_error_fallback(self, to_user: Optional[str] = None):
         """Envia resposta de fallback em caso de erro"""
         try:
             error_message = "Desculpe, houve um problema técnico. Pode repetir por favor?"
@@ -321,7 +431,7 @@ FOCO:
             await asyncio.to_thread(
                 self.twilio_client.messages.create,
                 from_=f'whatsapp:{self.twilio_phone}',
-                to=f'whatsapp:{self.current_user}',
+                to=f'whatsapp:{to_user or self.current_user}',
                 body=error_message
             )
             
@@ -330,18 +440,28 @@ FOCO:
         except Exception as e:
             logging.error(f"Erro enviando fallback: {e}")
     
-    async def send_response_to_whatsapp(self):
-        """Envia resposta de áudio de volta para WhatsApp"""
+    async def send_response_to_whatsapp(self, audio_chunks=None, turn: Optional[int] = None,
+                                        to_user: Optional[str] = None):
+        """
+        Envia resposta de áudio de volta para WhatsApp.
+        Entre cada etapa verifica se o turno foi superado, para não gastar
+        conversão nem envio Twilio com respostas que o usuário já deixou para trás.
+        """
+        if audio_chunks is None:
+            audio_chunks, self.audio_chunks = self.audio_chunks, []
+        to_user = to_user or self.current_user
+        turn = self.user_turns.get(to_user) if turn is None else turn
+        
         try:
-            if not self.audio_chunks:
+            if not audio_chunks:
                 logging.warning("Nenhum chunk de áudio para enviar")
                 return
             
-            logging.info(f"🔊 Enviando {len(self.audio_chunks)} chunks de áudio")
+            logging.info(f"🔊 Enviando {len(audio_chunks)} chunks de áudio")
             
             # 1. Combina chunks de áudio
             complete_audio = b''.join([
-                base64.b64decode(chunk) for chunk in self.audio_chunks if chunk
+                base64.b64decode(chunk) for chunk in audio_chunks if chunk
             ])
             
             if not complete_audio:
@@ -349,22 +469,24 @@ FOCO:
                 return
             
             # 2. Converte para formato WhatsApp (OGG)
+            if self.is_superseded(turn, to_user):
+                logging.info("⏭️ Turno superado - conversão cancelada")
+                return
             ogg_audio = await self.convert_to_whatsapp_format(complete_audio)
             
             # 3. Salva e serve via HTTP
+            if self.is_superseded(turn, to_user):
+                logging.info("⏭️ Turno superado - envio cancelado")
+                return
             audio_url = await self.serve_audio_file(ogg_audio)
             
             # 4. Envia via Twilio
-            await self.send_via_twilio(audio_url)
-            
-            # 5. Reset para próxima mensagem
-            self.audio_chunks = []
+            await self.send_via_twilio(audio_url, to_user)
             
             logging.info("✅ Resposta de áudio enviada!")
             
         except Exception as e:
             logging.error(f"❌ Erro enviando resposta: {e}")
-            self.audio_chunks = []  # Reset mesmo com erro
     
     async def convert_to_whatsapp_format(self, pcm_audio: bytes) -> bytes:
         """
@@ -394,7 +516,10 @@ FOCO:
                 output_path
             ]
             
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
+            # Fora do event loop: o listener segue recebendo eventos (e cancelamentos)
+            result = await asyncio.to_thread(
+                subprocess.run, cmd, capture_output=True, text=True, timeout=30
+            )
             
             if result.returncode != 0:
                 logging.error(f"Erro conversão Realtime→WhatsApp: {result.stderr}")
@@ -438,14 +563,14 @@ FOCO:
         base_url = os.environ.get('REPLIT_URL', 'https://6771fe47-1a6d-4a14-a791-ac9ee41dd82d-00-ys74xr6dg9hv.worf.replit.dev')
         return f"{base_url}/static/audio/{filename}"
     
-    async def send_via_twilio(self, audio_url: str):
+    async def send_via_twilio(self, audio_url: str, to_user: Optional[str] = None):
         """Envia áudio via Twilio WhatsApp"""
         try:
             # Envia apenas o áudio (sem texto)
             message = await asyncio.to_thread(
                 self.twilio_client.messages.create,
                 from_=f'whatsapp:{self.twilio_phone}',
-                to=f'whatsapp:{self.current_user}',
+                to=f'whatsapp:{to_user or self.current_user}',
                 media_url=[audio_url]
             )
             
@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+Testes do cache de respostas (app/core/answer_cache.py)
+A tabela é global: respostas curtas de uma conversa não podem ser servidas a outro usuário
+"""
+from app.core.answer_cache import AnswerCache
+
+
+def test_reply_with_history_is_not_served_to_other_session():
+    cache = AnswerCache(ttl=60)
+    reply = ['Perfeito, João! Te mando o contrato do plano de R$ 5.000 agora.']
+
+    # "Sim" no meio da conversa do João: resposta personalizada, fora do cache
+    assert not cache.store('wa:111', 'Sim', reply, stateless=False)
+    assert cache.lookup('wa:222', 'SIM', stateless=True) is None
+    assert cache.lookup('wa:222', 'SIM', stateless=False) is None
+
+
+def test_stateless_reply_is_not_served_mid_conversation():
+    cache = AnswerCache(ttl=60)
+    assert cache.store('wa:111', 'Quem é você?', ['Sou o clone digital do Endrigo.'], stateless=True)
+
+    # Primeira mensagem de outra sessão: FAQ sem estado, pode vir do cache
+    assert cache.lookup('wa:222', 'quem e vc', stateless=True) is not None
+    # A mesma pergunta com histórico vai para o modelo
+    assert cache.lookup('wa:333', 'quem e vc', stateless=False) is None
+
+
+if __name__ == "__main__":
+    test_reply_with_history_is_not_served_to_other_session()
+    test_stateless_reply_is_not_served_mid_conversation()
+    print("✅ answer_cache ok")
@@ -4,11 +4,11 @@ Implementação conforme especificações do usuário
 """
 import asyncio
 import websockets
-import json
 import base64
 import logging
 import os
 from typing import Optional, Dict, Any
+from app.utils import jsoncodec
 
 class RealtimeWebSocketClient:
     """
@@ -22,6 +22,15 @@ class RealtimeWebSocketClient:
         self.is_connected = False
         self.session_id = None
         
+        # Barge-in: um turno novo cancela a resposta anterior e só é enviado
+        # depois que o coletor do turno antigo drenar o response.done
+        self.turn_id = 0
+        self.response_in_progress = False
+        self.active_item_id = None
+        self._response_lock = asyncio.Lock()
+        # Respostas cujo coletor estourou o timeout: os eventos que ainda chegarem são ignorados
+        self._abandoned_responses = set()
+        
         # Configurações conforme especificação
         self.config = {
             'model': 'gpt-4o-realtime-preview-2024-10-01',
@@ -76,7 +85,7 @@ class RealtimeWebSocketClient:
             }
         }
         
-        await self.ws.send(json.dumps(session_config))
+        await self.ws.send(jsoncodec.dumps(session_config))
         logging.info("🎯 Sessão Realtime configurada")
     
     def get_endrigo_instructions(self) -> str:
@@ -107,44 +116,128 @@ INSTRUÇÕES CRÍTICAS:
 - Seja natural e útil nas respostas
 """
     
+    async def begin_turn(self) -> int:
+        """Abre um novo turno do usuário, cancelando a resposta em streaming"""
+        self.turn_id += 1
+        if self.response_in_progress:
+            await self.cancel_response()
+        return self.turn_id
+    
+    def is_superseded(self, turn: int) -> bool:
+        """Indica se um turno já foi superado por uma mensagem mais nova"""
+        return turn != self.turn_id
+    
+    async def cancel_response(self):
+        """Envia response.cancel e trunca o item de áudio em andamento"""
+        try:
+            await self.ws.send(jsoncodec.dumps({"type": "response.cancel"}))
+            
+            if self.active_item_id:
+                # O áudio só é entregue ao final: o usuário não ouviu nenhum trecho
+                await self.ws.send(jsoncodec.dumps({
+                    "type": "conversation.item.truncate",
+                    "item_id": self.active_item_id,
+                    "content_index": 0,
+                    "audio_end_ms": 0
+                }))
+            
+            logging.info("✂️ Resposta em andamento cancelada (barge-in)")
+        except Exception as e:
+            logging.error(f"❌ Erro cancelando resposta: {e}")
+    
     async def process_audio_input(self, audio_data: bytes) -> Optional[bytes]:
-        """Processa entrada de áudio via Realtime API"""
+        """
+        Processa entrada de áudio via Realtime API.
+        Retorna None se o turno for superado por uma mensagem mais nova.
+        """
         try:
             if not self.is_connected:
                 await self.connect()
             
-            # Codifica áudio em base64
-            base64_audio = base64.b64encode(audio_data).decode('utf-8')
-            
-            # Envia áudio para processamento
-            audio_event = {
-                "type": "input_audio_buffer.append",
-                "audio": base64_audio
-            }
-            await self.ws.send(json.dumps(audio_event))
-            
-            # Confirma processamento
-            commit_event = {
-                "type": "input_audio_buffer.commit"
-            }
-            await self.ws.send(json.dumps(commit_event))
-            
-            # Solicita resposta
-            response_event = {
-                "type": "response.create"
-            }
-            await self.ws.send(json.dumps(response_event))
+            turn = await self.begin_turn()
             
-            # Coleta resposta em áudio
-            return await self.collect_audio_response()
+            async with self._response_lock:
+                if self.is_superseded(turn):
+                    logging.info("⏭️ Turno superado antes do envio - áudio descartado")
+                    return None
+                
+                # Codifica áudio em base64
+                base64_audio = base64.b64encode(audio_data).decode('utf-8')
+                
+                # Envia áudio para processamento (base64 não passa pelo serializador)
+                await self.ws.send(jsoncodec.encode_audio_append(base64_audio))
+                
+                # Confirma processamento
+                commit_event = {
+                    "type": "input_audio_buffer.commit"
+                }
+                await self.ws.send(jsoncodec.dumps(commit_event))
+                
+                # Solicita resposta (o turno volta no metadata do response.created)
+                response_event = {
+                    "type": "response.create",
+                    "response": {"metadata": {"turn": str(turn)}}
+                }
+                await self.ws.send(jsoncodec.dumps(response_event))
+                self.response_in_progress = True
+                
+                # Coleta resposta em áudio
+                return await self.collect_audio_response(turn)
             
         except Exception as e:
             logging.error(f"❌ Erro processamento áudio: {e}")
             return None
     
-    async def collect_audio_response(self) -> Optional[bytes]:
-        """Coleta chunks de áudio da resposta"""
+    def _track_response_event(self, event_type: str, message) -> None:
+        """Acompanha o ciclo de vida da resposta ativa (para cancelamento)"""
+        if event_type == "response.created":
+            self.response_in_progress = True
+        elif event_type == "response.output_item.added":
+            self.active_item_id = jsoncodec.loads(message).get("item", {}).get("id")
+        elif event_type == "response.done":
+            self.response_in_progress = False
+            self.active_item_id = None
+    
+    def _match_response(self, event_type: str, message, turn: int, response_id: Optional[str]):
+        """
+        Associa o evento à resposta do turno: adota o response.created com o turno no
+        metadata e ignora eventos de outras respostas (ex.: a de um coletor anterior que
+        estourou o timeout). Retorna (evento é da resposta do turno, id da resposta).
+        """
+        if event_type in ("response.audio.delta", "response.text.delta"):
+            return jsoncodec.peek_response_id(message) == response_id, response_id
+        if event_type not in ("response.created", "response.output_item.added", "response.done"):
+            return True, response_id
+        event = jsoncodec.loads(message)
+        event_id = event.get("response", {}).get("id") or event.get("response_id")
+        if event_type == "response.created" and response_id is None:
+            metadata = event.get("response", {}).get("metadata") or {}
+            if metadata.get("turn", str(turn)) == str(turn) and event_id not in self._abandoned_responses:
+                response_id = event_id
+        if event_id != response_id:
+            if event_type == "response.done":
+                self._abandoned_responses.discard(event_id)
+            return False, response_id
+        return True, response_id
+    
+    async def _abandon_response(self, response_id: Optional[str]):
+        """Timeout do coletor: cancela a resposta e marca o id para o próximo turno ignorá-la"""
+        if response_id:
+            self._abandoned_responses.add(response_id)
+        if self.response_in_progress:
+            await self.cancel_response()
+            self.response_in_progress = False
+            self.active_item_id = None
+    
+    async def collect_audio_response(self, turn: Optional[int] = None) -> Optional[bytes]:
+        """
+        Coleta chunks de áudio da resposta.
+        Se o turno for superado, continua drenando até o response.done
+        (para não vazar eventos no próximo turno) mas descarta o áudio.
+        """
+        turn = self.turn_id if turn is None else turn
         audio_chunks = []
+        response_id = None
         timeout_task = asyncio.create_task(asyncio.sleep(10))
         
         try:
@@ -157,20 +250,32 @@ INSTRUÇÕES CRÍTICAS:
                 )
                 
                 if timeout_task in done:
+                    message_task.cancel()
                     logging.warning("⏰ Timeout coletando resposta")
+                    await self._abandon_response(response_id)
                     break
                 
                 message = message_task.result()
-                event = json.loads(message)
+                event_type = jsoncodec.peek_type(message)
+                mine, response_id = self._match_response(event_type, message, turn, response_id)
+                if not mine:
+                    continue
                 
-                # Coleta chunks de áudio
-                if event.get("type") == "response.audio.delta":
-                    audio_chunk = base64.b64decode(event.get("delta", ""))
-                    audio_chunks.append(audio_chunk)
+                # Coleta chunks de áudio (sem decodificar se o turno já foi superado)
+                if event_type == "response.audio.delta":
+                    if not self.is_superseded(turn):
+                        audio_chunk = base64.b64decode(jsoncodec.extract_delta(message))
+                        audio_chunks.append(audio_chunk)
+                    continue
                 
-                elif event.get("type") == "response.done":
+                self._track_response_event(event_type, message)
+                if event_type == "response.done":
                     break
             
+            if self.is_superseded(turn):
+                logging.info(f"🗑️ Resposta superada descartada: {len(audio_chunks)} chunks")
+                return None
+            
             # Combina chunks
             if audio_chunks:
                 complete_audio = b''.join(audio_chunks)
@@ -187,42 +292,56 @@ INSTRUÇÕES CRÍTICAS:
             if not timeout_task.done():
                 timeout_task.cancel()
     
-    async def send_text_input(self, text: str) -> str:
-        """Envia entrada de texto e recebe resposta"""
+    async def send_text_input(self, text: str) -> Optional[str]:
+        """
+        Envia entrada de texto e recebe resposta.
+        Retorna None se o turno for superado por uma mensagem mais nova.
+        """
         try:
             if not self.is_connected:
                 await self.connect()
             
-            # Cria item de conversa
-            conversation_item = {
-                "type": "conversation.item.create",
-                "item": {
-                    "type": "message",
-                    "role": "user",
-                    "content": [{
-                        "type": "input_text",
-                        "text": text
-                    }]
-                }
-            }
-            await self.ws.send(json.dumps(conversation_item))
+            turn = await self.begin_turn()
             
-            # Solicita resposta
-            response_event = {
-                "type": "response.create"
-            }
-            await self.ws.send(json.dumps(response_event))
-            
-            # Coleta resposta em texto
-            return await self.collect_text_response()
+            async with self._response_lock:
+                if self.is_superseded(turn):
+                    logging.info("⏭️ Turno superado antes do envio - texto descartado")
+                    return None
+                
+                # Cria item de conversa
+                conversation_item = {
+                    "type": "conversation.item.create",
+                    "item": {
+                        "type": "message",
+                        "role": "user",
+                        "content": [{
+                            "type": "input_text",
+                            "text": text
+                        }]
+                    }
+                }
+                await self.ws.send(jsoncodec.dumps(conversation_item))
+                
+                # Solicita resposta (o turno volta no metadata do response.created)
+                response_event = {
+                    "type": "response.create",
+                    "response": {"metadata": {"turn": str(turn)}}
+                }
+                await self.ws.send(jsoncodec.dumps(response_event))
+                self.response_in_progress = True
+                
+                # Coleta resposta em texto
+                return await self.collect_text_response(turn)
             
         except Exception as e:
             logging.error(f"❌ Erro processamento texto: {e}")
             return "Erro processando mensagem via Realtime API"
     
-    async def collect_text_response(self) -> str:
-        """Coleta resposta em texto"""
+    async def collect_text_response(self, turn: Optional[int] = None) -> Optional[str]:
+        """Coleta resposta em texto (None se o turno for superado)"""
+        turn = self.turn_id if turn is None else turn
         text_parts = []
+        response_id = None
         timeout_task = asyncio.create_task(asyncio.sleep(10))
         
         try:
@@ -234,18 +353,30 @@ INSTRUÇÕES CRÍTICAS:
                 )
                 
                 if timeout_task in done:
+                    message_task.cancel()
+                    await self._abandon_response(response_id)
                     break
                 
                 message = message_task.result()
-                event = json.loads(message)
+                event_type = jsoncodec.peek_type(message)
+                mine, response_id = self._match_response(event_type, message, turn, response_id)
+                if not mine:
+                    continue
                 
                 # Coleta texto da resposta
-                if event.get("type") == "response.text.delta":
-                    text_parts.append(event.get("delta", ""))
+                if event_type == "response.text.delta":
+                    if not self.is_superseded(turn):
+                        text_parts.append(jsoncodec.loads(message).get("delta", ""))
+                    continue
                 
-                elif event.get("type") == "response.done":
+                self._track_response_event(event_type, message)
+                if event_type == "response.done":
                     break
             
+            if self.is_superseded(turn):
+                logging.info("🗑️ Resposta de texto superada descartada")
+                return None
+            
             return ''.join(text_parts) if text_parts else "Resposta via Realtime API processada"
             
         except Exception as e:
@@ -273,11 +404,11 @@ class EndrigoRealtimeClient:
         self.client = RealtimeWebSocketClient()
     
     async def process_voice_message(self, audio_data: bytes) -> Optional[bytes]:
-        """Processa mensagem de voz e retorna resposta em áudio"""
+        """Processa mensagem de voz e retorna resposta em áudio (None se superada)"""
         return await self.client.process_audio_input(audio_data)
     
-    async def process_text_message(self, text: str) -> str:
-        """Processa mensagem de texto via Realtime API"""
+    async def process_text_message(self, text: str) -> Optional[str]:
+        """Processa mensagem de texto via Realtime API (None se superada)"""
         return await self.client.send_text_input(text)
     
     def get_status(self) -> Dict[str, Any]: